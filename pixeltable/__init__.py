@@ -8,6 +8,7 @@ from .__version__ import __version__, __version_tuple__
 from .catalog import (
     Column,
     ColumnMetadata,
+    CompactionStatus,
     IndexMetadata,
     InsertableTable,
     Table,
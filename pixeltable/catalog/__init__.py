@@ -13,5 +13,5 @@ from .table_metadata import ColumnMetadata, IndexMetadata, TableMetadata, Versio
 from .table_version import TableVersion
 from .table_version_handle import ColumnHandle, TableVersionHandle
 from .table_version_path import TableVersionPath
-from .update_status import RowCountStats, UpdateStatus
+from .update_status import CompactionStatus, RowCountStats, UpdateStatus
 from .view import View
@@ -609,6 +609,7 @@ class Table(SchemaObject):
         print_stats: bool = False,
         on_error: Literal['abort', 'ignore'] = 'abort',
         if_exists: Literal['error', 'ignore', 'replace'] = 'error',
+        batch_mode: bool = False,
         **kwargs: exprs.Expr,
     ) -> UpdateStatus:
         """
@@ -632,6 +633,9 @@ class Table(SchemaObject):
                 - `'ignore'`: do nothing and return.
                 - `'replace' or 'replace_force'`: drop the existing column and add the new column, iff it has
                     no dependents.
+            batch_mode: If `True`, populate the column by executing the calls of udfs that support it (such as
+                `openai.chat_completions()` and `anthropic.messages()`) through the provider's batch API, which is
+                cheaper but returns results only after minutes or hours. Rows inserted later use the regular API.
 
         Returns:
             Information about the execution status of the operation.
@@ -694,7 +698,9 @@ class Table(SchemaObject):
             new_col = self._create_columns({col_name: col_schema})[0]
             self._verify_column(new_col)
             assert self._tbl_version is not None
-            result += self._tbl_version.get().add_columns([new_col], print_stats=print_stats, on_error=on_error)
+            result += self._tbl_version.get().add_columns(
+                [new_col], print_stats=print_stats, on_error=on_error, batch_mode=batch_mode
+            )
             FileCache.get().emit_eviction_warnings()
             return result
 
@@ -967,6 +973,115 @@ class Table(SchemaObject):
             index_info.append({'_id': idx.id, '_name': idx_name, '_column': idx.col.name})
         return index_info
 
+    def add_index(
+        self,
+        expr: str | exprs.Expr,
+        *,
+        idx_name: Optional[str] = None,
+        index_type: Literal['btree', 'gin'] = 'btree',
+        if_exists: Literal['error', 'ignore', 'replace', 'replace_force'] = 'error',
+    ) -> None:
+        """
+        Add a B-tree index on the value of an expression over a column, or a GIN index on a JSON column. Once the index
+        is created, it will be automatically kept up-to-date as new rows are inserted into the table.
+
+        B-tree indices on scalar columns are created automatically; `add_index()` is needed for indices on derived
+        values, such as a field of a JSON column. The index is used for comparisons of the indexed expression against
+        a literal:
+
+        >>> tbl.add_index(tbl.meta.source.astype(pxt.String))
+        ... tbl.where(tbl.meta.source == 'camera7').collect()
+
+        A GIN index (with the `jsonb_path_ops` operator class) covers equality comparisons for all paths into a JSON
+        column that consist of field names and non-negative list indices:
+
+        >>> tbl.add_index(tbl.detections, index_type='gin')
+        ... tbl.where(tbl.detections.labels[0] == 3).collect()
+
+        Args:
+            expr: The expression to be indexed, or the name of a column. For `index_type='btree'`, it must be a
+                scalar-typed expression that references exactly one column of the table; JSON values need to be
+                converted with `astype()`. For `index_type='gin'`, it must be a `Json` column.
+            idx_name: An optional name for the index. If not specified, a name such as `'idx0'` will be generated
+                automatically. If specified, the name must be unique for this table and a valid pixeltable column name.
+            index_type: The type of index; one of `'btree'` or `'gin'`. The default is `'btree'`.
+            if_exists: Directive for handling an existing index with the same name. Must be one of the following:
+
+                - `'error'`: raise an error if an index with the same name already exists.
+                - `'ignore'`: do nothing if an index with the same name already exists.
+                - `'replace'` or `'replace_force'`: replace the existing index with the new one.
+
+        Raises:
+            Error: If an index with the specified name already exists for the table and `if_exists='error'`, or if
+                the expression is not valid for the given index type.
+
+        Examples:
+            Add an index on the integer value of a JSON field:
+
+            >>> tbl.add_index(tbl.meta.count.astype(pxt.Int), idx_name='count_idx')
+
+            Add a GIN index on the `meta` column, referenced by name:
+
+            >>> tbl.add_index('meta', index_type='gin')
+        """
+        from pixeltable.catalog import Catalog
+
+        if index_type not in ('btree', 'gin'):
+            raise excs.Error(f"Invalid index type {index_type!r}; must be one of 'btree' or 'gin'")
+
+        with Catalog.get().begin_xact(tbl=self._tbl_version_path, for_write=True, lock_mutable_tree=True):
+            self.__check_mutable('add an index to')
+            if isinstance(expr, str):
+                expr = ColumnRef(self._resolve_column_parameter(expr))
+            if not isinstance(expr, exprs.Expr):
+                raise excs.Error(f'Invalid index expression type: {type(expr)}')
+
+            if idx_name is not None and idx_name in self._tbl_version.get().idxs_by_name:
+                if_exists_ = IfExistsParam.validated(if_exists, 'if_exists')
+                if if_exists_ == IfExistsParam.ERROR:
+                    raise excs.Error(f'Duplicate index name: {idx_name}')
+                existing_idx = self._tbl_version.get().idxs_by_name[idx_name].idx
+                if not isinstance(existing_idx, (index.ExprIndex, index.JsonIndex)):
+                    raise excs.Error(
+                        f'Index `{idx_name}` is not an expression or JSON index. Cannot {if_exists_.name.lower()} it.'
+                    )
+                if if_exists_ == IfExistsParam.IGNORE:
+                    return
+                assert if_exists_ in (IfExistsParam.REPLACE, IfExistsParam.REPLACE_FORCE)
+                self.drop_index(idx_name=idx_name)
+                assert idx_name not in self._tbl_version.get().idxs_by_name
+
+            if idx_name is not None:
+                Table.validate_column_name(idx_name)
+
+            idx: index.IndexBase
+            if index_type == 'gin':
+                if not isinstance(expr, ColumnRef):
+                    raise excs.Error(f'GIN index requires a column reference, got {expr}')
+                col = self._resolve_column_parameter(expr)
+                idx = index.JsonIndex(col)
+            else:
+                if isinstance(expr, ColumnRef):
+                    raise excs.Error(
+                        f'Column {expr.col.name!r}: B-tree indices on columns are created automatically; '
+                        'add_index() requires an expression'
+                    )
+                if not expr.is_bound_by([self._tbl_version_path]):
+                    raise excs.Error(f'Index expression {expr} references columns not in {self._display_str()}')
+                cols = {col_ref.col for col_ref in expr.subexprs(ColumnRef)}
+                if len(cols) != 1:
+                    raise excs.Error(f'Index expression {expr} needs to reference exactly one column')
+                if any(
+                    isinstance(e, exprs.FunctionCall) and (e.is_agg_fn_call or e.is_window_fn_call)
+                    for e in expr.subexprs()
+                ):
+                    raise excs.Error(f'Index expression {expr} cannot contain aggregate or window functions')
+                col = next(iter(cols))
+                idx = index.ExprIndex(col, expr)
+
+            _ = self._tbl_version.get().add_index(col, idx_name=idx_name, idx=idx)
+            FileCache.get().emit_eviction_warnings()
+
     def add_embedding_index(
         self,
         column: str | ColumnRef,
@@ -1227,7 +1342,7 @@ class Table(SchemaObject):
         if (column is None) == (idx_name is None):
             raise excs.Error("Exactly one of 'column' or 'idx_name' must be provided")
 
-        with Catalog.get().begin_xact(tbl=self._tbl_version_path, for_write=True, lock_mutable_tree=False):
+        with Catalog.get().begin_xact(tbl=self._tbl_version_path, for_write=True, lock_mutable_tree=True):
             col: Column = None
             if idx_name is None:
                 col = self._resolve_column_parameter(column)
@@ -1508,6 +1623,7 @@ class Table(SchemaObject):
         where: 'exprs.Expr' | None = None,
         errors_only: bool = False,
         cascade: bool = True,
+        batch_mode: bool = False,
     ) -> UpdateStatus:
         """Recompute the values in one or more computed columns of this table.
 
@@ -1517,6 +1633,8 @@ class Table(SchemaObject):
             errors_only: If True, only run the recomputation for rows that have errors in the column (ie, the column's
                 `errortype` property indicates that an error occurred). Only allowed for recomputing a single column.
             cascade: if True, also update all computed columns that transitively depend on the recomputed columns.
+            batch_mode: If True, execute the calls of udfs that support it through the provider's batch API (see
+                [`add_computed_column()`][pixeltable.Table.add_computed_column]).
 
         Examples:
             Recompute computed columns `c1` and `c2` for all rows in this table, and everything that transitively
@@ -1573,7 +1691,7 @@ class Table(SchemaObject):
                 raise excs.Error(f"'where' ({where}) not bound by {self._display_str()}")
 
             result = self._tbl_version.get().recompute_columns(
-                col_names, where=where, errors_only=errors_only, cascade=cascade
+                col_names, where=where, errors_only=errors_only, cascade=cascade, batch_mode=batch_mode
             )
             FileCache.get().emit_eviction_warnings()
             return result
@@ -1609,6 +1727,31 @@ class Table(SchemaObject):
             # remove cached md in order to force a reload on the next operation
             self._tbl_version_path.clear_cached_md()
 
+    def compact_storage(self) -> 'pxt.CompactionStatus':
+        """
+        Compacts the files that hold this table's large arrays, as well as the arrays and images embedded in its JSON
+        columns.
+
+        Files that aren't referenced by any version of the table are deleted. The contents of sparsely populated files
+        and of small files (as created by many small inserts) are copied into new, dense files, after which the old
+        files are deleted. Rows are updated in transactions of bounded size, so that the table remains accessible
+        during compaction.
+
+        Returns:
+            A [`CompactionStatus`][pixeltable.CompactionStatus] object with the amount of storage reclaimed and the
+            read amplification before and after compaction.
+
+        Examples:
+            >>> status = tbl.compact_storage()
+            ... print(status.bytes_reclaimed)
+        """
+        from pixeltable.catalog import Catalog
+        from pixeltable.exec.inlined_obj_compaction import InlinedObjectCompactor
+
+        with Catalog.get().begin_xact(tbl=self._tbl_version_path, for_write=False):
+            self.__check_mutable('compact the storage of')
+        return InlinedObjectCompactor(self._tbl_version_path).run()
+
     def external_stores(self) -> list[str]:
         return list(self._tbl_version.get().external_stores.keys())
 
@@ -19,6 +19,7 @@ from pixeltable import exprs, index
 from pixeltable.env import Env
 from pixeltable.iterators import ComponentIterator
 from pixeltable.metadata import schema
+from pixeltable.utils import media_blobs
 from pixeltable.utils.filecache import FileCache
 from pixeltable.utils.object_stores import ObjectOps
 
@@ -86,6 +87,7 @@ class TableVersion:
     iterator_cls: Optional[type[ComponentIterator]]
     iterator_args: Optional[exprs.InlineDict]
     num_iterator_cols: int
+    iterator_pos_state_col: Optional[Column]  # stores the pos_state() of the iterator; see ViewMd
 
     # target for data operation propagation (only set for non-snapshots, and only records non-snapshot views)
     mutable_views: frozenset[TableVersionHandle]
@@ -180,6 +182,7 @@ class TableVersion:
         self.cols = []
         self.cols_by_name = {}
         self.cols_by_id = {}
+        self.iterator_pos_state_col = None
         self.idxs_by_name = {}
         self.external_stores = {}
 
@@ -227,9 +230,14 @@ class TableVersion:
         for pos, col in enumerate(cols):
             col.id = pos
             col.schema_version_add = 0
-            cols_by_name[col.name] = col
             if col.is_computed:
                 col.check_value_expr()
+            if col.name is None:
+                # a hidden column
+                col_md, _ = col.to_md()
+                column_md[col.id] = col_md
+                continue
+            cols_by_name[col.name] = col
             col_md, sch_md = col.to_md(pos)
             assert sch_md is not None
             column_md[col.id] = col_md
@@ -387,6 +395,7 @@ class TableVersion:
         #         self.base.get().mutable_views.remove(TableVersionHandle.create(self))
 
         self.delete_media()
+        media_blobs.release_table(self.id)
         FileCache.get().clear(tbl_id=self.id)
         self.store_tbl.drop()
 
@@ -447,6 +456,9 @@ class TableVersion:
             # if not self.is_snapshot and col_md.value_expr is not None:
             #     self._record_refd_columns(col)
 
+        if self.view_md is not None and self.view_md.iterator_pos_state_col_id is not None:
+            self.iterator_pos_state_col = self.cols_by_id[self.view_md.iterator_pos_state_col_id]
+
     def _init_idxs(self) -> None:
         # self.idx_md = tbl_md.index_md
         self.idxs_by_name = {}
@@ -475,7 +487,8 @@ class TableVersion:
             # fix up the sa column type of the index value and undo columns
             val_col = self.cols_by_id[md.index_val_col_id]
             val_col.sa_col_type = idx.index_sa_type()
-            val_col._stores_cellmd = False
+            # expression indices record the rows for which the indexed expression failed
+            val_col._stores_cellmd = isinstance(idx, index_module.ExprIndex)
             undo_col = self.cols_by_id[md.index_val_undo_col_id]
             undo_col.sa_col_type = idx.index_sa_type()
             undo_col._stores_cellmd = False
@@ -613,6 +626,9 @@ class TableVersion:
         # TODO support on_error='abort' for indices; it's tricky because of the way metadata changes are entangled
         # with the database operations
         status = self._add_columns([val_col, undo_vol], print_stats=False, on_error='ignore')
+        if isinstance(idx, index.ExprIndex):
+            # only the value column is computed
+            idx.has_value_errors = status.num_excs > 0
         # now create the index structure
         self._create_index(col, val_col, undo_vol, idx_name, idx)
         return status
@@ -638,7 +654,7 @@ class TableVersion:
         _logger.info(f'Dropped index {idx_md.name} on table {self.name}')
 
     def add_columns(
-        self, cols: Iterable[Column], print_stats: bool, on_error: Literal['abort', 'ignore']
+        self, cols: Iterable[Column], print_stats: bool, on_error: Literal['abort', 'ignore'], batch_mode: bool = False
     ) -> UpdateStatus:
         """Adds columns to the table."""
         assert self.is_mutable
@@ -663,7 +679,7 @@ class TableVersion:
                 all_cols.append(val_col)
                 all_cols.append(undo_col)
         # Add all columns
-        status = self._add_columns(all_cols, print_stats=print_stats, on_error=on_error)
+        status = self._add_columns(all_cols, print_stats=print_stats, on_error=on_error, batch_mode=batch_mode)
         # Create indices and their md records
         for col, (idx, val_col, undo_col) in index_cols.items():
             self._create_index(col, val_col, undo_col, idx_name=None, idx=idx)
@@ -680,7 +696,7 @@ class TableVersion:
         return status
 
     def _add_columns(
-        self, cols: Iterable[Column], print_stats: bool, on_error: Literal['abort', 'ignore']
+        self, cols: Iterable[Column], print_stats: bool, on_error: Literal['abort', 'ignore'], batch_mode: bool = False
     ) -> UpdateStatus:
         """Add and populate columns within the current transaction"""
         from pixeltable.catalog import Catalog
@@ -724,8 +740,13 @@ class TableVersion:
                 continue
 
             # populate the column
+            if batch_mode:
+                self._submit_batch_requests(Planner.create_add_column_plan(self.path, col))
             plan = Planner.create_add_column_plan(self.path, col)
             plan.ctx.num_rows = row_count
+            plan.ctx.batch_mode = batch_mode
+            if print_stats:
+                plan.ctx.enable_profile()
             try:
                 plan.open()
                 try:
@@ -743,12 +764,12 @@ class TableVersion:
                 computed_values += plan.ctx.num_computed_exprs * row_count
             finally:
                 plan.close()
+            if print_stats:
+                # each column is populated by its own plan
+                plan.ctx.print_profile(num_rows=row_count)
 
         Catalog.get().record_column_dependencies(self)
 
-        if print_stats:
-            plan.ctx.profile.print(num_rows=row_count)
-
         # TODO: what to do about system columns with exceptions?
         row_counts = RowCountStats(
             upd_rows=row_count, num_excs=num_excs, computed_values=computed_values
@@ -896,11 +917,16 @@ class TableVersion:
         """Insert rows produced by exec_plan and propagate to views"""
         # we're creating a new version
         self.bump_version(timestamp, bump_schema_version=False)
+        if print_stats:
+            exec_plan.ctx.enable_profile()
         cols_with_excs, row_counts = self.store_tbl.insert_rows(
             exec_plan, v_min=self.version, rowids=rowids, abort_on_exc=abort_on_exc
         )
+        self._record_index_value_errors(cols_with_excs)
         result = UpdateStatus(
-            cols_with_excs=[f'{self.name}.{self.cols_by_id[cid].name}' for cid in cols_with_excs],
+            cols_with_excs=[
+                f'{self.name}.{self.cols_by_id[cid].name}' for cid in cols_with_excs if self.cols_by_id[cid].name
+            ],
             row_count_stats=row_counts,
         )
 
@@ -916,7 +942,7 @@ class TableVersion:
         self.update_status = result
         self._write_md(new_version=True, new_schema_version=False)
         if print_stats:
-            exec_plan.ctx.profile.print(num_rows=result.num_rows)
+            exec_plan.ctx.print_profile(num_rows=result.num_rows)
         _logger.info(f'TableVersion {self.name}: new version {self.version}')
         return result
 
@@ -1044,8 +1070,46 @@ class TableVersion:
 
         return update_targets
 
+    @staticmethod
+    def _submit_batch_requests(plan: exec.ExecNode) -> None:
+        """
+        Submission pass of a batch-mode backfill: evaluates plan only up to the submission of the batch API requests
+        of all rows (see BatchApiScheduler), so that the backfill itself (with a separate plan) finds them in the
+        request journal and doesn't need to submit them in chunks that are limited by the rows it buffers.
+
+        The pass is skipped if the arguments of the batched calls depend on other remote calls, which would otherwise
+        be made twice.
+        """
+        batch_calls = [
+            e
+            for e in plan.row_builder.unique_exprs
+            if isinstance(e, exprs.FunctionCall) and e.batch_resource_pool is not None
+        ]
+        if len(batch_calls) == 0:
+            return
+        for call in batch_calls:
+            for arg in call.subexprs(expr_class=exprs.FunctionCall):
+                if arg is not call and arg.resource_pool is not None and arg.batch_resource_pool is None:
+                    return
+        plan.ctx.batch_mode = True
+        plan.ctx.batch_submit_only = True
+        plan.ctx.show_pbar = False
+        # the rows are completed with an exception once their requests have been submitted
+        plan.ctx.ignore_errors = True
+        plan.open()
+        try:
+            for _ in plan:
+                pass
+        finally:
+            plan.close()
+
     def recompute_columns(
-        self, col_names: list[str], where: exprs.Expr | None = None, errors_only: bool = False, cascade: bool = True
+        self,
+        col_names: list[str],
+        where: exprs.Expr | None = None,
+        errors_only: bool = False,
+        cascade: bool = True,
+        batch_mode: bool = False,
     ) -> UpdateStatus:
         from pixeltable.exprs import CompoundPredicate, SqlElementCache
         from pixeltable.plan import Planner
@@ -1069,6 +1133,16 @@ class TableVersion:
         plan, updated_cols, recomputed_cols = Planner.create_update_plan(
             self.path, update_targets={}, recompute_targets=target_columns, where_clause=where_clause, cascade=cascade
         )
+        plan.ctx.batch_mode = batch_mode
+        if batch_mode:
+            submit_plan, _, _ = Planner.create_update_plan(
+                self.path,
+                update_targets={},
+                recompute_targets=target_columns,
+                where_clause=where_clause,
+                cascade=cascade,
+            )
+            self._submit_batch_requests(submit_plan)
 
         result = self.propagate_update(
             plan,
@@ -1078,6 +1152,7 @@ class TableVersion:
             timestamp=time.time(),
             cascade=cascade,
             show_progress=True,
+            batch_mode=batch_mode,
         )
         result += UpdateStatus(updated_cols=updated_cols)
         return result
@@ -1091,6 +1166,7 @@ class TableVersion:
         timestamp: float,
         cascade: bool,
         show_progress: bool = True,
+        batch_mode: bool = False,
     ) -> UpdateStatus:
         from pixeltable.catalog import Catalog
         from pixeltable.plan import Planner
@@ -1103,9 +1179,12 @@ class TableVersion:
             cols_with_excs, row_counts = self.store_tbl.insert_rows(
                 plan, v_min=self.version, show_progress=show_progress
             )
+            self._record_index_value_errors(cols_with_excs)
             result += UpdateStatus(
                 row_count_stats=row_counts.insert_to_update(),
-                cols_with_excs=[f'{self.name}.{self.cols_by_id[cid].name}' for cid in cols_with_excs],
+                cols_with_excs=[
+                    f'{self.name}.{self.cols_by_id[cid].name}' for cid in cols_with_excs if self.cols_by_id[cid].name
+                ],
             )
             self.store_tbl.delete_rows(
                 self.version, base_versions=base_versions, match_on_vmin=True, where_clause=where_clause
@@ -1119,8 +1198,19 @@ class TableVersion:
                 plan = None
                 if len(recomputed_cols) > 0:
                     plan = Planner.create_view_update_plan(view.get().path, recompute_targets=recomputed_cols)
+                    plan.ctx.batch_mode = batch_mode
+                    if batch_mode:
+                        self._submit_batch_requests(
+                            Planner.create_view_update_plan(view.get().path, recompute_targets=recomputed_cols)
+                        )
                 status = view.get().propagate_update(
-                    plan, None, recomputed_view_cols, base_versions=base_versions, timestamp=timestamp, cascade=True
+                    plan,
+                    None,
+                    recomputed_view_cols,
+                    base_versions=base_versions,
+                    timestamp=timestamp,
+                    cascade=True,
+                    batch_mode=batch_mode,
                 )
                 result += status.to_cascade()
         if create_new_table_version:
@@ -1128,6 +1218,14 @@ class TableVersion:
             self._write_md(new_version=True, new_schema_version=False)
         return result
 
+    def _record_index_value_errors(self, cols_with_excs: set[int]) -> None:
+        """Record in the index metadata that the indexed expression failed, if its value column has errors"""
+        for idx_info in self.idxs_by_name.values():
+            idx = idx_info.idx
+            if isinstance(idx, index.ExprIndex) and not idx.has_value_errors and idx_info.val_col.id in cols_with_excs:
+                idx.has_value_errors = True
+                self._tbl_md.index_md[idx_info.id].init_args = idx.as_dict()
+
     def _validate_where_clause(self, pred: exprs.Expr, error_prefix: str) -> None:
         """Validates that pred can be expressed as a SQL Where clause"""
         assert self.is_insertable
@@ -1299,6 +1397,7 @@ class TableVersion:
         # Do this at the end, after all DB operations have completed.
         # TODO: The transaction could still fail. Really this should be done via PendingTableOps.
         self.delete_media(tbl_version=old_version)
+        media_blobs.release_table(self.id, tbl_version=old_version)
         _logger.info(f'TableVersion {self.name}: reverted to version {self.version}')
 
     def _init_external_stores(self) -> None:
@@ -189,3 +189,52 @@ class UpdateStatus:
     def ext_num_rows(self) -> int:
         """Total number of rows affected in an external store."""
         return self.ext_row_count_stats.num_rows
+
+
+@dataclass(frozen=True)
+class CompactionStatus:
+    """
+    Information about the result of compacting the files that hold a table's externally stored arrays and the images
+    and arrays embedded in its JSON cells.
+    """
+
+    num_files_before: int = 0
+    """Number of files before compaction."""
+    num_files_after: int = 0
+    """Number of files after compaction."""
+    bytes_before: int = 0
+    """Total size of the files before compaction."""
+    bytes_after: int = 0
+    """Total size of the files after compaction."""
+    live_bytes: int = 0
+    """Total size of the objects referenced by the table (in any version)."""
+    num_deleted_files: int = 0
+    """Number of deleted files (unreferenced and rewritten files)."""
+    num_rewritten_cells: int = 0
+    """Number of cells whose objects were copied to new files."""
+    referenced_bytes_before: int = 0
+    """Total size of the files referenced by the table before compaction."""
+    referenced_bytes_after: int = 0
+    """Total size of the files referenced by the table after compaction."""
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        """Storage space reclaimed by compaction."""
+        return self.bytes_before - self.bytes_after
+
+    @property
+    def read_amplification_before(self) -> float:
+        """Ratio of the size of the files that need to be read to access all live objects to their size."""
+        return self.referenced_bytes_before / self.live_bytes if self.live_bytes > 0 else 1.0
+
+    @property
+    def read_amplification_after(self) -> float:
+        """Read amplification after compaction."""
+        return self.referenced_bytes_after / self.live_bytes if self.live_bytes > 0 else 1.0
+
+    def _repr_pretty_(self, p: 'RepresentationPrinter', cycle: bool) -> None:
+        p.text(
+            f'{self.num_files_before} files ({self.bytes_before} bytes) compacted into {self.num_files_after} files '
+            f'({self.bytes_after} bytes); {self.bytes_reclaimed} bytes reclaimed, read amplification '
+            f'{self.read_amplification_before:.2f} -> {self.read_amplification_after:.2f}.'
+        )
@@ -129,6 +129,7 @@ class View(Table):
                     f'base {base.tbl_name()}'
                 )
 
+        pos_state_col: Optional[Column] = None
         if iterator_cls is not None:
             assert iterator_args is not None
 
@@ -176,6 +177,10 @@ class View(Table):
                         f'Duplicate name: column {col.name!r} is already present in the iterator output schema'
                     )
             columns = iterator_cols + columns
+            if iterator_cls.has_pos_state():
+                # a hidden column for the pos_state() of the components; it goes last, after the user columns
+                pos_state_col = Column(None, ts.JsonType(nullable=True), stored=True)
+                columns.append(pos_state_col)
 
         from pixeltable.exprs import InlineDict
 
@@ -208,6 +213,8 @@ class View(Table):
         md = TableVersion.create_initial_md(
             name, columns, num_retained_versions, comment, media_validation=media_validation, view_md=view_md
         )
+        if pos_state_col is not None:
+            view_md.iterator_pos_state_col_id = pos_state_col.id
         if md.tbl_md.is_pure_snapshot:
             # this is purely a snapshot: no store table to create or load
             return md, None
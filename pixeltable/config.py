@@ -160,17 +160,36 @@ KNOWN_CONFIG_OPTIONS = {
         'time_zone': 'Default time zone for timestamps',
         'hide_warnings': 'Hide warnings from the console',
         'verbosity': 'Verbosity level for console output',
+        'iterator_workers': 'Number of worker threads for running view iterators concurrently',
+        'array_compression': 'Compression codec for externally stored arrays (zstd or lz4)',
+        'array_float16': 'Store float arrays as float16 in compressed array files',
+        'media_dedup': 'Store media files content-addressed, so that identical files are stored only once',
+        'transfer_budget_mb': 'Maximum size in MB of the media uploads and downloads that are in flight at once',
+        'aggregation_memory_mb': 'Memory budget in MB for hash aggregation, beyond which state is spilled to disk',
+        'eval_buffer_memory_mb': 'Memory budget in MB for the rows that are buffered during expression evaluation',
+        'adaptive_max_concurrency': 'Maximum number of in-flight requests against an adaptive resource pool',
+        'shared_rate_limits': 'Split API rate limits among all processes that use the same Pixeltable database',
         'api_key': 'API key for Pixeltable cloud',
         'r2_profile': 'AWS config profile name used to access R2 storage',
         's3_profile': 'AWS config profile name used to access S3 storage',
         'b2_profile': 'S3-compatible profile name used to access Backblaze B2 storage',
     },
     'anthropic': {'api_key': 'Anthropic API key'},
+    'b2': {
+        'upload_part_size_mb': 'Part size in MB for multipart uploads to Backblaze B2',
+        'upload_concurrency': 'Number of parts of a multipart upload to Backblaze B2 that are uploaded concurrently',
+    },
     'bedrock': {'api_key': 'AWS Bedrock API key'},
     'deepseek': {'api_key': 'Deepseek API key', 'rate_limit': 'Rate limit for Deepseek API requests'},
     'fireworks': {'api_key': 'Fireworks API key', 'rate_limit': 'Rate limit for Fireworks API requests'},
     'gemini': {'api_key': 'Gemini API key', 'rate_limits': 'Per-model rate limits for Gemini API requests'},
     'hf': {'auth_token': 'Hugging Face access token'},
+    'http': {
+        'max_connections': 'Maximum number of connections of the HTTP client used to fetch media files',
+        'max_connections_per_host': 'Maximum number of concurrent requests per host when fetching media files',
+        'http2': 'Use HTTP/2 to fetch media files (requires the h2 package)',
+        'revalidate_after_s': 'Revalidate cached HTTP media files with a conditional GET after this many seconds',
+    },
     'imagen': {'rate_limits': 'Per-model rate limits for Imagen API requests'},
     'veo': {'rate_limits': 'Per-model rate limits for Veo API requests'},
     'groq': {'api_key': 'Groq API key', 'rate_limit': 'Rate limit for Groq API requests'},
@@ -188,7 +207,15 @@ KNOWN_CONFIG_OPTIONS = {
         'app_name': 'Optional name for your application (for OpenRouter analytics)',
         'rate_limit': 'Rate limit for OpenRouter API requests',
     },
+    'r2': {
+        'upload_part_size_mb': 'Part size in MB for multipart uploads to Cloudflare R2',
+        'upload_concurrency': 'Number of parts of a multipart upload to Cloudflare R2 that are uploaded concurrently',
+    },
     'replicate': {'api_token': 'Replicate API token'},
+    's3': {
+        'upload_part_size_mb': 'Part size in MB for multipart uploads to Amazon S3',
+        'upload_concurrency': 'Number of parts of a multipart upload to Amazon S3 that are uploaded concurrently',
+    },
     'together': {
         'api_key': 'Together API key',
         'rate_limits': 'Per-model category rate limits for Together API requests',
@@ -1228,7 +1228,7 @@ class DataFrame:
             return self._first_tbl.tbl_version.get().update(value_spec, where=self.where_clause, cascade=cascade)
 
     def recompute_columns(
-        self, *columns: str | exprs.ColumnRef, errors_only: bool = False, cascade: bool = True
+        self, *columns: str | exprs.ColumnRef, errors_only: bool = False, cascade: bool = True, batch_mode: bool = False
     ) -> UpdateStatus:
         """Recompute one or more computed columns of the underlying table of the DataFrame.
 
@@ -1237,6 +1237,8 @@ class DataFrame:
             errors_only: If True, only run the recomputation for rows that have errors in the column (ie, the column's
                 `errortype` property indicates that an error occurred). Only allowed for recomputing a single column.
             cascade: if True, also update all computed columns that transitively depend on the recomputed columns.
+            batch_mode: If True, execute the calls of udfs that support it through the provider's batch API (see
+                [`add_computed_column()`][pixeltable.Table.add_computed_column]).
 
         Returns:
             UpdateStatus: the status of the operation.
@@ -1250,7 +1252,9 @@ class DataFrame:
         self._validate_mutable('recompute_columns', False)
         with Catalog.get().begin_xact(tbl=self._first_tbl, for_write=True, lock_mutable_tree=True):
             tbl = Catalog.get().get_table_by_id(self._first_tbl.tbl_id)
-            return tbl.recompute_columns(*columns, where=self.where_clause, errors_only=errors_only, cascade=cascade)
+            return tbl.recompute_columns(
+                *columns, where=self.where_clause, errors_only=errors_only, cascade=cascade, batch_mode=batch_mode
+            )
 
     def delete(self) -> UpdateStatus:
         """Delete rows form the underlying table of the DataFrame.
@@ -37,6 +37,7 @@ from pixeltable import exceptions as excs
 from pixeltable.config import Config
 from pixeltable.utils.console_output import ConsoleLogger, ConsoleMessageFilter, ConsoleOutputHandler, map_level
 from pixeltable.utils.dbms import CockroachDbms, Dbms, PostgresqlDbms
+from pixeltable.utils.exception_handler import run_cleanup
 from pixeltable.utils.http_server import make_server
 from pixeltable.utils.object_stores import ObjectPath, StorageObjectAddress
 
@@ -95,6 +96,7 @@ class Env:
     _current_conn: Optional[sql.Connection]
     _current_session: Optional[orm.Session]
     _current_isolation_level: Optional[Literal['REPEATABLE_READ', 'SERIALIZABLE']]
+    _on_commit_fns: list[Callable[[], None]]  # run after the current transaction has committed
     _dbms: Optional[Dbms]
     _event_loop: Optional[asyncio.AbstractEventLoop]  # event loop for ExecNode
 
@@ -161,6 +163,7 @@ class Env:
         self._current_conn = None
         self._current_session = None
         self._current_isolation_level = None
+        self._on_commit_fns = []
         self._dbms = None
         self._event_loop = None
 
@@ -256,6 +259,11 @@ class Env:
     def in_xact(self) -> bool:
         return self._current_conn is not None
 
+    def on_commit(self, fn: Callable[[], None]) -> None:
+        """Run fn after the current transaction has committed; fn is discarded if the transaction is rolled back"""
+        assert self._current_conn is not None
+        self._on_commit_fns.append(fn)
+
     @property
     def is_local(self) -> bool:
         assert self._db_url is not None  # is_local should be called only after db initialization
@@ -273,8 +281,10 @@ class Env:
         """
         if self._current_conn is None:
             assert self._current_session is None
+            on_commit_fns: list[Callable[[], None]] = []
             try:
                 self._current_isolation_level = 'SERIALIZABLE'
+                self._on_commit_fns = on_commit_fns
                 with (
                     self.engine.connect().execution_options(isolation_level=self._current_isolation_level) as conn,
                     orm.Session(conn) as session,
@@ -287,6 +297,10 @@ class Env:
                 self._current_session = None
                 self._current_conn = None
                 self._current_isolation_level = None
+                self._on_commit_fns = []
+            # we only get here if the transaction committed
+            for fn in on_commit_fns:
+                run_cleanup(fn, raise_error=False)
         else:
             assert self._current_session is not None
             assert for_write == (self._current_isolation_level == 'serializable')
@@ -767,8 +781,10 @@ class Env:
         self.__register_package('google.cloud.storage', library_name='google-cloud-storage')
         self.__register_package('google.genai', library_name='google-genai')
         self.__register_package('groq')
+        self.__register_package('h2')
         self.__register_package('huggingface_hub', library_name='huggingface-hub')
         self.__register_package('label_studio_sdk', library_name='label-studio-sdk')
+        self.__register_package('lz4')
         self.__register_package('llama_cpp', library_name='llama-cpp-python')
         self.__register_package('mcp')
         self.__register_package('mistralai')
@@ -791,6 +807,7 @@ class Env:
         self.__register_package('whisper', library_name='openai-whisper')
         self.__register_package('whisperx')
         self.__register_package('yolox', library_name='pixeltable-yolox')
+        self.__register_package('zstandard')
         self.__register_package('lancedb')
 
     def __register_package(self, package_name: str, library_name: Optional[str] = None) -> None:
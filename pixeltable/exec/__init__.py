@@ -9,6 +9,7 @@ from .data_row_batch import DataRowBatch
 from .exec_context import ExecContext
 from .exec_node import ExecNode
 from .expr_eval import ExprEvalNode
+from .hash_aggregation_node import HashAggregationNode
 from .in_memory_data_node import InMemoryDataNode
 from .object_store_save_node import ObjectStoreSaveNode
 from .row_update_node import RowUpdateNode
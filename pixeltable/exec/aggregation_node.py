@@ -61,16 +61,31 @@ class AggregationNode(ExecNode):
                 expr_msg = f'init() function of the aggregate {fn_call}'
                 raise excs.ExprEvalError(fn_call, expr_msg, exc, exc_tb, [], row_num) from exc
 
-    def _update_agg_state(self, row: exprs.DataRow, row_num: int) -> None:
+    def _update_agg_state(self, rows: list[exprs.DataRow], row_num: int) -> None:
+        """Update the agg state with consecutive rows of the current group"""
         for fn_call in self.agg_fn_calls:
+            if fn_call.is_window_fn_call or not fn_call.aggregator.has_update_batch():
+                for row in rows:
+                    self._update_fn_call(fn_call, row, row_num)
+                continue
             try:
-                fn_call.update(row)
+                fn_call.update_batch(rows)
             except Exception as exc:
                 _, _, exc_tb = sys.exc_info()
-                expr_msg = f'update() function of the aggregate {fn_call}'
-                input_vals = [row[d.slot_idx] for d in fn_call.dependencies()]
+                expr_msg = f'update_batch() function of the aggregate {fn_call}'
+                # the input values, as column vectors
+                input_vals = [[row[d.slot_idx] for row in rows] for d in fn_call.dependencies()]
                 raise excs.ExprEvalError(fn_call, expr_msg, exc, exc_tb, input_vals, row_num) from exc
 
+    def _update_fn_call(self, fn_call: exprs.FunctionCall, row: exprs.DataRow, row_num: int) -> None:
+        try:
+            fn_call.update(row)
+        except Exception as exc:
+            _, _, exc_tb = sys.exc_info()
+            expr_msg = f'update() function of the aggregate {fn_call}'
+            input_vals = [row[d.slot_idx] for d in fn_call.dependencies()]
+            raise excs.ExprEvalError(fn_call, expr_msg, exc, exc_tb, input_vals, row_num) from exc
+
     async def __aiter__(self) -> AsyncIterator[DataRowBatch]:
         prev_row: Optional[exprs.DataRow] = None
         current_group: Optional[list[Any]] = None  # the values of the group-by exprs
@@ -78,6 +93,8 @@ class AggregationNode(ExecNode):
         num_output_rows = 0
         async for row_batch in self.input:
             num_input_rows += len(row_batch)
+            # rows of current_group in this batch that haven't been passed to the aggregators yet
+            group_rows: list[exprs.DataRow] = []
             for row in row_batch:
                 group = [row[e.slot_idx] for e in self.group_by] if self.group_by is not None else None
 
@@ -87,6 +104,8 @@ class AggregationNode(ExecNode):
 
                 if group != current_group:
                     # we're entering a new group, emit a row for the previous one
+                    self._update_agg_state(group_rows, 0)
+                    group_rows = []
                     self.row_builder.eval(prev_row, self.agg_fn_eval_ctx, profile=self.ctx.profile)
                     self.output_batch.add_row(prev_row)
                     num_output_rows += 1
@@ -95,8 +114,9 @@ class AggregationNode(ExecNode):
                         return
                     current_group = group
                     self._reset_agg_state(0)
-                self._update_agg_state(row, 0)
+                group_rows.append(row)
                 prev_row = row
+            self._update_agg_state(group_rows, 0)
 
         if prev_row is not None:
             # emit the last group
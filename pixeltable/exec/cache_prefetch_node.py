@@ -4,6 +4,7 @@ import dataclasses
 import itertools
 import logging
 import threading
+import time
 import urllib.parse
 import urllib.request
 from collections import deque
@@ -14,7 +15,9 @@ from uuid import UUID
 
 from pixeltable import exceptions as excs, exprs
 from pixeltable.utils.filecache import FileCache
-from pixeltable.utils.object_stores import ObjectOps
+from pixeltable.utils.http_client import HttpValidators, http_client
+from pixeltable.utils.object_stores import ObjectOps, ObjectPath, StorageTarget
+from pixeltable.utils.transfer_budget import TransferBudget
 
 from .data_row_batch import DataRowBatch
 from .exec_node import ExecNode
@@ -25,6 +28,12 @@ _logger = logging.getLogger('pixeltable')
 class CachePrefetchNode(ExecNode):
     """Brings files with external URLs into the cache
 
+    Downloads are admitted by the process-wide TransferBudget (which is shared with ObjectStoreSaveNode); since their
+    size isn't known in advance, each one reserves TransferBudget.DEFAULT_RESERVATION bytes.
+
+    HTTP(S) URLs are fetched with the shared, pooled HttpClient. If the client is configured to revalidate cached files,
+    cached HTTP files whose validators are stale are revalidated with a conditional GET.
+
     TODO:
     - Process a row at a time and limit the number of in-flight rows to control memory usage
     - Create asyncio.Tasks to consume our input in order to increase concurrency.
@@ -48,6 +57,7 @@ class CachePrefetchNode(ExecNode):
     in_flight_rows: dict[int, CachePrefetchNode.RowState]  # rows with in-flight urls; id(row) -> RowState
     in_flight_requests: dict[futures.Future, str]  # in-flight requests for urls; future -> URL
     in_flight_urls: dict[str, list[tuple[exprs.DataRow, exprs.ColumnSlotIdx]]]  # URL -> [(row, info)]
+    revalidations: dict[str, tuple[Path, HttpValidators]]  # URL -> (cached path, validators) of in-flight URLs
     input_finished: bool
     row_idx: Iterator[Optional[int]]
 
@@ -70,6 +80,7 @@ class CachePrefetchNode(ExecNode):
         self.in_flight_rows = {}
         self.in_flight_requests = {}
         self.in_flight_urls = {}
+        self.revalidations = {}
         self.input_finished = False
         self.row_idx = itertools.count() if retain_input_order else itertools.repeat(None)
         assert self.QUEUE_DEPTH_HIGH_WATER > self.QUEUE_DEPTH_LOW_WATER
@@ -141,7 +152,8 @@ class CachePrefetchNode(ExecNode):
         file_cache = FileCache.get()
         for f in done:
             url = self.in_flight_requests.pop(f)
-            tmp_path, exc = f.result()
+            tmp_path, validators, exc = f.result()
+            revalidation = self.revalidations.pop(url, None)
             if exc is not None and not ignore_errors:
                 raise exc
             local_path: Optional[Path] = None
@@ -149,8 +161,14 @@ class CachePrefetchNode(ExecNode):
                 # register the file with the cache for the first column in which it's missing
                 assert url in self.in_flight_urls
                 _, info = self.in_flight_urls[url][0]
-                local_path = file_cache.add(info.col.tbl.id, info.col.id, url, tmp_path)
+                local_path = file_cache.add(info.col.tbl.id, info.col.id, url, tmp_path, validators=validators)
                 _logger.debug(f'cached {url} as {local_path}')
+            elif exc is None:
+                # the cached file is still valid
+                assert revalidation is not None
+                local_path, old_validators = revalidation
+                file_cache.set_validators(url, old_validators._replace(validated_at=time.time()))
+                _logger.debug(f'revalidated cached {url}')
 
             # add the local path/exception to the slots that reference the url
             for row, info in self.in_flight_urls.pop(url):
@@ -193,6 +211,10 @@ class CachePrefetchNode(ExecNode):
                     continue
 
                 local_path = file_cache.lookup(url)
+                validators = file_cache.validators(url) if local_path is not None else None
+                if local_path is not None and validators is not None and http_client().needs_revalidation(validators):
+                    self.revalidations[url] = (local_path, validators)
+                    local_path = None
                 if local_path is None:
                     cache_misses.append(url)
                     self.in_flight_urls[url] = [(row, info)]
@@ -209,12 +231,18 @@ class CachePrefetchNode(ExecNode):
 
         _logger.debug(f'submitting {len(cache_misses)} urls')
         for url in cache_misses:
-            f = executor.submit(self.__fetch_url, url)
+            revalidation = self.revalidations.get(url)
+            f = executor.submit(self.__fetch_url, url, None if revalidation is None else revalidation[1])
             _logger.debug(f'submitted {url} for idx {url_pos[url]}')
             self.in_flight_requests[f] = url
 
-    def __fetch_url(self, url: str) -> tuple[Optional[Path], Optional[Exception]]:
-        """Fetches a remote URL into the TempStore and returns its path"""
+    def __fetch_url(
+        self, url: str, validators: Optional[HttpValidators]
+    ) -> tuple[Optional[Path], Optional[HttpValidators], Optional[Exception]]:
+        """
+        Fetches a remote URL into the TempStore and returns its path and HTTP validators. If validators are given, the
+        fetch is conditional, and the returned path is None if the cached file is still valid.
+        """
         from pixeltable.utils.local_store import TempStore
 
         _logger.debug(f'fetching url={url} thread_name={threading.current_thread().name}')
@@ -230,11 +258,19 @@ class CachePrefetchNode(ExecNode):
         tmp_path = TempStore.create_path(extension=extension)
         try:
             _logger.debug(f'Downloading {url} to {tmp_path}')
-            ObjectOps.copy_object_to_local_file(url, tmp_path)
+            new_validators: Optional[HttpValidators] = None
+            with TransferBudget.get().reserve():
+                soa = ObjectPath.parse_object_storage_addr(url, may_contain_object_name=True)
+                if soa.storage_target == StorageTarget.HTTP_STORE:
+                    new_validators = http_client().download(url, tmp_path, validators)
+                    if new_validators is None:
+                        return None, None, None
+                else:
+                    ObjectOps.copy_object_to_local_file(url, tmp_path)
             _logger.debug(f'Downloaded {url} to {tmp_path}')
-            return tmp_path, None
+            return tmp_path, new_validators, None
         except Exception as e:
             # we want to add the file url to the exception message
             exc = excs.Error(f'Failed to download {url}: {e}')
             _logger.debug(f'Failed to download {url}: {e}', exc_info=e)
-            return None, exc
+            return None, None, exc
@@ -14,7 +14,9 @@ import sqlalchemy as sql
 import pixeltable.type_system as ts
 import pixeltable.utils.image as image_utils
 from pixeltable import catalog, exprs
+from pixeltable.config import Config
 from pixeltable.env import Env
+from pixeltable.utils.array_segment import ArraySegmentWriter, new_segment_path, segment_id, validate_codec
 from pixeltable.utils.local_store import LocalStore
 
 from .data_row_batch import DataRowBatch
@@ -36,6 +38,9 @@ class CellMaterializationNode(ExecNode):
     - Bool arrays are stored as packed bits (uint8)
     - cell_md: holds the url of the file, plus start and end offsets, plus bool flag and shape for bool arrays
       (this allows us to query cell_md to get the total external storage size of an array column)
+    - if the array_compression config option is set, larger arrays are instead written to compressed segment files
+      (see utils.array_segment), one per column and batch; cell_md then only holds the id of the segment file and
+      the index of the array within it
 
     Json values:
     - Inlined images and arrays are written to inlined_obj_files and replaced with a dict containing the object
@@ -54,6 +59,9 @@ class CellMaterializationNode(ExecNode):
     # execution state
     inlined_obj_files: list[Path]  # only [-1] is open for writing
     buffered_writer: io.BufferedWriter | None  # BufferedWriter for inlined_obj_files[-1]
+    array_compression: str | None  # codec for array segment files; None: use the uncompressed .npy layout
+    array_float16: bool  # downcast float arrays to float16 in segment files
+    segment_writers: dict[catalog.Column, ArraySegmentWriter]  # segment files of the current batch
 
     MIN_FILE_SIZE = 8 * 2**20  # 8MB
     MAX_DB_ARRAY_SIZE = 512  # max size of array stored in table column; in bytes
@@ -67,6 +75,11 @@ class CellMaterializationNode(ExecNode):
         }
         self.inlined_obj_files = []
         self.buffered_writer = None
+        self.array_compression = Config.get().get_string_value('array_compression')
+        if self.array_compression is not None:
+            validate_codec(self.array_compression)
+        self.array_float16 = Config.get().get_bool_value('array_float16') or False
+        self.segment_writers = {}
 
     async def __aiter__(self) -> AsyncIterator[DataRowBatch]:
         async for batch in self.input:
@@ -95,6 +108,9 @@ class CellMaterializationNode(ExecNode):
                     # continue with only the currently open file
                     self.inlined_obj_files = self.inlined_obj_files[-1:]
 
+            for writer in self.segment_writers.values():
+                writer.close()
+            self.segment_writers.clear()
             yield batch
 
         self._flush_buffer(finalize=True)
@@ -109,6 +125,9 @@ class CellMaterializationNode(ExecNode):
             # there must have been an error, otherwise _flush_full_buffer(finalize=True) would have set this to None
             self.buffered_writer.close()
             self.buffered_writer = None
+        for writer in self.segment_writers.values():
+            writer.abort()
+        self.segment_writers.clear()
 
     def _materialize_json_cell(self, row: exprs.DataRow, col: catalog.Column, val: Any) -> None:
         if self._json_has_inlined_objs(val):
@@ -129,6 +148,17 @@ class CellMaterializationNode(ExecNode):
             np.save(buffer, val, allow_pickle=False)
             row.cell_vals[col.id] = buffer.getvalue()
             row.cell_md[col.id] = None
+        elif self.array_compression is not None:
+            writer = self.segment_writers.get(col)
+            if writer is None:
+                local_path = new_segment_path(col.tbl.id, col.tbl.version)
+                writer = ArraySegmentWriter(local_path, self.array_compression, float16=self.array_float16)
+                self.segment_writers[col] = writer
+            segment_idx = writer.append(val)
+            row.cell_vals[col.id] = None
+            row.cell_md[col.id] = exprs.CellMd(
+                array_md=exprs.ArrayMd(segment_id=segment_id(writer.path), segment_idx=segment_idx)
+            )
         else:
             # append this array to the buffer and store its location in the cell md
             ar: np.ndarray
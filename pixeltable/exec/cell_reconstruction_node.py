@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import io
 import logging
+import mmap
 from pathlib import Path
 from typing import Any, AsyncIterator
 
@@ -11,6 +12,7 @@ import PIL.Image
 import pixeltable.type_system as ts
 from pixeltable import exprs
 from pixeltable.utils import parse_local_file_path
+from pixeltable.utils.array_segment import ArraySegmentReader, segment_path
 
 from .data_row_batch import DataRowBatch
 from .exec_node import ExecNode
@@ -30,50 +32,108 @@ def json_has_inlined_objs(element: Any) -> bool:
     return False
 
 
-def reconstruct_json(element: Any, urls: list[str], file_handles: dict[Path, io.BufferedReader]) -> Any:
+class MappedFiles:
+    """
+    Read-only memory maps of the files produced by CellMaterializationNode, each of which is mapped on first access.
+
+    Arrays are returned as read-only views into the mapped file (no copying), which is what queries return to the user
+    and pass to udfs; the mapping stays alive as long as any of those arrays is referenced, even after clear().
+    """
+
+    maps: dict[Path, mmap.mmap]
+    segments: dict[Path, ArraySegmentReader]
+
+    # the maximum size of an .npy header we need to read in order to locate the array data
+    NPY_HEADER_READ_SIZE = 4096
+
+    def __init__(self) -> None:
+        self.maps = {}
+        self.segments = {}
+
+    def get(self, path: Path) -> mmap.mmap:
+        mm = self.maps.get(path)
+        if mm is None:
+            with open(path, 'rb') as fp:
+                mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[path] = mm
+        return mm
+
+    def load_array(
+        self, path: Path, start: int, end: int, is_bool_array: bool, shape: tuple[int, ...] | None
+    ) -> np.ndarray | exprs.PackedBoolArray:
+        """
+        Returns a read-only view of the array stored in the given section of the file. Bool arrays are returned in
+        packed form, to be unpacked on first access by DataRow (or with unpack()).
+        """
+        mm = self.get(path)
+        header = io.BytesIO(mm[start : min(end, start + self.NPY_HEADER_READ_SIZE)])
+        version = np.lib.format.read_magic(header)
+        if version == (1, 0):
+            ar_shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+        else:
+            ar_shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+        count = int(np.prod(ar_shape))
+        data_start = start + header.tell()
+        assert data_start + count * dtype.itemsize == end
+        ar = np.frombuffer(mm, dtype=dtype, count=count, offset=data_start)
+        ar = ar.reshape(ar_shape, order='F' if fortran_order else 'C')
+        if is_bool_array:
+            assert shape is not None
+            return exprs.PackedBoolArray(ar, shape)
+        return ar
+
+    def segment(self, path: Path) -> ArraySegmentReader:
+        reader = self.segments.get(path)
+        if reader is None:
+            reader = ArraySegmentReader(self.get(path))
+            self.segments[path] = reader
+        return reader
+
+    def load_segment_array(self, path: Path, segment_idx: int) -> np.ndarray:
+        """Returns the array stored at the given index of the segment file."""
+        return self.segment(path).read(segment_idx)
+
+    def read_bytes(self, path: Path, start: int, end: int) -> bytes:
+        return self.get(path)[start:end]
+
+    def clear(self) -> None:
+        # we don't close the maps: arrays returned by load_array() might still reference them
+        self.maps.clear()
+        self.segments.clear()
+
+
+def reconstruct_json(element: Any, urls: list[str], files: MappedFiles) -> Any:
     """Recursively reconstructs inlined objects in a json structure."""
     if isinstance(element, list):
-        return [reconstruct_json(v, urls, file_handles) for v in element]
+        return [reconstruct_json(v, urls, files) for v in element]
     if isinstance(element, dict):
         if INLINED_OBJECT_MD_KEY in element:
             obj_md = InlinedObjectMd.from_dict(element[INLINED_OBJECT_MD_KEY])
             url = urls[obj_md.url_idx]
             local_path = parse_local_file_path(url)
-            if local_path not in file_handles:
-                file_handles[local_path] = open(local_path, 'rb')  # noqa: SIM115
-            fp = file_handles[local_path]
+            assert local_path is not None
 
             if obj_md.type == ts.ColumnType.Type.ARRAY.name:
-                fp.seek(obj_md.array_md.start)
-                ar = load_array(
-                    fp, obj_md.array_md.start, obj_md.array_md.end, obj_md.array_md.is_bool, obj_md.array_md.shape
+                assert obj_md.array_md.start is not None and obj_md.array_md.end is not None
+                ar = files.load_array(
+                    local_path,
+                    obj_md.array_md.start,
+                    obj_md.array_md.end,
+                    obj_md.array_md.is_bool,
+                    obj_md.array_md.shape,
                 )
-                return ar
+                # arrays nested in json values aren't accessed through a DataRow slot
+                return ar.unpack() if isinstance(ar, exprs.PackedBoolArray) else ar
             else:
-                fp.seek(obj_md.img_start)
-                bytesio = io.BytesIO(fp.read(obj_md.img_end - obj_md.img_start))
+                bytesio = io.BytesIO(files.read_bytes(local_path, obj_md.img_start, obj_md.img_end))
                 img = PIL.Image.open(bytesio)
                 img.load()
-                assert fp.tell() == obj_md.img_end, f'{fp.tell()} != {obj_md.img_end} / {obj_md.img_start}'
                 return img
         else:
-            return {k: reconstruct_json(v, urls, file_handles) for k, v in element.items()}
+            return {k: reconstruct_json(v, urls, files) for k, v in element.items()}
     return element
 
 
-def load_array(
-    fh: io.BufferedReader, start: int, end: int, is_bool_array: bool, shape: tuple[int, ...] | None
-) -> np.ndarray:
-    """Loads an array from a section of a file."""
-    fh.seek(start)
-    ar = np.load(fh, allow_pickle=False)
-    assert fh.tell() == end
-    if is_bool_array:
-        assert shape is not None
-        ar = np.unpackbits(ar, count=np.prod(shape)).reshape(shape).astype(bool)
-    return ar
-
-
 class CellReconstructionNode(ExecNode):
     """
     Reconstruction of stored json and array cells that were produced by CellMaterializationNode.
@@ -81,7 +141,7 @@ class CellReconstructionNode(ExecNode):
 
     json_refs: list[exprs.ColumnRef]
     array_refs: list[exprs.ColumnRef]
-    file_handles: dict[Path, io.BufferedReader]  # key: file path
+    files: MappedFiles
 
     def __init__(
         self,
@@ -93,10 +153,12 @@ class CellReconstructionNode(ExecNode):
         super().__init__(row_builder, [], [], input)
         self.json_refs = json_refs
         self.array_refs = array_refs
-        self.file_handles = {}
+        self.files = MappedFiles()
 
     async def __aiter__(self) -> AsyncIterator[DataRowBatch]:
         async for batch in self.input:
+            # externally stored arrays of this batch: (file path, start offset or segment idx, row, slot idx, cell md)
+            array_cells: list[tuple[Path, int, exprs.DataRow, int, exprs.CellMd]] = []
             for row in batch:
                 for col_ref in self.json_refs:
                     val = row[col_ref.slot_idx]
@@ -105,31 +167,40 @@ class CellReconstructionNode(ExecNode):
                     cell_md = row.slot_md.get(col_ref.slot_idx)
                     if cell_md is None or cell_md.file_urls is None or not json_has_inlined_objs(row[col_ref.slot_idx]):
                         continue
-                    row[col_ref.slot_idx] = reconstruct_json(val, cell_md.file_urls, self.file_handles)
+                    row[col_ref.slot_idx] = reconstruct_json(val, cell_md.file_urls, self.files)
 
                 for col_ref in self.array_refs:
                     cell_md = row.slot_md.get(col_ref.slot_idx)
                     if cell_md is not None and cell_md.array_md is not None:
                         assert row[col_ref.slot_idx] is None
-                        assert cell_md.file_urls is not None and len(cell_md.file_urls) == 1
-                        row[col_ref.slot_idx] = self._reconstruct_array(cell_md)
+                        array_md = cell_md.array_md
+                        local_path: Path | None
+                        if array_md.segment_id is not None:
+                            local_path = segment_path(col_ref.col.tbl.id, array_md.segment_id)
+                            pos = array_md.segment_idx
+                        else:
+                            assert cell_md.file_urls is not None and len(cell_md.file_urls) == 1
+                            local_path = parse_local_file_path(cell_md.file_urls[0])
+                            pos = array_md.start
+                        assert local_path is not None and pos is not None
+                        array_cells.append((local_path, pos, row, col_ref.slot_idx, cell_md))
                     else:
                         assert row[col_ref.slot_idx] is None or isinstance(row[col_ref.slot_idx], np.ndarray)
 
+            # read the arrays in file order
+            array_cells.sort(key=lambda cell: (cell[0], cell[1]))
+            for local_path, _, row, slot_idx, cell_md in array_cells:
+                row[slot_idx] = self._reconstruct_array(local_path, cell_md)
+
             yield batch
 
     def close(self) -> None:
-        for fp in self.file_handles.values():
-            fp.close()
-
-    def _reconstruct_array(self, cell_md: exprs.CellMd) -> np.ndarray:
-        assert cell_md.array_md is not None
-        local_path = parse_local_file_path(cell_md.file_urls[0])
-        assert local_path is not None
-        if local_path not in self.file_handles:
-            self.file_handles[local_path] = open(str(local_path), 'rb')  # noqa: SIM115
-        fp = self.file_handles[local_path]
-        ar = load_array(
-            fp, cell_md.array_md.start, cell_md.array_md.end, bool(cell_md.array_md.is_bool), cell_md.array_md.shape
-        )
-        return ar
+        self.files.clear()
+
+    def _reconstruct_array(self, local_path: Path, cell_md: exprs.CellMd) -> np.ndarray | exprs.PackedBoolArray:
+        array_md = cell_md.array_md
+        assert array_md is not None
+        if array_md.segment_id is not None:
+            return self.files.load_segment_array(local_path, array_md.segment_idx)
+        assert array_md.start is not None and array_md.end is not None
+        return self.files.load_array(local_path, array_md.start, array_md.end, bool(array_md.is_bool), array_md.shape)
@@ -1,25 +1,65 @@
-from typing import AsyncIterator
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import queue
+import threading
+from collections import deque
+from concurrent import futures
+from typing import Any, AsyncIterator, Optional, Union
 
 from pixeltable import catalog, exceptions as excs, exprs
+from pixeltable.config import Config
+from pixeltable.iterators import ComponentIterator
 
 from .data_row_batch import DataRowBatch
 from .exec_node import ExecNode
 
 
+@dataclasses.dataclass
+class _IteratorTask:
+    """An iterator instance for a single input row, running in a worker thread"""
+
+    input_row: exprs.DataRow
+    iterator_args: dict[str, Any]
+    # chunks of (component dict, pos_state()), followed by None (end of iteration) or the exception raised by the
+    # iterator
+    chunks: queue.Queue[Union[list[tuple[dict, Any]], Exception, None]]
+    cancelled: threading.Event = dataclasses.field(default_factory=threading.Event)
+    next_pos: int = 0
+
+
 class ComponentIterationNode(ExecNode):
     """Expands each row from a base table into one row per component returned by an iterator
 
     Returns row batches of OUTPUT_BATCH_SIZE size.
+
+    With num_workers > 1 (config option 'iterator_workers'), the iterators for up to num_workers input rows run
+    concurrently in a thread pool. Each iterator hands its output to the node in chunks of CHUNK_SIZE components,
+    through a queue of at most MAX_QUEUED_CHUNKS chunks; an iterator whose queue is full is blocked until the node
+    catches up. Output rows are still produced in (input row, pos) order, ie, the output is identical to that of
+    sequential iteration.
+
+    The workers are threads, so this only speeds up iterators that spend most of their time outside the GIL, such as
+    FrameIterator and AudioSplitter, which decode in PyAV. Iterators that run Python code for each component don't
+    benefit.
     """
 
     view: catalog.TableVersionHandle
+    iterator_cls: type[ComponentIterator]
+    num_workers: int
+    pos_state_slot_idx: Optional[int]
 
     __OUTPUT_BATCH_SIZE = 1024
+    CHUNK_SIZE = 16
+    MAX_QUEUED_CHUNKS = 4
 
     def __init__(self, view: catalog.TableVersionHandle, input: ExecNode):
         assert view.get().is_component_view
         super().__init__(input.row_builder, [], [], input)
         self.view = view
+        self.iterator_cls = view.get().iterator_cls
+        self.num_workers = max(Config.get().get_int_value('iterator_workers') or 1, 1)
         iterator_args = [view.get().iterator_args.copy()]
         self.row_builder.set_slot_idxs(iterator_args)
         self.iterator_args = iterator_args[0]
@@ -38,8 +78,22 @@ class ComponentIterationNode(ExecNode):
             for e in self.row_builder.unique_exprs
             if isinstance(e, exprs.ColumnRef) and e.col.name in self.iterator_output_fields
         }
+        # the stored column for the pos_state() of the components
+        pos_state_col = self.view.get().iterator_pos_state_col
+        self.pos_state_slot_idx = None
+        if pos_state_col is not None:
+            self.pos_state_slot_idx = next(
+                e.slot_idx
+                for e in self.row_builder.unique_exprs
+                if isinstance(e, exprs.ColumnRef) and e.col == pos_state_col
+            )
 
     async def __aiter__(self) -> AsyncIterator[DataRowBatch]:
+        if self.num_workers > 1:
+            async for batch in self.__parallel_iter():
+                yield batch
+            return
+
         output_batch = DataRowBatch(self.row_builder)
         async for input_batch in self.input:
             for input_row in input_batch:
@@ -55,7 +109,7 @@ class ComponentIterationNode(ExecNode):
                         output_row = self.row_builder.make_row()
                         input_row.copy(output_row)
                         # we're expanding the input and need to add the iterator position to the pk
-                        self.__populate_output_row(output_row, pos, component_dict)
+                        self.__populate_output_row(output_row, pos, component_dict, self.__pos_state(iterator))
                         output_batch.add_row(output_row)
                         if len(output_batch) == self.__OUTPUT_BATCH_SIZE:
                             yield output_batch
@@ -64,6 +118,111 @@ class ComponentIterationNode(ExecNode):
         if len(output_batch) > 0:
             yield output_batch
 
+    async def __parallel_iter(self) -> AsyncIterator[DataRowBatch]:
+        loop = asyncio.get_running_loop()
+        input_iter = aiter(self.input)
+        input_rows: deque[exprs.DataRow] = deque()
+        input_exhausted = False
+        # running iterators, in input row order; the node consumes the output of the first one
+        tasks: deque[_IteratorTask] = deque()
+        output_batch = DataRowBatch(self.row_builder)
+
+        executor = futures.ThreadPoolExecutor(max_workers=self.num_workers)
+        try:
+            while True:
+                # start iterators for the next input rows; all of them get a worker right away
+                while len(tasks) < self.num_workers:
+                    if len(input_rows) == 0:
+                        if input_exhausted:
+                            break
+                        try:
+                            input_rows.extend(await anext(input_iter))
+                        except StopAsyncIteration:
+                            input_exhausted = True
+                        continue
+                    input_row = input_rows.popleft()
+                    self.row_builder.eval(input_row, self.iterator_args_ctx)
+                    iterator_args = input_row[self.iterator_args.slot_idx]
+                    assert isinstance(iterator_args, dict)
+                    if not self.__non_nullable_args_specified(iterator_args):
+                        continue
+                    task = _IteratorTask(input_row, iterator_args, queue.Queue(maxsize=self.MAX_QUEUED_CHUNKS))
+                    executor.submit(self.__run_iterator, task)
+                    tasks.append(task)
+
+                if len(tasks) == 0:
+                    break
+                task = tasks[0]
+                try:
+                    chunk = task.chunks.get_nowait()
+                except queue.Empty:
+                    chunk = await loop.run_in_executor(None, self.__get_chunk, task)
+                if chunk is None:
+                    tasks.popleft()
+                    continue
+                if isinstance(chunk, Exception):
+                    raise chunk
+                for component_dict, pos_state in chunk:
+                    output_row = self.row_builder.make_row()
+                    task.input_row.copy(output_row)
+                    self.__populate_output_row(output_row, task.next_pos, component_dict, pos_state)
+                    task.next_pos += 1
+                    output_batch.add_row(output_row)
+                    if len(output_batch) == self.__OUTPUT_BATCH_SIZE:
+                        yield output_batch
+                        output_batch = DataRowBatch(self.row_builder)
+        finally:
+            # unblock any workers that are still running; if we stop early (eg, because of a limit), we don't wait for
+            # them to notice
+            for task in tasks:
+                task.cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if len(output_batch) > 0:
+            yield output_batch
+
+    def __run_iterator(self, task: _IteratorTask) -> None:
+        """Runs in a worker thread: drains the iterator for task into task.chunks"""
+        try:
+            iterator = self.iterator_cls(**task.iterator_args)
+            try:
+                chunk: list[tuple[dict, Any]] = []
+                for component_dict in iterator:
+                    chunk.append((component_dict, self.__pos_state(iterator)))
+                    if len(chunk) == self.CHUNK_SIZE:
+                        if not self.__put_chunk(task, chunk):
+                            return
+                        chunk = []
+                if len(chunk) > 0 and not self.__put_chunk(task, chunk):
+                    return
+            finally:
+                iterator.close()
+        except Exception as exc:
+            self.__put_chunk(task, exc)
+            return
+        self.__put_chunk(task, None)
+
+    @classmethod
+    def __get_chunk(cls, task: _IteratorTask) -> Union[list[tuple[dict, Any]], Exception, None]:
+        """Blocks until the next chunk is available; returns None if the task got cancelled in the meantime"""
+        while not task.cancelled.is_set():
+            try:
+                return task.chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    @classmethod
+    def __put_chunk(cls, task: _IteratorTask, chunk: Union[list[tuple[dict, Any]], Exception, None]) -> bool:
+        """Blocks until there's room in task.chunks; returns False if the task got cancelled in the meantime"""
+        while not task.cancelled.is_set():
+            try:
+                task.chunks.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
     def __non_nullable_args_specified(self, iterator_args: dict) -> bool:
         """
         Returns true if all non-nullable iterator arguments are not `None`.
@@ -75,9 +234,14 @@ class ComponentIterationNode(ExecNode):
                 return False
         return True
 
-    def __populate_output_row(self, output_row: exprs.DataRow, pos: int, component_dict: dict) -> None:
+    def __pos_state(self, iterator: ComponentIterator) -> Any:
+        return iterator.pos_state() if self.pos_state_slot_idx is not None else None
+
+    def __populate_output_row(self, output_row: exprs.DataRow, pos: int, component_dict: dict, pos_state: Any) -> None:
         pk = output_row.pk[:-1] + (pos,) + output_row.pk[-1:]
         output_row.set_pk(pk)
+        if self.pos_state_slot_idx is not None:
+            output_row[self.pos_state_slot_idx] = pos_state
         # verify and copy component_dict fields to their respective slots in output_row
         for field_name, field_val in component_dict.items():
             if field_name not in self.iterator_output_fields:
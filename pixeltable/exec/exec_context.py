@@ -1,8 +1,14 @@
-from typing import Optional
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
 
 import sqlalchemy as sql
 
 from pixeltable import exprs
+from pixeltable.env import Env
+
+if TYPE_CHECKING:
+    from .expr_eval import ExprEvalNode
 
 
 class ExecContext:
@@ -21,10 +27,29 @@ class ExecContext:
         self.show_pbar = show_pbar
         self.batch_size = batch_size
         self.row_builder = row_builder
-        self.profile = exprs.ExecProfile(row_builder)
+        # only collected if requested (see enable_profile()): timing each expr evaluation has a measurable cost
+        self.profile: Optional[exprs.ExecProfile] = None
+        # buffer statistics of the ExprEvalNodes of the plan, recorded when they finish
+        self.eval_buffer_stats: list[ExprEvalNode.BufferStats] = []
         # num_rows is used to compute the total number of computed cells used for the progress bar
         self.num_rows: Optional[int] = None
         self.conn: Optional[sql.engine.Connection] = None  # if present, use this to execute SQL queries
         self.pk_clause = pk_clause
         self.num_computed_exprs = num_computed_exprs
         self.ignore_errors = ignore_errors
+        # if True, FunctionCalls use their batch_resource_pool, if they have one, instead of their resource_pool
+        # (set for backfills of computed columns with batch_mode=True); with batch_submit_only, the requests are only
+        # submitted, without waiting for their results (see BatchApiScheduler)
+        self.batch_mode = False
+        self.batch_submit_only = False
+
+    def enable_profile(self) -> None:
+        """Record the execution time of expr evaluations (see exprs.ExecProfile)"""
+        self.profile = exprs.ExecProfile(self.row_builder)
+
+    def print_profile(self, num_rows: int) -> None:
+        """Print the execution profile and the buffer statistics"""
+        assert self.profile is not None
+        self.profile.print(num_rows=num_rows)
+        for stats in self.eval_buffer_stats:
+            Env.get().console_logger.info(f'eval buffer: {stats}')
@@ -5,10 +5,11 @@ import datetime
 import itertools
 import logging
 import sys
-from typing import Any, Callable, Iterator, Optional, cast
+from typing import Any, Callable, Iterable, Iterator, Optional, cast
 
 from pixeltable import exprs, func
 
+from ..globals import hashable_value
 from .globals import Dispatcher, Evaluator, ExecCtx, FnCallArgs
 
 _logger = logging.getLogger('pixeltable')
@@ -37,7 +38,13 @@ class DefaultExprEvaluator(Evaluator):
 
     async def eval(self, rows: list[exprs.DataRow]) -> None:
         rows_with_excs: set[int] = set()  # records idxs into rows
-        for idx, row in enumerate(rows):
+        idxs: Iterable[int] = range(len(rows))
+        if isinstance(self.e, exprs.ColumnRef) and self.e.is_unstored_iter_col:
+            # reconstruct iterator outputs in (base rowid, pos) order, which is the order in which the iterator
+            # produces them
+            idxs = sorted(idxs, key=lambda i: rows[i].pk)
+        for idx in idxs:
+            row = rows[idx]
             assert not row.has_val[self.e.slot_idx] and not row.has_exc(self.e.slot_idx)
             if asyncio.current_task().cancelled() or self.dispatcher.exc_event.is_set():
                 return
@@ -58,22 +65,32 @@ class FnCallEvaluator(Evaluator):
     - async functions: one task per row
     - the rest: one task per set of rows handed to schedule()
 
+    Calls of deterministic functions (CallableFunction.is_deterministic) are deduplicated: a row whose arguments are
+    identical to those of a call that is still queued or in flight doesn't result in another call and instead waits
+    in pending_calls for the result (see FnCallArgs.get_result_rows()).
+
     TODO:
     - adaptive batching: finding the optimal batch size based on observed execution times
     """
 
     fn_call: exprs.FunctionCall
     fn: func.CallableFunction
+    resource_pool: Optional[str]  # fn_call.resource_pool, or fn_call.batch_resource_pool in batch mode
     scalar_py_fn: Optional[Callable]  # only set for non-batching CallableFunctions
 
     # only set if fn.is_batched
     call_args_queue: Optional[asyncio.Queue[FnCallArgs]]  # FnCallArgs waiting for execution
     batch_size: Optional[int]
 
+    # only set if fn.is_deterministic; key: hashable args and kwargs of a queued or in-flight call
+    pending_calls: Optional[dict[Any, list[exprs.DataRow]]]
+    num_deduped_calls: int
+
     def __init__(self, fn_call: exprs.FunctionCall, dispatcher: Dispatcher, exec_ctx: ExecCtx):
         super().__init__(dispatcher, exec_ctx)
         self.fn_call = fn_call
         self.fn = cast(func.CallableFunction, fn_call.fn)
+        self.resource_pool = fn_call.resource_pool
         if isinstance(self.fn, func.CallableFunction) and self.fn.is_batched:
             self.call_args_queue = asyncio.Queue[FnCallArgs]()
             # we're not supplying sample arguments there, they're ignored anyway
@@ -86,6 +103,23 @@ class FnCallEvaluator(Evaluator):
                 self.scalar_py_fn = self.fn.py_fn
             else:
                 self.scalar_py_fn = None
+        is_deterministic = isinstance(self.fn, func.CallableFunction) and self.fn.is_deterministic
+        self.pending_calls = {} if is_deterministic else None
+        self.num_deduped_calls = 0
+
+    @classmethod
+    def _dedup_key(cls, args: list[Any], kwargs: dict[str, Any]) -> Optional[Any]:
+        """Returns a hashable representation of the arguments, or None if they aren't hashable"""
+        # include the types: 1, 1.0 and True are equal, but can produce different results
+        key = (
+            tuple((type(arg), hashable_value(arg)) for arg in args),
+            tuple((k, type(v), hashable_value(v)) for k, v in kwargs.items()),
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
 
     def schedule(self, rows: list[exprs.DataRow], slot_idx: int) -> None:
         assert self.fn_call.slot_idx >= 0
@@ -99,12 +133,34 @@ class FnCallEvaluator(Evaluator):
                 # nothing to do here
                 row[self.fn_call.slot_idx] = None
                 skip_rows.append(row)
-            else:
+            elif self.pending_calls is None:
                 args, kwargs = args_kwargs
                 rows_call_args.append(FnCallArgs(self.fn_call, [row], args=args, kwargs=kwargs))
+            else:
+                args, kwargs = args_kwargs
+                key = self._dedup_key(args, kwargs)
+                if key is not None:
+                    if key in self.pending_calls:
+                        # wait for the result of the identical call
+                        self.pending_calls[key].append(row)
+                        self.num_deduped_calls += 1
+                        continue
+                    self.pending_calls[key] = []
+                rows_call_args.append(
+                    FnCallArgs(
+                        self.fn_call,
+                        [row],
+                        args=args,
+                        kwargs=kwargs,
+                        dedup_keys=[key],
+                        pending_calls=self.pending_calls,
+                    )
+                )
 
         if len(skip_rows) > 0:
             self.dispatcher.dispatch(skip_rows, self.exec_ctx)
+        if len(rows_call_args) == 0:
+            return
 
         if self.batch_size is not None:
             if not self.is_closed and (len(rows_call_args) + self.call_args_queue.qsize() < self.batch_size):
@@ -129,18 +185,18 @@ class FnCallEvaluator(Evaluator):
                 # turn call_args_batch into a single batched FnCallArgs
                 _logger.debug(f'Creating batch of size {len(call_args_batch)} for slot {slot_idx}')
                 batched_call_args = self._create_batch_call_args(call_args_batch)
-                if self.fn_call.resource_pool is not None:
+                if self.resource_pool is not None:
                     # hand the call off to the resource pool's scheduler
-                    scheduler = self.dispatcher.schedulers[self.fn_call.resource_pool]
+                    scheduler = self.dispatcher.schedulers[self.resource_pool]
                     scheduler.submit(batched_call_args, self.exec_ctx)
                 else:
                     task = asyncio.create_task(self.eval_batch(batched_call_args))
                     self.dispatcher.register_task(task)
 
         elif self.fn.is_async:
-            if self.fn_call.resource_pool is not None:
+            if self.resource_pool is not None:
                 # hand the call off to the resource pool's scheduler
-                scheduler = self.dispatcher.schedulers[self.fn_call.resource_pool]
+                scheduler = self.dispatcher.schedulers[self.resource_pool]
                 for item in rows_call_args:
                     scheduler.submit(item, self.exec_ctx)
             else:
@@ -169,7 +225,12 @@ class FnCallEvaluator(Evaluator):
             for k in item.kwargs:
                 batch_kwargs[k][i] = item.kwargs[k]
         return FnCallArgs(
-            self.fn_call, [item.row for item in call_args], batch_args=batch_args, batch_kwargs=batch_kwargs
+            self.fn_call,
+            [item.row for item in call_args],
+            batch_args=batch_args,
+            batch_kwargs=batch_kwargs,
+            dedup_keys=None if self.pending_calls is None else [item.dedup_keys[0] for item in call_args],
+            pending_calls=self.pending_calls,
         )
 
     async def eval_batch(self, batched_call_args: FnCallArgs) -> None:
@@ -188,12 +249,14 @@ class FnCallEvaluator(Evaluator):
             _, _, exc_tb = sys.exc_info()
             for row in batched_call_args.rows:
                 row.set_exc(self.fn_call.slot_idx, exc)
-            self.dispatcher.dispatch_exc(batched_call_args.rows, self.fn_call.slot_idx, exc_tb, self.exec_ctx)
+            self.dispatcher.dispatch_exc(
+                batched_call_args.get_result_rows(), self.fn_call.slot_idx, exc_tb, self.exec_ctx
+            )
             return
 
         for i, row in enumerate(batched_call_args.rows):
             row[self.fn_call.slot_idx] = result_batch[i]
-        self.dispatcher.dispatch(batched_call_args.rows, self.exec_ctx)
+        self.dispatcher.dispatch(batched_call_args.get_result_rows(), self.exec_ctx)
 
     async def eval_async(self, call_args: FnCallArgs) -> None:
         assert len(call_args.rows) == 1
@@ -206,11 +269,11 @@ class FnCallEvaluator(Evaluator):
             call_args.row[self.fn_call.slot_idx] = await self.fn.aexec(*call_args.args, **call_args.kwargs)
             end_ts = datetime.datetime.now()
             _logger.debug(f'Evaluated slot {self.fn_call.slot_idx} in {end_ts - start_ts}')
-            self.dispatcher.dispatch([call_args.row], self.exec_ctx)
+            self.dispatcher.dispatch(call_args.get_result_rows(), self.exec_ctx)
         except Exception as exc:
             _, _, exc_tb = sys.exc_info()
             call_args.row.set_exc(self.fn_call.slot_idx, exc)
-            self.dispatcher.dispatch_exc(call_args.rows, self.fn_call.slot_idx, exc_tb, self.exec_ctx)
+            self.dispatcher.dispatch_exc(call_args.get_result_rows(), self.fn_call.slot_idx, exc_tb, self.exec_ctx)
 
     async def eval(self, call_args_batch: list[FnCallArgs]) -> None:
         rows_with_excs: set[int] = set()  # records idxs into 'rows'
@@ -227,19 +290,32 @@ class FnCallEvaluator(Evaluator):
                 _, _, exc_tb = sys.exc_info()
                 item.row.set_exc(self.fn_call.slot_idx, exc)
                 rows_with_excs.add(idx)
-                self.dispatcher.dispatch_exc(item.rows, self.fn_call.slot_idx, exc_tb, self.exec_ctx)
+                self.dispatcher.dispatch_exc(item.get_result_rows(), self.fn_call.slot_idx, exc_tb, self.exec_ctx)
         self.dispatcher.dispatch(
-            [call_args_batch[i].row for i in range(len(call_args_batch)) if i not in rows_with_excs], self.exec_ctx
+            [
+                row
+                for i in range(len(call_args_batch))
+                if i not in rows_with_excs
+                for row in call_args_batch[i].get_result_rows()
+            ],
+            self.exec_ctx,
         )
 
     def _close(self) -> None:
         """Create a task for the incomplete batch of queued FnCallArgs, if any"""
-        _logger.debug(f'FnCallEvaluator.close(): slot_idx={self.fn_call.slot_idx}')
+        _logger.debug(
+            f'FnCallEvaluator.close(): slot_idx={self.fn_call.slot_idx} #deduped_calls={self.num_deduped_calls}'
+        )
         if self.call_args_queue is None or self.call_args_queue.empty():
             return
         batched_call_args = self._create_batch_call_args(list(self._queued_call_args_iter()))
-        task = asyncio.create_task(self.eval_batch(batched_call_args))
-        self.dispatcher.register_task(task)
+        if self.resource_pool is not None:
+            # the last batch also goes through the resource pool's scheduler
+            scheduler = self.dispatcher.schedulers[self.resource_pool]
+            scheduler.submit(batched_call_args, self.exec_ctx)
+        else:
+            task = asyncio.create_task(self.eval_batch(batched_call_args))
+            self.dispatcher.register_task(task)
 
 
 class NestedRowList:
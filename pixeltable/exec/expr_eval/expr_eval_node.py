@@ -1,22 +1,28 @@
 from __future__ import annotations
 
 import asyncio
+import dataclasses
 import logging
+import sys
+import time
 import traceback
 from types import TracebackType
-from typing import AsyncIterator, Iterable, Optional
+from typing import Any, AsyncIterator, ClassVar, Iterable, Optional
 
 import numpy as np
+import PIL.Image
 
 import pixeltable.exceptions as excs
+import pixeltable.utils.av as av_utils
 from pixeltable import exprs
+from pixeltable.config import Config
 
 from ..data_row_batch import DataRowBatch
 from ..exec_node import ExecNode
 from .evaluators import FnCallEvaluator, NestedRowList
 from .globals import ExecCtx, Scheduler
 from .row_buffer import RowBuffer
-from .schedulers import SCHEDULERS
+from .schedulers import SCHEDULERS, BatchApiScheduler
 
 _logger = logging.getLogger('pixeltable')
 
@@ -27,15 +33,17 @@ class ExprEvalNode(ExecNode):
 
     Resource management:
     - the execution system tries to limit total memory consumption by limiting the number of rows that are in
-      circulation
+      circulation (max_buffered_rows): the limit is derived from the eval_buffer_memory_mb budget and an estimate of
+      the memory consumption of a row, which is sampled from the slot values of the rows passing through dispatch(),
+      and is kept between BATCH_SIZE and MAX_BUFFERED_ROWS
+    - the next input batch is only read ahead if the rows that are already buffered or available from the input are
+      below that limit
     - during execution, slots that aren't part of the output are garbage collected as soon as their direct dependents
       are materialized
 
     TODO:
     - Literal handling: currently, Literal values are copied into slots via the normal evaluation mechanism, which is
       needless overhead; instead: pre-populate Literal slots in _init_row()
-    - dynamically determine MAX_BUFFERED_ROWS, based on the avg memory consumption of a row and our configured memory
-      limit
     - local model inference on gpu: currently, no attempt is made to ensure that models can fit onto the gpu
       simultaneously, which will cause errors; instead, the execution should be divided into sequential phases, each
       of which only contains a subset of the models which is known to fit onto the gpu simultaneously
@@ -61,13 +69,40 @@ class ExprEvalNode(ExecNode):
     num_in_flight: int  # number of dispatched rows that haven't completed
     row_pos_map: Optional[dict[int, int]]  # id(row) -> position of row in input; only set if maintain_input_order
     output_buffer: RowBuffer  # holds rows that are ready to be returned, in order
+    memory_budget: int  # in bytes
+    row_size: Optional[float]  # estimated memory consumption of a buffered row, in bytes
+    max_buffered_rows: int  # current limit on total_buffered
+    num_sampled_rows: int  # number of rows seen by dispatch() since the last row size sample
 
     # debugging
     num_input_rows: int
     num_output_rows: int
+    stats: BufferStats  # also recorded in ExecContext.eval_buffer_stats
+
+    @dataclasses.dataclass
+    class BufferStats:
+        """Buffer occupancy, and how often and for how long the main event loop waited for each stall reason"""
+
+        peak_buffered_rows: int = 0
+        peak_buffered_bytes: int = 0  # estimated
+        num_stalls: dict[str, int] = dataclasses.field(default_factory=dict)
+        stall_time: dict[str, float] = dataclasses.field(default_factory=dict)
 
     BATCH_SIZE = 64
-    MAX_BUFFERED_ROWS = 2048  # maximum number of rows that have been dispatched but not yet returned
+    # upper bound for max_buffered_rows, regardless of the memory budget
+    MAX_BUFFERED_ROWS = 16384
+    DEFAULT_MEMORY_MB: ClassVar[int] = 1024
+    # the row size is re-estimated from one out of every SIZE_SAMPLE_INTERVAL rows seen by dispatch()
+    SIZE_SAMPLE_INTERVAL: ClassVar[int] = 64
+    # weight of a new sample in the row size estimate (exponential moving average)
+    SIZE_SAMPLE_WEIGHT: ClassVar[float] = 0.2
+    # per-slot memory consumption of the DataRow itself (vals, has_val, excs, etc.)
+    ROW_SLOT_OVERHEAD: ClassVar[int] = 64
+
+    # stall reasons
+    STALL_INPUT: ClassVar[str] = 'input'  # nothing in flight, waiting for the input
+    STALL_EVAL: ClassVar[str] = 'eval'  # waiting for dispatched rows to complete
+    STALL_MEMORY: ClassVar[str] = 'memory'  # waiting for dispatched rows to complete, input rows are held back
 
     def __init__(
         self,
@@ -94,9 +129,15 @@ class ExprEvalNode(ExecNode):
         self.num_in_flight = 0
         self.row_pos_map = None
         self.output_buffer = RowBuffer(self.MAX_BUFFERED_ROWS)
+        memory_mb = Config.get().get_int_value('eval_buffer_memory_mb') or self.DEFAULT_MEMORY_MB
+        self.memory_budget = memory_mb * 2**20
+        self.row_size = None
+        self.max_buffered_rows = self.MAX_BUFFERED_ROWS
+        self.num_sampled_rows = 0
 
         self.num_input_rows = 0
         self.num_output_rows = 0
+        self.stats = self.BufferStats()
 
         # self.slot_evaluators = {}
         self.schedulers = {}
@@ -142,15 +183,54 @@ class ExprEvalNode(ExecNode):
     def total_buffered(self) -> int:
         return self.num_in_flight + self.completed_rows.qsize() + self.output_buffer.num_rows
 
+    @classmethod
+    def _val_size(cls, val: Any) -> int:
+        """Estimated memory consumption of a slot value, in bytes"""
+        if val is None:
+            return 0
+        if isinstance(val, PIL.Image.Image):
+            # lazily loaded images are counted as if they had been loaded already
+            return val.width * val.height * len(val.getbands())
+        if isinstance(val, np.ndarray):
+            return val.nbytes
+        if isinstance(val, exprs.PackedBoolArray):
+            # likewise for packed bool arrays
+            return int(np.prod(val.shape))
+        if isinstance(val, (str, bytes)):
+            return len(val)
+        if isinstance(val, dict):
+            return sys.getsizeof(val) + sum(cls._val_size(k) + cls._val_size(v) for k, v in val.items())
+        if isinstance(val, (list, tuple)):
+            return sys.getsizeof(val) + sum(cls._val_size(v) for v in val)
+        return sys.getsizeof(val)
+
+    def _sample_row_size(self, row: exprs.DataRow) -> None:
+        """Updates row_size and max_buffered_rows with the memory consumption of row"""
+        size = len(row.vals) * self.ROW_SLOT_OVERHEAD
+        for idx in np.nonzero(row.has_val)[0]:
+            size += self._val_size(row.vals[idx]) + self._val_size(row.file_urls[idx])
+        if self.row_size is None:
+            self.row_size = float(size)
+        else:
+            self.row_size += self.SIZE_SAMPLE_WEIGHT * (size - self.row_size)
+        self.max_buffered_rows = min(
+            max(int(self.memory_budget / max(self.row_size, 1.0)), self.BATCH_SIZE), self.MAX_BUFFERED_ROWS
+        )
+
+    def _has_buffer_capacity(self) -> bool:
+        return self.total_buffered + self.avail_input_rows < self.max_buffered_rows
+
     def _dispatch_input_rows(self) -> None:
         """Dispatch the maximum number of input rows, given total_buffered; does not block"""
         if self.avail_input_rows == 0:
             return
-        num_rows = min(self.MAX_BUFFERED_ROWS - self.total_buffered, self.avail_input_rows)
-        assert num_rows >= 0
+        assert self.current_input_batch is not None
+        if self.row_size is None:
+            self._sample_row_size(self.current_input_batch.rows[self.input_row_idx])
+        # max_buffered_rows may have gone down since the last dispatch
+        num_rows = min(max(self.max_buffered_rows - self.total_buffered, 0), self.avail_input_rows)
         if num_rows == 0:
             return
-        assert self.current_input_batch is not None
         avail_current_batch_rows = len(self.current_input_batch) - self.input_row_idx
 
         rows: list[exprs.DataRow]
@@ -174,22 +254,25 @@ class ExprEvalNode(ExecNode):
 
         self.exec_ctx.init_rows(rows)
         self.dispatch(rows, self.exec_ctx)
+        self.stats.peak_buffered_rows = max(self.stats.peak_buffered_rows, self.total_buffered)
+        assert self.row_size is not None
+        self.stats.peak_buffered_bytes = max(self.stats.peak_buffered_bytes, int(self.total_buffered * self.row_size))
 
     def _log_state(self, prefix: str) -> None:
         _logger.debug(
             f'{prefix}: #in-flight={self.num_in_flight} #complete={self.completed_rows.qsize()} '
             f'#output-buffer={self.output_buffer.num_rows} #ready={self.output_buffer.num_ready} '
             f'total-buffered={self.total_buffered} #avail={self.avail_input_rows} '
-            f'#input={self.num_input_rows} #output={self.num_output_rows}'
+            f'max-buffered={self.max_buffered_rows} #input={self.num_input_rows} #output={self.num_output_rows}'
         )
 
     def _init_schedulers(self) -> None:
-        resource_pools = {
-            eval.fn_call.resource_pool
-            for eval in self.exec_ctx.slot_evaluators.values()
-            if isinstance(eval, FnCallEvaluator)
-        }
-        resource_pools = {pool for pool in resource_pools if pool is not None}
+        fn_call_evals = [eval for eval in self.exec_ctx.slot_evaluators.values() if isinstance(eval, FnCallEvaluator)]
+        if self.ctx.batch_mode:
+            for eval in fn_call_evals:
+                if eval.fn_call.batch_resource_pool is not None:
+                    eval.resource_pool = eval.fn_call.batch_resource_pool
+        resource_pools = {eval.resource_pool for eval in fn_call_evals if eval.resource_pool is not None}
         for pool_name in resource_pools:
             for scheduler in SCHEDULERS:
                 if scheduler.matches(pool_name):
@@ -197,6 +280,9 @@ class ExprEvalNode(ExecNode):
                     break
             if pool_name not in self.schedulers:
                 raise RuntimeError(f'No scheduler found for resource pool {pool_name}')
+            pool_scheduler = self.schedulers[pool_name]
+            if isinstance(pool_scheduler, BatchApiScheduler):
+                pool_scheduler.submit_only = self.ctx.batch_submit_only
 
     async def __aiter__(self) -> AsyncIterator[DataRowBatch]:
         """
@@ -266,10 +352,17 @@ class ExprEvalNode(ExecNode):
                         evaluator.close()
                     closed_evaluators = True
 
+                # top up our in-flight rows, in case max_buffered_rows went up
+                self._dispatch_input_rows()
+
                 # we don't have a full batch of rows at this point and need to wait
                 aws = {exc_event_aw}  # always wait for an exception
-                if self.next_input_batch is None and not self.input_complete:
-                    # also wait for another batch if we don't have a read-ahead batch yet
+                if (
+                    self.next_input_batch is None
+                    and not self.input_complete
+                    and (self.avail_input_rows == 0 or self._has_buffer_capacity() or input_batch_aw is not None)
+                ):
+                    # also wait for another batch if we don't have a read-ahead batch yet and it fits into the buffer
                     if input_batch_aw is None:
                         input_batch_aw = asyncio.create_task(self._fetch_input_batch(), name='_fetch_input_batch()')
                     aws.add(input_batch_aw)
@@ -278,7 +371,18 @@ class ExprEvalNode(ExecNode):
                     if completed_aw is None:
                         completed_aw = asyncio.create_task(self.completed_event.wait(), name='completed.wait()')
                     aws.add(completed_aw)
+                if self.num_in_flight == 0:
+                    stall_reason = self.STALL_INPUT
+                elif self._has_buffer_capacity() or self.input_complete:
+                    stall_reason = self.STALL_EVAL
+                else:
+                    stall_reason = self.STALL_MEMORY
+                wait_start = time.monotonic()
                 done, _ = await asyncio.wait(aws, return_when=asyncio.FIRST_COMPLETED)
+                self.stats.num_stalls[stall_reason] = self.stats.num_stalls.get(stall_reason, 0) + 1
+                self.stats.stall_time[stall_reason] = (
+                    self.stats.stall_time.get(stall_reason, 0.0) + time.monotonic() - wait_start
+                )
 
                 if self.exc_event.is_set():
                     # we got an exception that we need to propagate through __iter__()
@@ -308,6 +412,13 @@ class ExprEvalNode(ExecNode):
 
             # expr cleanup
             exprs.Expr.release_list(self.exec_ctx.all_exprs)
+            # the video decoders opened by udfs aren't needed after the query
+            av_utils.DecoderCache.get().close_idle()
+            if self.ctx is not None:
+                self.ctx.eval_buffer_stats.append(self.stats)
+            _logger.debug(
+                f'ExprEvalNode: row_size={self.row_size} max_buffered_rows={self.max_buffered_rows} {self.stats}'
+            )
 
     def dispatch_exc(
         self, rows: list[exprs.DataRow], slot_with_exc: int, exc_tb: TracebackType, exec_ctx: ExecCtx
@@ -341,7 +452,17 @@ class ExprEvalNode(ExecNode):
         # slots ready for evaluation; rows x slots
         ready_slots = np.zeros((len(rows), exec_ctx.row_builder.num_materialized), dtype=bool)
         completed_rows = np.zeros(len(rows), dtype=bool)
+        sample_row_size = False
+        if rows[0].parent_row is None:
+            # nested rows are accounted for in the size of their parent's slot
+            self.num_sampled_rows += len(rows)
+            sample_row_size = self.num_sampled_rows >= self.SIZE_SAMPLE_INTERVAL
         for i, row in enumerate(rows):
+            if sample_row_size:
+                # sample before intermediate values get garbage collected
+                self._sample_row_size(row)
+                self.num_sampled_rows = 0
+                sample_row_size = False
             row.missing_slots &= row.has_val == False
             if row.missing_slots.sum() == 0:
                 # all output slots have been materialized
@@ -23,6 +23,10 @@ class FnCallArgs:
     # batch call
     batch_args: Optional[list[list[Optional[Any]]]] = None
     batch_kwargs: Optional[dict[str, list[Optional[Any]]]] = None
+    # only set for deterministic functions (see FnCallEvaluator): rows with the same arguments as rows[i] are waiting
+    # in pending_calls[dedup_keys[i]] for the result of the call; None: the arguments of rows[i] aren't hashable
+    dedup_keys: Optional[list[Optional[Any]]] = None
+    pending_calls: Optional[dict[Any, list[exprs.DataRow]]] = None
 
     @property
     def pxt_fn(self) -> func.CallableFunction:
@@ -38,6 +42,33 @@ class FnCallArgs:
         assert len(self.rows) == 1
         return self.rows[0]
 
+    def get_result_rows(self) -> list[exprs.DataRow]:
+        """
+        Returns rows, plus the rows that are waiting for the result of the same calls, which receive the value or
+        exception of the corresponding entry in rows.
+
+        Needs to be called exactly once, after the value or exception has been recorded in rows.
+        """
+        if self.dedup_keys is None:
+            return self.rows
+        assert self.pending_calls is not None
+        slot_idx = self.fn_call.slot_idx
+        result_rows = list(self.rows)
+        for row, key in zip(self.rows, self.dedup_keys):
+            if key is None:
+                continue
+            waiting_rows = self.pending_calls.pop(key)
+            exc = row.get_exc(slot_idx) if row.has_exc(slot_idx) else None
+            # image values can also be stored as urls
+            val = row.vals[slot_idx] if row.file_urls[slot_idx] is None else row.file_urls[slot_idx]
+            for waiting_row in waiting_rows:
+                if exc is not None:
+                    waiting_row.set_exc(slot_idx, exc)
+                else:
+                    waiting_row[slot_idx] = val
+            result_rows.extend(waiting_rows)
+        return result_rows
+
 
 class Scheduler(abc.ABC):
     """
@@ -4,13 +4,17 @@ import asyncio
 import datetime
 import inspect
 import logging
+import random
 import re
 import sys
 import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
 from typing import Any, Awaitable, Collection, Optional
 
-from pixeltable import env, func
+from pixeltable import env, exceptions as excs, func
 from pixeltable.config import Config
+from pixeltable.utils import batch_api, rate_limit_buckets
 
 from .globals import Dispatcher, ExecCtx, FnCallArgs, Scheduler
 
@@ -27,12 +31,15 @@ class RateLimitsScheduler(Scheduler):
       (obtained via RateLimitsInfo.get_request_resources())
     - issue synchronous requests when we don't have a RateLimitsInfo yet or when we depleted a resource and need to
       wait for a reset
+    - if shared rate limits are enabled, draw the estimated resource usage from the pool's shared token buckets
+      (see utils.rate_limit_buckets), which refill at the reported limit per RATE_LIMIT_WINDOW
 
     TODO:
     - limit the number of in-flight requests based on the open file limit
     """
 
     get_request_resources_param_names: list[str]  # names of parameters of RateLimitsInfo.get_request_resources()
+    shared_limits: Optional[rate_limit_buckets.SharedRateLimits]
 
     # scheduling-related state
     pool_info: Optional[env.RateLimitsInfo]
@@ -46,6 +53,7 @@ class RateLimitsScheduler(Scheduler):
 
     TIME_FORMAT = '%H:%M.%S %f'
     MAX_RETRIES = 10
+    RATE_LIMIT_WINDOW = 60.0  # in seconds; the reported limits are per minute
 
     def __init__(self, resource_pool: str, dispatcher: Dispatcher):
         super().__init__(resource_pool, dispatcher)
@@ -58,6 +66,9 @@ class RateLimitsScheduler(Scheduler):
         self.total_requests = 0
         self.total_retried = 0
         self.get_request_resources_param_names = []
+        self.shared_limits = (
+            rate_limit_buckets.SharedRateLimits(resource_pool) if rate_limit_buckets.is_enabled() else None
+        )
 
     @classmethod
     def matches(cls, resource_pool: str) -> bool:
@@ -145,6 +156,20 @@ class RateLimitsScheduler(Scheduler):
                 # re-evaluate current capacity for current item
                 continue
 
+            if self.shared_limits is not None:
+                # other processes might be using up the same limits
+                shared_limits = {
+                    resource: (info.limit, info.limit / self.RATE_LIMIT_WINDOW)
+                    for resource, info in self.pool_info.resource_limits.items()
+                }
+                wait_duration = await asyncio.to_thread(
+                    self.shared_limits.try_acquire, request_resources, shared_limits
+                )
+                if wait_duration > 0.0:
+                    _logger.debug(f'waiting {wait_duration:.2f}s for shared rate limits of {self.resource_pool}')
+                    await asyncio.sleep(wait_duration)
+                    continue
+
             # we have a new in-flight request
             for resource, val in request_resources.items():
                 self.est_usage[resource] += val
@@ -217,7 +242,7 @@ class RateLimitsScheduler(Scheduler):
             # purge accumulated usage estimate, now that we have a new report
             self.est_usage = dict.fromkeys(self._resources, 0)
 
-            self.dispatcher.dispatch(request.rows, exec_ctx)
+            self.dispatcher.dispatch(request.get_result_rows(), exec_ctx)
         except Exception as exc:
             _logger.debug(f'scheduler {self.resource_pool}: exception in slot {request.fn_call.slot_idx}: {exc}')
             if hasattr(exc, 'response') and hasattr(exc.response, 'headers'):
@@ -241,7 +266,7 @@ class RateLimitsScheduler(Scheduler):
             _, _, exc_tb = sys.exc_info()
             for row in request.rows:
                 row.set_exc(request.fn_call.slot_idx, exc)
-            self.dispatcher.dispatch_exc(request.rows, request.fn_call.slot_idx, exc_tb, exec_ctx)
+            self.dispatcher.dispatch_exc(request.get_result_rows(), request.fn_call.slot_idx, exc_tb, exec_ctx)
         finally:
             _logger.debug(f'Scheduler stats: #requests={self.total_requests}, #retried={self.total_retried}')
             if is_task:
@@ -249,7 +274,130 @@ class RateLimitsScheduler(Scheduler):
                 self.request_completed.set()
 
 
-class RequestRateScheduler(Scheduler):
+class RetryingScheduler(Scheduler):
+    """
+    Base class for schedulers that retry requests which failed with a rate limit error (eg, HTTP 429) and that have no
+    runtime resource usage reports to go by.
+    """
+
+    RATE_LIMIT_INDICATORS = ('rate limit', 'too many requests', '429', 'quota exceeded', 'throttled', 'rate exceeded')
+    RETRY_AFTER_PATTERNS = (
+        r'retry after (\d+(?:\.\d+)?)\s*seconds?',
+        r'try again in (\d+(?:\.\d+)?)\s*seconds?',
+        r'wait (\d+(?:\.\d+)?)\s*seconds?',
+        r'retry-after:\s*(\d+(?:\.\d+)?)',
+    )
+
+    async def _eval_request(self, request: FnCallArgs) -> None:
+        """Evaluates the function call for all rows of the request"""
+        pxt_fn = request.fn_call.fn
+        assert isinstance(pxt_fn, func.CallableFunction)
+        if request.is_batched:
+            batch_result = await pxt_fn.aexec_batch(*request.batch_args, **request.batch_kwargs)
+            assert len(batch_result) == len(request.rows)
+            for row, result in zip(request.rows, batch_result):
+                row[request.fn_call.slot_idx] = result
+        else:
+            result = await pxt_fn.aexec(*request.args, **request.kwargs)
+            request.row[request.fn_call.slot_idx] = result
+
+    def _is_rate_limit_error(self, exc: Exception) -> tuple[bool, Optional[float]]:
+        """Returns True if the exception indicates a rate limit error, and the retry delay in seconds."""
+        from http import HTTPStatus
+
+        # Check for HTTP status TOO_MANY_REQUESTS in various exception classes.
+        # We look for attributes that contain status codes, instead of checking the type of the exception,
+        # in order to handle a wider variety of exception classes.
+        is_rate_limit_error = False
+        retry_delay: Optional[float] = None
+
+        # requests.HTTPError/httpx.HTTPStatusError
+        if (
+            hasattr(exc, 'response')
+            and hasattr(exc.response, 'status_code')
+            and exc.response.status_code == HTTPStatus.TOO_MANY_REQUESTS.value
+        ):
+            is_rate_limit_error = True
+            retry_delay = self._extract_retry_delay_from_headers(exc.response.headers)
+        elif (
+            # urllib.error.HTTPError
+            (hasattr(exc, 'code') and exc.code == HTTPStatus.TOO_MANY_REQUESTS.value)
+            # aiohttp.ClientResponseError
+            or (hasattr(exc, 'status') and exc.status == HTTPStatus.TOO_MANY_REQUESTS.value)
+        ) and hasattr(exc, 'headers'):
+            is_rate_limit_error = True
+            retry_delay = self._extract_retry_delay_from_headers(exc.headers)
+
+        if is_rate_limit_error:
+            return True, retry_delay
+
+        # Check common rate limit keywords in exception message
+        error_msg = str(exc).lower()
+        if any(indicator in error_msg for indicator in self.RATE_LIMIT_INDICATORS):
+            retry_delay = self._extract_retry_delay_from_message(error_msg)
+            return True, retry_delay
+
+        return False, None
+
+    def _extract_retry_delay_from_headers(self, headers: Optional[Any]) -> Optional[float]:
+        """Extract retry delay from HTTP headers."""
+        if headers is None:
+            return None
+
+        # convert headers to dict-like object for consistent access
+        header_dict: dict
+        if hasattr(headers, 'get'):
+            header_dict = headers
+        else:
+            # headers are a list of tuples or other format
+            try:
+                header_dict = dict(headers)
+            except (TypeError, ValueError):
+                return None
+        # normalize dict keys: lowercase and remove dashes
+        header_dict = {k.lower().replace('-', ''): v for k, v in header_dict.items()}
+
+        # check Retry-After header
+        retry_after = header_dict.get('retryafter')
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except (ValueError, TypeError):
+                pass
+
+        # check X-RateLimit-Reset (Unix timestamp)
+        reset_time = header_dict.get('xratelimitreset')
+        if reset_time is not None:
+            try:
+                reset_timestamp = float(reset_time)
+                delay = max(0, reset_timestamp - time.time())
+                return delay
+            except (ValueError, TypeError):
+                pass
+
+        # check X-RateLimit-Reset-After (seconds from now)
+        reset_after = header_dict.get('xratelimitresetafter')
+        if reset_after is not None:
+            try:
+                return float(reset_after)
+            except (ValueError, TypeError):
+                pass
+
+        return None
+
+    def _extract_retry_delay_from_message(self, msg: str) -> Optional[float]:
+        msg_lower = msg.lower()
+        for pattern in self.RETRY_AFTER_PATTERNS:
+            match = re.search(pattern, msg_lower)
+            if match is not None:
+                try:
+                    return float(match.group(1))
+                except (ValueError, TypeError):
+                    continue
+        return None
+
+
+class RequestRateScheduler(RetryingScheduler):
     """
     Scheduler for FunctionCalls with a fixed request rate limit and no runtime resource usage reports.
 
@@ -261,12 +409,15 @@ class RequestRateScheduler(Scheduler):
         * a single rate limit for all calls against that model
         * in the config: section '<endpoint>.rate_limits', key '<model>'
     - if no rate limit is found in the config, uses a default of 600 RPM
+    - if shared rate limits are enabled, requests are also drawn from a token bucket that is shared with other
+      processes (see utils.rate_limit_buckets)
 
-    TODO:
-    - adaptive rate limiting based on 429 errors
+    For endpoints without a known rate limit (eg, self-hosted inference servers), AdaptiveConcurrencyScheduler
+    discovers the sustainable load at runtime.
     """
 
     secs_per_request: float  # inverted rate limit
+    shared_limits: Optional[rate_limit_buckets.SharedRateLimits]
     num_in_flight: int
     total_requests: int
     total_retried: int
@@ -275,13 +426,6 @@ class RequestRateScheduler(Scheduler):
     TIME_FORMAT = '%H:%M.%S %f'
     MAX_RETRIES = 3
     DEFAULT_RATE_LIMIT = 600  # requests per minute
-    RATE_LIMIT_INDICATORS = ('rate limit', 'too many requests', '429', 'quota exceeded', 'throttled', 'rate exceeded')
-    RETRY_AFTER_PATTERNS = (
-        r'retry after (\d+(?:\.\d+)?)\s*seconds?',
-        r'try again in (\d+(?:\.\d+)?)\s*seconds?',
-        r'wait (\d+(?:\.\d+)?)\s*seconds?',
-        r'retry-after:\s*(\d+(?:\.\d+)?)',
-    )
 
     # Exponential backoff defaults
     BASE_RETRY_DELAY = 1.0  # in seconds
@@ -316,6 +460,9 @@ class RequestRateScheduler(Scheduler):
         requests_per_min = requests_per_min or self.DEFAULT_RATE_LIMIT
         _logger.debug(f'rate limit for {self.resource_pool}: {requests_per_min} RPM')
         self.secs_per_request = 1 / (requests_per_min / 60)
+        self.shared_limits = (
+            rate_limit_buckets.SharedRateLimits(resource_pool) if rate_limit_buckets.is_enabled() else None
+        )
 
     @classmethod
     def matches(cls, resource_pool: str) -> bool:
@@ -336,6 +483,18 @@ class RequestRateScheduler(Scheduler):
             if wait_duration > 0:
                 _logger.debug(f'waiting for {wait_duration} for {self.resource_pool}')
                 await asyncio.sleep(wait_duration)
+            if self.shared_limits is not None:
+                # allow bursts of up to one second's worth of requests
+                requests_per_sec = 1 / self.secs_per_request
+                shared_limits = {'requests': (max(1.0, requests_per_sec), requests_per_sec)}
+                while True:
+                    wait_duration = await asyncio.to_thread(
+                        self.shared_limits.try_acquire, {'requests': 1}, shared_limits
+                    )
+                    if wait_duration == 0.0:
+                        break
+                    _logger.debug(f'waiting {wait_duration:.2f}s for shared rate limit of {self.resource_pool}')
+                    await asyncio.sleep(wait_duration)
 
             last_request_ts = time.monotonic()
             if item.num_retries > 0:
@@ -355,27 +514,18 @@ class RequestRateScheduler(Scheduler):
 
         try:
             start_ts = datetime.datetime.now(tz=datetime.timezone.utc)
-            pxt_fn = request.fn_call.fn
-            assert isinstance(pxt_fn, func.CallableFunction)
             _logger.debug(
                 f'scheduler {self.resource_pool}: '
                 f'start evaluating slot {request.fn_call.slot_idx}, batch_size={len(request.rows)}'
             )
             self.total_requests += 1
-            if request.is_batched:
-                batch_result = await pxt_fn.aexec_batch(*request.batch_args, **request.batch_kwargs)
-                assert len(batch_result) == len(request.rows)
-                for row, result in zip(request.rows, batch_result):
-                    row[request.fn_call.slot_idx] = result
-            else:
-                result = await pxt_fn.aexec(*request.args, **request.kwargs)
-                request.row[request.fn_call.slot_idx] = result
+            await self._eval_request(request)
             end_ts = datetime.datetime.now(tz=datetime.timezone.utc)
             _logger.debug(
                 f'scheduler {self.resource_pool}: evaluated slot {request.fn_call.slot_idx} '
                 f'in {end_ts - start_ts}, batch_size={len(request.rows)}'
             )
-            self.dispatcher.dispatch(request.rows, exec_ctx)
+            self.dispatcher.dispatch(request.get_result_rows(), exec_ctx)
 
         except Exception as exc:
             _logger.debug(f'exception for {self.resource_pool}: type={type(exc)}\n{exc}')
@@ -396,7 +546,7 @@ class RequestRateScheduler(Scheduler):
             _, _, exc_tb = sys.exc_info()
             for row in request.rows:
                 row.set_exc(request.fn_call.slot_idx, exc)
-            self.dispatcher.dispatch_exc(request.rows, request.fn_call.slot_idx, exc_tb, exec_ctx)
+            self.dispatcher.dispatch_exc(request.get_result_rows(), request.fn_call.slot_idx, exc_tb, exec_ctx)
         finally:
             _logger.debug(
                 f'Scheduler stats: #in-flight={self.num_in_flight} #requests={self.total_requests}, '
@@ -405,119 +555,415 @@ class RequestRateScheduler(Scheduler):
             if is_task:
                 self.num_in_flight -= 1
 
-    def _is_rate_limit_error(self, exc: Exception) -> tuple[bool, Optional[float]]:
-        """Returns True if the exception indicates a rate limit error, and the retry delay in seconds."""
-        from http import HTTPStatus
+    def _compute_retry_delay(self, num_retries: int, retry_after: Optional[float] = None) -> float:
+        """
+        Calculate exponential backoff delay for rate limit errors.
 
-        # Check for HTTP status TOO_MANY_REQUESTS in various exception classes.
-        # We look for attributes that contain status codes, instead of checking the type of the exception,
-        # in order to handle a wider variety of exception classes.
-        is_rate_limit_error = False
-        retry_delay: Optional[float] = None
+        Args:
+            retry_count: Number of retries attempted (0-based)
+            retry_after: Suggested delay from Retry-After header
 
-        # requests.HTTPError/httpx.HTTPStatusError
-        if (
-            hasattr(exc, 'response')
-            and hasattr(exc.response, 'status_code')
-            and exc.response.status_code == HTTPStatus.TOO_MANY_REQUESTS.value
-        ):
-            is_rate_limit_error = True
-            retry_delay = self._extract_retry_delay_from_headers(exc.response.headers)
-        elif (
-            # urllib.error.HTTPError
-            (hasattr(exc, 'code') and exc.code == HTTPStatus.TOO_MANY_REQUESTS.value)
-            # aiohttp.ClientResponseError
-            or (hasattr(exc, 'status') and exc.status == HTTPStatus.TOO_MANY_REQUESTS.value)
-        ) and hasattr(exc, 'headers'):
-            is_rate_limit_error = True
-            retry_delay = self._extract_retry_delay_from_headers(exc.headers)
+        Returns:
+            Delay in seconds
+        """
+        if retry_after is not None and retry_after > 0:
+            # Use server-suggested delay, but cap it at max_delay
+            return max(min(retry_after, self.MAX_RETRY_DELAY), self.BASE_RETRY_DELAY)
+        else:
+            delay = self.BASE_RETRY_DELAY * (self.RETRY_BACKOFF_MULTIPLIER**num_retries)
+            return max(min(delay, self.MAX_RETRY_DELAY), self.BASE_RETRY_DELAY)
 
-        if is_rate_limit_error:
-            return True, retry_delay
 
-        # Check common rate limit keywords in exception message
-        error_msg = str(exc).lower()
-        if any(indicator in error_msg for indicator in self.RATE_LIMIT_INDICATORS):
-            retry_delay = self._extract_retry_delay_from_message(error_msg)
-            return True, retry_delay
+@dataclass
+class AdaptiveConcurrencyInfo:
+    """
+    Concurrency limit learned by AdaptiveConcurrencyScheduler for a resource pool.
 
-        return False, None
+    Stored in Env's resource pool info, so that subsequent queries against the same pool start out with what earlier
+    ones learned.
+    """
 
-    def _extract_retry_delay_from_headers(self, headers: Optional[Any]) -> Optional[float]:
-        """Extract retry delay from HTTP headers."""
-        if headers is None:
-            return None
+    limit: float  # max number of in-flight requests; fractional, so that additive increases can accumulate
+    min_latency: Optional[float] = None  # baseline latency of successful requests, in seconds
+    last_decrease_ts: float = 0.0  # time.monotonic() of the last decrease
+    num_decreases: int = 0
+    backoff_until: float = 0.0  # time.monotonic(); set from Retry-After, no requests are issued before then
 
-        # convert headers to dict-like object for consistent access
-        header_dict: dict
-        if hasattr(headers, 'get'):
-            header_dict = headers
+
+class AdaptiveConcurrencyScheduler(RetryingScheduler):
+    """
+    Scheduler for FunctionCalls against endpoints that have neither known rate limits nor resource usage reports,
+    such as self-hosted inference servers or gateways: resource_pool='adaptive:<endpoint>[:<model>]'.
+
+    Scheduling strategy: limit the number of in-flight requests and adjust that limit via additive increase/
+    multiplicative decrease (AIMD):
+    - the limit starts out small and doubles with each round of successful requests until the first decrease
+      ("slow start"), after which it grows by one per round of successful requests
+    - rate limit errors (HTTP 429), 503s and timeouts cut the limit in half, a latency that exceeds the baseline latency
+      by more than LATENCY_TOLERANCE cuts it by LATENCY_DECREASE_FACTOR
+    - only requests that were started after the last decrease can trigger another one, so that a burst of failures
+      of requests that were issued under the old limit counts as a single congestion signal
+    - a Retry-After header pauses the entire pool; failed requests are retried with jittered exponential backoff
+
+    The limit is capped by the config option 'adaptive_max_concurrency' (default: 64).
+    """
+
+    info: AdaptiveConcurrencyInfo
+    max_concurrency: int
+    num_in_flight: int
+    request_completed: asyncio.Event
+    total_requests: int
+    total_retried: int
+    total_errors: int
+
+    MAX_RETRIES = 5
+    INITIAL_CONCURRENCY = 2
+    MIN_CONCURRENCY = 1
+    DEFAULT_MAX_CONCURRENCY = 64
+    ERROR_DECREASE_FACTOR = 0.5
+    LATENCY_DECREASE_FACTOR = 0.9
+    LATENCY_TOLERANCE = 2.5  # relative to min_latency
+    MIN_LATENCY_DRIFT = 0.01  # the baseline rises by this fraction per request, in order to track a slower endpoint
+    OVERLOAD_STATUS_CODES = (429, 503)
+
+    # backoff for retries without a Retry-After, before jitter
+    BASE_RETRY_DELAY = 0.5  # in seconds
+    MAX_RETRY_DELAY = 60.0  # in seconds
+    RETRY_JITTER = 0.2  # fraction of a Retry-After delay that is added at random
+
+    def __init__(self, resource_pool: str, dispatcher: Dispatcher):
+        super().__init__(resource_pool, dispatcher)
+        loop_task = asyncio.create_task(self._main_loop())
+        self.dispatcher.register_task(loop_task)
+        self.max_concurrency = Config.get().get_int_value('adaptive_max_concurrency') or self.DEFAULT_MAX_CONCURRENCY
+        self.info = env.Env.get().get_resource_pool_info(
+            resource_pool, lambda: AdaptiveConcurrencyInfo(limit=min(self.INITIAL_CONCURRENCY, self.max_concurrency))
+        )
+        assert isinstance(self.info, AdaptiveConcurrencyInfo)
+        # the config might have changed since the limit was learned
+        self.info.limit = min(self.info.limit, self.max_concurrency)
+        self.num_in_flight = 0
+        self.request_completed = asyncio.Event()
+        self.total_requests = 0
+        self.total_retried = 0
+        self.total_errors = 0
+
+    @classmethod
+    def matches(cls, resource_pool: str) -> bool:
+        return resource_pool.startswith('adaptive:')
+
+    async def _main_loop(self) -> None:
+        item: Optional[AdaptiveConcurrencyScheduler.QueueItem] = None
+        while True:
+            if item is None:
+                item = await self.queue.get()
+                if item.num_retries > 0:
+                    self.total_retried += 1
+
+            now = time.monotonic()
+            wait_until = max(self.info.backoff_until, item.retry_after or 0.0)
+            if wait_until > now:
+                _logger.debug(f'waiting {wait_until - now:.2f}s for {self.resource_pool}')
+                await asyncio.sleep(wait_until - now)
+                # the backoff might have been extended in the meantime
+                continue
+
+            if self.num_in_flight >= int(self.info.limit):
+                self.request_completed.clear()
+                await self.request_completed.wait()
+                continue
+
+            _logger.debug(f'creating task for {self.resource_pool}: limit={self.info.limit:.2f}')
+            self.num_in_flight += 1
+            task = asyncio.create_task(self._exec(item.request, item.exec_ctx, item.num_retries))
+            self.dispatcher.register_task(task)
+            item = None
+
+    async def _exec(self, request: FnCallArgs, exec_ctx: ExecCtx, num_retries: int) -> None:
+        assert all(not row.has_val[request.fn_call.slot_idx] for row in request.rows)
+        assert all(not row.has_exc(request.fn_call.slot_idx) for row in request.rows)
+
+        start_ts = time.monotonic()
+        try:
+            self.total_requests += 1
+            await self._eval_request(request)
+            self._record_success(start_ts, time.monotonic() - start_ts)
+            self.dispatcher.dispatch(request.get_result_rows(), exec_ctx)
+
+        except Exception as exc:
+            _logger.debug(f'exception for {self.resource_pool}: type={type(exc)}\n{exc}')
+            is_overload_error, retry_after = self._is_overload_error(exc)
+            if is_overload_error:
+                self._decrease(start_ts, self.ERROR_DECREASE_FACTOR)
+                retry_ts = time.monotonic() + self._compute_retry_delay(num_retries, retry_after)
+                if retry_after is not None and retry_after > 0:
+                    # the server told us when to come back: that applies to all requests
+                    self.info.backoff_until = max(self.info.backoff_until, retry_ts)
+                if num_retries < self.MAX_RETRIES:
+                    _logger.debug(f'scheduler {self.resource_pool}: retrying in {retry_ts - time.monotonic():.2f}s')
+                    self.queue.put_nowait(self.QueueItem(request, num_retries + 1, exec_ctx, retry_after=retry_ts))
+                    return
+
+            # record the exception
+            self.total_errors += 1
+            _, _, exc_tb = sys.exc_info()
+            for row in request.rows:
+                row.set_exc(request.fn_call.slot_idx, exc)
+            self.dispatcher.dispatch_exc(request.get_result_rows(), request.fn_call.slot_idx, exc_tb, exec_ctx)
+        finally:
+            _logger.debug(
+                f'Scheduler stats: #in-flight={self.num_in_flight} limit={self.info.limit:.2f} '
+                f'#requests={self.total_requests}, #retried={self.total_retried} #errors={self.total_errors}'
+            )
+            self.num_in_flight -= 1
+            self.request_completed.set()
+
+    def _record_success(self, start_ts: float, latency: float) -> None:
+        info = self.info
+        if info.min_latency is not None and latency > self.LATENCY_TOLERANCE * info.min_latency:
+            self._decrease(start_ts, self.LATENCY_DECREASE_FACTOR)
+        elif self.num_in_flight >= int(info.limit):
+            # only grow the limit if it is actually being used
+            increase = 1.0 if info.num_decreases == 0 else 1.0 / info.limit
+            info.limit = min(info.limit + increase, self.max_concurrency)
+        if info.min_latency is None or latency < info.min_latency:
+            info.min_latency = latency
         else:
-            # headers are a list of tuples or other format
-            try:
-                header_dict = dict(headers)
-            except (TypeError, ValueError):
-                return None
-        # normalize dict keys: lowercase and remove dashes
-        header_dict = {k.lower().replace('-', ''): v for k, v in header_dict.items()}
+            info.min_latency *= 1.0 + self.MIN_LATENCY_DRIFT
 
-        # check Retry-After header
-        retry_after = header_dict.get('retryafter')
-        if retry_after is not None:
-            try:
-                return float(retry_after)
-            except (ValueError, TypeError):
-                pass
+    def _decrease(self, start_ts: float, factor: float) -> None:
+        info = self.info
+        if start_ts < info.last_decrease_ts:
+            # the request was issued under the previous limit
+            return
+        info.limit = max(info.limit * factor, self.MIN_CONCURRENCY)
+        info.last_decrease_ts = time.monotonic()
+        info.num_decreases += 1
+        _logger.debug(f'scheduler {self.resource_pool}: decreased limit to {info.limit:.2f}')
 
-        # check X-RateLimit-Reset (Unix timestamp)
-        reset_time = header_dict.get('xratelimitreset')
-        if reset_time is not None:
-            try:
-                reset_timestamp = float(reset_time)
-                delay = max(0, reset_timestamp - time.time())
-                return delay
-            except (ValueError, TypeError):
-                pass
+    def _is_overload_error(self, exc: Exception) -> tuple[bool, Optional[float]]:
+        """
+        Returns True if the exception indicates that the endpoint is overloaded (rate limit error, 503 or timeout), and
+        the retry delay in seconds, if one was supplied.
+        """
+        is_rate_limit_error, retry_after = self._is_rate_limit_error(exc)
+        if is_rate_limit_error:
+            return True, retry_after
+        response = getattr(exc, 'response', None)
+        status_code = getattr(response, 'status_code', None) or getattr(exc, 'status', None)
+        if status_code in self.OVERLOAD_STATUS_CODES:
+            return True, self._extract_retry_delay_from_headers(getattr(response, 'headers', None))
+        # asyncio.TimeoutError, httpx.TimeoutException, openai.APITimeoutError, etc.
+        if isinstance(exc, TimeoutError) or 'timeout' in type(exc).__name__.lower():
+            return True, None
+        return False, None
 
-        # check X-RateLimit-Reset-After (seconds from now)
-        reset_after = header_dict.get('xratelimitresetafter')
-        if reset_after is not None:
-            try:
-                return float(reset_after)
-            except (ValueError, TypeError):
-                pass
+    def _compute_retry_delay(self, num_retries: int, retry_after: Optional[float]) -> float:
+        """Returns the Retry-After delay plus some jitter, or an exponential backoff delay with full jitter"""
+        if retry_after is not None and retry_after > 0:
+            return min(retry_after * (1.0 + random.uniform(0.0, self.RETRY_JITTER)), self.MAX_RETRY_DELAY)
+        return random.uniform(0.0, min(self.BASE_RETRY_DELAY * 2**num_retries, self.MAX_RETRY_DELAY))
 
-        return None
 
-    def _extract_retry_delay_from_message(self, msg: str) -> Optional[float]:
-        msg_lower = msg.lower()
-        for pattern in self.RETRY_AFTER_PATTERNS:
-            match = re.search(pattern, msg_lower)
-            if match is not None:
+class BatchApiScheduler(Scheduler):
+    """
+    Scheduler for FunctionCalls that are executed through a provider's batch API:
+    resource_pool='batch-api:<provider>:<endpoint>:<model>' (see utils.batch_api).
+
+    Scheduling strategy:
+    - collect pending calls until no new ones have arrived for BATCH_LINGER seconds (the number of pending calls is
+      bounded by the rows that ExprEvalNode buffers) or until there are MAX_BATCH_REQUESTS of them
+    - calls that make the same request share a single batch request
+    - requests that were already submitted, by this or an earlier process, are looked up in the request journal and
+      not submitted again
+    - each batch is polled every POLL_INTERVAL seconds; once it is done, its results are written back into the rows,
+      which then continue through the rest of the evaluation (and are stored, if this is a backfill)
+
+    With submit_only (ExecContext.batch_submit_only), the rows don't wait for the batches: they are completed with an
+    exception as soon as their requests have been submitted and journaled. A batch-mode backfill makes such a
+    submission pass over all rows first, so that the number of submitted requests isn't bounded by the ExprEvalNode
+    buffer; the backfill itself then finds all requests in the journal and stores the rows of each batch when it
+    completes.
+    """
+
+    @dataclass
+    class PendingCall:
+        request: FnCallArgs
+        exec_ctx: ExecCtx
+        num_outstanding: int  # rows of request without a result
+
+    endpoint: batch_api.BatchEndpoint
+    model: str
+    request_param_names: list[str]  # names of the parameters of BatchEndpoint.make_request()
+    waiting: dict[str, list[tuple[PendingCall, int]]]  # request key -> [(call, row idx)]
+    batch_keys: dict[str, set[str]]  # batch id -> keys of waiting requests
+    batch_outputs: OrderedDict[str, batch_api.BatchOutput]  # most recent outputs of completed batches
+    submit_only: bool
+    total_requests: int
+    total_submitted: int
+    total_batches: int
+
+    MAX_BATCH_REQUESTS = 10_000
+    BATCH_LINGER = 2.0  # in seconds
+    POLL_INTERVAL = 30.0  # in seconds
+    MAX_CACHED_OUTPUTS = 4
+
+    def __init__(self, resource_pool: str, dispatcher: Dispatcher):
+        super().__init__(resource_pool, dispatcher)
+        self.endpoint, self.model = batch_api.parse_resource_pool(resource_pool)
+        sig = inspect.signature(self.endpoint.make_request)
+        self.request_param_names = [p.name for p in sig.parameters.values()]
+        self.waiting = defaultdict(list)
+        self.batch_keys = {}
+        self.batch_outputs = OrderedDict()
+        self.submit_only = False
+        self.total_requests = 0
+        self.total_submitted = 0
+        self.total_batches = 0
+        loop_task = asyncio.create_task(self._main_loop())
+        self.dispatcher.register_task(loop_task)
+
+    @classmethod
+    def matches(cls, resource_pool: str) -> bool:
+        return resource_pool.startswith('batch-api:')
+
+    async def _main_loop(self) -> None:
+        await asyncio.to_thread(batch_api.purge_requests)
+        while True:
+            items = [await self.queue.get()]
+            num_rows = len(items[0].request.rows)
+            while num_rows < self.MAX_BATCH_REQUESTS:
                 try:
-                    return float(match.group(1))
-                except (ValueError, TypeError):
+                    item = await asyncio.wait_for(self.queue.get(), timeout=self.BATCH_LINGER)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                num_rows += len(item.request.rows)
+            await self._submit(items)
+
+    async def _submit(self, items: list[Scheduler.QueueItem]) -> None:
+        """Submits the requests of items that aren't already waiting for a batch"""
+        bodies: dict[str, dict[str, Any]] = {}  # request key -> body of requests that aren't waiting yet
+        for item in items:
+            call = self.PendingCall(item.request, item.exec_ctx, len(item.request.rows))
+            kwargs_list = item.request.fn_call.get_param_values(self.request_param_names, item.request.rows)
+            for i, kwargs in enumerate(kwargs_list):
+                self.total_requests += 1
+                try:
+                    body = self.endpoint.make_request(**kwargs)
+                except Exception as exc:
+                    self._set_result(call, i, None, exc)
                     continue
-        return None
+                key = batch_api.request_key(self.resource_pool, body)
+                if key not in self.waiting:
+                    bodies[key] = body
+                self.waiting[key].append((call, i))
+        if len(bodies) == 0:
+            return
 
-    def _compute_retry_delay(self, num_retries: int, retry_after: Optional[float] = None) -> float:
-        """
-        Calculate exponential backoff delay for rate limit errors.
+        # requests that were submitted earlier only need to be picked up
+        batch_ids = await asyncio.to_thread(batch_api.lookup_requests, self.resource_pool, list(bodies.keys()))
+        for key, batch_id in batch_ids.items():
+            self._watch(batch_id, [key])
+        new_keys = [key for key in bodies if key not in batch_ids]
+        if len(new_keys) == 0:
+            return
 
-        Args:
-            retry_count: Number of retries attempted (0-based)
-            retry_after: Suggested delay from Retry-After header
+        try:
+            requests = [batch_api.BatchRequest(key, bodies[key]) for key in new_keys]
+            batch_id = await self.endpoint.api.submit(self.endpoint.url, self.model, requests)
+            await asyncio.to_thread(batch_api.record_requests, self.resource_pool, batch_id, new_keys)
+        except Exception as exc:
+            _logger.debug(f'scheduler {self.resource_pool}: batch submission failed: {exc}')
+            for key in new_keys:
+                self._deliver(key, None, exc)
+            return
+        self.total_submitted += len(new_keys)
+        self.total_batches += 1
+        _logger.debug(f'scheduler {self.resource_pool}: submitted batch {batch_id} with {len(new_keys)} requests')
+        self._watch(batch_id, new_keys)
+
+    def _watch(self, batch_id: str, keys: list[str]) -> None:
+        """Makes the requests wait for the output of the batch"""
+        if self.submit_only:
+            for key in keys:
+                self._deliver(key, None, excs.Error(f'Batch request submitted (batch {batch_id})'))
+            return
+        if batch_id in self.batch_keys:
+            self.batch_keys[batch_id].update(keys)
+            return
+        self.batch_keys[batch_id] = set(keys)
+        task = asyncio.create_task(self._poll(batch_id))
+        self.dispatcher.register_task(task)
 
-        Returns:
-            Delay in seconds
-        """
-        if retry_after is not None and retry_after > 0:
-            # Use server-suggested delay, but cap it at max_delay
-            return max(min(retry_after, self.MAX_RETRY_DELAY), self.BASE_RETRY_DELAY)
-        else:
-            delay = self.BASE_RETRY_DELAY * (self.RETRY_BACKOFF_MULTIPLIER**num_retries)
-            return max(min(delay, self.MAX_RETRY_DELAY), self.BASE_RETRY_DELAY)
+    async def _poll(self, batch_id: str) -> None:
+        output = self.batch_outputs.get(batch_id)
+        try:
+            while output is None:
+                output = await self.endpoint.api.poll(batch_id)
+                if output is None:
+                    await asyncio.sleep(self.POLL_INTERVAL)
+        except Exception as exc:
+            _logger.debug(f'scheduler {self.resource_pool}: polling batch {batch_id} failed: {exc}')
+            for key in self.batch_keys.pop(batch_id):
+                self._deliver(key, None, exc)
+            return
+
+        self.batch_outputs[batch_id] = output
+        self.batch_outputs.move_to_end(batch_id)
+        if len(self.batch_outputs) > self.MAX_CACHED_OUTPUTS:
+            self.batch_outputs.popitem(last=False)
+
+        keys = self.batch_keys.pop(batch_id)
+        failed_keys = [key for key in keys if output.results.get(key) is None or output.results[key].error is not None]
+        # failed requests are submitted again by subsequent queries; forget them before the results are delivered, so
+        # that a query that starts after this one has completed doesn't pick up the failed batch again
+        await asyncio.to_thread(batch_api.forget_requests, self.resource_pool, failed_keys)
+        for key in keys:
+            result = output.results.get(key)
+            if result is None or result.error is not None:
+                error = output.error if result is None else result.error
+                self._deliver(key, None, excs.Error(f'Batch request failed (batch {batch_id}): {error}'))
+            else:
+                self._deliver(key, result.body, None)
+        _logger.debug(
+            f'scheduler {self.resource_pool}: batch {batch_id} done: #results={len(keys)} #failed={len(failed_keys)} '
+            f'#requests={self.total_requests} #submitted={self.total_submitted} #batches={self.total_batches}'
+        )
+
+    def _deliver(self, key: str, body: Optional[dict[str, Any]], exc: Optional[Exception]) -> None:
+        for call, row_idx in self.waiting.pop(key, []):
+            self._set_result(call, row_idx, body, exc)
+
+    def _set_result(
+        self, call: PendingCall, row_idx: int, body: Optional[dict[str, Any]], exc: Optional[Exception]
+    ) -> None:
+        slot_idx = call.request.fn_call.slot_idx
+        row = call.request.rows[row_idx]
+        if exc is None:
+            try:
+                row[slot_idx] = self.endpoint.parse_response(body)
+            except Exception as parse_exc:
+                exc = parse_exc
+        if exc is not None:
+            row.set_exc(slot_idx, exc)
+        call.num_outstanding -= 1
+        if call.num_outstanding > 0:
+            return
+
+        # all rows of the call have a result
+        rows = call.request.get_result_rows()
+        self.dispatcher.dispatch([row for row in rows if not row.has_exc(slot_idx)], call.exec_ctx)
+        exc_rows = [row for row in rows if row.has_exc(slot_idx)]
+        if len(exc_rows) > 0:
+            exc_tb = exc_rows[0].get_exc(slot_idx).__traceback__
+            self.dispatcher.dispatch_exc(exc_rows, slot_idx, exc_tb, call.exec_ctx)
 
 
 # all concrete Scheduler subclasses that implement matches()
-SCHEDULERS = [RateLimitsScheduler, RequestRateScheduler]
+SCHEDULERS: list[type[Scheduler]] = [
+    RateLimitsScheduler,
+    RequestRateScheduler,
+    AdaptiveConcurrencyScheduler,
+    BatchApiScheduler,
+]
@@ -1,6 +1,11 @@
 from __future__ import annotations
 
 import dataclasses
+import json
+from typing import Any
+
+import numpy as np
+import PIL.Image
 
 from pixeltable.exprs import ArrayMd
 from pixeltable.utils.misc import non_none_dict_factory
@@ -8,6 +13,20 @@ from pixeltable.utils.misc import non_none_dict_factory
 INLINED_OBJECT_MD_KEY = '__pxtinlinedobjmd__'
 
 
+def hashable_value(val: Any) -> Any:
+    """Returns a hashable representation of a slot value, which is equal for equal values of the same type"""
+    if isinstance(val, (dict, list)):
+        return ('json', json.dumps(val, sort_keys=True, default=str))
+    if isinstance(val, np.ndarray):
+        return ('array', val.dtype.str, val.shape, val.tobytes())
+    if isinstance(val, PIL.Image.Image):
+        return ('image', val.mode, val.size, val.tobytes())
+    if isinstance(val, (bool, int, float)):
+        # 1, 1.0 and True are equal in Python, but they are different json values
+        return (type(val).__name__, val)
+    return val
+
+
 @dataclasses.dataclass
 class InlinedObjectMd:
     type: str  # corresponds to ts.ColumnType.Type
@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import pickle
+import sys
+import tempfile
+from typing import IO, Any, AsyncIterator, ClassVar, Iterable, Iterator, Optional, cast
+
+from pixeltable import exceptions as excs, exprs, func
+from pixeltable.config import Config
+from pixeltable.env import Env
+
+from .data_row_batch import DataRowBatch
+from .exec_node import ExecNode
+from .globals import hashable_value
+
+_logger = logging.getLogger('pixeltable')
+
+# the args and kwargs of an update() call, or None if the row is skipped (see FunctionCall.make_update_args())
+UpdateArgs = Optional[tuple[list[Any], dict[str, Any]]]
+
+
+class HashAggregationNode(ExecNode):
+    """
+    Hash-based aggregation for UDAs.
+
+    Used for grouping exprs that can't be evaluated in SQL (eg, UDF calls): groups are kept in a hash table that is
+    keyed by the values of the grouping exprs, so that the input doesn't need to be sorted by them.
+
+    If the estimated size of the aggregation state exceeds the aggregation_memory_mb budget, hash partitions of the
+    groups are spilled to local disk: the partial aggregator state of each group in a spilled partition is written out
+    once, and subsequent input rows of that partition are appended to the spill file. Spilled partitions are
+    aggregated after the input has been consumed, and are partitioned again if they don't fit into memory by
+    themselves.
+
+    If all aggregators implement merge(), spilled partitions continue to be aggregated in memory, and the partial
+    states of a group are merged after the input has been consumed, instead of the input rows being spilled.
+
+    Groups are returned in batches, in order of their first appearance in the input (spilled partitions last).
+    Within a group, the input rows are passed to the aggregators in input order, and aggregators that implement
+    update_batch() receive all rows of a group in an input batch with a single call.
+    """
+
+    DEFAULT_MEMORY_MB: ClassVar[int] = 256
+    NUM_PARTITIONS: ClassVar[int] = 16
+    # partitions are split recursively at most this many times; beyond that, groups are kept in memory
+    MAX_SPILL_LEVELS: ClassVar[int] = 3
+    OUTPUT_BATCH_SIZE: ClassVar[int] = 1024
+    # the size of the aggregation state is re-estimated every MEMORY_CHECK_INTERVAL rows
+    MEMORY_CHECK_INTERVAL: ClassVar[int] = 1024
+    # number of groups that are serialized to estimate the size of a group
+    SIZE_SAMPLE: ClassVar[int] = 32
+
+    group_by: list[exprs.Expr]
+    input_exprs: list[exprs.Expr]
+    agg_fn_eval_ctx: exprs.RowBuilder.EvalCtx
+    agg_fn_calls: list[exprs.FunctionCall]
+    memory_budget: int
+    can_merge: bool
+    limit: Optional[int]
+
+    # stats
+    num_spilled_partitions: int
+
+    def __init__(
+        self,
+        row_builder: exprs.RowBuilder,
+        group_by: list[exprs.Expr],
+        agg_fn_calls: list[exprs.FunctionCall],
+        input_exprs: Iterable[exprs.Expr],
+        input: ExecNode,
+    ):
+        output_exprs: list[exprs.Expr] = [*group_by, *agg_fn_calls]
+        super().__init__(row_builder, output_exprs, input_exprs, input)
+        self.input = input
+        self.group_by = group_by
+        self.input_exprs = list(input_exprs)
+        self.agg_fn_eval_ctx = row_builder.create_eval_ctx(agg_fn_calls, exclude=self.input_exprs)
+        # we need to make sure to refer to the same exprs that RowBuilder.eval() will use
+        self.agg_fn_calls = [cast(exprs.FunctionCall, e) for e in self.agg_fn_eval_ctx.target_exprs]
+        memory_mb = Config.get().get_int_value('aggregation_memory_mb') or self.DEFAULT_MEMORY_MB
+        self.memory_budget = memory_mb * 2**20
+        self.can_merge = all(self._agg_class(fn_call).has_merge() for fn_call in self.agg_fn_calls)
+        self.limit = None
+        self.num_spilled_partitions = 0
+
+    def set_limit(self, limit: int) -> None:
+        # we can't propagate the limit to our input
+        self.limit = limit
+
+    def _init_aggregators(self) -> list[Any]:
+        aggregators: list[Any] = []
+        for fn_call in self.agg_fn_calls:
+            try:
+                fn_call.reset_agg()
+            except Exception as exc:
+                _, _, exc_tb = sys.exc_info()
+                expr_msg = f'init() function of the aggregate {fn_call}'
+                raise excs.ExprEvalError(fn_call, expr_msg, exc, exc_tb, [], 0) from exc
+            aggregators.append(fn_call.aggregator)
+        return aggregators
+
+    def _agg_states(self, aggregators: list[Any]) -> list[dict[str, Any]]:
+        # Aggregator instances can't be pickled directly: @uda replaces the class in its module with an
+        # AggregateFunction, so we pickle their attributes instead
+        return [vars(aggregator) for aggregator in aggregators]
+
+    @classmethod
+    def _agg_class(cls, fn_call: exprs.FunctionCall) -> type[func.Aggregator]:
+        assert isinstance(fn_call.fn, func.AggregateFunction)
+        return fn_call.fn.agg_class
+
+    def _restore_aggregators(self, states: list[dict[str, Any]]) -> list[Any]:
+        aggregators: list[Any] = []
+        for fn_call, state in zip(self.agg_fn_calls, states):
+            agg_class = self._agg_class(fn_call)
+            aggregator = agg_class.__new__(agg_class)
+            aggregator.__dict__.update(state)
+            aggregators.append(aggregator)
+        return aggregators
+
+    def _update_aggregators(self, aggregators: list[Any], rows_args: list[list[UpdateArgs]]) -> None:
+        """Updates the aggregators of a group with rows_args (the update args of each aggregator, for each row)"""
+        for i, (fn_call, aggregator) in enumerate(zip(self.agg_fn_calls, aggregators)):
+            if aggregator.has_update_batch():
+                batch_args = exprs.FunctionCall.make_batch_args([row_args[i] for row_args in rows_args])
+                if batch_args is None:
+                    continue
+                arg_vecs, kwarg_vecs = batch_args
+                try:
+                    aggregator.update_batch(*arg_vecs, **kwarg_vecs)
+                except Exception as exc:
+                    _, _, exc_tb = sys.exc_info()
+                    expr_msg = f'update_batch() function of the aggregate {fn_call}'
+                    input_vals = [*arg_vecs, *kwarg_vecs.values()]
+                    raise excs.ExprEvalError(fn_call, expr_msg, exc, exc_tb, input_vals, 0) from exc
+                continue
+
+            for row_args in rows_args:
+                if row_args[i] is None:
+                    continue
+                args, kwargs = row_args[i]
+                try:
+                    aggregator.update(*args, **kwargs)
+                except Exception as exc:
+                    _, _, exc_tb = sys.exc_info()
+                    expr_msg = f'update() function of the aggregate {fn_call}'
+                    raise excs.ExprEvalError(fn_call, expr_msg, exc, exc_tb, [*args, *kwargs.values()], 0) from exc
+
+    def _merge_aggregators(self, aggregators: list[Any], others: list[Any]) -> None:
+        for fn_call, aggregator, other in zip(self.agg_fn_calls, aggregators, others):
+            try:
+                aggregator.merge(other)
+            except Exception as exc:
+                _, _, exc_tb = sys.exc_info()
+                expr_msg = f'merge() function of the aggregate {fn_call}'
+                raise excs.ExprEvalError(fn_call, expr_msg, exc, exc_tb, [], 0) from exc
+
+    async def __aiter__(self) -> AsyncIterator[DataRowBatch]:
+        table = _GroupTable(self, level=0)
+        try:
+            async for output_batch in self._aggregate(table):
+                yield output_batch
+        finally:
+            table.close()
+
+    async def _aggregate(self, table: _GroupTable) -> AsyncIterator[DataRowBatch]:
+        num_input_rows = 0
+        async for row_batch in self.input:
+            num_input_rows += len(row_batch)
+            # the update args of the rows of each group in this batch, in input order
+            batch_groups: dict[tuple, tuple[list[Any], list[list[UpdateArgs]]]] = {}
+            for row in row_batch:
+                vals = [row[e.slot_idx] for e in self.group_by]
+                key = tuple(hashable_value(v) for v in vals)
+                row_args = [fn_call.make_update_args(row) for fn_call in self.agg_fn_calls]
+                if key in batch_groups:
+                    batch_groups[key][1].append(row_args)
+                else:
+                    batch_groups[key] = (vals, [row_args])
+            for key, (vals, rows_args) in batch_groups.items():
+                table.add(key, vals, None, rows_args)
+
+        num_output_rows = 0
+        output_batch = DataRowBatch(self.row_builder)
+        for vals, aggregators in table.finish():
+            row = output_batch.add_row(None)
+            for e, val in zip(self.group_by, vals):
+                row[e.slot_idx] = val
+            for fn_call, aggregator in zip(self.agg_fn_calls, aggregators):
+                fn_call.aggregator = aggregator
+            self.row_builder.eval(row, self.agg_fn_eval_ctx, profile=self.ctx.profile)
+            num_output_rows += 1
+            if self.limit is not None and num_output_rows == self.limit:
+                break
+            if len(output_batch) == self.OUTPUT_BATCH_SIZE:
+                yield output_batch
+                output_batch = DataRowBatch(self.row_builder)
+
+        _logger.debug(
+            f'HashAggregationNode: consumed {num_input_rows} rows, returning {num_output_rows} rows '
+            f'({self.num_spilled_partitions} partitions spilled)'
+        )
+        if len(output_batch) > 0:
+            yield output_batch
+
+
+class _GroupTable:
+    """
+    The groups of one level of HashAggregationNode's hash table.
+
+    Spill files contain pickled records (key, grouping values, aggregator states, update args): a record with
+    aggregator states carries the partial state of a group (and precedes all rows of that group), a record with update
+    args contains input rows of a group. If the aggregators can be merged, spill files only contain aggregator states,
+    possibly several per group.
+    """
+
+    node: HashAggregationNode
+    level: int
+    groups: dict[tuple, tuple[list[Any], list[Any]]]  # key -> (grouping values, aggregators)
+    spill_files: dict[int, IO[bytes]]  # partition -> spill file
+    can_spill: bool
+    num_updates: int
+
+    def __init__(self, node: HashAggregationNode, level: int):
+        self.node = node
+        self.level = level
+        self.groups = {}
+        self.spill_files = {}
+        self.can_spill = level < HashAggregationNode.MAX_SPILL_LEVELS
+        self.num_updates = 0
+
+    def _partition(self, key: tuple) -> int:
+        # include the level, so that a spilled partition is split up when it is partitioned again
+        return hash((self.level, key)) % HashAggregationNode.NUM_PARTITIONS
+
+    def add(
+        self, key: tuple, vals: list[Any], aggregators: Optional[list[Any]], rows_args: Optional[list[list[UpdateArgs]]]
+    ) -> None:
+        """Adds either the partial state of a group (aggregators) or input rows of a group (rows_args)"""
+        partition = self._partition(key)
+        if partition in self.spill_files and not self.node.can_merge:
+            agg_states = self.node._agg_states(aggregators) if aggregators is not None else None
+            if self._write(partition, (key, vals, agg_states, rows_args)):
+                return
+
+        group = self.groups.get(key)
+        if aggregators is not None:
+            if group is None:
+                self.groups[key] = (vals, aggregators)
+            else:
+                self.node._merge_aggregators(group[1], aggregators)
+        else:
+            assert rows_args is not None
+            if group is None:
+                group = (vals, self.node._init_aggregators())
+                self.groups[key] = group
+            self.node._update_aggregators(group[1], rows_args)
+
+        self.num_updates += 1
+        if self.can_spill and self.num_updates % HashAggregationNode.MEMORY_CHECK_INTERVAL == 0:
+            self._check_memory()
+
+    def _check_memory(self) -> None:
+        sample = list(itertools.islice(self.groups.items(), HashAggregationNode.SIZE_SAMPLE))
+        if len(sample) == 0:
+            return
+        try:
+            sample_size = sum(
+                len(pickle.dumps((key, vals, self.node._agg_states(aggregators))))
+                for key, (vals, aggregators) in sample
+            )
+        except Exception as exc:
+            _logger.warning(f'HashAggregationNode: aggregation state cannot be spilled to disk ({exc})')
+            self.can_spill = False
+            return
+        group_size = sample_size / len(sample)
+        if len(self.groups) * group_size <= self.node.memory_budget:
+            return
+
+        # spill the largest partitions until we're at half the budget, to avoid spilling again right away
+        partition_sizes: dict[int, int] = {}
+        for key in self.groups:
+            p = self._partition(key)
+            partition_sizes[p] = partition_sizes.get(p, 0) + 1
+        num_groups = len(self.groups)
+        for p in sorted(partition_sizes, key=partition_sizes.get, reverse=True):
+            if num_groups * group_size <= self.node.memory_budget / 2 or not self.can_spill:
+                break
+            self._spill(p)
+            num_groups -= partition_sizes[p]
+
+    def _spill(self, partition: int) -> None:
+        if partition not in self.spill_files:
+            # closed in finish() or close()
+            self.spill_files[partition] = tempfile.TemporaryFile(dir=Env.get().tmp_dir)  # noqa: SIM115
+            self.node.num_spilled_partitions += 1
+        keys = [key for key in self.groups if self._partition(key) == partition]
+        for key in keys:
+            vals, aggregators = self.groups[key]
+            if not self._write(partition, (key, vals, self.node._agg_states(aggregators), None)):
+                return
+            del self.groups[key]
+        _logger.debug(f'HashAggregationNode: spilled {len(keys)} groups (level {self.level}, partition {partition})')
+
+    def _write(self, partition: int, record: tuple) -> bool:
+        """
+        Appends record to the spill file of partition. If the record can't be pickled, the partition is read back
+        into memory and spilling is disabled for this table; returns False in that case.
+        """
+        try:
+            data = pickle.dumps(record)
+        except Exception as exc:
+            _logger.warning(f'HashAggregationNode: aggregation state cannot be spilled to disk ({exc})')
+            self.can_spill = False
+            self._unspill(partition)
+            return False
+        self.spill_files[partition].write(data)
+        return True
+
+    def _unspill(self, partition: int) -> None:
+        spill_file = self.spill_files.pop(partition)
+        try:
+            spill_file.seek(0)
+            for key, vals, agg_states, rows_args in self._read(spill_file):
+                aggregators = self.node._restore_aggregators(agg_states) if agg_states is not None else None
+                self.add(key, vals, aggregators, rows_args)
+        finally:
+            spill_file.close()
+
+    @classmethod
+    def _read(cls, spill_file: IO[bytes]) -> Iterator[tuple]:
+        while True:
+            try:
+                yield pickle.load(spill_file)
+            except EOFError:
+                return
+
+    def close(self) -> None:
+        for spill_file in self.spill_files.values():
+            spill_file.close()
+        self.spill_files = {}
+
+    def finish(self) -> Iterator[tuple[list[Any], list[Any]]]:
+        """Returns (grouping values, aggregators) for all groups, including the spilled ones"""
+        if self.node.can_merge:
+            # groups of spilled partitions need to be merged with their spilled state
+            for partition in list(self.spill_files):
+                self._spill(partition)
+        groups, self.groups = self.groups, {}
+        yield from groups.values()
+        del groups
+
+        try:
+            for spill_file in self.spill_files.values():
+                spill_file.seek(0)
+                table = _GroupTable(self.node, self.level + 1)
+                try:
+                    for key, vals, agg_states, rows_args in self._read(spill_file):
+                        aggregators = self.node._restore_aggregators(agg_states) if agg_states is not None else None
+                        table.add(key, vals, aggregators, rows_args)
+                    spill_file.close()
+                    yield from table.finish()
+                finally:
+                    table.close()
+        finally:
+            # the caller may stop early (eg, because of a limit)
+            self.close()
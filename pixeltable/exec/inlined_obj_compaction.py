@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import dataclasses
+import io
+import logging
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, ClassVar, Iterator, Optional
+from uuid import UUID
+
+import sqlalchemy as sql
+
+import pixeltable.type_system as ts
+from pixeltable import catalog, exprs
+from pixeltable.env import Env
+from pixeltable.utils import parse_local_file_path
+from pixeltable.utils.array_segment import ArraySegmentWriter, segment_id, segment_path
+from pixeltable.utils.local_store import LocalStore
+from pixeltable.utils.object_stores import ObjectPath
+
+from .cell_materialization_node import CellMaterializationNode
+from .cell_reconstruction_node import MappedFiles
+from .globals import INLINED_OBJECT_MD_KEY, InlinedObjectMd
+
+_logger = logging.getLogger('pixeltable')
+
+
+@dataclasses.dataclass(frozen=True)
+class _ObjLoc:
+    """Location of an object in a file written by CellMaterializationNode"""
+
+    path: Path
+    start: int  # byte offset; for segment files: the index of the array in the segment
+    end: Optional[int] = None  # byte offset; None for segment files
+
+
+@dataclasses.dataclass
+class _Cell:
+    """A json or array cell that references objects in files written by CellMaterializationNode"""
+
+    col: catalog.Column
+    pk: tuple
+    cell_md: exprs.CellMd
+    val: Any  # the json value; None for array cells
+    locs: list[_ObjLoc]
+
+
+def _file_version(path: Path) -> int:
+    matched = re.match(ObjectPath.PATTERN, path.name)
+    assert matched is not None
+    return int(matched[3])
+
+
+def _inlined_obj_loc(obj_md: InlinedObjectMd, urls: list[str]) -> _ObjLoc:
+    local_path = parse_local_file_path(urls[obj_md.url_idx])
+    assert local_path is not None
+    if obj_md.type == ts.ColumnType.Type.ARRAY.name:
+        assert obj_md.array_md is not None and obj_md.array_md.start is not None
+        return _ObjLoc(local_path, obj_md.array_md.start, obj_md.array_md.end)
+    assert obj_md.img_start is not None
+    return _ObjLoc(local_path, obj_md.img_start, obj_md.img_end)
+
+
+def _inlined_objs(element: Any) -> Iterator[InlinedObjectMd]:
+    if isinstance(element, list):
+        for v in element:
+            yield from _inlined_objs(v)
+    elif isinstance(element, dict):
+        if INLINED_OBJECT_MD_KEY in element:
+            yield InlinedObjectMd.from_dict(dict(element[INLINED_OBJECT_MD_KEY]))
+        else:
+            for v in element.values():
+                yield from _inlined_objs(v)
+
+
+def _map_inlined_objs(element: Any, fn: Callable[[InlinedObjectMd], InlinedObjectMd]) -> Any:
+    """Returns a copy of element in which fn() has been applied to all inlined objects."""
+    if isinstance(element, list):
+        return [_map_inlined_objs(v, fn) for v in element]
+    if isinstance(element, dict):
+        if INLINED_OBJECT_MD_KEY in element:
+            obj_md = fn(InlinedObjectMd.from_dict(dict(element[INLINED_OBJECT_MD_KEY])))
+            return {INLINED_OBJECT_MD_KEY: obj_md.as_dict()}
+        return {k: _map_inlined_objs(v, fn) for k, v in element.items()}
+    return element
+
+
+class _ObjectCopier:
+    """
+    Copies objects into new files.
+
+    The new files are labeled with the oldest table version of the copied objects: revert() deletes the files of the
+    reverted version, and the oldest version can only be reverted after all newer versions have been reverted.
+    """
+
+    tbl_id: UUID
+    version: int
+    files: MappedFiles
+    target_file_size: int
+    writer: Optional[tuple[Path, io.BufferedWriter]]
+    segment_writers: dict[str, ArraySegmentWriter]  # key: codec
+    new_locs: dict[_ObjLoc, _ObjLoc]  # objects can be referenced by multiple cells; we only copy them once
+    new_paths: list[Path]
+
+    def __init__(self, tbl_id: UUID, version: int, files: MappedFiles, target_file_size: int):
+        self.tbl_id = tbl_id
+        self.version = version
+        self.files = files
+        self.target_file_size = target_file_size
+        self.writer = None
+        self.segment_writers = {}
+        self.new_locs = {}
+        self.new_paths = []
+
+    def _new_path(self, ext: Optional[str] = None) -> Path:
+        path = LocalStore(Env.get().media_dir)._prepare_path_raw(self.tbl_id, 0, self.version, ext=ext)
+        self.new_paths.append(path)
+        return path
+
+    def copy(self, loc: _ObjLoc) -> _ObjLoc:
+        if loc in self.new_locs:
+            return self.new_locs[loc]
+        new_loc: _ObjLoc
+        if loc.end is None:
+            # copy the compressed segment entry as is
+            reader = self.files.segment(loc.path)
+            seg_writer = self.segment_writers.get(reader.codec)
+            if seg_writer is None:
+                seg_writer = ArraySegmentWriter(self._new_path(ext='.seg'), reader.codec)
+                self.segment_writers[reader.codec] = seg_writer
+            new_loc = _ObjLoc(seg_writer.path, seg_writer.append_entry(reader.entry(loc.start)))
+        else:
+            if self.writer is None:
+                path = self._new_path()
+                fh = open(path, 'wb', buffering=CellMaterializationNode.MIN_FILE_SIZE * 2)  # noqa: SIM115
+                assert isinstance(fh, io.BufferedWriter)
+                self.writer = (path, fh)
+            path, fh = self.writer
+            start = fh.tell()
+            fh.write(self.files.read_bytes(loc.path, loc.start, loc.end))
+            new_loc = _ObjLoc(path, start, fh.tell())
+        self.new_locs[loc] = new_loc
+        return new_loc
+
+    def flush(self) -> None:
+        """Make all copied objects durable; needs to be called before the referencing cells are committed."""
+        if self.writer is not None:
+            _, fh = self.writer
+            fh.flush()
+            os.fsync(fh.fileno())  # needed to force bytes cached by OS to storage
+            if fh.tell() >= self.target_file_size:
+                fh.close()
+                self.writer = None
+        # segment files are only readable after they have been finalized
+        for seg_writer in self.segment_writers.values():
+            seg_writer.close()
+        self.segment_writers.clear()
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer[1].close()
+            self.writer = None
+        for seg_writer in self.segment_writers.values():
+            seg_writer.abort()
+        self.segment_writers.clear()
+
+
+class InlinedObjectCompactor:
+    """
+    Compaction of the files written by CellMaterializationNode for a single table:
+    - files that aren't referenced by any row (in any version of the table) are deleted
+    - the objects in sparsely populated files and in small files (typically the result of many small inserts) are
+      copied into new, dense files; the cells are updated to point to the copies in transactions of at most
+      CELLS_PER_XACT cells, after which the old files are deleted
+
+    Rows of older table versions are still reachable via time travel; their objects count as live.
+    """
+
+    # files with a smaller fraction of live bytes get rewritten
+    MIN_LIVE_FRACTION: ClassVar[float] = 0.5
+    # files smaller than this get merged
+    MIN_FILE_SIZE: ClassVar[int] = CellMaterializationNode.MIN_FILE_SIZE
+    # size of the files written by compaction
+    TARGET_FILE_SIZE: ClassVar[int] = 64 * 2**20
+    # max number of cells updated in a single transaction
+    CELLS_PER_XACT: ClassVar[int] = 1000
+
+    tbl_version_path: catalog.TableVersionPath
+    files: MappedFiles
+
+    def __init__(self, tbl_version_path: catalog.TableVersionPath):
+        self.tbl_version_path = tbl_version_path
+        self.files = MappedFiles()
+
+    def run(self) -> catalog.CompactionStatus:
+        from pixeltable.catalog import Catalog
+
+        tbl_id = self.tbl_version_path.tbl_id
+        with Catalog.get().begin_xact(tbl=self.tbl_version_path, for_write=True):
+            # we hold the table lock: no operation that writes new files for this table is in progress
+            files_before = self._list_files()
+            cells = self._scan()
+            file_live_bytes, _ = self._live_bytes(cells)
+            refd_paths = set(file_live_bytes.keys()) | self._media_paths()
+            orphans = [path for path in files_before if path not in refd_paths]
+            for path in orphans:
+                path.unlink(missing_ok=True)
+            _logger.debug(f'compaction of {tbl_id}: deleted {len(orphans)} unreferenced files')
+
+        candidates = self._rewrite_candidates(files_before, file_live_bytes)
+        num_rewritten_cells = self._rewrite(tbl_id, cells, candidates)
+        self.files.clear()
+
+        with Catalog.get().begin_xact(tbl=self.tbl_version_path, for_write=True):
+            # delete the rewritten files, unless they acquired new references in the meantime
+            file_live_bytes_after, live_bytes_after = self._live_bytes(self._scan())
+            deleted = [path for path in candidates if path not in file_live_bytes_after]
+            for path in deleted:
+                path.unlink(missing_ok=True)
+            files_after = self._list_files()
+        self.files.clear()
+
+        return catalog.CompactionStatus(
+            num_files_before=len(files_before),
+            num_files_after=len(files_after),
+            bytes_before=sum(files_before.values()),
+            bytes_after=sum(files_after.values()),
+            live_bytes=live_bytes_after,
+            num_deleted_files=len(orphans) + len(deleted),
+            num_rewritten_cells=num_rewritten_cells,
+            referenced_bytes_before=sum(files_before.get(path, 0) for path in file_live_bytes),
+            referenced_bytes_after=sum(files_after.get(path, 0) for path in file_live_bytes_after),
+        )
+
+    def _cols(self) -> list[catalog.Column]:
+        """Columns that can reference files written by CellMaterializationNode, including dropped columns"""
+        tv = self.tbl_version_path.tbl_version.get()
+        return [
+            col
+            for col in tv.cols
+            if col.is_stored and col.stores_cellmd and (col.col_type.is_json_type() or col.col_type.is_array_type())
+        ]
+
+    def _list_files(self) -> dict[Path, int]:
+        """Returns the files written by CellMaterializationNode for this table, with their sizes"""
+        result: dict[Path, int] = {}
+        for path in LocalStore(Env.get().media_dir).list_files(self.tbl_version_path.tbl_id):
+            matched = re.match(ObjectPath.PATTERN, path.name)
+            # media files have a file extension
+            if matched is None or int(matched[2]) != 0 or path.suffix not in ('', '.seg'):
+                continue
+            result[path] = path.stat().st_size
+        return result
+
+    def _media_paths(self) -> set[Path]:
+        """Returns the paths of media files that could be mistaken for files written by CellMaterializationNode"""
+        tv = self.tbl_version_path.tbl_version.get()
+        result: set[Path] = set()
+        for col in tv.cols:
+            if col.id != 0 or not col.is_stored or not col.col_type.is_media_type():
+                continue
+            stmt = sql.select(col.sa_col).where(col.sa_col.is_not(None))
+            for (url,) in Env.get().conn.execute(stmt):
+                assert isinstance(url, str)
+                local_path = parse_local_file_path(url)
+                if local_path is not None:
+                    result.add(local_path)
+        return result
+
+    def _scan(self) -> list[_Cell]:
+        """Returns all cells (in all table versions) that reference files written by CellMaterializationNode"""
+        store = self.tbl_version_path.tbl_version.get().store_tbl
+        pk_cols = store.pk_columns()
+        result: list[_Cell] = []
+        for col in self._cols():
+            is_json = col.col_type.is_json_type()
+            select_cols = [*pk_cols, col.sa_cellmd_col, *([col.sa_col] if is_json else [])]
+            cellmd_col = col.sa_cellmd_col
+            stmt = sql.select(*select_cols).where(
+                sql.or_(cellmd_col['file_urls'].is_not(None), cellmd_col['array_md']['segment_id'].is_not(None))
+            )
+            for row in Env.get().conn.execute(stmt):
+                cell_md = exprs.CellMd.from_dict(row[len(pk_cols)])
+                val = row[len(pk_cols) + 1] if is_json else None
+                locs: list[_ObjLoc]
+                array_md = cell_md.array_md
+                if array_md is not None and array_md.segment_id is not None:
+                    assert array_md.segment_idx is not None
+                    locs = [_ObjLoc(segment_path(col.tbl.id, array_md.segment_id), array_md.segment_idx)]
+                elif array_md is not None:
+                    assert cell_md.file_urls is not None and array_md.start is not None
+                    local_path = parse_local_file_path(cell_md.file_urls[0])
+                    assert local_path is not None
+                    locs = [_ObjLoc(local_path, array_md.start, array_md.end)]
+                else:
+                    assert cell_md.file_urls is not None
+                    locs = [_inlined_obj_loc(obj_md, cell_md.file_urls) for obj_md in _inlined_objs(val)]
+                result.append(_Cell(col, tuple(row[: len(pk_cols)]), cell_md, val, locs))
+        return result
+
+    def _live_bytes(self, cells: list[_Cell]) -> tuple[dict[Path, int], int]:
+        """Returns the live bytes per referenced file and in total"""
+        locs = {loc for cell in cells for loc in cell.locs}
+        file_live_bytes: dict[Path, int] = defaultdict(int)
+        for loc in locs:
+            if not loc.path.exists():
+                _logger.warning(f'compaction: missing file {loc.path}')
+                continue
+            if loc.end is None:
+                file_live_bytes[loc.path] += len(self.files.segment(loc.path).entry(loc.start))
+            else:
+                file_live_bytes[loc.path] += loc.end - loc.start
+        return file_live_bytes, sum(file_live_bytes.values())
+
+    def _rewrite_candidates(self, files: dict[Path, int], file_live_bytes: dict[Path, int]) -> set[Path]:
+        """Returns the files whose live objects should be copied into new files"""
+        # we can only merge files with the same layout
+        groups: dict[str, list[Path]] = defaultdict(list)
+        for path in file_live_bytes:
+            if path in files:
+                groups[path.suffix].append(path)
+        result: set[Path] = set()
+        for paths in groups.values():
+            sparse = [path for path in paths if file_live_bytes[path] < self.MIN_LIVE_FRACTION * files[path]]
+            small = [path for path in paths if files[path] < self.MIN_FILE_SIZE and path not in sparse]
+            result.update(sparse)
+            if len(sparse) + len(small) > 1:
+                # merging a single small file doesn't reduce the number of files
+                result.update(small)
+        return result
+
+    def _rewrite(self, tbl_id: UUID, cells: list[_Cell], paths: set[Path]) -> int:
+        """Copies the objects in paths into new files and updates the referencing cells; returns the number of cells"""
+        from pixeltable.catalog import Catalog
+
+        if len(paths) == 0:
+            return 0
+        cells = [cell for cell in cells if any(loc.path in paths for loc in cell.locs)]
+        # copy the objects in file order
+        cells.sort(key=lambda cell: min((str(loc.path), loc.start) for loc in cell.locs if loc.path in paths))
+        version = min(_file_version(path) for path in paths)
+        copier = _ObjectCopier(tbl_id, version, self.files, self.TARGET_FILE_SIZE)
+        try:
+            for i in range(0, len(cells), self.CELLS_PER_XACT):
+                with Catalog.get().begin_xact(tbl=self.tbl_version_path, for_write=True):
+                    store = self.tbl_version_path.tbl_version.get().store_tbl
+                    updates = [self._rewrite_cell(cell, paths, copier) for cell in cells[i : i + self.CELLS_PER_XACT]]
+                    copier.flush()
+                    for cell, values in zip(cells[i : i + self.CELLS_PER_XACT], updates):
+                        pk_clause = sql.and_(*(pk_col == val for pk_col, val in zip(store.pk_columns(), cell.pk)))
+                        Env.get().conn.execute(sql.update(store.sa_tbl).values(values).where(pk_clause))
+        finally:
+            copier.close()
+        _logger.debug(f'compaction of {tbl_id}: rewrote {len(cells)} cells into {len(copier.new_paths)} files')
+        return len(cells)
+
+    def _rewrite_cell(self, cell: _Cell, paths: set[Path], copier: _ObjectCopier) -> dict[sql.Column, Any]:
+        """Copies the cell's objects that are located in paths; returns the new column values"""
+        cell_md = cell.cell_md
+        values: dict[sql.Column, Any] = {}
+        if cell_md.array_md is not None:
+            new_loc = copier.copy(cell.locs[0])
+            array_md: exprs.ArrayMd
+            if cell_md.array_md.segment_id is not None:
+                array_md = dataclasses.replace(
+                    cell_md.array_md, segment_id=segment_id(new_loc.path), segment_idx=new_loc.start
+                )
+                new_md = dataclasses.replace(cell_md, array_md=array_md)
+            else:
+                array_md = dataclasses.replace(cell_md.array_md, start=new_loc.start, end=new_loc.end)
+                new_md = dataclasses.replace(cell_md, file_urls=[new_loc.path.as_uri()], array_md=array_md)
+        else:
+            file_urls = cell_md.file_urls
+            assert file_urls is not None
+            # url -> url_idx
+            urls: dict[str, int] = {}
+
+            def rewrite_obj(obj_md: InlinedObjectMd) -> InlinedObjectMd:
+                loc = _inlined_obj_loc(obj_md, file_urls)
+                if loc.path in paths:
+                    loc = copier.copy(loc)
+                url_idx = urls.setdefault(loc.path.as_uri(), len(urls))
+                if obj_md.array_md is not None:
+                    array_md = dataclasses.replace(obj_md.array_md, start=loc.start, end=loc.end)
+                    return dataclasses.replace(obj_md, url_idx=url_idx, array_md=array_md)
+                return dataclasses.replace(obj_md, url_idx=url_idx, img_start=loc.start, img_end=loc.end)
+
+            values[cell.col.sa_col] = _map_inlined_objs(cell.val, rewrite_obj)
+            new_md = dataclasses.replace(cell_md, file_urls=list(urls.keys()))
+        values[cell.col.sa_cellmd_col] = new_md.as_dict()
+        return values
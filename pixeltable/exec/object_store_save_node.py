@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import contextlib
 import dataclasses
 import itertools
 import logging
@@ -9,7 +10,10 @@ from pathlib import Path
 from typing import AsyncIterator, Iterator, NamedTuple, Optional
 
 from pixeltable import exprs
+from pixeltable.config import Config
+from pixeltable.utils import media_blobs
 from pixeltable.utils.object_stores import ObjectOps, ObjectPath, StorageTarget
+from pixeltable.utils.transfer_budget import TransferBudget
 
 from .data_row_batch import DataRowBatch
 from .exec_node import ExecNode
@@ -31,6 +35,13 @@ class ObjectStoreSaveNode(ExecNode):
                 dest1: [row_location1, row_location2, ...]
     Paths with multiple destinations are removed from the TempStore only after all destination copies are complete.
 
+    If the media_dedup config option is set, files are stored content-addressed where the destination supports it
+    (see utils.media_blobs). The reference from the table to a file is recorded before the file is stored; if the
+    query fails, the references recorded by it are released again.
+
+    Uploads to remote destinations are admitted by the process-wide TransferBudget, which limits the number of bytes
+    in flight; moves and copies within the local file system don't go through the budget.
+
     TODO:
     - Process a row at a time and limit the number of in-flight rows to control memory usage
     """
@@ -54,6 +65,7 @@ class ObjectStoreSaveNode(ExecNode):
 
     retain_input_order: bool  # if True, return rows in the exact order they were received
     file_col_info: list[exprs.ColumnSlotIdx]
+    dedup: bool  # if True, store files content-addressed
 
     # execution state
     num_returned_rows: int
@@ -72,6 +84,7 @@ class ObjectStoreSaveNode(ExecNode):
 
     input_finished: bool
     row_idx: Iterator[Optional[int]]
+    new_blob_refs: list[media_blobs.BlobRef]  # references to content-addressed files recorded by this node
 
     @dataclasses.dataclass
     class RowState:
@@ -85,6 +98,7 @@ class ObjectStoreSaveNode(ExecNode):
         super().__init__(input.row_builder, [], [], input)
         self.retain_input_order = retain_input_order
         self.file_col_info = file_col_info
+        self.dedup = Config.get().get_bool_value('media_dedup') or False
 
         self.num_returned_rows = 0
         self.ready_rows = deque()
@@ -93,6 +107,7 @@ class ObjectStoreSaveNode(ExecNode):
         self.in_flight_work = {}
         self.input_finished = False
         self.row_idx = itertools.count() if retain_input_order else itertools.repeat(None)
+        self.new_blob_refs = []
         assert self.QUEUE_DEPTH_HIGH_WATER > self.QUEUE_DEPTH_LOW_WATER
 
     @property
@@ -112,35 +127,44 @@ class ObjectStoreSaveNode(ExecNode):
 
     async def __aiter__(self) -> AsyncIterator[DataRowBatch]:
         input_iter = aiter(self.input)
-        with futures.ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
-            while True:
-                # Create work to fill the queue to the high water mark ... ?without overrunning the in-flight row limit.
-                while not self.input_finished and self.queued_work < self.QUEUE_DEPTH_HIGH_WATER:
-                    input_batch = await self.get_input_batch(input_iter)
-                    if input_batch is not None:
-                        self.__process_input_batch(input_batch, executor)
-
-                # Wait for enough completions to enable more queueing or if we're done
-                while self.queued_work > self.QUEUE_DEPTH_LOW_WATER or (self.input_finished and self.queued_work > 0):
-                    done, _ = futures.wait(self.in_flight_requests, return_when=futures.FIRST_COMPLETED)
-                    self.__process_completions(done, ignore_errors=self.ctx.ignore_errors)
-
-                # Emit results to meet batch size requirements or empty the in-flight row queue
-                if self.__has_ready_batch() or (
-                    len(self.ready_rows) > 0 and self.input_finished and self.queued_work == 0
-                ):
-                    # create DataRowBatch from the first BATCH_SIZE ready rows
-                    batch = DataRowBatch(self.row_builder)
-                    rows = [self.ready_rows.popleft() for _ in range(min(self.BATCH_SIZE, len(self.ready_rows)))]
-                    for row in rows:
-                        assert row is not None
-                        batch.add_row(row)
-                    self.num_returned_rows += len(rows)
-                    _logger.debug(f'returning {len(rows)} rows')
-                    yield batch
-
-                if self.input_finished and self.queued_work == 0 and len(self.ready_rows) == 0:
-                    return
+        try:
+            with futures.ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+                while True:
+                    # Create work to fill the queue to the high water mark
+                    # ... ?without overrunning the in-flight row limit.
+                    while not self.input_finished and self.queued_work < self.QUEUE_DEPTH_HIGH_WATER:
+                        input_batch = await self.get_input_batch(input_iter)
+                        if input_batch is not None:
+                            self.__process_input_batch(input_batch, executor)
+
+                    # Wait for enough completions to enable more queueing or if we're done
+                    while self.queued_work > self.QUEUE_DEPTH_LOW_WATER or (
+                        self.input_finished and self.queued_work > 0
+                    ):
+                        done, _ = futures.wait(self.in_flight_requests, return_when=futures.FIRST_COMPLETED)
+                        self.__process_completions(done, ignore_errors=self.ctx.ignore_errors)
+
+                    # Emit results to meet batch size requirements or empty the in-flight row queue
+                    if self.__has_ready_batch() or (
+                        len(self.ready_rows) > 0 and self.input_finished and self.queued_work == 0
+                    ):
+                        # create DataRowBatch from the first BATCH_SIZE ready rows
+                        batch = DataRowBatch(self.row_builder)
+                        rows = [self.ready_rows.popleft() for _ in range(min(self.BATCH_SIZE, len(self.ready_rows)))]
+                        for row in rows:
+                            assert row is not None
+                            batch.add_row(row)
+                        self.num_returned_rows += len(rows)
+                        _logger.debug(f'returning {len(rows)} rows')
+                        yield batch
+
+                    if self.input_finished and self.queued_work == 0 and len(self.ready_rows) == 0:
+                        return
+        except Exception:
+            # the executor has finished all in-flight work: release the references recorded by this (failed) query,
+            # which also deletes the files that were stored only for it
+            media_blobs.release_refs(self.new_blob_refs)
+            raise
 
     def __has_ready_batch(self) -> bool:
         """True if there are >= BATCH_SIZES entries in ready_rows and the first BATCH_SIZE ones are all non-None"""
@@ -283,13 +307,41 @@ class ObjectStoreSaveNode(ExecNode):
             )
             _logger.debug(f'submitted {work_item}')
 
+    @staticmethod
+    def __is_remote(destination: Optional[str]) -> bool:
+        """Returns True if storing a file at destination is a network transfer"""
+        if destination is None:
+            return False  # the default LocalStore
+        soa = ObjectPath.parse_object_storage_addr(destination, False)
+        return soa.storage_target != StorageTarget.LOCAL_STORE
+
     def __persist_media_file(self, work_item: WorkItem) -> tuple[Optional[str], Optional[Exception]]:
         """Move data from the TempStore to another location"""
         src_path = work_item.src_path
         col = work_item.info.col
         assert col.destination == work_item.destination
         try:
-            new_file_url = ObjectOps.put_file(col, src_path, work_item.destination_count == 1)
+            budget = (
+                TransferBudget.get().reserve(src_path.stat().st_size)
+                if self.__is_remote(work_item.destination)
+                else contextlib.nullcontext()
+            )
+            with budget:
+                new_file_url: Optional[str] = None
+                if self.dedup:
+                    new_file_url = ObjectOps.blob_url(col, src_path)
+                if new_file_url is not None:
+                    # record the reference before storing the file, so that it can't be deleted underneath us
+                    blob_name = ObjectPath.blob_name(new_file_url)
+                    assert blob_name is not None and col.tbl is not None
+                    ref = media_blobs.BlobRef(
+                        col.tbl.id, col.tbl.version, work_item.destination or '', blob_name, new_file_url
+                    )
+                    if media_blobs.add_ref(ref):
+                        self.new_blob_refs.append(ref)
+                    ObjectOps.put_blob(col, src_path, new_file_url, work_item.destination_count == 1)
+                else:
+                    new_file_url = ObjectOps.put_file(col, src_path, work_item.destination_count == 1)
             return new_file_url, None
         except Exception as e:
             _logger.debug(f'Failed to move/copy {src_path}: {e}', exc_info=e)
@@ -132,6 +132,12 @@ class SqlNode(ExecNode):
             sql_subexprs = iter_arg.subexprs(filter=self.sql_elements.contains, traverse_matches=False)
             for e in sql_subexprs:
                 self.select_list.add(e)
+        # ... and their stored pos_state(), if we're scanning the view (a view load plan scans the base instead)
+        if tbl is not None:
+            scanned_tbl_ids = {tbl_version.id for tbl_version in tbl.get_tbl_versions()}
+            for view_id, pos_state_ref in row_builder.unstored_iter_pos_states.items():
+                if view_id in scanned_tbl_ids:
+                    self.select_list.add(pos_state_ref)
         super().__init__(row_builder, self.select_list, [], None)  # we materialize self.select_list
 
         if tbl is not None:
@@ -351,6 +357,10 @@ class SqlNode(ExecNode):
         num_rows_returned = 0
         is_using_cockroachdb = Env.get().is_using_cockroachdb
         tzinfo = Env.get().default_time_zone
+        # aggregates whose SQL translation returns partial state, which we turn into the final value in Python
+        sql_state_idxs = {
+            i for i, e in enumerate(self.select_list) if isinstance(e, exprs.FunctionCall) and e.has_sql_state
+        }
 
         for sql_row in result_cursor:
             output_row = output_batch.add_row(output_row)
@@ -377,7 +387,10 @@ class SqlNode(ExecNode):
             # copy the output of the SQL query into the output row
             for i, e in enumerate(self.select_list):
                 slot_idx = e.slot_idx
-                if isinstance(sql_row[i], Decimal):
+                if i in sql_state_idxs:
+                    assert isinstance(e, exprs.FunctionCall)
+                    output_row[slot_idx] = e.value_from_sql_state(sql_row[i])
+                elif isinstance(sql_row[i], Decimal):
                     # certain numerical operations can produce Decimals (eg, SUM(<int column>)); we need to convert them
                     if e.col_type.is_int_type():
                         output_row[slot_idx] = int(sql_row[i])
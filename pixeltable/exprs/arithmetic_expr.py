@@ -103,9 +103,9 @@ class ArithmeticExpr(Expr):
         raise AssertionError()
 
     def eval(self, data_row: DataRow, row_builder: RowBuilder) -> None:
-        op1_val = data_row[self._op1.slot_idx]
-        op2_val = data_row[self._op2.slot_idx]
+        data_row[self.slot_idx] = self._eval_vals(data_row[self._op1.slot_idx], data_row[self._op2.slot_idx])
 
+    def _eval_vals(self, op1_val: Any, op2_val: Any) -> Any:
         # if one or both columns is JsonTyped, we need a dynamic check that they are numeric
         if self._op1.col_type.is_json_type() and op1_val is not None and not isinstance(op1_val, (int, float)):
             raise excs.Error(
@@ -116,7 +116,14 @@ class ArithmeticExpr(Expr):
                 f'{self.operator} requires numeric types, but {self._op2} has type {type(op2_val).__name__}'
             )
 
-        data_row[self.slot_idx] = self.eval_nullable(op1_val, op2_val)
+        return self.eval_nullable(op1_val, op2_val)
+
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        if self._op1.col_type.is_json_type() or self._op2.col_type.is_json_type():
+            ns[f'arith{self.slot_idx}'] = self._eval_vals
+            return f'arith{self.slot_idx}({args[0]}, {args[1]})'
+        op1, op2 = args
+        return f'(None if {op1} is None or {op2} is None else {op1} {self.operator} {op2})'
 
     def eval_nullable(self, op1_val: Optional[float], op2_val: Optional[float]) -> Optional[float]:
         """
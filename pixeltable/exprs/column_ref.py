@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import copy
-from typing import Any, Optional, Sequence
+from collections import OrderedDict
+from typing import Any, ClassVar, Optional
 from uuid import UUID
 
 import sqlalchemy as sql
@@ -37,6 +38,12 @@ class ColumnRef(Expr):
     their reference tables will be `v` and `t`, respectively. This is to ensure correct behavior of expressions such
     as `v.my_col.head()`.
 
+    Unstored iterator columns (eg, the frame column of a FrameIterator view) are reconstructed by instantiating the
+    iterator for the base row and calling set_pos() (or restore_pos(), if the view stores the iterator's pos_state()
+    for each component). The iterators of the MAX_OPEN_ITERATORS most recently accessed base rows are kept open, so
+    that rows arriving out of base row order don't force the iterator to be re-created (which for videos means
+    re-opening the file and seeking).
+
     TODO:
     separate Exprs (like validating ColumnRefs) from the logical expression tree and instead have RowBuilder
     insert them into the EvalCtxs as needed
@@ -47,13 +54,15 @@ class ColumnRef(Expr):
     reference_tbl: Optional[catalog.TableVersionPath]
     is_unstored_iter_col: bool
     iter_arg_ctx: Optional[RowBuilder.EvalCtx]
+    pos_state_ref: Optional[Expr]  # the stored pos_state() of the component, if the iterator records one
     base_rowid_len: int
-    base_rowid: Sequence[Optional[Any]]
-    iterator: Optional[iters.ComponentIterator]
+    iterators: OrderedDict[tuple, iters.ComponentIterator]  # LRU order, keyed by base rowid
     pos_idx: Optional[int]
     id: int
     perform_validation: bool  # if True, performs media validation
 
+    MAX_OPEN_ITERATORS: ClassVar[int] = 8
+
     def __init__(
         self,
         col: catalog.Column,
@@ -68,10 +77,10 @@ class ColumnRef(Expr):
 
         self.is_unstored_iter_col = col.tbl.is_component_view and col.tbl.is_iterator_column(col) and not col.is_stored
         self.iter_arg_ctx = None
+        self.pos_state_ref = None
         # number of rowid columns in the base table
         self.base_rowid_len = col.tbl.base.get().num_rowid_columns() if self.is_unstored_iter_col else 0
-        self.base_rowid = [None] * self.base_rowid_len
-        self.iterator = None
+        self.iterators = OrderedDict()
         # index of the position column in the view's primary key; don't try to reference tbl.store_tbl here
         self.pos_idx = col.tbl.num_rowid_columns() - 1 if self.is_unstored_iter_col else None
 
@@ -92,9 +101,10 @@ class ColumnRef(Expr):
             self.components = [non_validating_col_ref]
         self.id = self._create_id()
 
-    def set_iter_arg_ctx(self, iter_arg_ctx: RowBuilder.EvalCtx) -> None:
+    def set_iter_arg_ctx(self, iter_arg_ctx: RowBuilder.EvalCtx, pos_state_ref: Optional[Expr] = None) -> None:
         self.iter_arg_ctx = iter_arg_ctx
         assert len(self.iter_arg_ctx.target_slot_idxs) == 1  # a single inline dict
+        self.pos_state_ref = pos_state_ref
 
     def _id_attrs(self) -> list[tuple[str, Any]]:
         return [
@@ -294,16 +304,39 @@ class ColumnRef(Expr):
             data_row[self.slot_idx] = None
             return
 
-        # if this is a new base row, we need to instantiate a new iterator
-        if self.base_rowid != data_row.pk[: self.base_rowid_len]:
+        base_rowid = tuple(data_row.pk[: self.base_rowid_len])
+        iterator = self.iterators.get(base_rowid)
+        if iterator is None:
+            # this is a base row we haven't seen recently: we need to instantiate a new iterator
             row_builder.eval(data_row, self.iter_arg_ctx)
             iterator_args = data_row[self.iter_arg_ctx.target_slot_idxs[0]]
-            self.iterator = self.col.tbl.iterator_cls(**iterator_args)
-            self.base_rowid = data_row.pk[: self.base_rowid_len]
-        self.iterator.set_pos(data_row.pk[self.pos_idx])
-        res = next(self.iterator)
+            iterator = self.col.tbl.iterator_cls(**iterator_args)
+            self.iterators[base_rowid] = iterator
+            while len(self.iterators) > self.MAX_OPEN_ITERATORS:
+                _, evicted = self.iterators.popitem(last=False)
+                evicted.close()
+        else:
+            self.iterators.move_to_end(base_rowid)
+        pos = data_row.pk[self.pos_idx]
+        if self.pos_state_ref is not None and data_row.has_val[self.pos_state_ref.slot_idx]:
+            iterator.restore_pos(pos, data_row[self.pos_state_ref.slot_idx])
+        else:
+            iterator.set_pos(pos)
+        res = next(iterator)
         data_row[self.slot_idx] = res[self.col.name]
 
+    def copy(self) -> ColumnRef:
+        result = super().copy()
+        # the open iterators are execution state and can't be shared with the copy
+        result.iterators = OrderedDict()
+        return result
+
+    def release(self) -> None:
+        for iterator in self.iterators.values():
+            iterator.close()
+        self.iterators.clear()
+        super().release()
+
     def _as_dict(self) -> dict:
         tbl = self.col.tbl
         version = tbl.version if tbl.is_snapshot else None
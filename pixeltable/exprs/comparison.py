@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import json
+import math
 from typing import Any, Optional
 
 import sqlalchemy as sql
+from sqlalchemy.dialects import postgresql
 
 import pixeltable.exceptions as excs
 import pixeltable.type_system as ts
@@ -72,6 +75,14 @@ class Comparison(Expr):
     def sql_expr(self, sql_elements: SqlElementCache) -> Optional[sql.ColumnElement]:
         from pixeltable import index
 
+        idx_clause = self._expr_index_clause()
+        if idx_clause is not None:
+            return idx_clause
+
+        json_clause = self._json_path_clause(sql_elements)
+        if json_clause is not None:
+            return json_clause
+
         if str(self._op1.col_type.to_sa_type()) != str(self._op2.col_type.to_sa_type()):
             # Comparing columns of different SQL types (e.g., string vs. json); this can only be done in Python
             # TODO(aaron-siegel): We may be able to handle some cases in SQL by casting one side to the other's type
@@ -93,19 +104,119 @@ class Comparison(Expr):
         right = sql_elements.get(self._op2)
         if left is None or right is None:
             return None
+        return self._sql_comparison(self.operator, left, right)
 
-        if self.operator == ComparisonOperator.LT:
+    @classmethod
+    def _sql_comparison(
+        cls, operator: ComparisonOperator, left: sql.ColumnElement, right: sql.ColumnElement
+    ) -> sql.ColumnElement:
+        if operator == ComparisonOperator.LT:
             return left < right
-        if self.operator == ComparisonOperator.LE:
+        if operator == ComparisonOperator.LE:
             return left <= right
-        if self.operator == ComparisonOperator.EQ:
+        if operator == ComparisonOperator.EQ:
             return left == right
-        if self.operator == ComparisonOperator.NE:
+        if operator == ComparisonOperator.NE:
             return left != right
-        if self.operator == ComparisonOperator.GT:
+        if operator == ComparisonOperator.GT:
             return left > right
-        if self.operator == ComparisonOperator.GE:
+        if operator == ComparisonOperator.GE:
             return left >= right
+        raise AssertionError(operator)
+
+    def _json_path_clause(self, sql_elements: SqlElementCache) -> Optional[sql.ColumnElement]:
+        """
+        Returns a clause for a comparison of a JsonPath against a scalar literal, if the path can be evaluated in SQL,
+        otherwise None.
+
+        The clause has Python semantics: ints, floats and bools compare numerically, strings compare by code point,
+        and values of any other type (including None) compare unequal to the literal. An ordering comparison with a
+        value of another type raises an error in Python, which SQL can't do; ordering comparisons are therefore only
+        done in SQL if the json_schema of the anchor guarantees a value of a comparable type.
+        """
+        from .json_path import JsonPath
+
+        op1, op2, operator = self._op1, self._op2, self.operator
+        if isinstance(op1, Literal):
+            op1, op2, operator = op2, op1, operator.reverse()
+        if not isinstance(op1, JsonPath) or not isinstance(op2, Literal):
+            return None
+        val = op2.val
+        if not isinstance(val, (str, int, float)) or (isinstance(val, float) and not math.isfinite(val)):
+            return None
+        if operator not in (ComparisonOperator.EQ, ComparisonOperator.NE):
+            types, is_present = op1.schema_types()
+            comparable_types = {'string'} if isinstance(val, str) else {'integer', 'number', 'boolean'}
+            if types is None or not is_present or not types <= comparable_types:
+                return None
+        path_el = op1.sql_path_expr(sql_elements)
+        if path_el is None:
+            return None
+
+        left: sql.ColumnElement
+        right: sql.ColumnElement
+        if isinstance(val, str):
+            if operator in (ComparisonOperator.EQ, ComparisonOperator.NE):
+                left, right = path_el, sql.cast(sql.literal(json.dumps(val)), postgresql.JSONB)
+            else:
+                left = sql.collate(JsonPath.sql_json_as(path_el, ts.StringType()), 'C')
+                right = sql.literal(val, type_=sql.Text)
+        elif isinstance(val, float):
+            left, right = sql.cast(JsonPath.sql_json_number(path_el), sql.Float), sql.literal(val, type_=sql.Float)
+        else:
+            left, right = JsonPath.sql_json_number(path_el), sql.literal(int(val), type_=sql.Numeric)
+
+        if operator == ComparisonOperator.EQ:
+            return left.is_not_distinct_from(right)
+        if operator == ComparisonOperator.NE:
+            return left.is_distinct_from(right)
+        return self._sql_comparison(operator, left, right)
+
+    def _expr_index_clause(self) -> Optional[sql.ColumnElement]:
+        """
+        Returns a clause against the value column of an ExprIndex or JsonIndex if this is a comparison of an indexed
+        expression against a literal, otherwise None.
+        """
+        from pixeltable import index
+
+        from .json_path import JsonPath
+
+        if self.is_search_arg_comparison:
+            # this is a column comparison, which is handled by the column's BtreeIndex
+            return None
+        op1, op2, operator = self._op1, self._op2, self.operator
+        if isinstance(op1, Literal):
+            op1, op2, operator = op2, op1, operator.reverse()
+        if not isinstance(op2, Literal) or op2.val is None or isinstance(op1, Literal):
+            return None
+        cols = {col_ref.col for col_ref in op1.subexprs(ColumnRef)}
+        if len(cols) != 1:
+            return None
+        col = next(iter(cols))
+        if col.tbl.is_snapshot:
+            # indices don't apply to snapshots
+            return None
+
+        for info in col.get_idx_info().values():
+            if isinstance(info.idx, index.ExprIndex) and info.idx.search_arg(op1, op2.col_type, operator):
+                if isinstance(op2.val, str) and len(op2.val) >= index.BtreeIndex.MAX_STRING_LEN:
+                    # the index value is truncated; the comparison needs to be done on the full value
+                    continue
+                right = sql.sql.expression.literal(op2.val, type_=info.val_col.sa_col_type)
+                return self._sql_comparison(operator, info.val_col.sa_col, right)
+            if (
+                isinstance(info.idx, index.JsonIndex)
+                and operator == ComparisonOperator.EQ
+                and isinstance(op1, JsonPath)
+                and isinstance(op1.anchor, ColumnRef)
+                and op1.anchor.col == col
+                and isinstance(op2.val, (str, int, float))
+                and not isinstance(op2.val, bool)
+            ):
+                path = index.JsonIndex.search_path(op1)
+                if path is not None:
+                    return index.JsonIndex.search_clause(info.val_col, path, op2.val)
+        return None
 
     def eval(self, data_row: DataRow, row_builder: RowBuilder) -> None:
         left = data_row[self._op1.slot_idx]
@@ -124,6 +235,9 @@ class Comparison(Expr):
         elif self.operator == ComparisonOperator.GE:
             data_row[self.slot_idx] = left >= right
 
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        return f'({args[0]} {self.operator} {args[1]})'
+
     def _as_dict(self) -> dict:
         return {'operator': self.operator.value, **super()._as_dict()}
 
@@ -90,6 +90,13 @@ class CompoundPredicate(Expr):
                 val = op_function(val, data_row[op.slot_idx])
             data_row[self.slot_idx] = val
 
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        if self.operator == LogicalOperator.NOT:
+            return f'(not {args[0]})'
+        # same evaluation order and operators as eval()
+        initial_val = 'True' if self.operator == LogicalOperator.AND else 'False'
+        return f' {self.operator} '.join([f'({initial_val}', *args]) + ')'
+
     def _as_dict(self) -> dict:
         return {'operator': self.operator.value, **super()._as_dict()}
 
@@ -20,19 +20,39 @@ from pixeltable.utils.local_store import TempStore
 from pixeltable.utils.misc import non_none_dict_factory
 
 
+@dataclasses.dataclass(frozen=True)
+class PackedBoolArray:
+    """
+    A bool array in the form produced by np.packbits(), which DataRow unpacks on first access of the slot.
+    """
+
+    data: np.ndarray  # of uint8
+    shape: tuple[int, ...]
+
+    def unpack(self) -> np.ndarray:
+        # unpackbits() returns 0/1 uint8 values, which we can reinterpret as bool without another copy
+        return np.unpackbits(self.data, count=int(np.prod(self.shape))).reshape(self.shape).view(np.bool_)
+
+
 @dataclasses.dataclass
 class ArrayMd:
     """
     Metadata for array cells that are stored externally.
     """
 
-    start: int
-    end: int
+    # byte offsets of the .npy data in the file
+    start: int | None = None
+    end: int | None = None
 
     # we store bool arrays as packed bits (uint8 arrays), and need to record the shape to reconstruct the array
-    is_bool: bool = False
+    is_bool: bool | None = None
     shape: tuple[int, ...] | None = None
 
+    # for arrays stored in a segment file (see utils.array_segment): the id of the segment file, which determines its
+    # path, and the index of the array in the segment; the segment records dtype and shape itself
+    segment_id: str | None = None
+    segment_idx: int | None = None
+
     def as_dict(self) -> dict:
         # dict_factory: suppress Nones
         x = dataclasses.asdict(self, dict_factory=non_none_dict_factory)
@@ -52,7 +72,7 @@ class CellMd:
 
     # a list of file urls that are used to store images and arrays; only set for json and array columns
     # for json columns: a list of all urls referenced in the column value
-    # for array columns: a single url
+    # for array columns: a single url (None for arrays stored in a segment file, see ArrayMd.segment_id)
     file_urls: list[str] | None = None
 
     array_md: ArrayMd | None = None
@@ -258,7 +278,11 @@ class DataRow:
                 self.vals[index] = PIL.Image.open(self.file_paths[index])
                 self.vals[index].load()
 
-        return self.vals[index]
+        val = self.vals[index]
+        if isinstance(val, PackedBoolArray):
+            val = val.unpack()
+            self.vals[index] = val
+        return val
 
     def get_stored_val(self, index: int, sa_col_type: Optional[sql.types.TypeEngine] = None) -> Any:
         """Return the value that gets stored in the db"""
@@ -273,8 +297,8 @@ class DataRow:
             return self.file_urls[index]
 
         if self.vals[index] is not None and index in self.array_slot_idxs:
-            assert isinstance(self.vals[index], np.ndarray)
-            np_array = self.vals[index]
+            np_array = self[index]
+            assert isinstance(np_array, np.ndarray)
             if sa_col_type is not None and isinstance(sa_col_type, pgvector.sqlalchemy.Vector):
                 return np_array
             buffer = io.BytesIO()
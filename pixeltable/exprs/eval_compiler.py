@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+import numpy as np
+
+from .data_row import DataRow
+
+if TYPE_CHECKING:
+    from .row_builder import RowBuilder
+
+_logger = logging.getLogger('pixeltable')
+
+# compiled_eval(data_row, ignore_errors): returns True if all exprs of the EvalCtx were evaluated
+CompiledEval = Callable[[DataRow, bool], bool]
+
+
+def compile_eval_ctx(row_builder: RowBuilder, ctx: RowBuilder.EvalCtx) -> Optional[CompiledEval]:
+    """
+    Compiles the evaluation of ctx into a single Python function, which computes the values of exprs that implement
+    Expr.compiled_eval() in local variables, without going through DataRow and Expr.eval() for each of them.
+
+    The other exprs are evaluated with RowBuilder.eval_expr(), as they would be by RowBuilder.eval(). The compiled
+    function gives up (returns False) and leaves the row to RowBuilder.eval() if
+    - some of the compiled exprs already have a value or an input is missing (ie, the row is partially evaluated)
+    - the row has an exception or a compiled expr raises one (which RowBuilder.eval() then records)
+
+    Returns None if none of the exprs can be compiled.
+    """
+    media_slot_idxs = set(row_builder.img_slot_idxs) | set(row_builder.media_slot_idxs)
+    ctx_slot_idxs = set(ctx.slot_idxs)
+    ns: dict[str, Any] = {'rb': row_builder}
+    compiled: dict[int, str] = {}  # slot idx -> Python expression
+    for e in ctx.exprs:
+        if e.slot_idx in media_slot_idxs:
+            # DataRow.__setitem__() needs to see media values
+            continue
+        src = e.compiled_eval([f'v{d.slot_idx}' for d in e.dependencies()], ns)
+        if src is not None:
+            compiled[e.slot_idx] = src
+    if len(compiled) == 0:
+        return None
+
+    # slot idxs of the values that compiled exprs depend on
+    arg_slot_idxs = {d.slot_idx for e in ctx.exprs if e.slot_idx in compiled for d in e.dependencies()}
+    input_slot_idxs = sorted(arg_slot_idxs - ctx_slot_idxs)
+    # the row needs to have values for all inputs and none for the compiled exprs
+    ns['check_idxs'] = np.array(input_slot_idxs + sorted(compiled), dtype=np.int64)
+    ns['check_vals'] = np.array([True] * len(input_slot_idxs) + [False] * len(compiled), dtype=bool)
+
+    lines = [
+        'def compiled_eval(row, ignore_errors):',
+        '    if row._may_have_exc or not (row.has_val[check_idxs] == check_vals).all():',
+        '        return False',
+        '    vals = row.vals',
+        '    has_val = row.has_val',
+    ]
+    # image slots are loaded and packed bool arrays are unpacked on access
+    access_slot_idxs = set(row_builder.img_slot_idxs) | set(row_builder.array_slot_idxs)
+    lines.extend(
+        f'    v{idx} = row[{idx}]' if idx in access_slot_idxs else f'    v{idx} = vals[{idx}]'
+        for idx in input_slot_idxs
+    )
+
+    segment: list[int] = []  # compiled slot idxs that haven't been stored in the row yet
+
+    def flush_segment() -> None:
+        if len(segment) == 0:
+            return
+        lines.append('    try:')
+        lines.extend(f'        v{idx} = {compiled[idx]}' for idx in segment)
+        lines.append('    except Exception:')
+        lines.append('        return False')
+        lines.extend(f'    vals[{idx}] = v{idx}' for idx in segment)
+        ns[f'segment_idxs{segment[0]}'] = np.array(segment, dtype=np.int64)
+        lines.append(f'    has_val[segment_idxs{segment[0]}] = True')
+        segment.clear()
+
+    for e in ctx.exprs:
+        if e.slot_idx in compiled:
+            segment.append(e.slot_idx)
+            continue
+        flush_segment()
+        ns[f'e{e.slot_idx}'] = e
+        lines.append(f'    rb.eval_expr(row, e{e.slot_idx}, None, ignore_errors)')
+        lines.append('    if row._may_have_exc:')
+        lines.append('        return False')
+        if e.slot_idx in arg_slot_idxs:
+            lines.append(f'    v{e.slot_idx} = row[{e.slot_idx}]')
+    flush_segment()
+    lines.append('    return True')
+
+    src = '\n'.join(lines)
+    _logger.debug(f'Compiled EvalCtx for {ctx.target_exprs}:\n{src}')
+    exec(compile(src, f'<compiled EvalCtx for {ctx.target_exprs}>', 'exec'), ns)
+    return ns['compiled_eval']
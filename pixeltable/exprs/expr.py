@@ -495,6 +495,17 @@ class Expr(abc.ABC):
         """
         pass
 
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        """
+        If eval() can be expressed as a Python expression over the values of self.dependencies():
+        - returns that expression, which needs to compute the same value as eval() (or raise the same exception)
+        - args contains the names of the dependency values
+        - objects referenced by the expression are added to ns, under names that include self.slot_idx
+        Otherwise returns None, and eval() will be called.
+        Used by RowBuilder to compile EvalCtxs (see exprs.eval_compiler).
+        """
+        return None
+
     def release(self) -> None:
         """
         Allow Expr class to tear down execution state. This is called after the last eval() call.
@@ -25,6 +25,7 @@ class FunctionCall(Expr):
     is_method_call: bool
     agg_init_args: dict[str, Any]
     resource_pool: Optional[str]
+    batch_resource_pool: Optional[str]  # used instead of resource_pool in batch-mode backfills, if set
 
     # These collections hold the component indices corresponding to the args and kwargs
     # that were passed to the FunctionCall. They're 1:1 with the original call pattern.
@@ -117,6 +118,7 @@ class FunctionCall(Expr):
         if validation_error is not None:
             self.bound_idxs = {}
             self.resource_pool = None
+            self.batch_resource_pool = None
             return
 
         # Now generate bound_idxs for the args and kwargs indices.
@@ -129,6 +131,7 @@ class FunctionCall(Expr):
         bindings = fn.signature.py_signature.bind(*args, **kwargs)
         bound_args = bindings.arguments
         self.resource_pool = fn.call_resource_pool(bound_args)
+        self.batch_resource_pool = fn.call_resource_pool(bound_args, batch_mode=True)
 
         self.agg_init_args = {}
         if self.is_agg_fn_call:
@@ -269,6 +272,18 @@ class FunctionCall(Expr):
 
         return self.fn._to_sql(*args, **kwargs)
 
+    @property
+    def has_sql_state(self) -> bool:
+        """True if the SQL translation of this aggregate returns partial state rather than the final value"""
+        return isinstance(self.fn, func.AggregateFunction) and self.fn.agg_class.has_merge_sql_state()
+
+    def value_from_sql_state(self, state: Any) -> Any:
+        assert self.has_sql_state
+        assert isinstance(self.fn, func.AggregateFunction)
+        aggregator = self.fn.agg_class(**self.agg_init_args)
+        aggregator.merge_sql_state(state)
+        return aggregator.value()
+
     def reset_agg(self) -> None:
         """
         Init agg state
@@ -318,9 +333,46 @@ class FunctionCall(Expr):
         Update agg state
         """
         assert self.is_agg_fn_call
-        args, kwargs = self.make_args(data_row)
+        args, kwargs = self.make_update_args(data_row)
         self.aggregator.update(*args, **kwargs)
 
+    def update_batch(self, data_rows: list[DataRow]) -> None:
+        """
+        Update agg state with a batch of rows, via Aggregator.update_batch()
+        """
+        assert self.is_agg_fn_call
+        batch_args = self.make_batch_args([self.make_update_args(row) for row in data_rows])
+        if batch_args is not None:
+            args, kwargs = batch_args
+            self.aggregator.update_batch(*args, **kwargs)
+
+    @classmethod
+    def make_batch_args(
+        cls, row_args: list[Optional[tuple[list[Any], dict[str, Any]]]]
+    ) -> Optional[tuple[list[list[Any]], dict[str, list[Any]]]]:
+        """
+        Turns the per-row results of make_args() into column vectors of args and kwargs, skipping rows with None;
+        returns None if there are no rows left.
+        """
+        rows = [args_kwargs for args_kwargs in row_args if args_kwargs is not None]
+        if len(rows) == 0:
+            return None
+        num_args = len(rows[0][0])
+        args = [[args_i[i] for args_i, _ in rows] for i in range(num_args)]
+        kwargs = {name: [kwargs_i[name] for _, kwargs_i in rows] for name in rows[0][1]}
+        return args, kwargs
+
+    def make_update_args(self, data_row: DataRow) -> Optional[tuple[list[Any], dict[str, Any]]]:
+        """Return the args and kwargs of Aggregator.update(): those of make_args(), minus the init args"""
+        assert self.is_agg_fn_call
+        assert isinstance(self.fn, func.AggregateFunction)
+        args_kwargs = self.make_args(data_row)
+        if args_kwargs is None:
+            return None
+        args, kwargs = args_kwargs
+        init_param_names = self.fn.init_param_names[0]
+        return args, {name: val for name, val in kwargs.items() if name not in init_param_names}
+
     def make_args(self, data_row: DataRow) -> Optional[tuple[list[Any], dict[str, Any]]]:
         """Return args and kwargs, constructed for data_row; returns None if any non-nullable arg is None."""
         args: list[Any] = []
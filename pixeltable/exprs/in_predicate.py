@@ -88,6 +88,12 @@ class InPredicate(Expr):
             value_list = self._normalize_value_set(value_set, filter_type_mismatches=False)
             data_row[self.slot_idx] = lhs_val in value_list
 
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        if self.value_list is None:
+            return None
+        ns[f'value_list{self.slot_idx}'] = self.value_list
+        return f'({args[0]} in value_list{self.slot_idx})'
+
     def _as_dict(self) -> dict:
         return {'value_list': self.value_list, **super()._as_dict()}
 
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import Any, Optional
 
 import sqlalchemy as sql
 
@@ -25,6 +25,15 @@ class IsNull(Expr):
         return True
 
     def sql_expr(self, sql_elements: SqlElementCache) -> Optional[sql.ColumnElement]:
+        from .json_path import JsonPath
+
+        if isinstance(self.components[0], JsonPath):
+            path_el = self.components[0].sql_path_expr(sql_elements)
+            if path_el is None:
+                return None
+            # a JSON null is None in Python
+            return sql.or_(path_el.is_(None), sql.func.jsonb_typeof(path_el) == 'null')
+
         e = sql_elements.get(self.components[0])
         if e is None:
             return None
@@ -33,6 +42,9 @@ class IsNull(Expr):
     def eval(self, data_row: DataRow, row_builder: RowBuilder) -> None:
         data_row[self.slot_idx] = data_row[self.components[0].slot_idx] is None
 
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        return f'({args[0]} is None)'
+
     @classmethod
     def _from_dict(cls, d: dict, components: list[Expr]) -> IsNull:
         assert len(components) == 1
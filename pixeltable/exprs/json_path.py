@@ -1,11 +1,10 @@
 from __future__ import annotations
 
-import io
-from pathlib import Path
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional
 
 import jmespath
 import sqlalchemy as sql
+from sqlalchemy.dialects import postgresql
 
 from pixeltable import catalog, exceptions as excs, type_system as ts
 
@@ -18,6 +17,9 @@ from .object_ref import ObjectRef
 from .row_builder import RowBuilder
 from .sql_element_cache import SqlElementCache
 
+if TYPE_CHECKING:
+    from pixeltable.exec.cell_reconstruction_node import MappedFiles
+
 
 class JsonPath(Expr):
     """
@@ -29,7 +31,7 @@ class JsonPath(Expr):
     path_elements: list[str | int | slice]
     compiled_path: jmespath.parser.ParsedResult | None
     scope_idx: int
-    file_handles: dict[Path, io.BufferedReader]  # key: file path
+    mapped_files: Optional[MappedFiles]  # created on first use
 
     def __init__(
         self, anchor: Optional[Expr], path_elements: Optional[list[str | int | slice]] = None, scope_idx: int = 0
@@ -45,12 +47,11 @@ class JsonPath(Expr):
         # NOTE: the _create_id() result will change if set_anchor() gets called;
         # this is not a problem, because _create_id() shouldn't be called after init()
         self.id = self._create_id()
-        self.file_handles = {}
+        self.mapped_files = None
 
     def release(self) -> None:
-        for fh in self.file_handles.values():
-            fh.close()
-        self.file_handles.clear()
+        if self.mapped_files is not None:
+            self.mapped_files.clear()
 
     def __repr__(self) -> str:
         # else 'R': the anchor is RELATIVE_PATH_ROOT
@@ -153,12 +154,118 @@ class JsonPath(Expr):
         Postgres appears to have a bug: jsonb_path_query('{a: [{b: 0}, {b: 1}]}', '$.a.b') returns
         *two* rows (each containing col val 0), not a single row with [0, 0].
         We need to use a workaround: retrieve the entire dict, then use jmespath to extract the path correctly.
+
+        The value of a path can also contain inlined objects, which need to be reconstructed in Python (see eval()).
+        Exprs that convert the value to a scalar (comparisons, type casts, IsNull) use sql_path_expr() instead.
+        """
+        return None
+
+    def sql_path_expr(self, sql_elements: SqlElementCache) -> Optional[sql.ColumnElement]:
+        """
+        Returns the jsonb value of this path, or None if the anchor can't be evaluated in SQL or the path contains
+        wildcards or slices.
+
+        Key and index access with -> has the same semantics as jmespath: a missing key, an index that is out of range
+        (negative indices count from the end) and access into a value of the wrong type all result in NULL. The latter
+        needs a type check: -> with an index returns a scalar itself (for index 0 or -1).
         """
-        # path_str = '$.' + '.'.join(self.path_elements)
-        # assert isinstance(self._anchor(), ColumnRef)
-        # return sql.func.jsonb_path_query(self._anchor().col.sa_col, path_str)
+        if self.anchor is None or not self.anchor.col_type.is_json_type():
+            return None
+        if any(isinstance(el, slice) or el == '*' for el in self.path_elements):
+            return None
+        el = sql_elements.get(self.anchor)
+        if el is None:
+            return None
+        for path_el in self.path_elements:
+            key: sql.ColumnElement
+            if isinstance(path_el, str):
+                key, container_type = sql.cast(sql.literal(path_el), sql.Text), 'object'
+            else:
+                key, container_type = sql.cast(sql.literal(path_el), sql.Integer), 'array'
+            el = sql.case(
+                (sql.func.jsonb_typeof(el) == container_type, el.op('->', return_type=postgresql.JSONB)(key)),
+                else_=sql.null(),
+            )
+        return el
+
+    def schema_types(self) -> tuple[Optional[set[str]], bool]:
+        """
+        Returns the JSON schema types that the value of this path can have according to the json_schema of the anchor
+        (or None if the schema doesn't say), and whether the schema guarantees that the path has a value.
+        """
+        if self.anchor is None or not isinstance(self.anchor.col_type, ts.JsonType):
+            return None, False
+        schema = self.anchor.col_type.json_schema
+        is_present = not self.anchor.col_type.nullable
+        for path_el in self.path_elements:
+            if schema is None or isinstance(path_el, slice) or path_el == '*':
+                return None, False
+            if isinstance(path_el, str) and schema.get('type') == 'object':
+                is_present = is_present and path_el in schema.get('required', [])
+                schema = schema.get('properties', {}).get(path_el)
+            elif isinstance(path_el, int) and schema.get('type') == 'array' and isinstance(schema.get('items'), dict):
+                # the index can be out of range
+                is_present = False
+                schema = schema['items']
+            else:
+                return None, False
+        return self.json_schema_types(schema), is_present
+
+    @classmethod
+    def json_schema_types(cls, schema: Optional[dict[str, Any]]) -> Optional[set[str]]:
+        """Returns the types allowed by schema, or None if it doesn't constrain the type"""
+        if schema is None:
+            return None
+        types = schema.get('type')
+        if isinstance(types, str):
+            return {types}
+        if isinstance(types, list):
+            return set(types)
         return None
 
+    @classmethod
+    def _sql_json_scalar(cls, el: sql.ColumnElement) -> tuple[sql.ColumnElement, sql.ColumnElement]:
+        """Returns the type name (jsonb_typeof()) and the unquoted text of the jsonb value el"""
+        return sql.func.jsonb_typeof(el), el.op('#>>', return_type=sql.Text)(sql.literal_column("'{}'"))
+
+    @classmethod
+    def sql_json_as(cls, el: sql.ColumnElement, col_type: ts.ColumnType) -> Optional[sql.ColumnElement]:
+        """
+        Returns the jsonb value el converted to the scalar col_type, or None if the conversion can't be done in SQL.
+
+        The conversion follows col_type.create_literal() (eg, an int converts to a float or a bool, a string doesn't
+        convert to an int), except that a value that create_literal() rejects becomes NULL instead of raising an error.
+        """
+        json_type, text = cls._sql_json_scalar(el)
+        num = sql.cast(text, sql.Numeric)
+        # a json number without fractional digits is an int in Python ('3.0' is a float)
+        is_int = sql.func.scale(num) == 0
+        if col_type.is_string_type():
+            return sql.case((json_type == 'string', text))
+        if col_type.is_float_type():
+            return sql.case(
+                (json_type == 'number', sql.cast(text, sql.Float)),
+                (json_type == 'boolean', sql.case((text == 'true', 1.0), else_=0.0)),
+            )
+        if col_type.is_bool_type():
+            return sql.case(
+                (json_type == 'boolean', sql.cast(text, sql.Boolean)),
+                (json_type == 'number', sql.case((is_int, num != 0))),
+            )
+        return None
+
+    @classmethod
+    def sql_json_number(cls, el: sql.ColumnElement) -> sql.ColumnElement:
+        """
+        Returns the jsonb value el as a numeric if it is a number or a bool (which compare like 0 and 1 in Python),
+        otherwise NULL.
+        """
+        json_type, text = cls._sql_json_scalar(el)
+        return sql.case(
+            (json_type == 'number', sql.cast(text, sql.Numeric)),
+            (json_type == 'boolean', sql.case((text == 'true', 1), else_=0)),
+        )
+
     def _json_path(self) -> str:
         assert len(self.path_elements) > 0
         result: list[str] = []
@@ -175,29 +282,39 @@ class JsonPath(Expr):
 
     def eval(self, row: DataRow, row_builder: RowBuilder) -> None:
         assert self.anchor is not None, self
-        val = row[self.anchor.slot_idx]
+        row[self.slot_idx] = self._eval_val(row[self.anchor.slot_idx], row)
+
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        if self.anchor is None:
+            return None
+        ns[f'path{self.slot_idx}'] = self._eval_val
+        return f'path{self.slot_idx}({args[0]}, row)'
+
+    def _eval_val(self, val: Any, row: DataRow) -> Any:
+        """Returns the value of this path, given the value of the anchor"""
         if self.compiled_path is not None:
             val = self.compiled_path.search(val)
-        row[self.slot_idx] = val
         if val is None or self.anchor is None or not isinstance(self.anchor, ColumnRef):
-            return
+            return val
 
         # the origin of val is a json-typed column, which might stored inlined objects
         if self.anchor.slot_idx not in row.slot_md:
             # we can infer that there aren't any inlined objects because our execution plan doesn't include
             # materializing the cellmd (eg, insert plans)
             # TODO: have the planner pass that fact into ExprEvalNode explicitly to streamline this path a bit more
-            return
+            return val
 
         # defer import until it's needed
-        from pixeltable.exec.cell_reconstruction_node import json_has_inlined_objs, reconstruct_json
+        from pixeltable.exec.cell_reconstruction_node import MappedFiles, json_has_inlined_objs, reconstruct_json
 
         cell_md = row.slot_md[self.anchor.slot_idx]
         if cell_md is None or cell_md.file_urls is None or not json_has_inlined_objs(val):
             # val doesn't contain inlined objects
-            return
+            return val
 
-        row.vals[self.slot_idx] = reconstruct_json(val, cell_md.file_urls, self.file_handles)
+        if self.mapped_files is None:
+            self.mapped_files = MappedFiles()
+        return reconstruct_json(val, cell_md.file_urls, self.mapped_files)
 
 
 RELATIVE_PATH_ROOT = JsonPath(None)
@@ -77,6 +77,10 @@ class Literal(Expr):
         # this will be called, even though sql_expr() does not return None
         data_row[self.slot_idx] = self.val
 
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        ns[f'lit{self.slot_idx}'] = self.val
+        return f'lit{self.slot_idx}'
+
     def _as_dict(self) -> dict:
         # For some types, we need to explicitly record their type, because JSON does not know
         # how to interpret them unambiguously
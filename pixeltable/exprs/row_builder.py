@@ -3,7 +3,7 @@ from __future__ import annotations
 import dataclasses
 import sys
 import time
-from typing import Any, Iterable, NamedTuple, Optional, Sequence
+from typing import Any, ClassVar, Iterable, NamedTuple, Optional, Sequence
 from uuid import UUID
 
 import numpy as np
@@ -14,6 +14,7 @@ from pixeltable.env import Env
 from pixeltable.utils.misc import non_none_dict_factory
 
 from .data_row import DataRow
+from .eval_compiler import CompiledEval, compile_eval_ctx
 from .expr import Expr, ExprScope
 from .expr_set import ExprSet
 
@@ -73,6 +74,7 @@ class RowBuilder:
     table_columns: dict[catalog.Column, int | None]  # value: slot idx, if the result of an expr
     default_eval_ctx: EvalCtx
     unstored_iter_args: dict[UUID, Expr]
+    unstored_iter_pos_states: dict[UUID, Expr]  # ColumnRefs to the iterator_pos_state_col of the component views
 
     # transitive dependents for the purpose of exception propagation: an exception for slot i is propagated to
     # _exc_dependents[i]
@@ -96,6 +98,9 @@ class RowBuilder:
     array_slot_idxs: list[int]  # Indices of array slots
     json_slot_idxs: list[int]  # Indices of json slots
 
+    # if True, eval() runs compiled EvalCtxs (see exprs.eval_compiler), unless it is asked to profile
+    COMPILE_EVAL_CTXS: ClassVar[bool] = True
+
     @dataclasses.dataclass
     class EvalCtx:
         """Context for evaluating a set of target exprs"""
@@ -104,6 +109,9 @@ class RowBuilder:
         exprs: list[Expr]  # exprs corresponding to slot_idxs
         target_slot_idxs: list[int]  # slot idxs of target exprs; might contain duplicates
         target_exprs: list[Expr]  # exprs corresponding to target_slot_idxs
+        # created on first use, if COMPILE_EVAL_CTXS; None: not compilable
+        compiled_eval: Optional[CompiledEval] = None
+        is_compiled: bool = False
 
     def __init__(
         self,
@@ -193,9 +201,16 @@ class RowBuilder:
             id: self._record_unique_expr(arg, recursive=True) for id, arg in unstored_iter_args.items()
         }
 
+        # the stored pos_state() of the components lets the iterators go directly to a component
+        self.unstored_iter_pos_states = {
+            view.id: self._record_unique_expr(ColumnRef(view.iterator_pos_state_col), recursive=False)
+            for view in component_views
+            if view.iterator_pos_state_col is not None
+        }
+
         for col_ref in unstored_iter_col_refs:
             iter_arg_ctx = self.create_eval_ctx([unstored_iter_args[col_ref.col.tbl.id]])
-            col_ref.set_iter_arg_ctx(iter_arg_ctx)
+            col_ref.set_iter_arg_ctx(iter_arg_ctx, self.unstored_iter_pos_states.get(col_ref.col.tbl.id))
 
         # we guarantee that we can compute the expr DAG in a single front-to-back pass
         for i, expr in enumerate(self.unique_exprs):
@@ -439,24 +454,43 @@ class RowBuilder:
         ignore_errors: if False, raises ExprEvalError if any expr.eval() raises an exception
         force_eval: forces exprs in the specified scope to be reevaluated, even if they already have a value
         """
+        if profile is None and force_eval is None and self.COMPILE_EVAL_CTXS:
+            if not ctx.is_compiled:
+                ctx.compiled_eval = compile_eval_ctx(self, ctx)
+                ctx.is_compiled = True
+            if ctx.compiled_eval is not None and ctx.compiled_eval(data_row, ignore_errors):
+                return
         for expr in ctx.exprs:
-            assert expr.slot_idx >= 0
-            if expr.scope() != force_eval and (data_row.has_val[expr.slot_idx] or data_row.has_exc(expr.slot_idx)):
-                continue
-            try:
+            self.eval_expr(data_row, expr, profile, ignore_errors, force_eval)
+
+    def eval_expr(
+        self,
+        data_row: DataRow,
+        expr: Expr,
+        profile: Optional[ExecProfile],
+        ignore_errors: bool,
+        force_eval: Optional[ExprScope] = None,
+    ) -> None:
+        """Evaluates a single expr of an EvalCtx; see eval()"""
+        assert expr.slot_idx >= 0
+        if (data_row.has_val[expr.slot_idx] or data_row.has_exc(expr.slot_idx)) and expr.scope() != force_eval:
+            return
+        try:
+            if profile is None:
+                expr.eval(data_row, self)
+            else:
                 start_time = time.perf_counter()
                 expr.eval(data_row, self)
-                if profile is not None:
-                    profile.eval_time[expr.slot_idx] += time.perf_counter() - start_time
-                    profile.eval_count[expr.slot_idx] += 1
-            except Exception as exc:
-                _, _, exc_tb = sys.exc_info()
-                self.set_exc(data_row, expr.slot_idx, exc)
-                if not ignore_errors:
-                    input_vals = [data_row[d.slot_idx] for d in expr.dependencies()]
-                    raise excs.ExprEvalError(
-                        expr, f'expression {expr}', data_row.get_exc(expr.slot_idx), exc_tb, input_vals, 0
-                    ) from exc
+                profile.eval_time[expr.slot_idx] += time.perf_counter() - start_time
+                profile.eval_count[expr.slot_idx] += 1
+        except Exception as exc:
+            _, _, exc_tb = sys.exc_info()
+            self.set_exc(data_row, expr.slot_idx, exc)
+            if not ignore_errors:
+                input_vals = [data_row[d.slot_idx] for d in expr.dependencies()]
+                raise excs.ExprEvalError(
+                    expr, f'expression {expr}', data_row.get_exc(expr.slot_idx), exc_tb, input_vals, 0
+                ) from exc
 
     def create_store_table_row(
         self, data_row: DataRow, cols_with_excs: Optional[set[int]], pk: tuple[int, ...]
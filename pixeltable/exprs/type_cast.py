@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, ClassVar, Optional
 
 import sqlalchemy as sql
 
@@ -16,6 +16,14 @@ class TypeCast(Expr):
     a specified `ColumnType`.
     """
 
+    # JSON schema types whose values all convert to a given scalar type; a JSON schema integer can also be a float
+    # without fractional digits (eg, 3.0), which doesn't convert to an int
+    _JSON_CAST_TYPES: ClassVar[dict[ts.ColumnType.Type, set[str]]] = {
+        ts.ColumnType.Type.STRING: {'string'},
+        ts.ColumnType.Type.FLOAT: {'integer', 'number', 'boolean'},
+        ts.ColumnType.Type.BOOL: {'boolean'},
+    }
+
     def __init__(self, underlying: Expr, new_type: ts.ColumnType):
         super().__init__(new_type)
         self.components: list[Expr] = [underlying]
@@ -29,17 +37,61 @@ class TypeCast(Expr):
     def _op1(self) -> Expr:
         return self.components[0]
 
-    def sql_expr(self, _: SqlElementCache) -> Optional[sql.ColumnElement]:
+    def sql_expr(self, sql_elements: SqlElementCache) -> Optional[sql.ColumnElement]:
         """
-        sql_expr() is unimplemented for now, in order to sidestep potentially thorny
-        questions about consistency of doing type conversions in both Python and Postgres.
+        Casts between scalar types and from JSON to scalar types are done in SQL, with the semantics of
+        ColumnType.create_literal(). Casts that fail for some values (eg, int to string, or a nullable to a
+        non-nullable type) are left to Python, so that the errors are reported. For JSON values, that means that the
+        json_schema needs to guarantee a value that converts (see JsonPath.sql_json_as(), which returns NULL
+        otherwise).
         """
+        from .json_path import JsonPath
+
+        src_type, dst_type = self._op1.col_type, self.col_type
+        if src_type.nullable and not dst_type.nullable:
+            return None
+        if src_type.is_json_type():
+            if isinstance(self._op1, JsonPath):
+                types, _ = self._op1.schema_types()
+            else:
+                assert isinstance(src_type, ts.JsonType)
+                types = JsonPath.json_schema_types(src_type.json_schema)
+            # None converts to None (dst_type is nullable, if the value can be None)
+            if types is None or not types <= self._JSON_CAST_TYPES.get(dst_type.type_enum, set()) | {'null'}:
+                return None
+            el = (
+                self._op1.sql_path_expr(sql_elements)
+                if isinstance(self._op1, JsonPath)
+                else sql_elements.get(self._op1)
+            )
+            return None if el is None else JsonPath.sql_json_as(el, dst_type)
+
+        if not src_type.is_scalar_type() or not dst_type.is_scalar_type():
+            return None
+        el = sql_elements.get(self._op1)
+        if el is None:
+            return None
+        if src_type.type_enum == dst_type.type_enum:
+            return el
+        if src_type.is_int_type() and dst_type.is_float_type():
+            return sql.cast(el, sql.Float)
+        if src_type.is_bool_type() and dst_type.is_float_type():
+            return sql.cast(sql.cast(el, sql.Integer), sql.Float)
+        if src_type.is_int_type() and dst_type.is_bool_type():
+            return el != 0
         return None
 
     def eval(self, data_row: DataRow, row_builder: RowBuilder) -> None:
         original_val = data_row[self._op1.slot_idx]
         data_row[self.slot_idx] = self.col_type.create_literal(original_val)
 
+    def compiled_eval(self, args: list[str], ns: dict[str, Any]) -> Optional[str]:
+        if not self.col_type.is_scalar_type() and not self.col_type.is_json_type():
+            # media and array values need the conversions in DataRow.__setitem__()
+            return None
+        ns[f'cast{self.slot_idx}'] = self.col_type.create_literal
+        return f'cast{self.slot_idx}({args[0]})'
+
     def as_literal(self) -> Optional[Literal]:
         op1_lit = self._op1.as_literal()
         if op1_lit is None:
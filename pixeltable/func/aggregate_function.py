@@ -4,6 +4,8 @@ import abc
 import inspect
 from typing import TYPE_CHECKING, Any, Callable, ClassVar, Optional, Sequence, overload
 
+from typing_extensions import Self
+
 import pixeltable.exceptions as excs
 import pixeltable.type_system as ts
 
@@ -16,12 +18,47 @@ if TYPE_CHECKING:
 
 
 class Aggregator(abc.ABC):
+    """
+    Base class for user-defined aggregates (see @uda).
+
+    Subclasses must implement update() and value(), and can optionally implement:
+    - update_batch(): a vectorized update(), which is called with one list of values per parameter of update() (ie,
+      with column vectors for a batch of rows, which can be converted to numpy arrays with np.asarray()); it is used
+      instead of update() when the aggregate is computed in Python
+    - merge(): combines the partial state of another instance, which was updated with rows that come after those
+      of this instance, into this instance; it allows partial aggregation state to be combined
+    - merge_sql_state(): combines partial state that was computed by the database into this instance; if it is
+      implemented, the SQL translation of the aggregate (see Function.to_sql()) returns that state instead of the
+      final value, and the value is computed with value()
+    """
+
     @abc.abstractmethod
     def update(self, *args: Any, **kwargs: Any) -> None: ...
 
     @abc.abstractmethod
     def value(self) -> Any: ...
 
+    def update_batch(self, *args: Any, **kwargs: Any) -> None:
+        raise NotImplementedError
+
+    def merge(self, other: Self) -> None:
+        raise NotImplementedError
+
+    def merge_sql_state(self, state: Any) -> None:
+        raise NotImplementedError
+
+    @classmethod
+    def has_update_batch(cls) -> bool:
+        return cls.update_batch is not Aggregator.update_batch
+
+    @classmethod
+    def has_merge(cls) -> bool:
+        return cls.merge is not Aggregator.merge
+
+    @classmethod
+    def has_merge_sql_state(cls) -> bool:
+        return cls.merge_sql_state is not Aggregator.merge_sql_state
+
 
 class AggregateFunction(Function):
     """Function interface for an aggregation operation.
@@ -260,6 +297,8 @@ def uda(*args, **kwargs):  # type: ignore[no-untyped-def]
     - update(self, ...) to update the aggregator with a new value
     - value(self) to return the final result
 
+    It can also implement update_batch(self, ...) and merge(self, other) (see Aggregator).
+
     The decorator creates an AggregateFunction instance from the class and adds it
     to the module where the class is defined.
 
@@ -27,6 +27,7 @@ class CallableFunction(Function):
     py_fns: list[Callable]
     self_name: Optional[str]
     batch_size: Optional[int]
+    is_deterministic: bool  # if True, calls with identical arguments are deduplicated during execution
 
     def __init__(
         self,
@@ -37,6 +38,7 @@ class CallableFunction(Function):
         batch_size: Optional[int] = None,
         is_method: bool = False,
         is_property: bool = False,
+        is_deterministic: bool = False,
     ):
         assert len(signatures) > 0
         assert len(signatures) == len(py_fns)
@@ -45,6 +47,7 @@ class CallableFunction(Function):
         self.py_fns = py_fns
         self.self_name = self_name
         self.batch_size = batch_size
+        self.is_deterministic = is_deterministic
         self.__doc__ = self.py_fns[0].__doc__
         super().__init__(signatures, self_path=self_path, is_method=is_method, is_property=is_property)
 
@@ -183,7 +186,11 @@ class CallableFunction(Function):
 
     def to_store(self) -> tuple[dict, bytes]:
         assert not self.is_polymorphic  # multi-signature UDFs not allowed for stored fns
-        md = {'signature': self.signature.as_dict(), 'batch_size': self.batch_size}
+        md = {
+            'signature': self.signature.as_dict(),
+            'batch_size': self.batch_size,
+            'is_deterministic': self.is_deterministic,
+        }
         return md, cloudpickle.dumps(self.py_fn)
 
     @classmethod
@@ -192,7 +199,10 @@ class CallableFunction(Function):
         assert callable(py_fn)
         sig = Signature.from_dict(md['signature'])
         batch_size = md['batch_size']
-        return CallableFunction([sig], [py_fn], self_name=name, batch_size=batch_size)
+        is_deterministic = md.get('is_deterministic', False)
+        return CallableFunction(
+            [sig], [py_fn], self_name=name, batch_size=batch_size, is_deterministic=is_deterministic
+        )
 
     def validate_call(self, bound_args: dict[str, 'exprs.Expr']) -> None:
         from pixeltable import exprs
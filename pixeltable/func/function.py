@@ -50,6 +50,11 @@ class Function(ABC):
     # of the parameters of the original function, with the same type.
     _resource_pool: Callable[..., Optional[str]]
 
+    # Returns the resource pool to use for calling this function through a provider's batch API (see utils.batch_api),
+    # which is done for batch-mode backfills of computed columns.
+    # Overriden for specific Function instances via the batch_resource_pool() decorator, like _resource_pool.
+    _batch_resource_pool: Callable[..., Optional[str]]
+
     def __init__(
         self,
         signatures: list[Signature],
@@ -68,6 +73,7 @@ class Function(ABC):
         self.__resolved_fns = []
         self._to_sql = self.__default_to_sql
         self._resource_pool = self.__default_resource_pool
+        self._batch_resource_pool = self.__default_resource_pool
 
     @property
     def is_valid(self) -> bool:
@@ -211,14 +217,18 @@ class Function(ABC):
         assert not self.is_polymorphic
         self.signature.validate_args(bound_args, context=f'in function {self.name!r}')
 
-    def call_resource_pool(self, bound_args: dict[str, 'exprs.Expr']) -> str:
-        """Return the resource pool to use for calling this function with the given arguments"""
-        rp_kwargs = self._assemble_callable_args(self._resource_pool, bound_args)
+    def call_resource_pool(self, bound_args: dict[str, 'exprs.Expr'], batch_mode: bool = False) -> Optional[str]:
+        """
+        Return the resource pool to use for calling this function with the given arguments; with batch_mode=True, the
+        resource pool for calling it through a provider's batch API (None if that isn't supported)
+        """
+        rp_fn = self._batch_resource_pool if batch_mode else self._resource_pool
+        rp_kwargs = self._assemble_callable_args(rp_fn, bound_args)
         if rp_kwargs is None:
             # TODO: What to do in this case? An example where this can happen is if model_id is not a constant
             #   in a call to one of the OpenAI endpoints.
             raise excs.Error('Could not determine resource pool')
-        return self._resource_pool(**rp_kwargs)
+        return rp_fn(**rp_kwargs)
 
     def call_return_type(self, bound_args: dict[str, 'exprs.Expr']) -> ts.ColumnType:
         """Return the type of the value returned by calling this function with the given arguments"""
@@ -425,6 +435,11 @@ class Function(ABC):
         self._resource_pool = fn
         return fn
 
+    def batch_resource_pool(self, fn: Callable[..., str]) -> Callable[..., str]:
+        """Instance decorator for specifying the resource pool of this function in batch-mode backfills"""
+        self._batch_resource_pool = fn
+        return fn
+
     def __default_resource_pool(self) -> Optional[str]:
         return None
 
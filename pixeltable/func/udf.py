@@ -32,6 +32,7 @@ def udf(
     is_property: bool = False,
     resource_pool: Optional[str] = None,
     type_substitutions: Optional[Sequence[dict]] = None,
+    is_deterministic: bool = False,
     _force_stored: bool = False,
 ) -> Callable[[Callable], CallableFunction]: ...
 
@@ -46,6 +47,10 @@ def udf(
 def udf(*args, **kwargs):  # type: ignore[no-untyped-def]
     """A decorator to create a Function from a function definition.
 
+    If `is_deterministic=True`, the function is assumed to always return the same result for the same arguments:
+    calls with identical arguments that are pending at the same time during a query or insert are then executed only
+    once, and the result (or exception) is passed to all of the rows that made the call.
+
     Examples:
         >>> @pxt.udf
         ... def my_function(x: int) -> int:
@@ -73,6 +78,7 @@ def udf(*args, **kwargs):  # type: ignore[no-untyped-def]
         is_property = kwargs.pop('is_property', None)
         resource_pool = kwargs.pop('resource_pool', None)
         type_substitutions = kwargs.pop('type_substitutions', None)
+        is_deterministic = kwargs.pop('is_deterministic', False)
         force_stored = kwargs.pop('_force_stored', False)
         if len(kwargs) > 0:
             raise excs.Error(f'Invalid @udf decorator kwargs: {", ".join(kwargs.keys())}')
@@ -88,6 +94,7 @@ def udf(*args, **kwargs):  # type: ignore[no-untyped-def]
                 is_property=is_property,
                 resource_pool=resource_pool,
                 type_substitutions=type_substitutions,
+                is_deterministic=is_deterministic,
                 force_stored=force_stored,
             )
 
@@ -105,6 +112,7 @@ def make_function(
     resource_pool: Optional[str] = None,
     type_substitutions: Optional[Sequence[dict]] = None,
     function_name: Optional[str] = None,
+    is_deterministic: bool = False,
     force_stored: bool = False,
 ) -> CallableFunction:
     """
@@ -183,6 +191,7 @@ def make_function(
         batch_size=batch_size,
         is_method=is_method,
         is_property=is_property,
+        is_deterministic=is_deterministic,
     )
     if resource_pool is not None:
         result.resource_pool(lambda: resource_pool)
@@ -8,17 +8,19 @@ the [Working with Anthropic](https://pixeltable.readme.io/docs/working-with-anth
 import datetime
 import json
 import logging
-from typing import TYPE_CHECKING, Any, Iterable, Optional, cast
+from typing import TYPE_CHECKING, Any, Optional, cast
 
 import httpx
 
 import pixeltable as pxt
 from pixeltable import env, exprs
 from pixeltable.func import Tools
+from pixeltable.utils import batch_api
 from pixeltable.utils.code import local_public_names
 
 if TYPE_CHECKING:
     import anthropic
+    from anthropic.types.messages.batch_create_params import Request as BatchRequestParams
 
 _logger = logging.getLogger('pixeltable')
 
@@ -146,6 +148,46 @@ class AnthropicRateLimitsInfo(env.RateLimitsInfo):
         return super().get_retry_delay(exc)
 
 
+def _messages_request(
+    messages: list[dict[str, str]],
+    model: str,
+    max_tokens: int,
+    model_kwargs: Optional[dict[str, Any]] = None,
+    tools: Optional[list[dict[str, Any]]] = None,
+    tool_choice: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    """Returns the body of the messages request"""
+    model_kwargs = {} if model_kwargs is None else dict(model_kwargs)
+
+    if tools is not None:
+        # Reformat `tools` into Anthropic format
+        model_kwargs['tools'] = [
+            {
+                'name': tool['name'],
+                'description': tool['description'],
+                'input_schema': {
+                    'type': 'object',
+                    'properties': tool['parameters']['properties'],
+                    'required': tool['required'],
+                },
+            }
+            for tool in tools
+        ]
+
+    if tool_choice is not None:
+        if tool_choice['auto']:
+            model_kwargs['tool_choice'] = {'type': 'auto'}
+        elif tool_choice['required']:
+            model_kwargs['tool_choice'] = {'type': 'any'}
+        else:
+            assert tool_choice['tool'] is not None
+            model_kwargs['tool_choice'] = {'type': 'tool', 'name': tool_choice['tool']}
+        if not tool_choice['parallel_tool_calls']:
+            model_kwargs['tool_choice']['disable_parallel_tool_use'] = True
+
+    return {'messages': messages, 'model': model, 'max_tokens': max_tokens, **model_kwargs}
+
+
 @pxt.udf
 async def messages(
     messages: list[dict[str, str]],
@@ -167,6 +209,11 @@ async def messages(
     Uses the rate limit-related headers returned by the API to throttle requests adaptively, based on available
     request and token capacity. No configuration is necessary.
 
+    Batch mode:
+    In backfills with `add_computed_column(..., batch_mode=True)` or `recompute_columns(..., batch_mode=True)`,
+    requests are executed through the Message Batches API instead, which is cheaper, but returns results only after
+    minutes or hours.
+
     __Requirements:__
 
     - `pip install anthropic`
@@ -189,34 +236,7 @@ async def messages(
         >>> msgs = [{'role': 'user', 'content': tbl.prompt}]
         ... tbl.add_computed_column(response=messages(msgs, model='claude-3-5-sonnet-20241022'))
     """
-    if model_kwargs is None:
-        model_kwargs = {}
-
-    if tools is not None:
-        # Reformat `tools` into Anthropic format
-        model_kwargs['tools'] = [
-            {
-                'name': tool['name'],
-                'description': tool['description'],
-                'input_schema': {
-                    'type': 'object',
-                    'properties': tool['parameters']['properties'],
-                    'required': tool['required'],
-                },
-            }
-            for tool in tools
-        ]
-
-    if tool_choice is not None:
-        if tool_choice['auto']:
-            model_kwargs['tool_choice'] = {'type': 'auto'}
-        elif tool_choice['required']:
-            model_kwargs['tool_choice'] = {'type': 'any'}
-        else:
-            assert tool_choice['tool'] is not None
-            model_kwargs['tool_choice'] = {'type': 'tool', 'name': tool_choice['tool']}
-        if not tool_choice['parallel_tool_calls']:
-            model_kwargs['tool_choice']['disable_parallel_tool_use'] = True
+    request = _messages_request(messages, model, max_tokens, model_kwargs, tools, tool_choice)
 
     # make sure the pool info exists prior to making the request
     resource_pool_id = f'rate-limits:anthropic:{model}'
@@ -224,11 +244,7 @@ async def messages(
     assert isinstance(rate_limits_info, env.RateLimitsInfo)
 
     # TODO: timeouts should be set system-wide and be user-configurable
-    from anthropic.types import MessageParam
-
-    result = await _anthropic_client().messages.with_raw_response.create(
-        messages=cast(Iterable[MessageParam], messages), model=model, max_tokens=max_tokens, **model_kwargs
-    )
+    result = await _anthropic_client().messages.with_raw_response.create(**request)
 
     requests_info, input_tokens_info, output_tokens_info = _get_header_info(result.headers)
     # retry_after_str = result.headers.get('retry-after')
@@ -248,6 +264,47 @@ def _(model: str) -> str:
     return f'rate-limits:anthropic:{model}'
 
 
+@messages.batch_resource_pool
+def _(model: str) -> str:
+    return f'batch-api:anthropic:messages:{model}'
+
+
+class AnthropicBatchApi(batch_api.BatchApi):
+    """
+    Executes requests through the Message Batches API; see
+    <https://docs.anthropic.com/en/docs/build-with-claude/batch-processing>
+    """
+
+    async def submit(self, url: str, model: str, requests: list[batch_api.BatchRequest]) -> str:
+        batch = await _anthropic_client().messages.batches.create(
+            requests=[cast('BatchRequestParams', {'custom_id': r.custom_id, 'params': r.body}) for r in requests]
+        )
+        return batch.id
+
+    async def poll(self, batch_id: str) -> Optional[batch_api.BatchOutput]:
+        client = _anthropic_client()
+        batch = await client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != 'ended':
+            return None
+        results: dict[str, batch_api.BatchResult] = {}
+        async for entry in await client.messages.batches.results(batch_id):
+            if entry.result.type == 'succeeded':
+                results[entry.custom_id] = batch_api.BatchResult(entry.result.message.to_dict(), None)
+            elif entry.result.type == 'errored':
+                results[entry.custom_id] = batch_api.BatchResult(None, str(entry.result.error.to_dict()))
+            else:
+                # canceled or expired
+                results[entry.custom_id] = batch_api.BatchResult(None, entry.result.type)
+        return batch_api.BatchOutput(results, 'no result')
+
+
+batch_api.register_endpoint(
+    'anthropic',
+    'messages',
+    batch_api.BatchEndpoint(AnthropicBatchApi(), '/v1/messages', _messages_request, lambda body: body),
+)
+
+
 def invoke_tools(tools: Tools, response: exprs.Expr) -> exprs.InlineDict:
     """Converts an Anthropic response dict to Pixeltable tool invocation format and calls `tools._invoke()`."""
     return tools._invoke(_anthropic_response_to_pxt_tool_calls(response))
@@ -3,6 +3,7 @@ import typing
 from typing import Any, Callable, Optional
 
 import sqlalchemy as sql
+from typing_extensions import Self
 
 from pixeltable import exceptions as excs, exprs, func, type_system as ts
 from pixeltable.utils.code import local_public_names
@@ -34,6 +35,14 @@ class sum(func.Aggregator, typing.Generic[T]):
         else:
             self.sum += val  # type: ignore[operator]
 
+    def update_batch(self, val: list[T]) -> None:
+        vals = [v for v in val if v is not None]
+        if len(vals) > 0:
+            self.update(builtins.sum(vals))  # type: ignore[arg-type]
+
+    def merge(self, other: Self) -> None:
+        self.update(other.sum)
+
     def value(self) -> T:
         return self.sum
 
@@ -59,6 +68,12 @@ class count(func.Aggregator, typing.Generic[T]):
         if val is not None:
             self.count += 1
 
+    def update_batch(self, val: list[T]) -> None:
+        self.count += builtins.sum(v is not None for v in val)
+
+    def merge(self, other: Self) -> None:
+        self.count += other.count
+
     def value(self) -> int:
         return self.count
 
@@ -84,6 +99,14 @@ class min(func.Aggregator, typing.Generic[T]):
         else:
             self.val = builtins.min(self.val, val)  # type: ignore[call-overload]
 
+    def update_batch(self, val: list[T]) -> None:
+        vals = [v for v in val if v is not None]
+        if len(vals) > 0:
+            self.update(builtins.min(vals))  # type: ignore[type-var]
+
+    def merge(self, other: Self) -> None:
+        self.update(other.val)
+
     def value(self) -> T:
         return self.val
 
@@ -114,6 +137,14 @@ class max(func.Aggregator, typing.Generic[T]):
         else:
             self.val = builtins.max(self.val, val)  # type: ignore[call-overload]
 
+    def update_batch(self, val: list[T]) -> None:
+        vals = [v for v in val if v is not None]
+        if len(vals) > 0:
+            self.update(builtins.max(vals))  # type: ignore[type-var]
+
+    def merge(self, other: Self) -> None:
+        self.update(other.val)
+
     def value(self) -> T:
         return self.val
 
@@ -141,6 +172,22 @@ class mean(func.Aggregator, typing.Generic[T]):
             self.sum += val  # type: ignore[operator]
         self.count += 1
 
+    def update_batch(self, val: list[T]) -> None:
+        vals = [v for v in val if v is not None]
+        if len(vals) > 0:
+            self._add_partial(builtins.sum(vals), len(vals))  # type: ignore[arg-type]
+
+    def merge(self, other: Self) -> None:
+        if other.count > 0:
+            self._add_partial(other.sum, other.count)
+
+    def _add_partial(self, partial_sum: T, partial_count: int) -> None:
+        if self.sum is None:
+            self.sum = partial_sum
+        else:
+            self.sum += partial_sum  # type: ignore[operator]
+        self.count += partial_count
+
     def value(self) -> Optional[float]:  # Always a float
         if self.count == 0:
             return None
@@ -13,6 +13,8 @@ t.select(pxtf.json.make_list(t.json_col)).collect()
 
 from typing import Any
 
+from typing_extensions import Self
+
 import pixeltable as pxt
 from pixeltable.utils.code import local_public_names
 
@@ -31,6 +33,12 @@ class make_list(pxt.Aggregator):
             return
         self.output.append(obj)
 
+    def update_batch(self, obj: list[Any]) -> None:
+        self.output.extend(o for o in obj if o is not None)
+
+    def merge(self, other: Self) -> None:
+        self.output.extend(other.output)
+
     def value(self) -> list[Any]:
         return self.output
 
@@ -13,7 +13,7 @@ import logging
 import math
 import pathlib
 import re
-from typing import TYPE_CHECKING, Any, Callable, Optional, Type
+from typing import TYPE_CHECKING, Any, Callable, Optional, Type, cast
 
 import httpx
 import numpy as np
@@ -22,6 +22,7 @@ import PIL
 import pixeltable as pxt
 from pixeltable import env, exprs, type_system as ts
 from pixeltable.func import Batch, Tools
+from pixeltable.utils import batch_api
 from pixeltable.utils.code import local_public_names
 from pixeltable.utils.local_store import TempStore
 
@@ -357,6 +358,34 @@ def _chat_completions_get_request_resources(
     return {'requests': 1, 'tokens': int(num_tokens) + completion_tokens}
 
 
+def _chat_completions_request(
+    messages: list,
+    model: str,
+    model_kwargs: Optional[dict[str, Any]] = None,
+    tools: Optional[list[dict[str, Any]]] = None,
+    tool_choice: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    """Returns the body of the chat/completions request"""
+    model_kwargs = {} if model_kwargs is None else dict(model_kwargs)
+
+    if tools is not None:
+        model_kwargs['tools'] = [{'type': 'function', 'function': tool} for tool in tools]
+
+    if tool_choice is not None:
+        if tool_choice['auto']:
+            model_kwargs['tool_choice'] = 'auto'
+        elif tool_choice['required']:
+            model_kwargs['tool_choice'] = 'required'
+        else:
+            assert tool_choice['tool'] is not None
+            model_kwargs['tool_choice'] = {'type': 'function', 'function': {'name': tool_choice['tool']}}
+
+    if tool_choice is not None and not tool_choice['parallel_tool_calls']:
+        model_kwargs['parallel_tool_calls'] = False
+
+    return {'messages': messages, 'model': model, **model_kwargs}
+
+
 @pxt.udf
 async def chat_completions(
     messages: list,
@@ -377,6 +406,11 @@ async def chat_completions(
     Uses the rate limit-related headers returned by the API to throttle requests adaptively, based on available
     request and token capacity. No configuration is necessary.
 
+    Batch mode:
+    In backfills with `add_computed_column(..., batch_mode=True)` or `recompute_columns(..., batch_mode=True)`,
+    requests are executed through the OpenAI Batch API instead, which is cheaper, but returns results only after
+    minutes or hours.
+
     __Requirements:__
 
     - `pip install openai`
@@ -400,23 +434,7 @@ async def chat_completions(
         ... ]
         >>> tbl.add_computed_column(response=chat_completions(messages, model='gpt-4o-mini'))
     """
-    if model_kwargs is None:
-        model_kwargs = {}
-
-    if tools is not None:
-        model_kwargs['tools'] = [{'type': 'function', 'function': tool} for tool in tools]
-
-    if tool_choice is not None:
-        if tool_choice['auto']:
-            model_kwargs['tool_choice'] = 'auto'
-        elif tool_choice['required']:
-            model_kwargs['tool_choice'] = 'required'
-        else:
-            assert tool_choice['tool'] is not None
-            model_kwargs['tool_choice'] = {'type': 'function', 'function': {'name': tool_choice['tool']}}
-
-    if tool_choice is not None and not tool_choice['parallel_tool_calls']:
-        model_kwargs['parallel_tool_calls'] = False
+    request = _chat_completions_request(messages, model, model_kwargs, tools, tool_choice)
 
     # make sure the pool info exists prior to making the request
     resource_pool = _rate_limits_pool(model)
@@ -424,9 +442,7 @@ async def chat_completions(
         resource_pool, lambda: OpenAIRateLimitsInfo(_chat_completions_get_request_resources)
     )
 
-    result = await _openai_client().chat.completions.with_raw_response.create(
-        messages=messages, model=model, **model_kwargs
-    )
+    result = await _openai_client().chat.completions.with_raw_response.create(**request)
 
     requests_info, tokens_info = _get_header_info(result.headers)
     is_retry = _runtime_ctx is not None and _runtime_ctx.is_retry
@@ -562,6 +578,13 @@ def _embeddings_get_request_resources(input: list[str]) -> dict[str, int]:
     return {'requests': 1, 'tokens': int(input_len / 4)}
 
 
+def _embeddings_request(
+    input: str | list[str], model: str, model_kwargs: Optional[dict[str, Any]] = None
+) -> dict[str, Any]:
+    """Returns the body of the embeddings request"""
+    return {'input': input, 'model': model, 'encoding_format': 'float', **(model_kwargs or {})}
+
+
 @pxt.udf(batch_size=32)
 async def embeddings(
     input: Batch[str],
@@ -580,6 +603,11 @@ async def embeddings(
     Uses the rate limit-related headers returned by the API to throttle requests adaptively, based on available
     request and token capacity. No configuration is necessary.
 
+    Batch mode:
+    In backfills with `add_computed_column(..., batch_mode=True)` or `recompute_columns(..., batch_mode=True)`,
+    requests are executed through the OpenAI Batch API instead, which is cheaper, but returns results only after
+    minutes or hours.
+
     __Requirements:__
 
     - `pip install openai`
@@ -603,17 +631,13 @@ async def embeddings(
 
         >>> tbl.add_embedding_index(embedding=embeddings.using(model='text-embedding-3-small'))
     """
-    if model_kwargs is None:
-        model_kwargs = {}
-
     _logger.debug(f'embeddings: batch_size={len(input)}')
     resource_pool = _rate_limits_pool(model)
     rate_limits_info = env.Env.get().get_resource_pool_info(
         resource_pool, lambda: OpenAIRateLimitsInfo(_embeddings_get_request_resources)
     )
-    result = await _openai_client().embeddings.with_raw_response.create(
-        input=input, model=model, encoding_format='float', **model_kwargs
-    )
+    request = _embeddings_request(input, model, model_kwargs)
+    result = await _openai_client().embeddings.with_raw_response.create(**request)
     requests_info, tokens_info = _get_header_info(result.headers)
     is_retry = _runtime_ctx is not None and _runtime_ctx.is_retry
     rate_limits_info.record(requests=requests_info, tokens=tokens_info, reset_exc=is_retry)
@@ -748,13 +772,102 @@ def _(model: str) -> str:
     return f'request-rate:openai:{model}'
 
 
-@chat_completions.resource_pool
 @vision.resource_pool
+def _(model: str) -> str:
+    return _rate_limits_pool(model)
+
+
+@chat_completions.resource_pool
+def _(model: str) -> str:
+    return _rate_limits_pool(model)
+
+
+@chat_completions.batch_resource_pool
+def _(model: str) -> str:
+    return f'batch-api:openai:chat_completions:{model}'
+
+
 @embeddings.resource_pool
 def _(model: str) -> str:
     return _rate_limits_pool(model)
 
 
+@embeddings.batch_resource_pool
+def _(model: str) -> str:
+    return f'batch-api:openai:embeddings:{model}'
+
+
+#####################################
+# Batch API
+
+
+class OpenAIBatchApi(batch_api.BatchApi):
+    """Executes requests through the OpenAI Batch API; see <https://platform.openai.com/docs/guides/batch>"""
+
+    IN_PROGRESS_STATUSES = ('validating', 'in_progress', 'finalizing', 'cancelling')
+
+    async def submit(self, url: str, model: str, requests: list[batch_api.BatchRequest]) -> str:
+        client = _openai_client()
+        lines = [json.dumps({'custom_id': r.custom_id, 'method': 'POST', 'url': url, 'body': r.body}) for r in requests]
+        input_file = await client.files.create(file=('batch.jsonl', '\n'.join(lines).encode()), purpose='batch')
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=cast(Any, url),  # the batch endpoints are a Literal type
+            completion_window='24h',
+            metadata={'source': 'pixeltable', 'model': model},
+        )
+        return batch.id
+
+    async def poll(self, batch_id: str) -> Optional[batch_api.BatchOutput]:
+        client = _openai_client()
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in self.IN_PROGRESS_STATUSES:
+            return None
+
+        # failed requests are reported in the error file
+        results: dict[str, batch_api.BatchResult] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            content = await client.files.content(file_id)
+            for line in content.text.splitlines():
+                if len(line.strip()) == 0:
+                    continue
+                entry = json.loads(line)
+                response = entry.get('response')
+                if entry.get('error') is not None:
+                    results[entry['custom_id']] = batch_api.BatchResult(None, str(entry['error']))
+                elif response is None or response['status_code'] != 200:
+                    msg = 'no response' if response is None else f'{response["status_code"]}: {response["body"]}'
+                    results[entry['custom_id']] = batch_api.BatchResult(None, msg)
+                else:
+                    results[entry['custom_id']] = batch_api.BatchResult(response['body'], None)
+
+        error: Optional[str] = None
+        if batch.status != 'completed':
+            error = f'batch {batch.status}'
+            if batch.errors is not None and batch.errors.data:
+                error += ': ' + '; '.join(str(e.message) for e in batch.errors.data)
+        return batch_api.BatchOutput(results, error)
+
+
+def _embeddings_response(body: dict[str, Any]) -> np.ndarray:
+    return np.array(body['data'][0]['embedding'], dtype=np.float64)
+
+
+_batch_api = OpenAIBatchApi()
+batch_api.register_endpoint(
+    'openai',
+    'chat_completions',
+    batch_api.BatchEndpoint(_batch_api, '/v1/chat/completions', _chat_completions_request, lambda body: body),
+)
+batch_api.register_endpoint(
+    'openai',
+    'embeddings',
+    batch_api.BatchEndpoint(_batch_api, '/v1/embeddings', _embeddings_request, _embeddings_response),
+)
+
+
 def invoke_tools(tools: Tools, response: exprs.Expr) -> exprs.InlineDict:
     """Converts an OpenAI response dict to Pixeltable tool invocation format and calls `tools._invoke()`."""
     return tools._invoke(_openai_response_to_pxt_tool_calls(response))
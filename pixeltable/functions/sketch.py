@@ -0,0 +1,298 @@
+"""
+Pixeltable [UDAs](https://pixeltable.readme.io/docs/user-defined-functions-udfs) for approximate distinct counts and
+percentiles, based on mergeable sketches.
+
+`approx_count_distinct()` and `approx_percentile()` compute their result directly. The `*_accumulate()` aggregates
+instead return the sketch itself (as a JSON object), which can be stored in a column, combined with other sketches
+with the `*_combine()` aggregates, and evaluated with `hll_estimate()` and `kll_quantile()`.
+
+Example:
+```python
+import pixeltable as pxt
+import pixeltable.functions as pxtf
+
+t = pxt.get_table(...)
+t.group_by(t.day).select(
+    t.day,
+    users=pxtf.sketch.approx_count_distinct(t.user_id),
+    p99=pxtf.sketch.approx_percentile(t.latency, q=0.99),
+).collect()
+
+# daily sketches that can be rolled up later
+daily = t.group_by(t.day).select(t.day, users=pxtf.sketch.hll_accumulate(t.user_id)).collect()
+```
+"""
+
+import math
+import typing
+from typing import Optional
+
+import numpy as np
+import sqlalchemy as sql
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from typing_extensions import Self
+
+import pixeltable as pxt
+import pixeltable.type_system as ts
+from pixeltable.env import Env
+from pixeltable.utils.code import local_public_names
+from pixeltable.utils.sketches import HyperLogLog, KllSketch
+
+T = typing.TypeVar('T')
+
+_DISTINCT_TYPES = (str, int, float, bool, ts.Timestamp, ts.Date, ts.Json)
+_NUMERIC_TYPES = (int, float)
+
+
+@pxt.uda(type_substitutions=tuple({T: Optional[t]} for t in _DISTINCT_TYPES))  # type: ignore[misc]
+class approx_count_distinct(pxt.Aggregator, typing.Generic[T]):
+    """
+    Estimates the number of distinct non-null values, using a HyperLogLog sketch.
+
+    If the argument can be computed in SQL, the registers of the sketch are computed by the database (from
+    `hashtextextended()`), and only the estimate is computed in Python.
+
+    Args:
+        precision: The sketch has `2**precision` registers; the relative standard error of the estimate is about
+            `1.04 / sqrt(2**precision)` (0.8% for the default precision of 14).
+
+    Returns:
+        The estimated number of distinct values.
+    """
+
+    def __init__(self, precision: int = HyperLogLog.DEFAULT_PRECISION) -> None:
+        self.hll = HyperLogLog(precision)
+
+    def update(self, val: T) -> None:
+        if val is not None:
+            self.hll.update([val])
+
+    def update_batch(self, val: list[T]) -> None:
+        self.hll.update([v for v in val if v is not None])
+
+    def merge(self, other: Self) -> None:
+        self.hll.merge(other.hll)
+
+    def merge_sql_state(self, state: Optional[dict[str, int]]) -> None:
+        # state: register -> rank, for the registers that are set
+        if state is not None:
+            idxs = np.fromiter((int(idx) for idx in state), dtype=np.int64, count=len(state))
+            ranks = np.fromiter(state.values(), dtype=np.uint8, count=len(state))
+            self.hll.update_registers(idxs, ranks)
+
+    def value(self) -> int:
+        return self.hll.estimate()
+
+
+@approx_count_distinct.to_sql
+def _(val: sql.ColumnElement, precision: Optional[sql.ColumnElement] = None) -> Optional[sql.ColumnElement]:
+    if Env.get().is_using_cockroachdb:
+        return None
+    # shift amounts need to be integers
+    precision = sql.cast(HyperLogLog.DEFAULT_PRECISION if precision is None else precision, sql.Integer)
+    # the low precision bits of the hash select the register, the rank is 1 + the number of trailing zeros of the
+    # rest; the sentinel bit caps the rank at 64 - precision + 1
+    one = sql.literal(1, sql.BigInteger)
+    hash_val = sql.func.hashtextextended(sql.cast(val, sql.Text), 0)
+    register = hash_val.op('&')(one.op('<<')(precision) - 1)
+    rest = hash_val.op('>>')(precision).op('|')(one.op('<<')(64 - precision))
+    lowest_bit = rest.op('&')(-rest)
+    rank = sql.cast(sql.func.round(sql.func.ln(sql.cast(lowest_bit, sql.Float)) / math.log(2)), sql.Integer) + 1
+    # aggregating in the order of rank leaves the maximum rank of each register in the object
+    return sql.func.jsonb_object_agg(register, aggregate_order_by(rank, rank)).filter(val.is_not(None))
+
+
+@pxt.uda(type_substitutions=tuple({T: Optional[t]} for t in _NUMERIC_TYPES))  # type: ignore[misc]
+class approx_percentile(pxt.Aggregator, typing.Generic[T]):
+    """
+    Estimates a percentile of the non-null values, using a KLL sketch.
+
+    If the argument can be computed in SQL, the percentile is computed by the database instead, with
+    `percentile_disc()`; it returns one of the values, and `k` doesn't apply.
+
+    Args:
+        q: The percentile, as a fraction between 0 and 1 (eg, 0.99 for the 99th percentile).
+        k: The size of the sketch; the rank error of the estimate is about `1.65 / k` (0.8% for the default of 200).
+
+    Returns:
+        The estimated percentile, or `None` if there are no values.
+    """
+
+    def __init__(self, q: float = 0.5, k: int = KllSketch.DEFAULT_K) -> None:
+        if not 0.0 <= q <= 1.0:
+            raise pxt.Error(f'q must be between 0 and 1: {q}')
+        self.q = q
+        self.kll = KllSketch(k)
+
+    def update(self, val: T) -> None:
+        if val is not None:
+            self.kll.update([val])  # type: ignore[list-item]
+
+    def update_batch(self, val: list[T]) -> None:
+        self.kll.update(v for v in val if v is not None)  # type: ignore[misc]
+
+    def merge(self, other: Self) -> None:
+        self.kll.merge(other.kll)
+
+    def value(self) -> Optional[float]:
+        return self.kll.quantile(self.q)
+
+
+@approx_percentile.to_sql
+def _(
+    val: sql.ColumnElement, q: Optional[sql.ColumnElement] = None, k: Optional[sql.ColumnElement] = None
+) -> Optional[sql.ColumnElement]:
+    return sql.cast(sql.func.percentile_disc(q if q is not None else 0.5).within_group(val), sql.Float)
+
+
+@pxt.uda(type_substitutions=tuple({T: Optional[t]} for t in _DISTINCT_TYPES))  # type: ignore[misc]
+class hll_accumulate(pxt.Aggregator, typing.Generic[T]):
+    """
+    Collects the non-null values into a HyperLogLog sketch, which can be stored, combined with other sketches with
+    [`hll_combine()`][pixeltable.functions.sketch.hll_combine] and evaluated with
+    [`hll_estimate()`][pixeltable.functions.sketch.hll_estimate].
+
+    Args:
+        precision: See [`approx_count_distinct()`][pixeltable.functions.sketch.approx_count_distinct]; only sketches
+            with the same precision can be combined.
+
+    Returns:
+        The sketch, as a JSON object.
+    """
+
+    def __init__(self, precision: int = HyperLogLog.DEFAULT_PRECISION) -> None:
+        self.hll = HyperLogLog(precision)
+
+    def update(self, val: T) -> None:
+        if val is not None:
+            self.hll.update([val])
+
+    def update_batch(self, val: list[T]) -> None:
+        self.hll.update([v for v in val if v is not None])
+
+    def merge(self, other: Self) -> None:
+        self.hll.merge(other.hll)
+
+    def value(self) -> dict:
+        return self.hll.as_dict()
+
+
+@pxt.uda
+class hll_combine(pxt.Aggregator):
+    """
+    Combines HyperLogLog sketches created by [`hll_accumulate()`][pixeltable.functions.sketch.hll_accumulate].
+
+    Returns:
+        The combined sketch, or `None` if there are no sketches.
+    """
+
+    def __init__(self) -> None:
+        self.hll: Optional[HyperLogLog] = None
+
+    def update(self, sketch: pxt.Json) -> None:
+        if sketch is None:
+            return
+        hll = HyperLogLog.from_dict(sketch)
+        if self.hll is None:
+            self.hll = hll
+        else:
+            self.hll.merge(hll)
+
+    def merge(self, other: Self) -> None:
+        if self.hll is None:
+            self.hll = other.hll
+        elif other.hll is not None:
+            self.hll.merge(other.hll)
+
+    def value(self) -> Optional[dict]:
+        return None if self.hll is None else self.hll.as_dict()
+
+
+@pxt.udf
+def hll_estimate(sketch: pxt.Json) -> int:
+    """
+    Returns the estimated number of distinct values in a HyperLogLog sketch created by
+    [`hll_accumulate()`][pixeltable.functions.sketch.hll_accumulate] or
+    [`hll_combine()`][pixeltable.functions.sketch.hll_combine].
+    """
+    return HyperLogLog.from_dict(sketch).estimate()
+
+
+@pxt.uda(type_substitutions=tuple({T: Optional[t]} for t in _NUMERIC_TYPES))  # type: ignore[misc]
+class kll_accumulate(pxt.Aggregator, typing.Generic[T]):
+    """
+    Collects the non-null values into a KLL quantile sketch, which can be stored, combined with other sketches with
+    [`kll_combine()`][pixeltable.functions.sketch.kll_combine] and evaluated with
+    [`kll_quantile()`][pixeltable.functions.sketch.kll_quantile].
+
+    Args:
+        k: See [`approx_percentile()`][pixeltable.functions.sketch.approx_percentile]; only sketches with the same
+            `k` can be combined.
+
+    Returns:
+        The sketch, as a JSON object.
+    """
+
+    def __init__(self, k: int = KllSketch.DEFAULT_K) -> None:
+        self.kll = KllSketch(k)
+
+    def update(self, val: T) -> None:
+        if val is not None:
+            self.kll.update([val])  # type: ignore[list-item]
+
+    def update_batch(self, val: list[T]) -> None:
+        self.kll.update(v for v in val if v is not None)  # type: ignore[misc]
+
+    def merge(self, other: Self) -> None:
+        self.kll.merge(other.kll)
+
+    def value(self) -> dict:
+        return self.kll.as_dict()
+
+
+@pxt.uda
+class kll_combine(pxt.Aggregator):
+    """
+    Combines KLL sketches created by [`kll_accumulate()`][pixeltable.functions.sketch.kll_accumulate].
+
+    Returns:
+        The combined sketch, or `None` if there are no sketches.
+    """
+
+    def __init__(self) -> None:
+        self.kll: Optional[KllSketch] = None
+
+    def update(self, sketch: pxt.Json) -> None:
+        if sketch is None:
+            return
+        kll = KllSketch.from_dict(sketch)
+        if self.kll is None:
+            self.kll = kll
+        else:
+            self.kll.merge(kll)
+
+    def merge(self, other: Self) -> None:
+        if self.kll is None:
+            self.kll = other.kll
+        elif other.kll is not None:
+            self.kll.merge(other.kll)
+
+    def value(self) -> Optional[dict]:
+        return None if self.kll is None else self.kll.as_dict()
+
+
+@pxt.udf
+def kll_quantile(sketch: pxt.Json, q: float) -> Optional[float]:
+    """
+    Returns the estimated quantile `q` (a fraction between 0 and 1) of the values in a KLL sketch created by
+    [`kll_accumulate()`][pixeltable.functions.sketch.kll_accumulate] or
+    [`kll_combine()`][pixeltable.functions.sketch.kll_combine].
+    """
+    return KllSketch.from_dict(sketch).quantile(q)
+
+
+__all__ = local_public_names(__name__)
+
+
+def __dir__() -> list[str]:
+    return __all__
@@ -2,6 +2,7 @@
 Pixeltable [UDFs](https://pixeltable.readme.io/docs/user-defined-functions-udfs) for `VideoType`.
 """
 
+import copy
 import logging
 import pathlib
 import subprocess
@@ -221,7 +222,9 @@ def get_metadata(video: pxt.Video) -> dict:
 
         >>> tbl.select(tbl.video_col.get_metadata()).collect()
     """
-    return av_utils.get_metadata(video)
+    with av_utils.DecoderCache.get().session(str(video)) as session:
+        # the session's copy is shared across calls
+        return copy.deepcopy(session.metadata)
 
 
 @pxt.udf(is_method=True)
@@ -235,7 +238,8 @@ def get_duration(video: pxt.Video) -> float | None:
     Returns:
         The duration in seconds, or None if the duration cannot be determined.
     """
-    return av_utils.get_video_duration(video)
+    with av_utils.DecoderCache.get().session(str(video)) as session:
+        return session.video_duration
 
 
 @pxt.udf(is_method=True)
@@ -263,35 +267,9 @@ def extract_frame(video: pxt.Video, *, timestamp: float) -> PIL.Image.Image | No
         raise ValueError("'timestamp' must be non-negative")
 
     try:
-        with av.open(str(video)) as container:
-            video_stream = container.streams.video[0]
-            time_base = float(video_stream.time_base)
-            start_time = video_stream.start_time or 0
-            duration = video_stream.duration
-
-            # Check if timestamp is beyond video duration
-            if duration is not None:
-                duration_seconds = float(duration * time_base)
-                if timestamp > duration_seconds:
-                    return None
-
-            # Convert timestamp to stream time base units
-            target_pts = int(timestamp / time_base) + start_time
-
-            # Seek to the nearest keyframe *before* our target timestamp
-            container.seek(target_pts, backward=True, stream=video_stream)
-
-            # Decode frames until we reach or pass the target timestamp
-            for frame in container.decode(video=0):
-                frame_pts = frame.pts
-                if frame_pts is None:
-                    continue
-                frame_timestamp = (frame_pts - start_time) * time_base
-                if frame_timestamp >= timestamp:
-                    return frame.to_image()
-
-            return None
-
+        # calls for the same video share an open decoder; timestamps in increasing order are decoded sequentially
+        with av_utils.DecoderCache.get().session(str(video)) as session:
+            return session.extract_frame(timestamp)
     except Exception as e:
         raise pxt.Error(f'extract_frame(): failed to extract frame: {e}') from e
 
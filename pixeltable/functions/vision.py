@@ -18,6 +18,7 @@ from typing import Any, Optional
 
 import numpy as np
 import PIL.Image
+from typing_extensions import Self
 
 import pixeltable as pxt
 from pixeltable.utils.code import local_public_names
@@ -246,6 +247,10 @@ class mean_ap(pxt.Aggregator):
             class_idx = eval_dict['class']
             self.class_tpfp[class_idx].append(eval_dict)
 
+    def merge(self, other: Self) -> None:
+        for class_idx, tpfp in other.class_tpfp.items():
+            self.class_tpfp[class_idx].extend(tpfp)
+
     def value(self) -> dict:
         eps = np.finfo(np.float32).eps
         result: dict[int, float] = {}
@@ -3,3 +3,5 @@
 from .base import IndexBase
 from .btree import BtreeIndex
 from .embedding_index import EmbeddingIndex
+from .expr_index import ExprIndex
+from .json_index import JsonIndex
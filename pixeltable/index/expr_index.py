@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import sqlalchemy as sql
+
+import pixeltable.exceptions as excs
+import pixeltable.type_system as ts
+from pixeltable import catalog, exprs
+from pixeltable.env import Env
+
+from .base import IndexBase
+from .btree import BtreeIndex
+
+
+class ExprIndex(IndexBase):
+    """
+    Interface to B-tree indices in Postgres on the value of an expression over a column (eg, a path into a JSON
+    column or a scalar expression such as `t.a + 1`), rather than on the column value itself.
+    - the index value column stores the expression value; string values are truncated to BtreeIndex.MAX_STRING_LEN,
+      as for BtreeIndex
+    - Comparison.sql_expr() substitutes the index value column for a comparison of the indexed expression against a
+      literal (see search_arg())
+    - rows for which the expression fails (eg, a cast of a JSON value of a different type) have a NULL index value
+      and record the error; TableVersion sets has_value_errors when that happens while populating or updating the
+      index value column, after which the comparison is evaluated without the index value column, so that the errors
+      are reported
+    - the indexed expression is restored lazily after a catalog reload, because it can reference the catalog
+    """
+
+    _indexed_expr: Optional[exprs.Expr]
+    _indexed_expr_dict: dict[str, Any]
+    value_type: ts.ColumnType
+    has_value_errors: bool  # True if the indexed expression failed for any row (recorded in the index metadata)
+
+    def __init__(
+        self,
+        c: catalog.Column,
+        expr: Optional[exprs.Expr] = None,
+        indexed_expr_dict: Optional[dict[str, Any]] = None,
+        value_type: Optional[ts.ColumnType] = None,
+        has_value_errors: bool = False,
+    ):
+        assert (expr is None) != (indexed_expr_dict is None)
+        if expr is not None:
+            if expr.col_type.is_json_type():
+                raise excs.Error(
+                    f'Index on {expr}: B-tree index requires a scalar expression, got {expr.col_type}; '
+                    f'use astype() to convert the JSON value to a scalar type, or use a GIN index'
+                )
+            if not expr.col_type.is_scalar_type():
+                raise excs.Error(f'Index on {expr}: B-tree index requires a scalar expression, got {expr.col_type}')
+            self._indexed_expr = expr.copy()
+            self._indexed_expr_dict = expr.as_dict()
+            self.value_type = expr.col_type
+        else:
+            assert value_type is not None
+            self._indexed_expr = None
+            self._indexed_expr_dict = indexed_expr_dict
+            self.value_type = value_type
+        self.has_value_errors = has_value_errors
+
+    @property
+    def indexed_expr(self) -> exprs.Expr:
+        if self._indexed_expr is None:
+            self._indexed_expr = exprs.Expr.from_dict(self._indexed_expr_dict)
+        return self._indexed_expr
+
+    def index_value_expr(self) -> exprs.Expr:
+        expr = self.indexed_expr.copy()
+        return BtreeIndex.str_filter(expr) if self.value_type.is_string_type() else expr
+
+    def records_value_errors(self) -> bool:
+        # the expression (eg, a type cast of a JSON path) can fail for individual rows
+        return True
+
+    def index_sa_type(self) -> sql.types.TypeEngine:
+        return self.value_type.to_sa_type()
+
+    def search_arg(self, e: exprs.Expr, val_type: ts.ColumnType, operator: exprs.ComparisonOperator) -> bool:
+        """
+        Returns True if the comparison `e <operator> <literal of val_type>` can be evaluated against the index value
+        column.
+
+        This is the case if e is the indexed expression and it didn't fail for any row, or if e is a JSON path, the
+        indexed expression is a cast of that path to val_type, and the comparison is an equality: a row that fails the
+        cast (and has a NULL index value) can't compare equal to the literal in Python either.
+        """
+        if val_type.type_enum != self.value_type.type_enum:
+            return False
+        if self.indexed_expr.equals(e):
+            return not self.has_value_errors
+        return (
+            operator == exprs.ComparisonOperator.EQ
+            and isinstance(e, exprs.JsonPath)
+            and isinstance(self.indexed_expr, exprs.TypeCast)
+            and self.indexed_expr.components[0].equals(e)
+        )
+
+    def create_index(self, index_name: str, index_value_col: catalog.Column) -> None:
+        """Create the index on the index value column"""
+        idx = sql.Index(index_name, index_value_col.sa_col, postgresql_using='btree')
+        idx.create(bind=Env.get().conn)
+
+    def drop_index(self, index_name: str, index_value_col: catalog.Column) -> None:
+        """Drop the index on the index value column"""
+        sql.Index(index_name, index_value_col.sa_col).drop(bind=Env.get().conn, checkfirst=True)
+
+    @classmethod
+    def display_name(cls) -> str:
+        return 'btree'
+
+    def as_dict(self) -> dict:
+        return {
+            'indexed_expr': self._indexed_expr_dict,
+            'value_type': self.value_type.as_dict(),
+            'has_value_errors': self.has_value_errors,
+        }
+
+    @classmethod
+    def from_dict(cls, c: catalog.Column, d: dict) -> ExprIndex:
+        return cls(
+            c,
+            indexed_expr_dict=d['indexed_expr'],
+            value_type=ts.ColumnType.from_dict(d['value_type']),
+            has_value_errors=d.get('has_value_errors', False),
+        )
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Optional
+
+import sqlalchemy as sql
+
+import pixeltable.exceptions as excs
+from pixeltable import catalog, exprs
+from pixeltable.env import Env
+
+from .base import IndexBase
+
+
+class JsonIndex(IndexBase):
+    """
+    Interface to GIN indices (with the jsonb_path_ops operator class) on JSON columns in Postgres.
+
+    jsonb_path_ops only supports the containment operator (@>), which by itself doesn't match the semantics of a
+    JSON path comparison (eg, {"a": [1, 2]} @> {"a": [2]}). search_clause() therefore returns a containment test,
+    which can be answered by the index, together with an exact comparison of the path value, which Postgres evaluates
+    as a recheck on the candidate rows.
+    """
+
+    value_expr: exprs.ColumnRef
+
+    def __init__(self, c: catalog.Column):
+        if not c.col_type.is_json_type():
+            raise excs.Error(f'Index on column {c.name}: GIN index requires a JSON column, got {c.col_type}')
+        self.value_expr = exprs.ColumnRef(c)
+
+    def index_value_expr(self) -> exprs.Expr:
+        return self.value_expr
+
+    def records_value_errors(self) -> bool:
+        return False
+
+    def index_sa_type(self) -> sql.types.TypeEngine:
+        return self.value_expr.col_type.to_sa_type()
+
+    @classmethod
+    def search_path(cls, e: exprs.JsonPath) -> Optional[list[str | int]]:
+        """
+        Returns the path elements of e if they can be expressed as a containment test (ie, e consists of keys and
+        non-negative list indices), otherwise None.
+        """
+        if len(e.path_elements) == 0:
+            return None
+        path: list[str | int] = []
+        for el in e.path_elements:
+            if (isinstance(el, str) and el != '*') or (isinstance(el, int) and el >= 0):
+                path.append(el)
+            else:
+                return None
+        return path
+
+    @classmethod
+    def search_clause(cls, index_value_col: catalog.Column, path: list[str | int], val: Any) -> sql.ColumnElement[bool]:
+        """Returns a clause for `<path> == val` against the index value column that can make use of the index"""
+        assert isinstance(val, (str, int, float)) and not isinstance(val, bool)
+        containment_doc: Any = val
+        for el in reversed(path):
+            containment_doc = {el: containment_doc} if isinstance(el, str) else [containment_doc]
+        sa_col = index_value_col.sa_col
+        jsonb_type = index_value_col.sa_col_type
+        path_val = sa_col.op('#>')(sql.literal([str(el) for el in path], type_=sql.ARRAY(sql.String)))
+        return sql.and_(
+            sa_col.op('@>')(sql.cast(sql.literal(json.dumps(containment_doc)), jsonb_type)),
+            path_val == sql.cast(sql.literal(json.dumps(val)), jsonb_type),
+        )
+
+    def create_index(self, index_name: str, index_value_col: catalog.Column) -> None:
+        """Create the index on the index value column"""
+        idx = sql.Index(
+            index_name,
+            index_value_col.sa_col,
+            postgresql_using='gin',
+            postgresql_ops={index_value_col.sa_col.name: 'jsonb_path_ops'},
+        )
+        conn = Env.get().conn
+        idx.create(bind=conn)
+
+    def drop_index(self, index_name: str, index_value_col: catalog.Column) -> None:
+        """Drop the index on the index value column"""
+        conn = Env.get().conn
+        sql.Index(index_name, index_value_col.sa_col).drop(bind=conn, checkfirst=True)
+
+    @classmethod
+    def display_name(cls) -> str:
+        return 'gin'
+
+    def as_dict(self) -> dict:
+        return {}
+
+    @classmethod
+    def from_dict(cls, c: catalog.Column, d: dict) -> JsonIndex:
+        return cls(c)
@@ -1,10 +1,14 @@
 import logging
+import math
+from collections import deque
 from fractions import Fraction
 from pathlib import Path
-from typing import Any, ClassVar, Optional
+from typing import Any, ClassVar, Iterator, Optional
 
 import av
+import numpy as np
 
+import pixeltable.utils.av as av_utils
 from pixeltable import exceptions as excs, type_system as ts
 from pixeltable.utils.local_store import TempStore
 
@@ -24,6 +28,12 @@ class AudioSplitter(ComponentIterator):
         chunk_duration_sec: Audio chunk duration in seconds
         overlap_sec: Overlap between consecutive chunks in seconds.
         min_chunk_duration_sec: Drop the last chunk if it is smaller than min_chunk_duration_sec
+        stream_copy: If True, chunks are written by copying the packets of the input stream, without re-encoding.
+            Chunk boundaries are then aligned to packet boundaries: a chunk contains the packets that start
+            within its time range; if no packet starts within the range of a chunk, `audio_chunk` is None.
+        pcm_sample_rate: If specified, `audio_chunk` is returned as a mono float32 array of PCM samples at this
+            sample rate (eg, 16000 for Whisper) instead of an audio file. The chunks are produced in a single
+            sequential decoding pass over the audio file, without creating files.
     """
 
     # Input parameters
@@ -41,6 +51,23 @@ class AudioSplitter(ComponentIterator):
     # next chunk to extract
     next_pos: int
 
+    stream_copy: bool
+    pcm_sample_rate: Optional[int]
+
+    # PCM decoding state: the decoded samples, starting at sample index pcm_start (relative to the start of the audio)
+    pcm_chunks_in_samples: list[tuple[int, int]]
+    pcm_frames: Optional[Iterator[av.AudioFrame]]
+    pcm_resampler: Optional[av.AudioResampler]
+    pcm_buffer: deque[np.ndarray]
+    pcm_start: int
+    pcm_end: int
+    pcm_eof: bool
+    pcm_is_positioned: bool  # False until the first frame after a (re)start has been decoded
+    pcm_decoded_pos: int  # the next chunk we can produce without seeking
+
+    # decoding after a seek starts this much earlier, so that the decoder and resampler have settled at the chunk start
+    PCM_SEEK_PREROLL_SEC: ClassVar[float] = 0.5
+
     __codec_map: ClassVar[dict[str, str]] = {
         'mp3': 'mp3',  # MP3 decoder -> mp3/libmp3lame encoder
         'mp3float': 'mp3',  # MP3float decoder -> mp3 encoder
@@ -53,15 +80,25 @@ class AudioSplitter(ComponentIterator):
     }
 
     def __init__(
-        self, audio: str, chunk_duration_sec: float, *, overlap_sec: float = 0.0, min_chunk_duration_sec: float = 0.0
+        self,
+        audio: str,
+        chunk_duration_sec: float,
+        *,
+        overlap_sec: float = 0.0,
+        min_chunk_duration_sec: float = 0.0,
+        stream_copy: bool = False,
+        pcm_sample_rate: Optional[int] = None,
     ):
         assert chunk_duration_sec > 0.0
         assert chunk_duration_sec >= min_chunk_duration_sec
         assert overlap_sec < chunk_duration_sec
+        assert not (stream_copy and pcm_sample_rate is not None)
         audio_path = Path(audio)
         assert audio_path.exists() and audio_path.is_file()
         self.audio_path = audio_path
         self.next_pos = 0
+        self.stream_copy = bool(stream_copy)
+        self.pcm_sample_rate = pcm_sample_rate
         self.container = av.open(str(audio_path))
         if len(self.container.streams.audio) == 0:
             # No audio stream
@@ -76,12 +113,23 @@ class AudioSplitter(ComponentIterator):
         total_audio_duration_pts = self.container.streams.audio[0].duration or 0
         total_audio_duration_sec = float(total_audio_duration_pts * self.audio_time_base)
 
+        chunks_in_sec = self.build_chunks(
+            audio_start_time_sec, total_audio_duration_sec, chunk_duration_sec, overlap_sec, min_chunk_duration_sec
+        )
         self.chunks_to_extract_in_pts = [
-            (round(start / self.audio_time_base), round(end / self.audio_time_base))
-            for (start, end) in self.build_chunks(
-                audio_start_time_sec, total_audio_duration_sec, chunk_duration_sec, overlap_sec, min_chunk_duration_sec
-            )
+            (round(start / self.audio_time_base), round(end / self.audio_time_base)) for (start, end) in chunks_in_sec
         ]
+        if self.pcm_sample_rate is not None:
+            self.audio_start_time_sec = audio_start_time_sec
+            self.pcm_chunks_in_samples = [
+                (
+                    round((start - audio_start_time_sec) * self.pcm_sample_rate),
+                    round((end - audio_start_time_sec) * self.pcm_sample_rate),
+                )
+                for (start, end) in chunks_in_sec
+            ]
+            self.pcm_buffer = deque()
+            self.__reset_pcm_decoder(seek_pts=None)
         _logger.debug(
             f'AudioIterator: path={self.audio_path} total_audio_duration_pts={total_audio_duration_pts} '
             f'chunks_to_extract_in_pts={self.chunks_to_extract_in_pts}'
@@ -121,6 +169,8 @@ class AudioSplitter(ComponentIterator):
             'chunk_duration_sec': ts.FloatType(nullable=True),
             'overlap_sec': ts.FloatType(nullable=True),
             'min_chunk_duration_sec': ts.FloatType(nullable=True),
+            'stream_copy': ts.BoolType(nullable=True),
+            'pcm_sample_rate': ts.IntType(nullable=True),
         }
 
     @classmethod
@@ -138,15 +188,26 @@ class AudioSplitter(ComponentIterator):
             raise excs.Error('chunk_duration_sec must be at least min_chunk_duration_sec')
         if overlap_sec >= chunk_duration_sec:
             raise excs.Error('overlap_sec must be less than chunk_duration_sec')
-        return {
-            'start_time_sec': ts.FloatType(),
-            'end_time_sec': ts.FloatType(),
-            'audio_chunk': ts.AudioType(nullable=True),
-        }, []
+        pcm_sample_rate = params.get('pcm_sample_rate')
+        if pcm_sample_rate is not None:
+            if params.get('stream_copy'):
+                raise excs.Error('stream_copy and pcm_sample_rate cannot be specified together')
+            if pcm_sample_rate <= 0:
+                raise excs.Error('pcm_sample_rate must be a positive number')
+        audio_chunk_type: ts.ColumnType = (
+            ts.AudioType(nullable=True)
+            if pcm_sample_rate is None
+            else ts.ArrayType((None,), dtype=ts.FloatType(), nullable=True)
+        )
+        return {'start_time_sec': ts.FloatType(), 'end_time_sec': ts.FloatType(), 'audio_chunk': audio_chunk_type}, []
 
     def __next__(self) -> dict[str, Any]:
         if self.next_pos >= len(self.chunks_to_extract_in_pts):
             raise StopIteration
+        if self.stream_copy:
+            return self._next_stream_copy()
+        if self.pcm_sample_rate is not None:
+            return self._next_pcm()
         target_chunk_start, target_chunk_end = self.chunks_to_extract_in_pts[self.next_pos]
         chunk_start_pts = 0
         chunk_end_pts = 0
@@ -209,8 +270,181 @@ class AudioSplitter(ComponentIterator):
             self.next_pos += 1
             raise StopIteration
 
+    def _next_stream_copy(self) -> dict[str, Any]:
+        target_chunk_start, target_chunk_end = self.chunks_to_extract_in_pts[self.next_pos]
+        input_stream = self.container.streams.audio[0]
+        chunk_file = str(TempStore.create_path(extension=self.audio_path.suffix))
+        output_container: Optional[av.container.OutputContainer] = None
+        output_stream: Optional[av.stream.Stream] = None
+        chunk_start_pts: Optional[int] = None
+        chunk_end_pts = 0
+        try:
+            self.container.seek(target_chunk_start, backward=True, stream=input_stream)
+        except av.error.FFmpegError:
+            # seeking can fail close to the end of the stream (eg, for flac); demux from the start instead
+            self.container.seek(0, backward=True, stream=input_stream)
+        for packet in self.container.demux(input_stream):
+            if packet.pts is None or packet.size == 0:
+                # flush packet
+                continue
+            if packet.pts < target_chunk_start:
+                continue
+            if packet.pts >= target_chunk_end:
+                break
+            if output_container is None:
+                output_container = av.open(chunk_file, mode='w')
+                output_stream = av_utils.add_stream_from_template(output_container, input_stream)
+                chunk_start_pts = packet.pts
+            assert chunk_start_pts is not None
+            chunk_end_pts = packet.pts + (packet.duration or 0)
+            # timestamps are rebased so that the chunk starts at 0
+            out_packet = av.Packet(bytes(packet))
+            out_packet.pts = packet.pts - chunk_start_pts
+            out_packet.dts = packet.dts - chunk_start_pts if packet.dts is not None else None
+            out_packet.duration = packet.duration
+            out_packet.time_base = packet.time_base
+            out_packet.stream = output_stream
+            output_container.mux(out_packet)
+
+        if output_container is None:
+            # no packet starts in the range of this chunk (eg, because the packets are longer than the chunks)
+            if self.next_pos == len(self.chunks_to_extract_in_pts) - 1:
+                self.next_pos += 1
+                raise StopIteration
+            # we still return the chunk, so that the position of a chunk doesn't depend on the preceding ones (which
+            # is what set_pos() relies on)
+            result: dict[str, Any] = {
+                'start_time_sec': round(float(target_chunk_start * self.audio_time_base), 4),
+                'end_time_sec': round(float(target_chunk_end * self.audio_time_base), 4),
+                'audio_chunk': None,
+            }
+            self.next_pos += 1
+            return result
+        output_container.close()
+        assert chunk_start_pts is not None
+        result = {
+            'start_time_sec': round(float(chunk_start_pts * self.audio_time_base), 4),
+            'end_time_sec': round(float(chunk_end_pts * self.audio_time_base), 4),
+            'audio_chunk': chunk_file,
+        }
+        _logger.debug('audio chunk result: %s', result)
+        self.next_pos += 1
+        return result
+
+    def __reset_pcm_decoder(self, seek_pts: Optional[int]) -> None:
+        """Restart decoding, at the beginning of the audio or PCM_SEEK_PREROLL_SEC before seek_pts"""
+        if seek_pts is not None:
+            input_stream = self.container.streams.audio[0]
+            preroll_pts = round(self.PCM_SEEK_PREROLL_SEC / self.audio_time_base)
+            seek_pts = max(seek_pts - preroll_pts, input_stream.start_time or 0)
+            self.container.seek(seek_pts, backward=True, stream=input_stream)
+        self.pcm_frames = self.container.decode(audio=0)
+        self.pcm_resampler = av.AudioResampler(format='flt', layout='mono', rate=self.pcm_sample_rate)
+        self.pcm_buffer.clear()
+        self.pcm_start = self.pcm_end = 0
+        self.pcm_eof = False
+        self.pcm_is_positioned = False
+        self.pcm_decoded_pos = self.next_pos
+
+    def __decode_pcm(self) -> None:
+        """Decode and resample the next audio frame and append the samples to the buffer"""
+        assert self.pcm_frames is not None and self.pcm_resampler is not None
+        try:
+            frame: Optional[av.AudioFrame] = next(self.pcm_frames)
+        except EOFError as e:
+            raise excs.Error(f"Failed to read audio file '{self.audio_path}': {e}") from e
+        except StopIteration:
+            frame = None
+            self.pcm_eof = True
+        if frame is not None and not self.pcm_is_positioned:
+            # the first frame after a (re)start determines the position of the decoded samples
+            frame = self.__position_pcm(frame)
+            if frame is None:
+                return
+        # passing None flushes the resampler
+        for resampled in self.pcm_resampler.resample(frame):
+            samples = resampled.to_ndarray().reshape(-1)
+            self.pcm_buffer.append(samples)
+            self.pcm_end += len(samples)
+
+    def __position_pcm(self, frame: av.AudioFrame) -> Optional[av.AudioFrame]:
+        """
+        Sets pcm_start from the first frame after a (re)start. The frame is trimmed to start at an input sample that
+        coincides with an output sample, so that the resampler produces the same samples as when decoding from the
+        beginning. Returns None if the entire frame precedes that sample.
+        """
+        assert self.pcm_sample_rate is not None
+        if frame.pts is None:
+            self.pcm_is_positioned = True
+            return frame
+        frame_start_sec = float(frame.pts * frame.time_base) - self.audio_start_time_sec
+        frame_start = max(0, round(frame_start_sec * frame.sample_rate))  # in input samples
+        # every in_period input samples correspond to exactly out_period output samples
+        gcd = math.gcd(frame.sample_rate, self.pcm_sample_rate)
+        in_period, out_period = frame.sample_rate // gcd, self.pcm_sample_rate // gcd
+        num_skipped = -frame_start % in_period
+        if num_skipped >= frame.samples:
+            return None
+        if num_skipped > 0:
+            data: Any = frame.to_ndarray()
+            # packed formats interleave the channels in a single plane
+            num_channels = 1 if frame.format.is_planar else len(frame.layout.channels)
+            trimmed = av.AudioFrame.from_ndarray(
+                np.ascontiguousarray(data[:, num_skipped * num_channels :]),
+                format=frame.format.name,
+                layout=frame.layout.name,
+            )
+            trimmed.sample_rate = frame.sample_rate
+            trimmed.time_base = Fraction(1, frame.sample_rate)
+            trimmed.pts = round(frame.pts * frame.time_base * frame.sample_rate) + num_skipped
+            frame = trimmed
+        self.pcm_start = self.pcm_end = (frame_start + num_skipped) // in_period * out_period
+        self.pcm_is_positioned = True
+        return frame
+
+    def _next_pcm(self) -> dict[str, Any]:
+        assert self.pcm_sample_rate is not None
+        if self.next_pos != self.pcm_decoded_pos:
+            # random access: start decoding at the chunk start
+            self.__reset_pcm_decoder(seek_pts=self.chunks_to_extract_in_pts[self.next_pos][0])
+        start_sample, end_sample = self.pcm_chunks_in_samples[self.next_pos]
+        while self.pcm_end < end_sample and not self.pcm_eof:
+            self.__decode_pcm()
+
+        samples = np.concatenate(self.pcm_buffer) if len(self.pcm_buffer) > 0 else np.empty(0, dtype=np.float32)
+        chunk_start = max(start_sample, self.pcm_start)
+        chunk_end = min(end_sample, self.pcm_end)
+        if chunk_end <= chunk_start:
+            # there's no audio in the range of the last chunk
+            assert self.next_pos == len(self.chunks_to_extract_in_pts) - 1
+            self.next_pos += 1
+            raise StopIteration
+        chunk = samples[chunk_start - self.pcm_start : chunk_end - self.pcm_start].copy()
+
+        # retain the samples needed for the next chunk (which overlap with this one, if overlap_sec > 0)
+        self.pcm_buffer.clear()
+        if self.next_pos + 1 < len(self.pcm_chunks_in_samples):
+            next_start_sample = self.pcm_chunks_in_samples[self.next_pos + 1][0]
+            if next_start_sample < self.pcm_end:
+                retain_from = max(next_start_sample, self.pcm_start)
+                self.pcm_buffer.append(samples[retain_from - self.pcm_start :])
+                self.pcm_start = retain_from
+            else:
+                self.pcm_start = self.pcm_end
+
+        result = {
+            'start_time_sec': round(self.audio_start_time_sec + chunk_start / self.pcm_sample_rate, 4),
+            'end_time_sec': round(self.audio_start_time_sec + chunk_end / self.pcm_sample_rate, 4),
+            'audio_chunk': chunk,
+        }
+        self.next_pos += 1
+        self.pcm_decoded_pos = self.next_pos
+        return result
+
     def close(self) -> None:
         self.container.close()
 
     def set_pos(self, pos: int) -> None:
-        pass
+        # the chunk boundaries are computed upfront and __next__() seeks to the start of the chunk, so there's no
+        # need to decode the preceding chunks
+        self.next_pos = pos
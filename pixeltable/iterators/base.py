@@ -48,6 +48,22 @@ class ComponentIterator(ABC):
         """Set the iterator position to pos"""
         raise NotImplementedError
 
+    @classmethod
+    def has_pos_state(cls) -> bool:
+        """True if the iterator returns a pos_state() for its components, which its views then store"""
+        return False
+
+    def pos_state(self) -> Any:
+        """
+        Returns JSON-serializable state that lets restore_pos() go directly to the component most recently returned
+        by next(), or None.
+        """
+        return None
+
+    def restore_pos(self, pos: int, pos_state: Any) -> None:
+        """Set the iterator position to pos, given the pos_state() that was recorded for the component at pos"""
+        self.set_pos(pos)
+
     @classmethod
     def create(cls, **kwargs: Any) -> tuple[type[ComponentIterator], dict[str, Any]]:
         return cls, kwargs
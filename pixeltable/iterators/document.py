@@ -1,14 +1,24 @@
+from __future__ import annotations
+
+import atexit
 import dataclasses
 import enum
+import hashlib
+import itertools
 import logging
-from typing import Any, ClassVar, Iterable, Iterator, Optional
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent import futures
+from typing import Any, ClassVar, Iterable, Iterator, NamedTuple, Optional
 
 import ftfy
 
 from pixeltable.env import Env
 from pixeltable.exceptions import Error
-from pixeltable.type_system import ColumnType, DocumentType, IntType, JsonType, StringType
-from pixeltable.utils.documents import get_document_handle
+from pixeltable.type_system import BoolType, ColumnType, DocumentType, IntType, JsonType, StringType
+from pixeltable.utils.documents import DocumentHandle, get_document_handle
 
 from .base import ComponentIterator
 
@@ -54,6 +64,103 @@ class DocumentSection:
 
     text: Optional[str]
     metadata: Optional[DocumentSectionMetadata]
+    # position of the section produced by the format-specific splitting that this is (a chunk of); set by the
+    # splitting pipeline
+    section_idx: Optional[int] = None
+
+
+class _ChunkLocation(NamedTuple):
+    """
+    The location of a chunk: every chunk is a substring of the text of a section produced by the format-specific
+    splitting (ie, before sentence/token_limit/char_limit splitting).
+    """
+
+    section_idx: int
+    start: int  # offsets of the chunk within the section text
+    end: int
+    # the format-specific splitting of the section can start at this page (PDF; 0 otherwise) ...
+    first_page: int
+    # ... whose first section has this idx
+    first_section_idx: int
+
+
+@dataclasses.dataclass
+class _ChunkIndex:
+    """The locations of the chunks of a document that are known to a DocumentSplitter"""
+
+    # the location of the chunk at each position produced by the splitting pipeline (None if the chunk couldn't be
+    # located) or passed to restore_pos()
+    chunks: dict[int, Optional[_ChunkLocation]] = dataclasses.field(default_factory=dict)
+    # the PDF page of each section produced by the splitting pipeline so far (None for other formats)
+    section_pages: list[Optional[int]] = dataclasses.field(default_factory=list)
+    num_chunks: Optional[int] = None  # set once the splitting pipeline ran to completion
+
+
+@dataclasses.dataclass
+class _ParsedDocument:
+    """The title and the sections produced by the format-specific splitting of a document"""
+
+    title: str
+    sections: list[DocumentSection]
+    size: int  # total length of the section texts
+
+
+class _ParsedDocumentCache:
+    """
+    Per-process LRU cache of parsed documents, keyed by a hash of the document content and the parameters of the
+    format-specific splitting, and bounded by the total size of the section texts.
+    """
+
+    __instance: Optional[_ParsedDocumentCache] = None
+
+    MAX_SIZE: ClassVar[int] = 256 * 2**20
+
+    docs: OrderedDict[tuple, _ParsedDocument]
+    size: int
+    lock: threading.Lock
+
+    @classmethod
+    def get(cls) -> _ParsedDocumentCache:
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    def __init__(self) -> None:
+        self.docs = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, key: tuple) -> Optional[_ParsedDocument]:
+        with self.lock:
+            doc = self.docs.get(key)
+            if doc is not None:
+                self.docs.move_to_end(key)
+            return doc
+
+    def add(self, key: tuple, doc: _ParsedDocument) -> None:
+        if doc.size > self.MAX_SIZE:
+            return
+        with self.lock:
+            if key in self.docs:
+                return
+            self.docs[key] = doc
+            self.size += doc.size
+            while self.size > self.MAX_SIZE:
+                _, evicted = self.docs.popitem(last=False)
+                self.size -= evicted.size
+
+    def clear(self) -> None:
+        with self.lock:
+            self.docs.clear()
+            self.size = 0
+
+
+def _extract_pdf_blocks(path: str, start: int, stop: int) -> list[list[tuple]]:
+    """Returns the text blocks of pages [start, stop); runs in a worker process"""
+    import fitz  # type: ignore[import-untyped]
+
+    with fitz.open(path) as doc:
+        return [doc[page_number].get_text('blocks') for page_number in range(start, stop)]
 
 
 def _parse_separators(separators: str) -> list[Separator]:
@@ -104,8 +211,36 @@ class DocumentSplitter(ComponentIterator):
         metadata: additional metadata fields to include in the output. Options are:
              `'title'`, `'heading'` (HTML and Markdown), `'sourceline'` (HTML), `'page'` (PDF), `'bounding_box'`
              (PDF). The input may be a comma-separated string, e.g., `'title,heading,sourceline'`.
+        store_text: If False, the `text` column of the view isn't stored; when it's queried, the text is reconstructed
+             from the document, using the location of each chunk that the view stores.
     """
 
+    # sentence splitting: sections are passed to spaCy's nlp.pipe() in batches of SPACY_BATCH_SIZE, using
+    # SPACY_N_PROCESS processes
+    SPACY_BATCH_SIZE: ClassVar[int] = 64
+    SPACY_N_PROCESS: ClassVar[int] = 1
+
+    # text extraction of PDFs with at least PDF_PARALLEL_MIN_PAGES pages is done in PDF_MAX_WORKERS worker processes
+    # (PyMuPDF doesn't support multi-threading), in tasks of PDF_PAGES_PER_TASK pages
+    PDF_PARALLEL_MIN_PAGES: ClassVar[int] = 64
+    PDF_PAGES_PER_TASK: ClassVar[int] = 16
+    PDF_MAX_WORKERS: ClassVar[int] = min(4, os.cpu_count() or 1)
+    # shared by all iterators in the process; created on first use and shut down at exit
+    _pdf_executor: ClassVar[Optional[futures.ProcessPoolExecutor]] = None
+    _pdf_executor_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    _doc_path: str
+    _doc_handle: Optional[DocumentHandle]  # None if the parsed document came from the cache
+    _parsed_doc_key: tuple
+    _parsed_doc: Optional[_ParsedDocument]
+    _index: _ChunkIndex
+    _next_pos: int  # the position of the chunk returned by the next call to __next__()
+    _pipeline_pos: int  # the position of the chunk returned by the next call to next(self._sections)
+    # the sections produced by the format-specific splitting that haven't been fully chunked yet, with their idxs
+    _pending_sections: deque[tuple[int, DocumentSection]]
+    _section_offset: int  # start offset of the most recently located chunk within _pending_sections[0]
+    _jump_section: Optional[tuple[int, DocumentSection]]  # the section most recently reconstructed by set_pos()
+
     METADATA_COLUMN_TYPES: ClassVar[dict[ChunkMetadata, ColumnType]] = {
         ChunkMetadata.TITLE: StringType(nullable=True),
         ChunkMetadata.HEADING: JsonType(nullable=True),
@@ -125,51 +260,106 @@ class DocumentSplitter(ComponentIterator):
         html_skip_tags: Optional[list[str]] = None,
         tiktoken_encoding: Optional[str] = 'cl100k_base',
         tiktoken_target_model: Optional[str] = None,
+        store_text: bool = True,
     ):
         if html_skip_tags is None:
             html_skip_tags = ['nav']
-        self._doc_handle = get_document_handle(document)
-        assert self._doc_handle is not None
         # calling the output_schema method to validate the input arguments
         self.output_schema(separators=separators, metadata=metadata, limit=limit, overlap=overlap)
         self._separators = _parse_separators(separators)
         self._metadata_fields = _parse_metadata(metadata)
-        if self._doc_handle.bs_doc is not None:
-            title = self._doc_handle.bs_doc.title
-            if title is None:
-                self._doc_title = ''
-            else:
-                self._doc_title = ftfy.fix_text(title.get_text().strip())
+        self._skip_tags = html_skip_tags
+        self._doc_path = document
+
+        # the format-specific splitting only depends on these separators
+        doc_separators = {Separator.HEADING, Separator.PARAGRAPH, Separator.SENTENCE, Separator.PAGE}
+        self._parsed_doc_key = (
+            self.__content_hash(document),
+            tuple(sorted(s.name for s in self._separators if s in doc_separators)),
+            tuple(self._skip_tags),
+        )
+        self._parsed_doc = _ParsedDocumentCache.get().lookup(self._parsed_doc_key)
+        if self._parsed_doc is not None:
+            self._doc_handle = None
+            self._doc_title = self._parsed_doc.title
         else:
-            self._doc_title = ''
+            self._doc_handle = get_document_handle(document)
+            assert self._doc_handle is not None
+            if self._doc_handle.bs_doc is not None:
+                title = self._doc_handle.bs_doc.title
+                if title is None:
+                    self._doc_title = ''
+                else:
+                    self._doc_title = ftfy.fix_text(title.get_text().strip())
+            else:
+                self._doc_title = ''
         self._limit = 0 if limit is None else limit
-        self._skip_tags = html_skip_tags
         self._overlap = 0 if overlap is None else overlap
         self._tiktoken_encoding = tiktoken_encoding
         self._tiktoken_target_model = tiktoken_target_model
 
-        # set up processing pipeline
+        self._index = _ChunkIndex()
+        self._next_pos = 0
+        self._jump_section = None
+        self._reset_pipeline()
+
+    @classmethod
+    def __content_hash(cls, path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(2**20):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _reset_pipeline(self) -> None:
+        self._pipeline_pos = 0
+        self._pending_sections = deque()
+        self._section_offset = 0
+        self._sections = self._split_sections(self._track_sections(self._doc_sections()))
+
+    def _doc_sections(self, first_page: int = 0) -> Iterator[DocumentSection]:
+        """Returns the sections produced by the format-specific splitting"""
+        if self._parsed_doc is not None:
+            return iter(self._parsed_doc.sections)
+        assert self._doc_handle is not None
         if self._doc_handle.format == DocumentType.DocumentFormat.HTML:
             assert self._doc_handle.bs_doc is not None
-            self._sections = self._html_sections()
+            return self._html_sections()
         elif self._doc_handle.format == DocumentType.DocumentFormat.MD:
             assert self._doc_handle.md_ast is not None
-            self._sections = self._markdown_sections()
+            return self._markdown_sections()
         elif self._doc_handle.format == DocumentType.DocumentFormat.PDF:
             assert self._doc_handle.pdf_doc is not None
-            self._sections = self._pdf_sections()
+            return self._pdf_sections(first_page)
         elif self._doc_handle.format == DocumentType.DocumentFormat.TXT:
             assert self._doc_handle.txt_doc is not None
-            self._sections = self._txt_sections()
+            return self._txt_sections()
         else:
             raise AssertionError(f'Unsupported document format: {self._doc_handle.format}')
 
+    def _split_sections(self, sections: Iterator[DocumentSection]) -> Iterator[DocumentSection]:
         if Separator.SENTENCE in self._separators:
-            self._sections = self._sentence_sections(self._sections)
+            sections = self._sentence_sections(sections)
         if Separator.TOKEN_LIMIT in self._separators:
-            self._sections = self._token_chunks(self._sections)
+            sections = self._token_chunks(sections)
         if Separator.CHAR_LIMIT in self._separators:
-            self._sections = self._char_chunks(self._sections)
+            sections = self._char_chunks(sections)
+        return sections
+
+    def _track_sections(self, sections: Iterator[DocumentSection]) -> Iterator[DocumentSection]:
+        """Records the sections that the chunks produced next are part of, and adds the parsed document to the cache"""
+        parsed_sections: Optional[list[DocumentSection]] = [] if self._parsed_doc is None else None
+        for idx, section in enumerate(sections):
+            if idx == len(self._index.section_pages):
+                self._index.section_pages.append(section.metadata.page if section.metadata is not None else None)
+            self._pending_sections.append((idx, section))
+            if parsed_sections is not None:
+                parsed_sections.append(section)
+            yield DocumentSection(text=section.text, metadata=section.metadata, section_idx=idx)
+        if parsed_sections is not None:
+            size = sum(len(section.text) for section in parsed_sections if section.text is not None)
+            self._parsed_doc = _ParsedDocument(title=self._doc_title, sections=parsed_sections, size=size)
+            _ParsedDocumentCache.get().add(self._parsed_doc_key, self._parsed_doc)
 
     @classmethod
     def input_schema(cls) -> dict[str, ColumnType]:
@@ -182,6 +372,7 @@ class DocumentSplitter(ComponentIterator):
             'skip_tags': StringType(nullable=True),
             'tiktoken_encoding': StringType(nullable=True),
             'tiktoken_target_model': StringType(nullable=True),
+            'store_text': BoolType(nullable=True),
         }
 
     @classmethod
@@ -211,26 +402,90 @@ class DocumentSplitter(ComponentIterator):
             if kwargs.get('limit') is None:
                 raise Error('limit is required with "token_limit"/"char_limit" separators')
 
-        return schema, []
+        return schema, ['text'] if kwargs.get('store_text') is False else []
 
     def __next__(self) -> dict[str, Any]:
-        while True:
-            section = next(self._sections)
-            if section.text is None:
-                continue
-            result: dict[str, Any] = {'text': section.text}
-            for md_field in self._metadata_fields:
-                if md_field == ChunkMetadata.TITLE:
-                    result[md_field.name.lower()] = self._doc_title
-                elif md_field == ChunkMetadata.HEADING:
-                    result[md_field.name.lower()] = section.metadata.heading
-                elif md_field == ChunkMetadata.SOURCELINE:
-                    result[md_field.name.lower()] = section.metadata.sourceline
-                elif md_field == ChunkMetadata.PAGE:
-                    result[md_field.name.lower()] = section.metadata.page
-                elif md_field == ChunkMetadata.BOUNDING_BOX:
-                    result[md_field.name.lower()] = section.metadata.bounding_box
-            return result
+        if self._index.num_chunks is not None and self._next_pos >= self._index.num_chunks:
+            raise StopIteration
+        if self._next_pos != self._pipeline_pos and self._index.chunks.get(self._next_pos) is not None:
+            # we're not positioned at this chunk: reconstruct it from its section
+            section = self._indexed_chunk(self._next_pos)
+        else:
+            if self._pipeline_pos > self._next_pos:
+                self._reset_pipeline()
+            while self._pipeline_pos < self._next_pos:
+                self._next_pipeline_chunk()
+            section = self._next_pipeline_chunk()
+        self._next_pos += 1
+
+        result: dict[str, Any] = {'text': section.text}
+        for md_field in self._metadata_fields:
+            if md_field == ChunkMetadata.TITLE:
+                result[md_field.name.lower()] = self._doc_title
+            elif md_field == ChunkMetadata.HEADING:
+                result[md_field.name.lower()] = section.metadata.heading
+            elif md_field == ChunkMetadata.SOURCELINE:
+                result[md_field.name.lower()] = section.metadata.sourceline
+            elif md_field == ChunkMetadata.PAGE:
+                result[md_field.name.lower()] = section.metadata.page
+            elif md_field == ChunkMetadata.BOUNDING_BOX:
+                result[md_field.name.lower()] = section.metadata.bounding_box
+        return result
+
+    def _next_pipeline_chunk(self) -> DocumentSection:
+        """Returns the next chunk produced by the splitting pipeline and records its location"""
+        try:
+            chunk = next(self._sections)
+            while chunk.text is None:
+                chunk = next(self._sections)
+        except StopIteration:
+            self._index.num_chunks = self._pipeline_pos
+            raise
+
+        # sections that precede the one of the chunk are done
+        assert chunk.section_idx is not None
+        while len(self._pending_sections) > 0 and self._pending_sections[0][0] != chunk.section_idx:
+            self._pending_sections.popleft()
+            self._section_offset = 0
+        location: Optional[_ChunkLocation] = None
+        if len(self._pending_sections) > 0:
+            section_idx, section = self._pending_sections[0]
+            assert section.text is not None
+            # chunk offsets are non-decreasing within a section
+            start = section.text.find(chunk.text, self._section_offset)
+            if start >= 0:
+                self._section_offset = start
+                location = self._chunk_location(section_idx, start, start + len(chunk.text))
+        self._index.chunks[self._pipeline_pos] = location
+        self._pipeline_pos += 1
+        return chunk
+
+    def _chunk_location(self, section_idx: int, start: int, end: int) -> _ChunkLocation:
+        # PDF sections can be reconstructed starting from their page
+        pages = self._index.section_pages
+        first_page, first_idx = 0, 0
+        page = pages[section_idx]
+        if page is not None:
+            first_page, first_idx = page, section_idx
+            while first_idx > 0 and pages[first_idx - 1] == first_page:
+                first_idx -= 1
+        return _ChunkLocation(section_idx, start, end, first_page, first_idx)
+
+    def _indexed_chunk(self, pos: int) -> DocumentSection:
+        location = self._index.chunks[pos]
+        assert location is not None
+        section_idx = location.section_idx
+        if self._parsed_doc is not None:
+            self._jump_section = (section_idx, self._parsed_doc.sections[section_idx])
+        elif self._jump_section is None or self._jump_section[0] != section_idx:
+            sections = self._doc_sections(location.first_page)
+            section = next(itertools.islice(sections, section_idx - location.first_section_idx, None))
+            self._jump_section = (section_idx, section)
+        section = self._jump_section[1]
+        assert section.text is not None
+        return DocumentSection(
+            text=section.text[location.start : location.end], metadata=section.metadata, section_idx=section_idx
+        )
 
     def _html_sections(self) -> Iterator[DocumentSection]:
         """Create DocumentSections reflecting the html-specific separators"""
@@ -352,9 +607,9 @@ class DocumentSplitter(ComponentIterator):
             yield from process_element(el)
         yield from emit()
 
-    def _pdf_sections(self) -> Iterator[DocumentSection]:
-        """Create DocumentSections reflecting the pdf-specific separators"""
-        import fitz  # type: ignore[import-untyped]
+    def _pdf_sections(self, first_page: int = 0) -> Iterator[DocumentSection]:
+        """Create DocumentSections reflecting the pdf-specific separators, starting at first_page"""
+        import fitz
 
         doc: fitz.Document = self._doc_handle.pdf_doc
         assert doc is not None
@@ -374,8 +629,8 @@ class DocumentSplitter(ComponentIterator):
             accumulated_text.clear()
             return full_text
 
-        for page_number, page in enumerate(doc.pages()):
-            for block in page.get_text('blocks'):
+        for page_number, blocks in self._pdf_page_blocks(first_page):
+            for block in blocks:
                 # there is no concept of paragraph in pdf, block is the closest thing
                 # we can get (eg a paragraph in text may cut across pages)
                 # see pymupdf docs https://pymupdf.readthedocs.io/en/latest/app1.html
@@ -394,6 +649,29 @@ class DocumentSplitter(ComponentIterator):
         if accumulated_text and not emit_on_page:
             yield DocumentSection(text=_emit_text(), metadata=DocumentSectionMetadata())
 
+    def _pdf_page_blocks(self, first_page: int) -> Iterator[tuple[int, list[tuple]]]:
+        """Returns the text blocks of each page, starting at first_page"""
+        assert self._doc_handle is not None
+        doc = self._doc_handle.pdf_doc
+        num_pages = doc.page_count
+        if first_page > 0 or self.PDF_MAX_WORKERS <= 1 or num_pages < self.PDF_PARALLEL_MIN_PAGES:
+            for page_number, page in enumerate(doc.pages(first_page), start=first_page):
+                yield page_number, page.get_text('blocks')
+            return
+
+        executor = self._get_pdf_executor()
+        starts = range(0, num_pages, self.PDF_PAGES_PER_TASK)
+        tasks = [
+            executor.submit(_extract_pdf_blocks, self._doc_path, start, min(start + self.PDF_PAGES_PER_TASK, num_pages))
+            for start in starts
+        ]
+        try:
+            for start, task in zip(starts, tasks):
+                yield from enumerate(task.result(), start=start)
+        finally:
+            for task in tasks:
+                task.cancel()
+
     def _txt_sections(self) -> Iterator[DocumentSection]:
         """Create DocumentSections for text files.
 
@@ -405,11 +683,13 @@ class DocumentSplitter(ComponentIterator):
 
     def _sentence_sections(self, input_sections: Iterable[DocumentSection]) -> Iterator[DocumentSection]:
         """Split the input sections into sentences"""
-        for section in input_sections:
-            if section.text is not None:
-                doc = Env.get().spacy_nlp(section.text)
-                for sent in doc.sents:
-                    yield DocumentSection(text=sent.text, metadata=section.metadata)
+        nlp_input = ((section.text, section) for section in input_sections if section.text is not None)
+        docs = Env.get().spacy_nlp.pipe(
+            nlp_input, as_tuples=True, batch_size=self.SPACY_BATCH_SIZE, n_process=self.SPACY_N_PROCESS
+        )
+        for doc, section in docs:
+            for sent in doc.sents:
+                yield DocumentSection(text=sent.text, metadata=section.metadata, section_idx=section.section_idx)
 
     def _token_chunks(self, input: Iterable[DocumentSection]) -> Iterator[DocumentSection]:
         import tiktoken
@@ -440,7 +720,7 @@ class DocumentSplitter(ComponentIterator):
 
                 assert end_idx > start_idx
                 assert text
-                yield DocumentSection(text=text, metadata=section.metadata)
+                yield DocumentSection(text=text, metadata=section.metadata, section_idx=section.section_idx)
                 start_idx = max(start_idx + 1, end_idx - self._overlap)  # ensure we make progress
 
     def _char_chunks(self, input: Iterable[DocumentSection]) -> Iterator[DocumentSection]:
@@ -451,11 +731,36 @@ class DocumentSplitter(ComponentIterator):
             while start_idx < len(section.text):
                 end_idx = min(start_idx + self._limit, len(section.text))
                 text = section.text[start_idx:end_idx]
-                yield DocumentSection(text=text, metadata=section.metadata)
+                yield DocumentSection(text=text, metadata=section.metadata, section_idx=section.section_idx)
                 start_idx += self._limit - self._overlap
 
+    @classmethod
+    def _get_pdf_executor(cls) -> futures.ProcessPoolExecutor:
+        with cls._pdf_executor_lock:
+            if cls._pdf_executor is None:
+                # we don't fork: the parent process is likely to be multi-threaded
+                cls._pdf_executor = futures.ProcessPoolExecutor(
+                    max_workers=cls.PDF_MAX_WORKERS, mp_context=multiprocessing.get_context('spawn')
+                )
+                atexit.register(cls._pdf_executor.shutdown, wait=False, cancel_futures=True)
+            return cls._pdf_executor
+
     def close(self) -> None:
         pass
 
     def set_pos(self, pos: int) -> None:
-        pass
+        self._next_pos = pos
+
+    @classmethod
+    def has_pos_state(cls) -> bool:
+        return True
+
+    def pos_state(self) -> Optional[list[int]]:
+        # the location of the chunk lets restore_pos() reconstruct it from its section
+        location = self._index.chunks.get(self._next_pos - 1)
+        return list(location) if location is not None else None
+
+    def restore_pos(self, pos: int, pos_state: Optional[list[int]]) -> None:
+        if pos_state is not None:
+            self._index.chunks[pos] = _ChunkLocation(*pos_state)
+        self.set_pos(pos)
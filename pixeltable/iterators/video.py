@@ -1,10 +1,12 @@
+import bisect
+import collections
 import logging
 import math
 import shutil
 import subprocess
 from fractions import Fraction
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterator, Optional
 
 import av
 import pandas as pd
@@ -72,6 +74,20 @@ class FrameIterator(ComponentIterator):
     # frame index in the video. Otherwise, the corresponding video index is `frames_to_extract[next_pos]`.
     next_pos: int
 
+    # Video index of the most recently decoded frame, or None if the decoder position is unknown (after a seek)
+    last_decoded_idx: Optional[int]
+
+    # If False, sparse sampling never seeks to keyframes and decodes all frames sequentially instead; not part of the
+    # input schema (it exists for tests and benchmarks)
+    seek: bool
+
+    # Sorted (video index, pts) of the keyframes in the video; populated on demand from the packet stream
+    # (which doesn't require decoding) when sparse sampling makes seeking worthwhile
+    keyframes: Optional[list[tuple[int, int]]]
+
+    # Estimated cost of a seek (flushing the decoder and re-reading the container index), in units of decoded frames
+    SEEK_COST_FRAMES = 16
+
     def __init__(
         self,
         video: str,
@@ -79,6 +95,7 @@ class FrameIterator(ComponentIterator):
         fps: Optional[float] = None,
         num_frames: Optional[int] = None,
         all_frame_attrs: bool = False,
+        seek: bool = True,
     ):
         if fps is not None and num_frames is not None:
             raise excs.Error('At most one of `fps` or `num_frames` may be specified')
@@ -87,6 +104,8 @@ class FrameIterator(ComponentIterator):
         assert video_path.exists() and video_path.is_file()
         self.video_path = video_path
         self.container = av.open(str(video_path))
+        # let the codec decode slices and frames in parallel
+        self.container.streams.video[0].thread_type = 'AUTO'
         self.fps = fps
         self.num_frames = num_frames
         self.all_frame_attrs = all_frame_attrs
@@ -138,6 +157,9 @@ class FrameIterator(ComponentIterator):
 
         _logger.debug(f'FrameIterator: path={self.video_path} fps={self.fps} num_frames={self.num_frames}')
         self.next_pos = 0
+        self.last_decoded_idx = -1
+        self.seek = seek
+        self.keyframes = None
 
     @classmethod
     def input_schema(cls) -> dict[str, ts.ColumnType]:
@@ -171,10 +193,10 @@ class FrameIterator(ComponentIterator):
         # find it. There are two reasons why it might not be the immediate next frame in the video:
         # (1) `fps` or `num_frames` was specified as an iterator argument; or
         # (2) we just did a seek, and the desired frame is not a keyframe.
-        # TODO: In case (1) it will usually be fastest to step through the frames until we find the one we're
-        #     looking for. But in some cases it may be faster to do a seek; for example, when `fps` is very
-        #     low and there are multiple keyframes in between each frame we want to extract (imagine extracting
-        #     10 frames from an hourlong video).
+        # In case (1), if there are keyframes between the current decoder position and the desired frame (imagine
+        # extracting 10 frames from an hourlong video), it can be faster to seek to the closest preceding keyframe.
+        if self.frames_to_extract is not None:
+            self._maybe_seek(next_video_idx)
         while True:
             try:
                 frame = next(self.container.decode(video=0))
@@ -186,6 +208,7 @@ class FrameIterator(ComponentIterator):
             pts = frame.pts - self.video_start_time
             video_idx = round(pts * self.video_time_base * self.video_framerate)
             assert isinstance(video_idx, int)
+            self.last_decoded_idx = video_idx
             if video_idx < next_video_idx:
                 # We haven't reached the desired frame yet
                 continue
@@ -214,6 +237,46 @@ class FrameIterator(ComponentIterator):
             self.next_pos += 1
             return result
 
+    def _load_keyframes(self) -> list[tuple[int, int]]:
+        """Collect the keyframe positions by demuxing the video stream, without decoding it"""
+        if self.keyframes is not None:
+            return self.keyframes
+        keyframes: list[tuple[int, int]] = []
+        with av.open(str(self.video_path)) as container:
+            for packet in container.demux(video=0):
+                if packet.is_keyframe and packet.pts is not None:
+                    pts = packet.pts - self.video_start_time
+                    keyframes.append((round(pts * self.video_time_base * self.video_framerate), packet.pts))
+        keyframes.sort()
+        self.keyframes = keyframes
+        return keyframes
+
+    def _maybe_seek(self, video_idx: int) -> None:
+        """
+        Seek to the keyframe preceding video_idx, if decoding from there is estimated to be cheaper than decoding
+        sequentially from the current position.
+        """
+        if not self.seek or self.last_decoded_idx is None:
+            # seeking is disabled, or we just did a seek
+            return
+        sequential_cost = video_idx - self.last_decoded_idx - 1
+        if sequential_cost <= self.SEEK_COST_FRAMES:
+            # we can't save anything, regardless of the keyframe positions; don't bother loading them
+            return
+        keyframes = self._load_keyframes()
+        i = bisect.bisect_right(keyframes, (video_idx, math.inf)) - 1
+        if i < 0:
+            return
+        keyframe_idx, keyframe_pts = keyframes[i]
+        if keyframe_idx <= self.last_decoded_idx:
+            # there's no keyframe between the current position and the desired frame
+            return
+        seek_cost = video_idx - keyframe_idx + self.SEEK_COST_FRAMES
+        if seek_cost < sequential_cost:
+            _logger.debug(f'seeking to keyframe {keyframe_idx} (for frame {video_idx})')
+            self.container.seek(keyframe_pts, backward=True, stream=self.container.streams.video[0])
+            self.last_decoded_idx = None
+
     def close(self) -> None:
         self.container.close()
 
@@ -229,6 +292,59 @@ class FrameIterator(ComponentIterator):
         # then the iterator will step forward to the desired frame on the subsequent call to next().
         self.container.seek(seek_pos, backward=True, stream=self.container.streams.video[0])
         self.next_pos = pos
+        self.last_decoded_idx = None
+
+
+class _SegmentWriter:
+    """
+    Writes the packets of a single video segment to a new file via stream copy (no re-encoding).
+
+    The segment covers [start, end) in seconds of video time; as with `ffmpeg -ss <start> -c copy`, the file content
+    starts at the video keyframe preceding `start`. Timestamps are rebased so that the file starts at 0.
+    """
+
+    path: str
+    container: av.container.OutputContainer
+    output_streams: dict[int, av.stream.Stream]  # key: index of the input stream
+    start: float
+    end: float  # the end of the content, for a segment that is completed by the end of the video
+    time_offset: Optional[float]  # dts of the first video packet, in seconds
+    content_end: Optional[float]  # end of the last video packet, in seconds
+
+    def __init__(self, input_streams: list[av.stream.Stream], start: float, end: float):
+        self.path = str(TempStore.create_path(extension='.mp4'))
+        self.container = av.open(self.path, mode='w')
+        self.output_streams = {s.index: av_utils.add_stream_from_template(self.container, s) for s in input_streams}
+        self.start = start
+        self.end = end
+        self.time_offset = None
+        self.content_end = None
+
+    def mux(self, packet: av.Packet) -> None:
+        is_video = packet.stream.type == 'video'
+        if self.time_offset is None:
+            if not is_video:
+                # the segment starts with a video packet
+                return
+            self.time_offset = float((packet.dts if packet.dts is not None else packet.pts) * packet.time_base)
+        offset = round(self.time_offset / packet.time_base)
+        dts = packet.dts - offset if packet.dts is not None else None
+        if dts is not None and dts < 0:
+            # this packet precedes the first video packet
+            return
+        out_packet = av.Packet(bytes(packet))
+        out_packet.pts = packet.pts - offset if packet.pts is not None else None
+        out_packet.dts = dts
+        out_packet.time_base = packet.time_base
+        out_packet.is_keyframe = packet.is_keyframe
+        out_packet.stream = self.output_streams[packet.stream.index]
+        self.container.mux(out_packet)
+        if is_video and packet.pts is not None:
+            packet_end = float((packet.pts + (packet.duration or 0)) * packet.time_base)
+            self.content_end = packet_end if self.content_end is None else max(self.content_end, packet_end)
+
+    def close(self) -> None:
+        self.container.close()
 
 
 class VideoSplitter(ComponentIterator):
@@ -240,6 +356,10 @@ class VideoSplitter(ComponentIterator):
         segment_duration: Video segment duration in seconds
         overlap: Overlap between consecutive segments in seconds.
         min_segment_duration: Drop the last segment if it is smaller than min_segment_duration
+        single_pass: If True, produces all segments in a single sequential pass over the video, by copying the
+            packets of the video and audio streams into the segment files in-process, rather than running one
+            `ffmpeg` process per segment. Each segment is returned as soon as it is complete. As with the default
+            mode, segment files start at the video keyframe preceding the segment start.
     """
 
     # Input parameters
@@ -247,6 +367,7 @@ class VideoSplitter(ComponentIterator):
     segment_duration: float
     overlap: float
     min_segment_duration: float
+    single_pass: bool
 
     # Video metadata
     video_duration: float
@@ -257,7 +378,23 @@ class VideoSplitter(ComponentIterator):
     next_segment_start: float
     next_segment_start_pts: int
 
-    def __init__(self, video: str, segment_duration: float, *, overlap: float = 0.0, min_segment_duration: float = 0.0):
+    # single-pass state
+    container: Optional[av.container.InputContainer]
+    packets: Optional[Iterator[av.Packet]]
+    gop_packets: list[av.Packet]  # packets since the most recent video keyframe
+    open_segments: collections.deque[_SegmentWriter]  # in order of their start
+    completed_segments: collections.deque[_SegmentWriter]
+    last_segment_end: Optional[float]
+
+    def __init__(
+        self,
+        video: str,
+        segment_duration: float,
+        *,
+        overlap: float = 0.0,
+        min_segment_duration: float = 0.0,
+        single_pass: bool = False,
+    ):
         assert segment_duration > 0.0
         assert segment_duration >= min_segment_duration
         assert overlap < segment_duration
@@ -265,13 +402,14 @@ class VideoSplitter(ComponentIterator):
         video_path = Path(video)
         assert video_path.exists() and video_path.is_file()
 
-        if not shutil.which('ffmpeg'):
+        if not single_pass and not shutil.which('ffmpeg'):
             raise pxt.Error('ffmpeg is not installed or not in PATH. Please install ffmpeg to use VideoSplitter.')
 
         self.video_path = video_path
         self.segment_duration = segment_duration
         self.overlap = overlap
         self.min_segment_duration = min_segment_duration
+        self.single_pass = single_pass
 
         with av.open(str(video_path)) as container:
             video_stream = container.streams.video[0]
@@ -281,6 +419,17 @@ class VideoSplitter(ComponentIterator):
         self.next_segment_start = float(self.video_start_time * self.video_time_base)
         self.next_segment_start_pts = self.video_start_time
 
+        self.container = None
+        self.packets = None
+        self.gop_packets = []
+        self.open_segments = collections.deque()
+        self.completed_segments = collections.deque()
+        self.last_segment_end = None
+        if single_pass:
+            self.container = av.open(str(video_path))
+            input_streams = [self.container.streams.video[0], *self.container.streams.audio]
+            self.packets = self.container.demux(input_streams)
+
     @classmethod
     def input_schema(cls) -> dict[str, ts.ColumnType]:
         return {
@@ -288,6 +437,7 @@ class VideoSplitter(ComponentIterator):
             'segment_duration': ts.FloatType(nullable=False),
             'overlap': ts.FloatType(nullable=True),
             'min_segment_duration': ts.FloatType(nullable=True),
+            'single_pass': ts.BoolType(nullable=True),
         }
 
     @classmethod
@@ -316,6 +466,9 @@ class VideoSplitter(ComponentIterator):
         }, []
 
     def __next__(self) -> dict[str, Any]:
+        if self.single_pass:
+            return self._next_single_pass()
+
         segment_path = str(TempStore.create_path(extension='.mp4'))
         try:
             cmd = av_utils.ffmpeg_clip_cmd(
@@ -357,8 +510,92 @@ class VideoSplitter(ComponentIterator):
                 error_msg += f': {e.stderr.strip()}'
             raise pxt.Error(error_msg) from e
 
+    def _next_single_pass(self) -> dict[str, Any]:
+        while True:
+            while len(self.completed_segments) == 0 and self.packets is not None:
+                self._process_next_packet()
+            if len(self.completed_segments) == 0:
+                raise StopIteration
+
+            segment = self.completed_segments.popleft()
+            # only segments that are completed by the end of the video can be shorter than segment_duration
+            if (
+                segment.content_end is None
+                or segment.end - segment.start < self.min_segment_duration
+                # the segment doesn't extend beyond the overlap with its predecessor
+                or (self.last_segment_end is not None and segment.end <= self.last_segment_end)
+            ):
+                Path(segment.path).unlink()
+                continue
+
+            self.last_segment_end = segment.end
+            return {
+                'segment_start': segment.start,
+                'segment_start_pts': round(segment.start / self.video_time_base),
+                'segment_end': segment.end,
+                'segment_end_pts': round(segment.end / self.video_time_base),
+                'video_segment': segment.path,
+            }
+
+    def _process_next_packet(self) -> None:
+        """Feed the next packet of the input into all segments that cover it, and record completed segments"""
+        assert self.container is not None and self.packets is not None
+        try:
+            packet = next(self.packets)
+        except StopIteration:
+            # we're at the end of the video: all open segments are complete and end with their content
+            for segment in self.open_segments:
+                segment.close()
+                if segment.content_end is not None:
+                    segment.end = min(segment.end, segment.content_end)
+            self.completed_segments.extend(self.open_segments)
+            self.open_segments.clear()
+            self.packets = None
+            return
+
+        ts_ = packet.dts if packet.dts is not None else packet.pts
+        if ts_ is None:
+            # a flush packet
+            return
+        packet_time = float(ts_ * packet.time_base)
+        is_video = packet.stream.type == 'video'
+
+        while packet_time >= self.next_segment_start:
+            # open the next segment; its content starts with the current GOP, whose keyframe precedes the segment start
+            segment = _SegmentWriter(
+                [self.container.streams.video[0], *self.container.streams.audio],
+                self.next_segment_start,
+                self.next_segment_start + self.segment_duration,
+            )
+            for gop_packet in self.gop_packets:
+                segment.mux(gop_packet)
+            self.open_segments.append(segment)
+            self.next_segment_start += self.segment_duration - self.overlap
+
+        if is_video and packet.is_keyframe:
+            self.gop_packets = []
+        self.gop_packets.append(packet)
+
+        if is_video:
+            # a video packet at or past the end of a segment completes it; segments are ordered by start and end
+            while len(self.open_segments) > 0 and packet_time >= self.open_segments[0].end:
+                segment = self.open_segments.popleft()
+                segment.close()
+                self.completed_segments.append(segment)
+        for segment in self.open_segments:
+            if packet_time < segment.end:
+                segment.mux(packet)
+
     def close(self) -> None:
-        pass
+        for segment in self.open_segments:
+            segment.close()
+            Path(segment.path).unlink(missing_ok=True)
+        for segment in self.completed_segments:
+            Path(segment.path).unlink(missing_ok=True)
+        self.open_segments.clear()
+        self.completed_segments.clear()
+        if self.container is not None:
+            self.container.close()
 
     def set_pos(self, pos: int) -> None:
         pass
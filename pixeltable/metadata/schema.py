@@ -1,10 +1,11 @@
 import dataclasses
+import datetime
 import typing
 import uuid
 from typing import Any, NamedTuple, Optional, TypeVar, Union, get_type_hints
 
 import sqlalchemy as sql
-from sqlalchemy import BigInteger, ForeignKey, Integer, LargeBinary, orm
+from sqlalchemy import BigInteger, Float, ForeignKey, Integer, LargeBinary, String, orm
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 
@@ -161,6 +162,9 @@ class ViewMd:
     # args to pass to the iterator class constructor; only for component views
     iterator_args: Optional[dict[str, Any]]
 
+    # hidden column that stores the pos_state() of each component; only for component views of iterators that have one
+    iterator_pos_state_col_id: Optional[int] = None
+
 
 @dataclasses.dataclass
 class TableMd:
@@ -322,6 +326,59 @@ class PendingTableOp(Base):
     op: orm.Mapped[dict[str, Any]] = orm.mapped_column(JSONB, nullable=False)  # catalog.TableOp
 
 
+# New system tables (like the following ones) are created by Env._init_metadata() (create_all(checkfirst=True)) when
+# they don't exist yet; as with pendingtableops, adding one doesn't require a new metadata version or converter.
+
+
+class MediaBlob(Base):
+    """
+    Reference from a table version to a content-addressed media file (see utils.media_blobs).
+
+    A media file can be shared by any number of tables; it is deleted when the last reference is released.
+    """
+
+    __tablename__ = 'mediablobs'
+
+    # the column destination; '' for the default media location
+    destination: orm.Mapped[str] = orm.mapped_column(String, primary_key=True, nullable=False)
+    # content hash of the file, followed by its extension
+    blob_name: orm.Mapped[str] = orm.mapped_column(String, primary_key=True, nullable=False)
+    tbl_id: orm.Mapped[uuid.UUID] = orm.mapped_column(UUID(as_uuid=True), primary_key=True, nullable=False)
+    # the table version that stored the file
+    tbl_version: orm.Mapped[int] = orm.mapped_column(BigInteger, primary_key=True, nullable=False)
+    url: orm.Mapped[str] = orm.mapped_column(String, nullable=False)
+
+
+class RateLimitBucket(Base):
+    """
+    Token bucket for a resource of a rate-limited resource pool, shared by all processes that use the database
+    (see utils.rate_limit_buckets).
+    """
+
+    __tablename__ = 'ratelimitbuckets'
+
+    pool_id: orm.Mapped[str] = orm.mapped_column(String, primary_key=True, nullable=False)
+    resource: orm.Mapped[str] = orm.mapped_column(String, primary_key=True, nullable=False)
+    capacity: orm.Mapped[float] = orm.mapped_column(Float, nullable=False)
+    refill_rate: orm.Mapped[float] = orm.mapped_column(Float, nullable=False)  # tokens per second
+    tokens: orm.Mapped[float] = orm.mapped_column(Float, nullable=False)  # as of updated_at; negative: overdrawn
+    updated_at: orm.Mapped[datetime.datetime] = orm.mapped_column(sql.TIMESTAMP(timezone=True), nullable=False)
+
+
+class BatchApiRequest(Base):
+    """
+    Request that was submitted to a provider's batch API (see utils.batch_api); allows a restarted process to retrieve
+    the result instead of submitting the request again.
+    """
+
+    __tablename__ = 'batchapirequests'
+
+    resource_pool: orm.Mapped[str] = orm.mapped_column(String, primary_key=True, nullable=False)
+    request_key: orm.Mapped[str] = orm.mapped_column(String, primary_key=True, nullable=False)  # hash of the request
+    batch_id: orm.Mapped[str] = orm.mapped_column(String, nullable=False)
+    created_at: orm.Mapped[datetime.datetime] = orm.mapped_column(sql.TIMESTAMP(timezone=True), nullable=False)
+
+
 @dataclasses.dataclass
 class FunctionMd:
     name: str
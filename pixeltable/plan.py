@@ -281,14 +281,31 @@ class Analyzer:
         ):
             raise excs.Error(f'where() cannot contain aggregate functions: {self.filter}')
 
-        # check that grouping exprs don't contain aggregates and can be expressed as SQL (we perform sort-based
-        # aggregation and rely on the SqlScanNode returning data in the correct order)
+        # check that grouping exprs don't contain aggregates
         for e in self.group_by_clause:
-            if not self.sql_elements.contains(e):
-                raise excs.Error(f'Invalid grouping expression, needs to be expressible in SQL: {e}')
             if e._contains(filter=_is_agg_fn_call):
                 raise excs.Error(f'Grouping expression contains aggregate function: {e}')
 
+        # grouping exprs that can't be expressed in SQL require hash aggregation, which doesn't produce its output
+        # in any particular order
+        if self.is_hash_agg:
+            non_sql_expr = next(e for e in self.group_by_clause if not self.sql_elements.contains(e))
+            if len(self.window_fn_calls) > 0:
+                raise excs.Error(
+                    f'Invalid grouping expression, needs to be expressible in SQL when used with window functions: '
+                    f'{non_sql_expr}'
+                )
+            if len(self.order_by_clause) > 0:
+                raise excs.Error(
+                    f'order_by() cannot be used with a grouping expression that is not expressible in SQL: '
+                    f'{non_sql_expr}'
+                )
+
+    @property
+    def is_hash_agg(self) -> bool:
+        """True if grouping aggregation needs to be hash-based, because some grouping exprs can't be expressed in SQL"""
+        return self.group_by_clause is not None and not self.sql_elements.contains_all(self.group_by_clause)
+
     def _determine_agg_status(self, e: exprs.Expr, grouping_expr_ids: set[int]) -> tuple[bool, bool]:
         """Determine whether expr is the input to or output of an aggregate function.
         Returns:
@@ -861,10 +878,10 @@ class Planner:
                 ordering = [OrderByItem(e, None) for e in gb] + [OrderByItem(e, True) for e in ob]
                 ob_clauses.append(ordering)
             for fn_call in analyzer.agg_fn_calls:
-                # agg functions with an ordering requirement are implicitly ascending
-                ordering = [OrderByItem(e, None) for e in analyzer.group_by_clause] + [
-                    OrderByItem(e, True) for e in fn_call.get_agg_order_by()
-                ]
+                # agg functions with an ordering requirement are implicitly ascending; sort-based aggregation also
+                # requires the input to be ordered by the grouping exprs, hash-based aggregation doesn't
+                ordering = [] if analyzer.is_hash_agg else [OrderByItem(e, None) for e in analyzer.group_by_clause]
+                ordering.extend(OrderByItem(e, True) for e in fn_call.get_agg_order_by())
                 ob_clauses.append(ordering)
 
         if len(ob_clauses) == 0:
@@ -913,6 +930,31 @@ class Planner:
         prefetch_node = exec.CachePrefetchNode(tbl_id, file_col_info, input_node)
         return prefetch_node
 
+    @classmethod
+    def _cluster_by_base_rowid(cls, row_builder: exprs.RowBuilder, sql_node: exec.SqlNode) -> None:
+        """
+        Have sql_node return rows in rowid order, if the query reconstructs unstored iterator columns.
+
+        Unstored iterator columns (eg, the frames of a FrameIterator view) are reconstructed by re-running the
+        iterator for the base row; returning the rows of a base row together and in pos order allows ColumnRef to
+        reuse the iterator and avoids backward seeks.
+        """
+        if sql_node.tbl is None:
+            return
+        # we can only order by the rowid of a table that the scan covers, ie, sql_node.tbl or one of its bases (the
+        # iterator view of a view load plan isn't scanned: its rows are produced by the ComponentIterationNode)
+        scanned_tbl_ids = {tbl_version.id for tbl_version in sql_node.tbl.get_tbl_versions()}
+        iter_tbls = [
+            e.col.tbl
+            for e in row_builder.unique_exprs
+            if isinstance(e, exprs.ColumnRef) and e.is_unstored_iter_col and e.col.tbl.id in scanned_tbl_ids
+        ]
+        if len(iter_tbls) == 0:
+            return
+        # the rowid of the view with the most rowid columns also clusters the rows of the component views it's based on
+        target = max(iter_tbls, key=lambda tbl: tbl.num_rowid_columns())
+        sql_node.set_order_by([OrderByItem(e, True) for e in cls.rowid_columns(target.handle)])
+
     @classmethod
     def create_query_plan(
         cls,
@@ -1104,16 +1146,14 @@ class Planner:
             agg_input = exprs.ExprSet(analyzer.grouping_exprs.copy())
             for fn_call in analyzer.agg_fn_calls:
                 agg_input.update(fn_call.components)
-            if not sql_exprs.issuperset(agg_input):
-                # we need an ExprEvalNode
-                plan = exec.ExprEvalNode(row_builder, agg_input, sql_exprs, input=plan)
 
             # batch size for aggregation input: this could be the entire table, so we need to divide it into
             # smaller batches; at the same time, we need to make the batches large enough to amortize the
             # function call overhead
             ctx.batch_size = 16
 
-            # do aggregation in SQL if all agg exprs can be translated
+            # do aggregation in SQL if all agg exprs can be translated; the SQL translation doesn't need the agg input
+            # to be materialized (Literal args, in particular, aren't)
             if (
                 sql_elements.contains_all(analyzer.select_list)
                 and sql_elements.contains_all(analyzer.grouping_exprs)
@@ -1124,17 +1164,33 @@ class Planner:
                     row_builder, input=plan, select_list=analyzer.select_list, group_by_items=analyzer.group_by_clause
                 )
             else:
+                if not is_python_agg:
+                    # the agg fn calls can be translated, but the query as a whole can't: the ordering requirements of
+                    # Python aggregation apply
+                    combined_ordering = cls._create_combined_ordering(analyzer, verify_agg=True)
+                if not sql_exprs.issuperset(agg_input):
+                    # we need an ExprEvalNode
+                    plan = exec.ExprEvalNode(row_builder, agg_input, sql_exprs, input=plan)
                 input_sql_node = plan.get_node(exec.SqlNode)
                 assert combined_ordering is not None
-                input_sql_node.set_order_by(combined_ordering)
-                plan = exec.AggregationNode(
-                    tbl.tbl_version,
-                    row_builder,
-                    analyzer.group_by_clause,
-                    analyzer.agg_fn_calls + analyzer.window_fn_calls,
-                    agg_input,
-                    input=plan,
-                )
+                if analyzer.is_hash_agg:
+                    # the grouping exprs are evaluated in Python, so we can't have SQL sort the input by them;
+                    # the input only needs to be sorted for agg functions that require an ordering
+                    if len(combined_ordering) > 0:
+                        input_sql_node.set_order_by(combined_ordering)
+                    plan = exec.HashAggregationNode(
+                        row_builder, analyzer.group_by_clause, analyzer.agg_fn_calls, agg_input, input=plan
+                    )
+                else:
+                    input_sql_node.set_order_by(combined_ordering)
+                    plan = exec.AggregationNode(
+                        tbl.tbl_version,
+                        row_builder,
+                        analyzer.group_by_clause,
+                        analyzer.agg_fn_calls + analyzer.window_fn_calls,
+                        agg_input,
+                        input=plan,
+                    )
                 typecheck_dummy = analyzer.grouping_exprs + analyzer.agg_fn_calls + analyzer.window_fn_calls
                 agg_output = exprs.ExprSet(typecheck_dummy)
                 if not agg_output.issuperset(exprs.ExprSet(eval_ctx.target_exprs)):
@@ -1161,6 +1217,8 @@ class Planner:
             expr_eval_node = plan.get_node(exec.ExprEvalNode)
             if expr_eval_node is not None:
                 expr_eval_node.set_input_order(False)
+            if analyzer.sample_clause is None and len(analyzer.from_clause.join_clauses) == 0:
+                cls._cluster_by_base_rowid(row_builder, sql_node)
 
         if limit is not None:
             assert isinstance(limit, exprs.Literal)
@@ -1362,6 +1362,11 @@ class Json(_PxtType):
 
 
 class Array(np.ndarray, _PxtType):
+    """
+    Arrays that are stored outside of the database are returned by queries, and passed to udfs, as read-only views
+    of the stored data; use `copy()` to obtain a writable array.
+    """
+
     def __class_getitem__(cls, item: Any) -> _AnnotatedAlias:
         """
         `item` (the type subscript) must be a tuple with exactly two elements (in any order):
@@ -0,0 +1,215 @@
+"""
+Segment files: a compressed layout for externally stored array cells.
+
+A segment file holds the arrays of one column for one batch of rows:
+    <entry 0> ... <entry n-1> <offset table> <footer>
+- entry: ENTRY_HEADER (ndim, length of dtype strings), the original and the stored dtype strings, the shape
+  (ndim little-endian uint64s), followed by the compressed array data in C order
+- offset table: n little-endian uint64 offsets of the entries
+- footer: FOOTER (offset of the offset table, n, codec id, MAGIC)
+
+Bool arrays are stored as packed bits; float arrays are optionally downcast to float16. In both cases the original
+dtype is recorded and restored on read (the float16 downcast is lossy).
+
+Segment files are identified by a segment id (their table version and uuid), from which the file path within the
+media dir of their table can be derived; cells only record that id and the index of their array in the segment.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import struct
+from pathlib import Path
+from typing import Any, Callable, ClassVar
+from uuid import UUID
+
+import numpy as np
+
+from pixeltable import exceptions as excs
+from pixeltable.env import Env
+from pixeltable.utils.object_stores import ObjectPath
+
+MAGIC = b'PXTSEG1'
+ENTRY_HEADER = struct.Struct('<BBB')  # ndim, len(dtype str), len(stored dtype str)
+FOOTER = struct.Struct(f'<QIB{len(MAGIC)}s')  # offset table offset, number of entries, codec id, magic
+
+# codec name -> (codec id, package)
+CODECS: dict[str, tuple[int, str]] = {'zstd': (1, 'zstandard'), 'lz4': (2, 'lz4')}
+
+
+def _compress_fn(codec: str) -> Callable[[bytes], bytes]:
+    if codec == 'zstd':
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3).compress
+    assert codec == 'lz4'
+    import lz4.frame  # type: ignore[import-untyped]
+
+    return lz4.frame.compress
+
+
+def _decompress_fn(codec_id: int) -> Callable[[Any], bytes]:
+    if codec_id == CODECS['zstd'][0]:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress
+    assert codec_id == CODECS['lz4'][0]
+    import lz4.frame
+
+    return lz4.frame.decompress
+
+
+def validate_codec(codec: str) -> None:
+    """Raises an error if codec isn't a supported codec or its package isn't installed."""
+    if codec not in CODECS:
+        raise excs.Error(f'Unknown array compression codec: {codec!r} (must be one of {", ".join(CODECS)})')
+    Env.get().require_package(CODECS[codec][1])
+
+
+def new_segment_path(tbl_id: UUID, tbl_version: int) -> Path:
+    """Returns the path of a new segment file for the given table version"""
+    from pixeltable.utils.local_store import LocalStore
+
+    return LocalStore(Env.get().media_dir)._prepare_path_raw(tbl_id, 0, tbl_version, ext='.seg')
+
+
+def segment_id(path: Path) -> str:
+    """Returns the id of the segment file at path (see segment_path())"""
+    matched = ObjectPath.PATTERN.fullmatch(path.stem)
+    assert matched is not None and path.suffix == '.seg', path
+    return f'{matched[3]}_{matched[4]}'
+
+
+def segment_path(tbl_id: UUID, segment_id: str) -> Path:
+    """Returns the path of the segment file of table tbl_id with the given segment id"""
+    tbl_version, id_hex = segment_id.split('_')
+    prefix, filename = ObjectPath.prefix_raw(tbl_id, 0, int(tbl_version), id_hex, ext='.seg')
+    return Env.get().media_dir / prefix / filename
+
+
+class ArraySegmentWriter:
+    """Appends arrays to a new segment file; close() writes the offset table and makes the file readable."""
+
+    # buffer size of the output file
+    BUFFER_SIZE: ClassVar[int] = 4 * 2**20
+
+    path: Path
+    codec: str
+    float16: bool
+    fh: io.BufferedWriter | None
+    offsets: list[int]
+    compress: Callable[[bytes], bytes]
+
+    def __init__(self, path: Path, codec: str, float16: bool = False):
+        validate_codec(codec)
+        self.path = path
+        self.codec = codec
+        self.float16 = float16
+        fh = open(path, 'wb', buffering=self.BUFFER_SIZE)  # noqa: SIM115
+        assert isinstance(fh, io.BufferedWriter)
+        self.fh = fh
+        self.offsets = []
+        self.compress = _compress_fn(codec)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def append(self, ar: np.ndarray) -> int:
+        """Append ar and return its index in the segment."""
+        assert self.fh is not None
+        data: np.ndarray
+        if np.issubdtype(ar.dtype, np.bool_):
+            data = np.packbits(ar)
+        elif self.float16 and ar.dtype in (np.float32, np.float64):
+            data = ar.astype(np.float16)
+        else:
+            data = ar
+        dtype_str = ar.dtype.str.encode()
+        stored_dtype_str = data.dtype.str.encode()
+        self.offsets.append(self.fh.tell())
+        self.fh.write(ENTRY_HEADER.pack(ar.ndim, len(dtype_str), len(stored_dtype_str)))
+        self.fh.write(dtype_str)
+        self.fh.write(stored_dtype_str)
+        self.fh.write(np.array(ar.shape, dtype='<u8').tobytes())
+        # tobytes() returns the data in C order, regardless of the memory layout of data
+        self.fh.write(self.compress(data.tobytes()))
+        return len(self.offsets) - 1
+
+    def append_entry(self, entry: Any) -> int:
+        """Append an entry as returned by ArraySegmentReader.entry() (which needs to use the same codec)."""
+        assert self.fh is not None
+        self.offsets.append(self.fh.tell())
+        self.fh.write(entry)
+        return len(self.offsets) - 1
+
+    def close(self) -> None:
+        """Write the offset table and footer and flush the file to storage."""
+        assert self.fh is not None
+        table_offset = self.fh.tell()
+        self.fh.write(np.array(self.offsets, dtype='<u8').tobytes())
+        self.fh.write(FOOTER.pack(table_offset, len(self.offsets), CODECS[self.codec][0], MAGIC))
+        self.fh.flush()
+        os.fsync(self.fh.fileno())  # needed to force bytes cached by OS to storage
+        self.fh.close()
+        self.fh = None
+
+    def abort(self) -> None:
+        """Close the file without finalizing it."""
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+
+class ArraySegmentReader:
+    """Reads individual arrays from a segment file, given as a bytes-like object (typically a memory map)."""
+
+    buf: memoryview
+    offsets: np.ndarray
+    table_offset: int
+    codec: str
+    decompress: Callable[[Any], bytes]
+
+    def __init__(self, buf: Any):
+        self.buf = memoryview(buf)
+        if len(self.buf) < FOOTER.size:
+            raise excs.Error('Invalid array segment file')
+        table_offset, count, codec_id, magic = FOOTER.unpack(self.buf[-FOOTER.size :])
+        if magic != MAGIC:
+            raise excs.Error('Invalid array segment file')
+        self.table_offset = table_offset
+        self.offsets = np.frombuffer(self.buf, dtype='<u8', count=count, offset=table_offset)
+        self.codec = next(name for name, (cid, _) in CODECS.items() if cid == codec_id)
+        self.decompress = _decompress_fn(codec_id)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _entry_bounds(self, idx: int) -> tuple[int, int]:
+        start = int(self.offsets[idx])
+        end = int(self.offsets[idx + 1]) if idx + 1 < len(self.offsets) else self.table_offset
+        return start, end
+
+    def entry(self, idx: int) -> memoryview:
+        """Returns the raw (compressed) entry, which can be copied to another segment with append_entry()"""
+        start, end = self._entry_bounds(idx)
+        return self.buf[start:end]
+
+    def read(self, idx: int) -> np.ndarray:
+        start, end = self._entry_bounds(idx)
+        ndim, dtype_len, stored_dtype_len = ENTRY_HEADER.unpack_from(self.buf, start)
+        pos = start + ENTRY_HEADER.size
+        dtype = np.dtype(bytes(self.buf[pos : pos + dtype_len]).decode())
+        pos += dtype_len
+        stored_dtype = np.dtype(bytes(self.buf[pos : pos + stored_dtype_len]).decode())
+        pos += stored_dtype_len
+        shape = tuple(int(n) for n in np.frombuffer(self.buf, dtype='<u8', count=ndim, offset=pos))
+        pos += 8 * ndim
+
+        data = np.frombuffer(self.decompress(self.buf[pos:end]), dtype=stored_dtype)
+        if np.issubdtype(dtype, np.bool_):
+            # unpackbits() returns 0/1 uint8 values, which we can reinterpret as bool without another copy
+            return np.unpackbits(data, count=int(np.prod(shape))).reshape(shape).view(np.bool_)
+        if stored_dtype != dtype:
+            data = data.astype(dtype)
+        return data.reshape(shape)
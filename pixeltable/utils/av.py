@@ -1,20 +1,34 @@
-from typing import Any
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, ClassVar, Iterator, Optional, cast
 
 import av
 import av.stream
+import PIL.Image
+
+_logger = logging.getLogger('pixeltable')
 
 
 def get_metadata(path: str) -> dict:
     with av.open(path) as container:
-        assert isinstance(container, av.container.InputContainer)
-        streams_info = [__get_stream_metadata(stream) for stream in container.streams]
-        result = {
-            'bit_exact': getattr(container, 'bit_exact', False),
-            'bit_rate': container.bit_rate,
-            'size': container.size,
-            'metadata': container.metadata,
-            'streams': streams_info,
-        }
+        return _get_container_metadata(container)
+
+
+def _get_container_metadata(container: av.container.InputContainer) -> dict:
+    assert isinstance(container, av.container.InputContainer)
+    streams_info = [__get_stream_metadata(stream) for stream in container.streams]
+    result = {
+        'bit_exact': getattr(container, 'bit_exact', False),
+        'bit_rate': container.bit_rate,
+        'size': container.size,
+        'metadata': container.metadata,
+        'streams': streams_info,
+    }
     return result
 
 
@@ -66,23 +80,253 @@ def __get_stream_metadata(stream: av.stream.Stream) -> dict:
 def get_video_duration(path: str) -> float | None:
     """Return video duration in seconds."""
     with av.open(path) as container:
-        video_stream = container.streams.video[0]
-        if video_stream is None:
+        return _get_container_video_duration(container)
+
+
+def _get_container_video_duration(container: av.container.InputContainer) -> float | None:
+    if len(container.streams.video) == 0:
+        return None
+    video_stream = container.streams.video[0]
+    if video_stream.duration is not None:
+        return float(video_stream.duration * video_stream.time_base)
+
+    # if duration is not in the header, look for it in the last packet
+    last_pts: int | None = None
+    for packet in container.demux(video_stream):
+        if packet.pts is not None:
+            last_pts = packet.pts
+    if last_pts is not None:
+        return float(last_pts * video_stream.time_base)
+
+    return None
+
+
+class DecoderSession:
+    """
+    An open video container together with its decoder state, which is reused across calls for the same video file.
+
+    extract_frame() returns the first frame at or after the requested timestamp. If timestamps arrive in increasing
+    order and are close to each other, the session decodes forward from its current position instead of seeking
+    (and decoding the GOP from the preceding keyframe again).
+    """
+
+    # don't decode forward across more than this many seconds of video; seek instead
+    MAX_FORWARD_DECODE_SECS: ClassVar[float] = 2.0
+
+    path: str
+    container: av.container.InputContainer
+    lock: threading.Lock
+    num_users: int  # number of DecoderCache.session() calls currently using this session; protected by the cache lock
+    is_evicted: bool  # if True, the last user closes the session
+    has_video: bool
+    time_base: float
+    start_time: int
+    duration_secs: Optional[float]  # from the stream header
+    _metadata: Optional[dict]
+    _video_duration: Optional[float]
+    _video_duration_computed: bool
+
+    # decoder position: the most recently decoded frame and the timestamp of its predecessor
+    frames: Optional[Any]  # the decoder generator
+    last_frame: Optional[av.VideoFrame]
+    last_frame_ts: Optional[float]
+    prev_frame_ts: Optional[float]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.container = av.open(path)
+        self.lock = threading.Lock()
+        self.num_users = 0
+        self.is_evicted = False
+        # the metadata of a file without a video stream (eg, audio-only) is still accessible through the session
+        self.has_video = len(self.container.streams.video) > 0
+        self.time_base, self.start_time, self.duration_secs = 1.0, 0, None
+        if self.has_video:
+            video_stream = self.container.streams.video[0]
+            video_stream.thread_type = 'AUTO'
+            self.time_base = float(video_stream.time_base)
+            self.start_time = video_stream.start_time or 0
+            if video_stream.duration is not None:
+                self.duration_secs = float(video_stream.duration * video_stream.time_base)
+        self._metadata = None
+        self._video_duration = None
+        self._video_duration_computed = False
+        self._reset_position()
+
+    def _reset_position(self) -> None:
+        self.frames = None
+        self.last_frame = None
+        self.last_frame_ts = None
+        self.prev_frame_ts = None
+
+    def close(self) -> None:
+        self.container.close()
+
+    @property
+    def metadata(self) -> dict:
+        if self._metadata is None:
+            self._metadata = _get_container_metadata(self.container)
+        return self._metadata
+
+    @property
+    def video_duration(self) -> Optional[float]:
+        if not self._video_duration_computed:
+            # this may demux the entire video (from the start), which invalidates the decoder position
+            self.container.seek(0)
+            self._video_duration = _get_container_video_duration(self.container)
+            self._video_duration_computed = True
+            self.container.seek(0)
+            self._reset_position()
+        return self._video_duration
+
+    def extract_frame(self, timestamp: float) -> Optional[PIL.Image.Image]:
+        if not self.has_video:
+            return None
+        if self.duration_secs is not None and timestamp > self.duration_secs:
             return None
-        if video_stream.duration is not None:
-            return float(video_stream.duration * video_stream.time_base)
 
-        # if duration is not in the header, look for it in the last packet
-        last_pts: int | None = None
-        for packet in container.demux(video_stream):
-            if packet.pts is not None:
-                last_pts = packet.pts
-        if last_pts is not None:
-            return float(last_pts * video_stream.time_base)
+        if self.last_frame is not None:
+            assert self.last_frame_ts is not None
+            if self.prev_frame_ts is not None and self.prev_frame_ts < timestamp <= self.last_frame_ts:
+                # the most recently decoded frame is the one we're looking for
+                return self.last_frame.to_image()
+            can_decode_forward = self.last_frame_ts < timestamp <= self.last_frame_ts + self.MAX_FORWARD_DECODE_SECS
+        else:
+            can_decode_forward = False
+
+        try:
+            if not can_decode_forward:
+                # seek to the nearest keyframe *before* the target timestamp
+                target_pts = int(timestamp / self.time_base) + self.start_time
+                self.container.seek(target_pts, backward=True, stream=self.container.streams.video[0])
+                self._reset_position()
+            if self.frames is None:
+                self.frames = self.container.decode(video=0)
+
+            # decode frames until we reach or pass the target timestamp
+            for frame in self.frames:
+                if frame.pts is None:
+                    continue
+                frame_ts = float((frame.pts - self.start_time) * self.time_base)
+                self.prev_frame_ts = self.last_frame_ts
+                self.last_frame = frame
+                self.last_frame_ts = frame_ts
+                if frame_ts >= timestamp:
+                    return frame.to_image()
+        except Exception:
+            # the decoder is in an unknown state: seek again on the next call
+            self._reset_position()
+            raise
 
+        # we're at the end of the video
+        self._reset_position()
         return None
 
 
+class DecoderCache:
+    """
+    Bounded per-process LRU cache of DecoderSessions, keyed by file path (and the file's size and mtime, so that
+    a modified file isn't served from a stale session).
+    """
+
+    __instance: Optional[DecoderCache] = None
+
+    MAX_SESSIONS: ClassVar[int] = 16
+
+    sessions: OrderedDict[tuple[str, int, int], DecoderSession]
+    lock: threading.Lock
+    num_requests: int
+    num_hits: int
+
+    @classmethod
+    def get(cls) -> DecoderCache:
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    def __init__(self) -> None:
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.num_hits = 0
+
+    @contextlib.contextmanager
+    def session(self, path: str) -> Iterator[DecoderSession]:
+        """
+        Context manager that returns the session for the given path, creating it if needed, for exclusive use.
+
+        The session is registered as in use before the cache lock is released, so that an eviction can't close it
+        before the caller gets to use it; an evicted session that is in use is closed by its last user instead.
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        evicted: list[DecoderSession] = []
+        with self.lock:
+            self.num_requests += 1
+            session = self.sessions.get(key)
+            if session is not None:
+                self.num_hits += 1
+                self.sessions.move_to_end(key)
+            else:
+                session = DecoderSession(path)
+                self.sessions[key] = session
+                while len(self.sessions) > self.MAX_SESSIONS:
+                    _, lru_session = self.sessions.popitem(last=False)
+                    if self._evict(lru_session):
+                        evicted.append(lru_session)
+            session.num_users += 1
+        # closing can take a while: don't hold up other lookups
+        for evicted_session in evicted:
+            evicted_session.close()
+
+        try:
+            with session.lock:
+                yield session
+        finally:
+            with self.lock:
+                session.num_users -= 1
+                close = session.is_evicted and session.num_users == 0
+            if close:
+                session.close()
+
+    def _evict(self, session: DecoderSession) -> bool:
+        """Marks session as evicted; returns True if it can be closed right away (requires self.lock)"""
+        session.is_evicted = True
+        return session.num_users == 0
+
+    def close_idle(self) -> None:
+        """Closes the sessions that aren't in use; called at the end of a query"""
+        evicted: list[DecoderSession] = []
+        with self.lock:
+            for key, session in list(self.sessions.items()):
+                if session.num_users == 0:
+                    del self.sessions[key]
+                    self._evict(session)
+                    evicted.append(session)
+        for evicted_session in evicted:
+            evicted_session.close()
+
+    def clear(self) -> None:
+        """Evicts all sessions; sessions in use are closed by their last user"""
+        evicted: list[DecoderSession] = []
+        with self.lock:
+            for session in self.sessions.values():
+                if self._evict(session):
+                    evicted.append(session)
+            self.sessions.clear()
+        for evicted_session in evicted:
+            evicted_session.close()
+
+
+def add_stream_from_template(container: av.container.OutputContainer, template: av.stream.Stream) -> av.stream.Stream:
+    """Add an output stream with the codec parameters of template, for stream copy"""
+    if hasattr(container, 'add_stream_from_template'):
+        # PyAV >= 14
+        return container.add_stream_from_template(template)
+    # the stubs of PyAV >= 14 don't include the template parameter
+    return cast(Any, container).add_stream(template=template)
+
+
 def has_audio_stream(path: str) -> bool:
     """Check if video has audio stream using PyAV."""
     md = get_metadata(path)
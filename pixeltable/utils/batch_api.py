@@ -0,0 +1,148 @@
+"""
+Execution of udf calls through the asynchronous batch APIs of providers (such as OpenAI and Anthropic), which are
+cheaper than the regular endpoints and have much higher throughput limits, but return results only after minutes or
+hours.
+
+In backfills of computed columns with batch_mode=True (see Table.add_computed_column() and
+Table.recompute_columns()), the supported udfs use their batch_resource_pool 'batch-api:<provider>:<endpoint>:<model>',
+which is handled by BatchApiScheduler (see exec/expr_eval/schedulers.py): the scheduler turns the pending calls into
+batch requests (via the BatchEndpoint registered for the udf), submits them in batches, polls the batches and writes
+the results back into the rows as each batch completes.
+
+Submitted requests are recorded in the batchapirequests table, keyed by a hash of their contents. A request that is
+found there (because the process that submitted it was restarted, or because another row makes the same request) is
+not submitted again; instead, its result is retrieved from the recorded batch. Records are retained for
+JOURNAL_RETENTION, except for failed requests, which are removed so that they get resubmitted.
+"""
+
+from __future__ import annotations
+
+import abc
+import dataclasses
+import datetime
+import hashlib
+import json
+import logging
+from typing import Any, Callable, NamedTuple, Optional
+
+import sqlalchemy as sql
+from sqlalchemy.dialects.postgresql import insert
+
+from pixeltable import exceptions as excs
+from pixeltable.env import Env
+from pixeltable.metadata import schema
+
+_logger = logging.getLogger('pixeltable')
+
+JOURNAL_RETENTION = datetime.timedelta(days=7)
+
+
+class BatchRequest(NamedTuple):
+    custom_id: str
+    body: dict[str, Any]  # the body of the request against the regular endpoint
+
+
+class BatchResult(NamedTuple):
+    body: Optional[dict[str, Any]]  # the response body, if the request succeeded
+    error: Optional[str]
+
+
+class BatchOutput(NamedTuple):
+    results: dict[str, BatchResult]  # key: custom_id
+    error: Optional[str]  # why requests without a result failed (eg, the batch expired)
+
+
+class BatchApi(abc.ABC):
+    """Client for a provider's batch API"""
+
+    @abc.abstractmethod
+    async def submit(self, url: str, model: str, requests: list[BatchRequest]) -> str:
+        """Submits a batch of requests against url and returns the batch id"""
+
+    @abc.abstractmethod
+    async def poll(self, batch_id: str) -> Optional[BatchOutput]:
+        """Returns the output of the batch, or None if it is still in progress"""
+
+
+@dataclasses.dataclass(frozen=True)
+class BatchEndpoint:
+    """How calls of a udf are executed through a provider's batch API"""
+
+    api: BatchApi
+    url: str  # the regular endpoint, eg '/v1/chat/completions'
+    # Returns the body of the request for a single call; its parameters are a subset of those of the udf.
+    make_request: Callable[..., dict[str, Any]]
+    # Returns the udf's return value for a response body.
+    parse_response: Callable[[dict[str, Any]], Any]
+
+
+_endpoints: dict[str, BatchEndpoint] = {}  # key: '<provider>:<endpoint>'
+
+
+def register_endpoint(provider: str, endpoint: str, batch_endpoint: BatchEndpoint) -> None:
+    _endpoints[f'{provider}:{endpoint}'] = batch_endpoint
+
+
+def parse_resource_pool(resource_pool: str) -> tuple[BatchEndpoint, str]:
+    """Returns the BatchEndpoint and the model for resource_pool='batch-api:<provider>:<endpoint>:<model>'"""
+    _, provider, endpoint, model = resource_pool.split(':', 3)
+    batch_endpoint = _endpoints.get(f'{provider}:{endpoint}')
+    if batch_endpoint is None:
+        raise excs.Error(f'No batch API endpoint registered for resource pool {resource_pool!r}')
+    return batch_endpoint, model
+
+
+def request_key(resource_pool: str, body: dict[str, Any]) -> str:
+    """Returns a hash of the request; it also serves as the request's custom_id"""
+    s = json.dumps([resource_pool, body], sort_keys=True, default=str)
+    return hashlib.sha256(s.encode()).hexdigest()
+
+
+def lookup_requests(resource_pool: str, keys: list[str]) -> dict[str, str]:
+    """Returns the batch ids of the requests that have already been submitted"""
+    if len(keys) == 0:
+        return {}
+    t = schema.BatchApiRequest
+    q = sql.select(t.request_key, t.batch_id).where(
+        t.resource_pool == resource_pool,
+        t.request_key.in_(keys),
+        t.created_at > datetime.datetime.now(tz=datetime.timezone.utc) - JOURNAL_RETENTION,
+    )
+    with Env.get().engine.begin() as conn:
+        return dict(conn.execute(q).tuples().all())
+
+
+def record_requests(resource_pool: str, batch_id: str, keys: list[str]) -> None:
+    if len(keys) == 0:
+        return
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    values = [
+        {'resource_pool': resource_pool, 'request_key': key, 'batch_id': batch_id, 'created_at': now} for key in keys
+    ]
+    stmt = insert(schema.BatchApiRequest).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['resource_pool', 'request_key'],
+        set_={'batch_id': stmt.excluded.batch_id, 'created_at': stmt.excluded.created_at},
+    )
+    with Env.get().engine.begin() as conn:
+        conn.execute(stmt)
+
+
+def forget_requests(resource_pool: str, keys: list[str]) -> None:
+    """Removes the records of failed requests, so that they are submitted again the next time"""
+    if len(keys) == 0:
+        return
+    t = schema.BatchApiRequest
+    with Env.get().engine.begin() as conn:
+        conn.execute(sql.delete(t).where(t.resource_pool == resource_pool, t.request_key.in_(keys)))
+
+
+def purge_requests() -> int:
+    """Removes the records that are older than JOURNAL_RETENTION; returns the number of removed records"""
+    t = schema.BatchApiRequest
+    cutoff = datetime.datetime.now(tz=datetime.timezone.utc) - JOURNAL_RETENTION
+    with Env.get().engine.begin() as conn:
+        num_purged = conn.execute(sql.delete(t).where(t.created_at <= cutoff)).rowcount
+    if num_purged > 0:
+        _logger.debug(f'batch API: purged {num_purged} request records')
+    return num_purged
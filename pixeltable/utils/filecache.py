@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import glob
 import hashlib
+import json
 import logging
 import os
 import warnings
@@ -15,9 +16,13 @@ from uuid import UUID
 import pixeltable.exceptions as excs
 from pixeltable.config import Config
 from pixeltable.env import Env
+from pixeltable.utils.http_client import HttpValidators
 
 _logger = logging.getLogger('pixeltable')
 
+# validators are stored in a file next to the cached file, with this suffix
+_VALIDATORS_SUFFIX = '.validators.json'
+
 
 @dataclass
 class CacheEntry:
@@ -27,11 +32,27 @@ class CacheEntry:
     size: int
     last_used: datetime
     ext: str
+    validators: Optional[HttpValidators] = None  # for entries downloaded via HTTP
 
     @property
     def path(self) -> Path:
         return Env.get().file_cache_dir / f'{self.tbl_id.hex}_{self.col_id}_{self.key}{self.ext}'
 
+    @property
+    def validators_path(self) -> Path:
+        return Env.get().file_cache_dir / f'{self.tbl_id.hex}_{self.col_id}_{self.key}{_VALIDATORS_SUFFIX}'
+
+    def save_validators(self) -> None:
+        if self.validators is None:
+            self.validators_path.unlink(missing_ok=True)
+        else:
+            self.validators_path.write_text(json.dumps(list(self.validators)))
+
+    def remove(self) -> None:
+        """Remove the files of this entry"""
+        os.remove(str(self.path))
+        self.validators_path.unlink(missing_ok=True)
+
     @classmethod
     def from_file(cls, path: Path) -> CacheEntry:
         components = path.stem.split('_')
@@ -44,7 +65,10 @@ class CacheEntry:
         # each time it is retrieved, so that the mtime of the file will always represent the last used time of
         # the cache entry.
         last_used = datetime.fromtimestamp(file_info.st_mtime, tz=timezone.utc)
-        return cls(key, tbl_id, col_id, file_info.st_size, last_used, path.suffix)
+        entry = cls(key, tbl_id, col_id, file_info.st_size, last_used, path.suffix)
+        if entry.validators_path.exists():
+            entry.validators = HttpValidators(*json.loads(entry.validators_path.read_text()))
+        return entry
 
 
 class FileCache:
@@ -114,7 +138,9 @@ class FileCache:
         self.evicted_working_set_keys = set()
         self.new_redownload_witnessed = False
         paths = glob.glob(str(Env.get().file_cache_dir / '*'))
-        entries = [CacheEntry.from_file(Path(path_str)) for path_str in paths]
+        entries = [
+            CacheEntry.from_file(Path(path_str)) for path_str in paths if not path_str.endswith(_VALIDATORS_SUFFIX)
+        ]
         # we need to insert entries in access order
         entries.sort(key=lambda e: e.last_used)
         for entry in entries:
@@ -148,7 +174,7 @@ class FileCache:
             entries_to_remove = [e for e in self.cache.values() if e.tbl_id == tbl_id]
             _logger.debug(f'clearing {self.num_files(tbl_id)} entries from file cache for table {tbl_id}')
         for entry in entries_to_remove:
-            os.remove(entry.path)
+            entry.remove()
             del self.cache[entry.key]
             self.total_size -= entry.size
 
@@ -192,14 +218,31 @@ class FileCache:
         _logger.debug(f'file cache hit for {url}')
         return path
 
-    def add(self, tbl_id: UUID, col_id: int, url: str, path: Path) -> Path:
+    def validators(self, url: str) -> Optional[HttpValidators]:
+        """Returns the HTTP validators of the cached file for url, if any"""
+        entry = self.cache.get(self._url_hash(url))
+        return None if entry is None else entry.validators
+
+    def set_validators(self, url: str, validators: HttpValidators) -> None:
+        """Records new validators for the cached file for url, eg, after it was revalidated"""
+        entry = self.cache.get(self._url_hash(url))
+        if entry is None:
+            return
+        entry.validators = validators
+        entry.save_validators()
+
+    def add(self, tbl_id: UUID, col_id: int, url: str, path: Path, validators: Optional[HttpValidators] = None) -> Path:
         """Adds url at 'path' to cache and returns its new path.
         'path' will not be accessible after this call. Retains the extension of 'path'.
+        If url is already cached (ie, it was downloaded again because it was modified), the old entry is replaced.
         """
         file_info = os.stat(str(path))
-        self.ensure_capacity(file_info.st_size)
         key = self._url_hash(url)
-        assert key not in self.cache
+        if key in self.cache:
+            old_entry = self.cache.pop(key)
+            self.total_size -= old_entry.size
+            old_entry.remove()
+        self.ensure_capacity(file_info.st_size)
         if key in self.keys_evicted_after_retrieval:
             # This key was evicted after being retrieved earlier this session, and is now being retrieved again.
             # Add it to `keys_multiply_downloaded` so that we may generate a warning later.
@@ -207,13 +250,20 @@ class FileCache:
             self.new_redownload_witnessed = True
         self.keys_retrieved.add(key)
         entry = CacheEntry(
-            key, tbl_id, col_id, file_info.st_size, datetime.fromtimestamp(file_info.st_mtime), path.suffix
+            key,
+            tbl_id,
+            col_id,
+            file_info.st_size,
+            datetime.fromtimestamp(file_info.st_mtime),
+            path.suffix,
+            None if validators is None or validators.is_empty else validators,
         )
         self.cache[key] = entry
         self.total_size += entry.size
         new_path = entry.path
         os.rename(str(path), str(new_path))
         new_path.touch(exist_ok=True)
+        entry.save_validators()
         _logger.debug(f'FileCache: cached url {url} with file name {new_path}')
         return new_path
 
@@ -229,7 +279,7 @@ class FileCache:
                 # This key was retrieved at some point earlier this session and is now being evicted.
                 # Make a record of the eviction, so that we can generate a warning later if the key is retrieved again.
                 self.keys_evicted_after_retrieval.add(lru_entry.key)
-            os.remove(str(lru_entry.path))
+            lru_entry.remove()
             _logger.debug(
                 f'evicted entry for cell {lru_entry.key} from file cache (of size {lru_entry.size // (1 << 20)} MiB)'
             )
@@ -0,0 +1,133 @@
+"""
+A shared, connection-pooled HTTP client for fetching media files.
+
+All HTTP(S) media downloads (HTTPStore, CachePrefetchNode) go through the client returned by http_client(), so that
+connections (and their TLS sessions) are reused across files. The client is configured in the [http] config section.
+"""
+
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from typing import ClassVar, NamedTuple, Optional
+
+import httpx
+
+from pixeltable import env
+
+_logger = logging.getLogger('pixeltable')
+
+
+class HttpValidators(NamedTuple):
+    """The validators of a downloaded file, used to revalidate it with a conditional GET"""
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated_at: float  # time.time() of the last download or revalidation
+
+    @property
+    def is_empty(self) -> bool:
+        return self.etag is None and self.last_modified is None
+
+
+class HttpClient:
+    """
+    A thread-safe HTTP client with keep-alive connection pooling, HTTP/2 (if the h2 package is installed) and a limit
+    on the number of concurrent requests per host.
+    """
+
+    DEFAULT_MAX_CONNECTIONS: ClassVar[int] = 100
+    DEFAULT_MAX_CONNECTIONS_PER_HOST: ClassVar[int] = 16
+    CHUNK_SIZE: ClassVar[int] = 2**20
+
+    client: httpx.Client
+    max_connections_per_host: int
+    # cached files are revalidated with a conditional GET if they were last validated more than this many seconds ago;
+    # None: cached files are never revalidated
+    revalidate_after_s: Optional[int]
+    host_semaphores: dict[str, threading.BoundedSemaphore]
+    lock: threading.Lock
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_connections_per_host: Optional[int] = None,
+        http2: Optional[bool] = None,
+        revalidate_after_s: Optional[int] = None,
+    ):
+        if http2 is None:
+            http2 = env.Env.get().is_installed_package('h2')
+        max_connections = max_connections or self.DEFAULT_MAX_CONNECTIONS
+        self.client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            http2=http2,
+            timeout=httpx.Timeout(30.0, connect=15.0),
+            follow_redirects=True,
+            headers={'User-Agent': 'pixeltable'},
+        )
+        self.max_connections_per_host = max_connections_per_host or self.DEFAULT_MAX_CONNECTIONS_PER_HOST
+        self.revalidate_after_s = revalidate_after_s
+        self.host_semaphores = {}
+        self.lock = threading.Lock()
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urllib.parse.urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(self.max_connections_per_host)
+            return self.host_semaphores[host]
+
+    def needs_revalidation(self, validators: Optional[HttpValidators]) -> bool:
+        """Returns True if a cached file with the given validators should be revalidated"""
+        if self.revalidate_after_s is None or validators is None or validators.is_empty:
+            return False
+        return time.time() - validators.validated_at > self.revalidate_after_s
+
+    def download(
+        self, url: str, dest_path: Path, validators: Optional[HttpValidators] = None
+    ) -> Optional[HttpValidators]:
+        """
+        Downloads url to dest_path. If validators are given, issues a conditional GET.
+
+        Returns:
+            The validators of the downloaded file, or None if the server indicated that the file identified by
+            validators hasn't been modified (in which case dest_path isn't created).
+        """
+        headers: dict[str, str] = {}
+        if validators is not None:
+            if validators.etag is not None:
+                headers['If-None-Match'] = validators.etag
+            if validators.last_modified is not None:
+                headers['If-Modified-Since'] = validators.last_modified
+        with self._host_semaphore(url), self.client.stream('GET', url, headers=headers) as resp:
+            if resp.status_code == httpx.codes.NOT_MODIFIED and validators is not None:
+                _logger.debug(f'HTTP: {url} not modified')
+                return None
+            resp.raise_for_status()
+            with open(dest_path, 'wb') as f:
+                for chunk in resp.iter_bytes(self.CHUNK_SIZE):
+                    f.write(chunk)
+                f.flush()  # Ensures Python buffers are written to OS
+                os.fsync(f.fileno())  # Forces OS to write to physical storage
+            _logger.debug(f'HTTP: downloaded {url} (http_version={resp.http_version})')
+            return HttpValidators(resp.headers.get('ETag'), resp.headers.get('Last-Modified'), time.time())
+
+    def close(self) -> None:
+        self.client.close()
+
+
+@env.register_client('http')
+def _(
+    max_connections: Optional[int] = None,
+    max_connections_per_host: Optional[int] = None,
+    http2: Optional[bool] = None,
+    revalidate_after_s: Optional[int] = None,
+) -> HttpClient:
+    return HttpClient(max_connections, max_connections_per_host, http2, revalidate_after_s)
+
+
+def http_client() -> HttpClient:
+    """Returns the shared HttpClient"""
+    return env.Env.get().get_client('http')
@@ -168,6 +168,34 @@ class LocalStore(ObjectStoreBase):
         _logger.debug(f'Media Storage: copied {src_path} to {new_file_url}')
         return new_file_url
 
+    def blob_url(self, content_hash: str, ext: Optional[str]) -> str:
+        prefix, filename = ObjectPath.create_blob_prefix(content_hash, ext)
+        dest_path = self.__base_dir / Path(prefix) / filename
+        return urllib.parse.urljoin('file:', urllib.request.pathname2url(str(dest_path)))
+
+    def put_blob(self, src_path: Path, url: str, move: bool) -> None:
+        """Store a local file under its content-addressed URL, unless it's already present"""
+        dest_path = self.resolve_url(url)
+        assert dest_path is not None, url
+        if dest_path.exists():
+            _logger.debug(f'Media Storage: {src_path} already stored as {url}')
+            return
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        # a concurrent writer of the same blob writes identical contents, so we simply let the last rename win
+        if move:
+            src_path.rename(dest_path)
+        else:
+            tmp_path = dest_path.parent / f'{dest_path.name}.{uuid.uuid4().hex}.tmp'
+            shutil.copy2(src_path, tmp_path)
+            os.replace(tmp_path, dest_path)
+        _logger.debug(f'Media Storage: stored {src_path} as {url}')
+
+    def delete_blob(self, url: str) -> None:
+        path = self.resolve_url(url)
+        assert path is not None, url
+        path.unlink(missing_ok=True)
+        _logger.debug(f'Media Storage: deleted {url}')
+
     def save_media_object(self, data: bytes | PIL.Image.Image, col: Column, format: Optional[str]) -> tuple[Path, str]:
         """Save a data object to a file in a LocalStore
         Returns:
@@ -226,12 +254,22 @@ class LocalStore(ObjectStoreBase):
         # Filter out directories, only count files
         return len([p for p in paths if not os.path.isdir(p)])
 
+    def list_files(self, tbl_id: UUID) -> list[Path]:
+        """
+        Return the paths of all files for given tbl_id.
+        """
+        table_prefix = ObjectPath.table_prefix(tbl_id)
+        paths = glob.glob(str(self.__base_dir / table_prefix) + f'/**/{table_prefix}_*', recursive=True)
+        return [Path(p) for p in paths if not os.path.isdir(p)]
+
     def stats(self) -> list[tuple[UUID, int, int, int]]:
         paths = glob.glob(str(self.__base_dir) + '/**', recursive=True)
+        blob_dir = str(self.__base_dir / ObjectPath.BLOB_PREFIX)
         # key: (tbl_id, col_id), value: (num_files, size)
         d: dict[tuple[UUID, int], list[int]] = defaultdict(lambda: [0, 0])
         for p in paths:
-            if not os.path.isdir(p):
+            # content-addressed files aren't owned by a single table
+            if not os.path.isdir(p) and not p.startswith(blob_dir):
                 matched = re.match(ObjectPath.PATTERN, Path(p).name)
                 assert matched is not None
                 tbl_id, col_id = UUID(hex=matched[1]), int(matched[2])
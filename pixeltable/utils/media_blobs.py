@@ -0,0 +1,139 @@
+"""
+Content-addressed media storage.
+
+If the media_dedup config option is set, ObjectStoreSaveNode stores media files under the sha256 hash of their
+contents (see ObjectPath.create_blob_prefix()), so that identical files are stored (and uploaded) only once per
+destination. Each table version that stores a file records a reference to it in the mediablobs table; the file is
+deleted when the last reference is released:
+- the references of a table version are released when that version is reverted, which physically removes its rows
+- the references of a table are released when the table is dropped
+delete() and update() don't release references: the rows they supersede remain visible in earlier versions of the
+table, and revert() restores them.
+
+A reference is committed before its file is stored, and files are deleted only after the absence of other references
+has been checked. Both steps run in their own transactions under a per-file advisory lock, so that a file can't be
+deleted while another table is in the process of storing it. The files of references released by a catalog operation
+are deleted only after that operation's transaction has committed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from pathlib import Path
+from typing import NamedTuple, Optional
+from uuid import UUID
+
+import sqlalchemy as sql
+from sqlalchemy.dialects.postgresql import insert
+
+from pixeltable.env import Env
+from pixeltable.metadata import schema
+from pixeltable.utils.object_stores import ObjectOps
+
+_logger = logging.getLogger('pixeltable')
+
+CHUNK_SIZE = 2**20
+
+
+class BlobRef(NamedTuple):
+    tbl_id: UUID
+    tbl_version: int  # the table version that stored the file
+    destination: str  # '' for the default media location
+    blob_name: str
+    url: str
+
+
+def content_hash(path: Path) -> str:
+    """Returns the sha256 hex digest of the contents of path"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _connect() -> sql.Connection:
+    """Returns a connection that's independent of the current transaction"""
+    return Env.get().engine.connect().execution_options(isolation_level='READ COMMITTED')
+
+
+def _lock_blob(conn: sql.Connection, destination: str, blob_name: str) -> None:
+    """Acquire the advisory lock of a content-addressed file for the duration of the transaction of conn"""
+    conn.execute(sql.select(sql.func.pg_advisory_xact_lock(sql.func.hashtextextended(f'{destination}/{blob_name}', 0))))
+
+
+def add_ref(ref: BlobRef) -> bool:
+    """
+    Record a reference from a table version to a content-addressed file; this is committed immediately.
+
+    Returns:
+        True if the reference didn't exist yet
+    """
+    with _connect() as conn, conn.begin():
+        _lock_blob(conn, ref.destination, ref.blob_name)
+        stmt = insert(schema.MediaBlob).values(ref._asdict()).on_conflict_do_nothing().returning(schema.MediaBlob.url)
+        return conn.execute(stmt).first() is not None
+
+
+def release_table(tbl_id: UUID, tbl_version: Optional[int] = None) -> None:
+    """
+    Remove the references of tbl_id (or only those of tbl_version) as part of the current transaction; the
+    content-addressed files that are no longer referenced are deleted after the transaction has committed.
+    """
+    stmt = sql.delete(schema.MediaBlob).where(schema.MediaBlob.tbl_id == tbl_id)
+    if tbl_version is not None:
+        stmt = stmt.where(schema.MediaBlob.tbl_version == tbl_version)
+    stmt = stmt.returning(
+        schema.MediaBlob.tbl_version, schema.MediaBlob.destination, schema.MediaBlob.blob_name, schema.MediaBlob.url
+    )
+    refs = [BlobRef(tbl_id, *row) for row in Env.get().conn.execute(stmt)]
+    _logger.debug(f'Media Storage: released {len(refs)} files of table {tbl_id}')
+    if len(refs) > 0:
+
+        def delete_unreferenced() -> None:
+            _delete_unreferenced(refs)
+
+        Env.get().on_commit(delete_unreferenced)
+
+
+def release_refs(refs: list[BlobRef]) -> int:
+    """
+    Remove references that were recorded with add_ref() (eg, by a query that subsequently failed) and delete the
+    content-addressed files that are no longer referenced.
+
+    Returns:
+        number of deleted files
+    """
+    if len(refs) == 0:
+        return 0
+    with _connect() as conn, conn.begin():
+        for ref in refs:
+            stmt = (
+                sql.delete(schema.MediaBlob)
+                .where(schema.MediaBlob.destination == ref.destination)
+                .where(schema.MediaBlob.blob_name == ref.blob_name)
+                .where(schema.MediaBlob.tbl_id == ref.tbl_id)
+                .where(schema.MediaBlob.tbl_version == ref.tbl_version)
+            )
+            conn.execute(stmt)
+    return _delete_unreferenced(refs)
+
+
+def _delete_unreferenced(refs: list[BlobRef]) -> int:
+    """Delete the files of released refs that aren't referenced anymore"""
+    num_deleted = 0
+    with _connect() as conn, conn.begin():
+        # acquire the locks in a fixed order to avoid deadlocks with concurrent releases
+        blobs = {(ref.destination, ref.blob_name): ref.url for ref in refs}
+        for (destination, blob_name), url in sorted(blobs.items()):
+            _lock_blob(conn, destination, blob_name)
+            q = (
+                sql.select(sql.func.count())
+                .where(schema.MediaBlob.destination == destination)
+                .where(schema.MediaBlob.blob_name == blob_name)
+            )
+            if conn.execute(q).scalar_one() == 0:
+                ObjectOps.get_store(destination or None, False).delete_blob(url)
+                num_deleted += 1
+    return num_deleted
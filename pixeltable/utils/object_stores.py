@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import enum
-import os
 import re
 import urllib.parse
 import urllib.request
@@ -112,6 +111,9 @@ class StorageObjectAddress(NamedTuple):
 
 class ObjectPath:
     PATTERN = re.compile(r'([0-9a-fA-F]+)_(\d+)_(\d+)_([0-9a-fA-F]+)')  # tbl_id, col_id, version, uuid
+    # content-addressed media files (see utils.media_blobs) are stored under this prefix
+    BLOB_PREFIX = 'blobs'
+    BLOB_PATTERN = re.compile(rf'{BLOB_PREFIX}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/([0-9a-f]{{64}}[^/]*)$')  # blob name
 
     @classmethod
     def table_prefix(cls, tbl_id: UUID) -> str:
@@ -129,12 +131,34 @@ class ObjectPath:
             prefix: a unix-style prefix for the file without leading/trailing slashes
             filename: a unique filename for the file without leading slashes
         """
+        return cls.prefix_raw(tbl_id, col_id, tbl_version, uuid.uuid4().hex, ext)
+
+    @classmethod
+    def prefix_raw(
+        cls, tbl_id: UUID, col_id: int, tbl_version: int, id_hex: str, ext: Optional[str] = None
+    ) -> tuple[str, str]:
+        """Returns the prefix and filename of the persisted file with the given uuid (see create_prefix_raw())"""
         table_prefix = cls.table_prefix(tbl_id)
-        id_hex = uuid.uuid4().hex
         prefix = f'{table_prefix}/{id_hex[:2]}/{id_hex[:4]}'
         filename = f'{table_prefix}_{col_id}_{tbl_version}_{id_hex}{ext or ""}'
         return prefix, filename
 
+    @classmethod
+    def create_blob_prefix(cls, content_hash: str, ext: Optional[str] = None) -> tuple[str, str]:
+        """Construct the unix-style prefix and filename of a content-addressed file.
+        Returns:
+            prefix: a unix-style prefix for the file without leading/trailing slashes
+            filename: the filename of the file (which is also its blob name)
+        """
+        assert len(content_hash) == 64
+        return f'{cls.BLOB_PREFIX}/{content_hash[:2]}/{content_hash[2:4]}', f'{content_hash}{ext or ""}'
+
+    @classmethod
+    def blob_name(cls, url: str) -> Optional[str]:
+        """Returns the blob name if url refers to a content-addressed file, else None."""
+        matched = cls.BLOB_PATTERN.search(url)
+        return None if matched is None else matched[1]
+
     @classmethod
     def separate_prefix_object(cls, path_and_object: str, may_contain_object_name: bool) -> tuple[str, str]:
         path = path_and_object
@@ -315,6 +339,27 @@ class ObjectStoreBase:
         """
         return None
 
+    def blob_url(self, content_hash: str, ext: Optional[str]) -> Optional[str]:
+        """Returns the URL of the content-addressed file with the given content hash and extension,
+        or None if the store doesn't support content-addressed storage.
+        """
+        return None
+
+    def put_blob(self, src_path: Path, url: str, move: bool) -> None:
+        """Store a local file under a URL returned by blob_url().
+        If a file with the same content is already present, the upload is skipped.
+
+        Args:
+            src_path: The Path to the local file
+            url: The URL returned by blob_url() for the file's contents
+            move: If True, the local file may be moved into the store
+        """
+        raise AssertionError
+
+    def delete_blob(self, url: str) -> None:
+        """Delete a content-addressed file that was stored with put_blob()."""
+        raise AssertionError
+
     def copy_object_to_local_file(self, src_path: str, dest_path: Path) -> None:
         """Copies an object from the store to a local media file.
 
@@ -453,6 +498,28 @@ class ObjectOps:
             TempStore.delete_media_file(src_path)
         return new_file_url
 
+    @classmethod
+    def blob_url(cls, col: Column, src_path: Path) -> Optional[str]:
+        """Returns the URL under which the contents of src_path are stored content-addressed in the destination,
+        or None if the destination doesn't support content-addressed storage.
+        """
+        from pixeltable.utils.media_blobs import content_hash
+
+        store = cls.get_store(col.destination, False, col.name)
+        return store.blob_url(content_hash(src_path), src_path.suffix)
+
+    @classmethod
+    def put_blob(cls, col: Column, src_path: Path, url: str, relocate_or_delete: bool) -> None:
+        """Store a file under a URL returned by blob_url().
+        If relocate_or_delete is True and the file is in the TempStore, the file will be deleted after the operation.
+        """
+        from pixeltable.utils.local_store import TempStore
+
+        store = cls.get_store(col.destination, False, col.name)
+        store.put_blob(src_path, url, relocate_or_delete)
+        if relocate_or_delete and src_path.exists():
+            TempStore.delete_media_file(src_path)
+
     @classmethod
     def move_local_file(cls, col: Column, src_path: Path) -> str:
         """Move a file to the destination specified by the Column, returning the file's URL within the destination."""
@@ -505,8 +572,6 @@ class HTTPStore(ObjectStoreBase):
             self.base_url += '/'
 
     def copy_object_to_local_file(self, src_path: str, dest_path: Path) -> None:
-        with urllib.request.urlopen(self.base_url + src_path) as resp, open(dest_path, 'wb') as f:
-            data = resp.read()
-            f.write(data)
-            f.flush()  # Ensures Python buffers are written to OS
-            os.fsync(f.fileno())  # Forces OS to write to physical storage
+        from pixeltable.utils.http_client import http_client
+
+        http_client().download(self.base_url + src_path, dest_path)
@@ -0,0 +1,117 @@
+"""
+Rate limit budgets that are shared by all processes using the same Pixeltable database.
+
+The schedulers in exec/expr_eval/schedulers.py only know about the requests of their own process. If the
+shared_rate_limits config option is set, they also draw from a token bucket per resource pool and resource, which is
+stored in the ratelimitbuckets table, before issuing a request. That way, processes that call the same provider
+account (such as the workers of a backfill) split its budget, instead of each one assuming that it owns all of it.
+
+Buckets are refilled lazily: each acquisition computes the current number of tokens from the elapsed (database) time.
+Waiting processes retry after the time it takes to refill the missing tokens, plus some jitter, so that no process
+is consistently first in line.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+from typing import Mapping
+
+import sqlalchemy as sql
+from sqlalchemy.dialects.postgresql import insert
+
+from pixeltable.config import Config
+from pixeltable.env import Env
+from pixeltable.metadata import schema
+
+_logger = logging.getLogger('pixeltable')
+
+
+def is_enabled() -> bool:
+    return Config.get().get_bool_value('shared_rate_limits') or False
+
+
+class SharedRateLimits:
+    """The token buckets of a resource pool"""
+
+    pool_id: str
+    limits: dict[str, tuple[float, float]]  # resource -> (capacity, refill rate) last recorded in the db
+
+    MAX_WAIT = 10.0  # in seconds; upper bound of the wait time returned by try_acquire()
+    WAIT_JITTER = 0.1  # fraction of the wait time that is added at random
+
+    def __init__(self, pool_id: str):
+        self.pool_id = pool_id
+        self.limits = {}
+
+    def try_acquire(self, amounts: Mapping[str, float], limits: Mapping[str, tuple[float, float]]) -> float:
+        """
+        Takes the given amounts from the buckets of the resources, if all of them have sufficient tokens. An amount
+        that exceeds the capacity of its bucket is taken once the bucket is full.
+
+        Blocks on database access; call it via asyncio.to_thread() from the event loop.
+
+        Args:
+            amounts: resource -> number of tokens
+            limits: resource -> (capacity, tokens per second); buckets are created or resized as needed
+
+        Returns:
+            0.0 if the tokens were taken, otherwise the number of seconds to wait before trying again
+        """
+        resources = sorted(r for r in amounts if limits.get(r, (0.0, 0.0))[1] > 0.0)
+        if len(resources) == 0:
+            return 0.0
+        # row locks need read committed isolation: we don't want to fail on concurrent updates, but wait for them
+        with Env.get().engine.connect().execution_options(isolation_level='READ COMMITTED') as conn, conn.begin():
+            self._record_limits(conn, {r: limits[r] for r in resources})
+            t = schema.RateLimitBucket
+            elapsed = sql.func.extract('epoch', sql.func.clock_timestamp() - t.updated_at)
+            q = (
+                sql.select(t.resource, t.capacity, t.refill_rate, t.tokens, elapsed)
+                .where(t.pool_id == self.pool_id, t.resource.in_(resources))
+                .order_by(t.resource)  # lock rows in a fixed order
+                .with_for_update()
+            )
+            available: dict[str, float] = {}
+            wait = 0.0
+            for resource, capacity, refill_rate, tokens, elapsed_secs in conn.execute(q):
+                available[resource] = min(capacity, tokens + refill_rate * max(float(elapsed_secs), 0.0))
+                needed = min(amounts[resource], capacity)
+                if available[resource] < needed:
+                    wait = max(wait, (needed - available[resource]) / refill_rate)
+            assert len(available) == len(resources)
+            if wait > 0.0:
+                return min(wait * (1.0 + random.uniform(0.0, self.WAIT_JITTER)), self.MAX_WAIT)
+
+            for resource in resources:
+                conn.execute(
+                    sql.update(t)
+                    .where(t.pool_id == self.pool_id, t.resource == resource)
+                    .values(tokens=available[resource] - amounts[resource], updated_at=sql.func.clock_timestamp())
+                )
+            return 0.0
+
+    def _record_limits(self, conn: sql.Connection, limits: Mapping[str, tuple[float, float]]) -> None:
+        """Creates missing buckets and updates the limits of existing ones"""
+        changed = {r: limit for r, limit in limits.items() if self.limits.get(r) != limit}
+        if len(changed) == 0:
+            return
+        values = [
+            {
+                'pool_id': self.pool_id,
+                'resource': resource,
+                'capacity': capacity,
+                'refill_rate': refill_rate,
+                'tokens': capacity,
+                'updated_at': sql.func.clock_timestamp(),
+            }
+            for resource, (capacity, refill_rate) in changed.items()
+        ]
+        stmt = insert(schema.RateLimitBucket).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['pool_id', 'resource'],
+            set_={'capacity': stmt.excluded.capacity, 'refill_rate': stmt.excluded.refill_rate},
+        )
+        conn.execute(stmt)
+        self.limits.update(changed)
+        _logger.debug(f'shared rate limits for {self.pool_id}: {changed}')
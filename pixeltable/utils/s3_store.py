@@ -1,13 +1,17 @@
+from __future__ import annotations
+
 import logging
 import re
 import threading
 import urllib.parse
 import uuid
+from concurrent import futures
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Iterator, NamedTuple, Optional
+from typing import TYPE_CHECKING, Any, ClassVar, Iterator, NamedTuple, Optional
 
 import boto3
 import botocore
+import tenacity
 from botocore.exceptions import ClientError
 
 from pixeltable import env, exceptions as excs
@@ -69,6 +73,163 @@ def _() -> Any:
     return S3Store.create_boto_resource(profile_name=profile_name)
 
 
+def is_retryable_error(e: BaseException) -> bool:
+    """Returns True if e is a transient error, ie, the failed request can be retried"""
+    if isinstance(e, ClientError):
+        error_code = e.response.get('Error', {}).get('Code')
+        status_code = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return error_code in MultipartUpload.RETRYABLE_ERROR_CODES or status_code >= 500
+    return isinstance(e, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError))
+
+
+# defaults of the upload settings (see UploadSettings)
+DEFAULT_UPLOAD_PART_SIZE_MB = 16
+DEFAULT_UPLOAD_CONCURRENCY = 4
+
+
+class UploadSettings(NamedTuple):
+    """Upload settings of a type of store, configured in the config section of its storage target (eg, [s3])"""
+
+    part_size: int
+    concurrency: int
+
+    @classmethod
+    def for_target(cls, storage_target: StorageTarget) -> UploadSettings:
+        config = Config.get()
+        section = str(storage_target)
+        part_size_mb = config.get_int_value('upload_part_size_mb', section) or DEFAULT_UPLOAD_PART_SIZE_MB
+        if part_size_mb * 2**20 < MultipartUpload.MIN_PART_SIZE:
+            raise excs.Error(
+                f'[{section}] upload_part_size_mb must be at least {MultipartUpload.MIN_PART_SIZE // 2**20}, '
+                f'got {part_size_mb}'
+            )
+        concurrency = config.get_int_value('upload_concurrency', section) or DEFAULT_UPLOAD_CONCURRENCY
+        if concurrency < 1:
+            raise excs.Error(f'[{section}] upload_concurrency must be a positive integer, got {concurrency}')
+        return cls(part_size_mb * 2**20, concurrency)
+
+
+class MultipartUpload:
+    """
+    A multipart upload of a local file to an S3-compatible store.
+
+    Parts are uploaded concurrently, and each part is retried individually on transient errors. If run() fails, the
+    upload can be resumed by calling run() again: parts that were already uploaded aren't uploaded again.
+    abort() discards the uploaded parts.
+
+    An upload that was left unfinished, eg, by an earlier process, is also resumed: the store keeps track of unfinished
+    uploads, and run() picks up the uploaded parts of the most recent unfinished upload of the same key via
+    list_parts(). Uploaded parts are only reused if their size matches; since the keys of media files are either
+    content-addressed or unique, a part of the right size has the right content.
+    """
+
+    # limits imposed by S3
+    MIN_PART_SIZE: ClassVar[int] = 5 * 2**20
+    MAX_PARTS: ClassVar[int] = 10000
+
+    PART_ATTEMPTS: ClassVar[int] = 5
+    RETRYABLE_ERROR_CODES: ClassVar[frozenset[str]] = frozenset(
+        ['RequestTimeout', 'RequestTimeTooSkewed', 'SlowDown', 'Throttling', 'InternalError', 'ServiceUnavailable']
+    )
+
+    client: Any
+    bucket: str
+    key: str
+    src_path: Path
+    size: int
+    part_size: int
+    concurrency: int
+    upload_id: Optional[str]
+    etags: dict[int, str]  # part number -> ETag of uploaded part
+
+    def __init__(self, client: Any, bucket: str, key: str, src_path: Path, part_size: int, concurrency: int):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.src_path = src_path
+        self.size = src_path.stat().st_size
+        # parts need to be large enough to stay within MAX_PARTS
+        self.part_size = max(part_size, self.MIN_PART_SIZE, -(-self.size // self.MAX_PARTS))
+        self.concurrency = concurrency
+        self.upload_id = None
+        self.etags = {}
+
+    @property
+    def num_parts(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    def part_len(self, part_number: int) -> int:
+        return min(self.part_size, self.size - (part_number - 1) * self.part_size)
+
+    def run(self) -> None:
+        if self.upload_id is None:
+            self._find_unfinished_upload()
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self.upload_id = response['UploadId']
+        missing = [n for n in range(1, self.num_parts + 1) if n not in self.etags]
+        exc: Optional[Exception] = None
+        with futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            part_futures = {executor.submit(self._upload_part, n): n for n in missing}
+            for f in futures.as_completed(part_futures):
+                try:
+                    self.etags[part_futures[f]] = f.result()
+                except Exception as e:
+                    if exc is None:
+                        exc = e
+        if exc is not None:
+            raise exc
+        parts = [{'ETag': self.etags[n], 'PartNumber': n} for n in range(1, self.num_parts + 1)]
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts}
+        )
+
+    def _find_unfinished_upload(self) -> None:
+        """Resume the most recent unfinished upload of our key, if there is one"""
+        response = self.client.list_multipart_uploads(Bucket=self.bucket, Prefix=self.key)
+        uploads = [u for u in response.get('Uploads', []) if u['Key'] == self.key]
+        if len(uploads) == 0:
+            return
+        upload_id = max(uploads, key=lambda u: u['Initiated'])['UploadId']
+        etags: dict[int, str] = {}
+        paginator = self.client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket, Key=self.key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                part_number = part['PartNumber']
+                if part_number <= self.num_parts and part['Size'] == self.part_len(part_number):
+                    etags[part_number] = part['ETag']
+        _logger.debug(f'Media Storage: resuming upload of {self.key} ({len(etags)}/{self.num_parts} parts done)')
+        self.upload_id = upload_id
+        self.etags = etags
+
+    def _upload_part(self, part_number: int) -> str:
+        """Upload a single part and return its ETag"""
+        with open(self.src_path, 'rb') as f:
+            f.seek((part_number - 1) * self.part_size)
+            data = f.read(self.part_size)
+        for attempt in tenacity.Retrying(
+            retry=tenacity.retry_if_exception(is_retryable_error),
+            stop=tenacity.stop_after_attempt(self.PART_ATTEMPTS),
+            wait=tenacity.wait_exponential_jitter(initial=0.5, max=10.0),
+            reraise=True,
+        ):
+            with attempt:
+                response = self.client.upload_part(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=data
+                )
+        return response['ETag']
+
+    def abort(self) -> None:
+        if self.upload_id is None:
+            return
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            _logger.warning(f'Failed to abort multipart upload of {self.src_path} to {self.key}: {e}')
+        self.upload_id = None
+        self.etags.clear()
+
+
 class S3Store(ObjectStoreBase):
     """Wrapper for an s3 storage target with all needed methods."""
 
@@ -82,6 +243,9 @@ class S3Store(ObjectStoreBase):
     # prefix path within the bucket, either empty or ending with a slash
     __prefix_name: str
 
+    # number of times a failed multipart upload is resumed, not counting retries of individual parts
+    UPLOAD_ATTEMPTS: ClassVar[int] = 3
+
     soa: StorageObjectAddress
 
     def __init__(self, soa: StorageObjectAddress):
@@ -187,22 +351,85 @@ class S3Store(ObjectStoreBase):
             self.handle_s3_error(e, self.bucket_name, f'download file {src_path}')
             raise
 
-    def copy_local_file(self, col: 'Column', src_path: Path) -> str:
-        """Copy a local file, and return its new URL"""
-        new_file_uri = self._prepare_uri(col, ext=src_path.suffix)
-        parsed = urllib.parse.urlparse(new_file_uri)
+    def _uri_to_key(self, uri: str) -> str:
+        """Return the object key of a URI within this store"""
+        parsed = urllib.parse.urlparse(uri)
         key = parsed.path.lstrip('/')
         if self.soa.storage_target in {StorageTarget.R2_STORE, StorageTarget.B2_STORE}:
             key = key.split('/', 1)[-1]  # Remove the bucket name from the key for R2/B2
+        return key
+
+    def _upload_file(self, src_path: Path, key: str) -> None:
+        """
+        Upload a local file. Files that are larger than the part size are uploaded in parts (see MultipartUpload);
+        if an upload fails, it is resumed up to UPLOAD_ATTEMPTS times. An upload that still fails with a transient
+        error is left in place, so that a later upload of the same key can resume it; an upload that fails with a
+        permanent error is aborted.
+        """
+        settings = UploadSettings.for_target(self.soa.storage_target)
+        if src_path.stat().st_size <= settings.part_size:
+            # a single request, which is retried by botocore
+            self.client().upload_file(Filename=str(src_path), Bucket=self.bucket_name, Key=key)
+            return
+        upload = MultipartUpload(
+            self.client(), self.bucket_name, key, src_path, settings.part_size, settings.concurrency
+        )
+        for attempt in range(1, self.UPLOAD_ATTEMPTS + 1):
+            try:
+                upload.run()
+                return
+            except Exception as e:
+                if not is_retryable_error(e):
+                    upload.abort()
+                    raise
+                if attempt == self.UPLOAD_ATTEMPTS:
+                    _logger.debug(f'Media Storage: leaving unfinished upload of {src_path} to {key} for a later resume')
+                    raise
+                _logger.debug(
+                    f'Media Storage: resuming upload of {src_path} ({len(upload.etags)}/{upload.num_parts} parts done)'
+                    f' after error: {e}'
+                )
+
+    def copy_local_file(self, col: 'Column', src_path: Path) -> str:
+        """Copy a local file, and return its new URL"""
+        new_file_uri = self._prepare_uri(col, ext=src_path.suffix)
+        key = self._uri_to_key(new_file_uri)
         try:
             _logger.debug(f'Media Storage: copying {src_path} to {new_file_uri} : Key: {key}')
-            self.client().upload_file(Filename=str(src_path), Bucket=self.bucket_name, Key=key)
+            self._upload_file(src_path, key)
             _logger.debug(f'Media Storage: copied {src_path} to {new_file_uri}')
             return new_file_uri
         except ClientError as e:
             self.handle_s3_error(e, self.bucket_name, f'setup iterator {self.prefix}')
             raise
 
+    def blob_url(self, content_hash: str, ext: Optional[str]) -> str:
+        prefix, filename = ObjectPath.create_blob_prefix(content_hash, ext)
+        return f'{self.__base_uri}{prefix}/{filename}'
+
+    def put_blob(self, src_path: Path, url: str, move: bool) -> None:
+        """Upload a local file under its content-addressed URL, unless it's already present"""
+        key = self._uri_to_key(url)
+        try:
+            self.client().head_object(Bucket=self.bucket_name, Key=key)
+            _logger.debug(f'Media Storage: {src_path} already stored as {url}')
+            return
+        except ClientError as e:
+            self.handle_s3_error(e, self.bucket_name, f'check object {key}', ignore_404=True)
+        try:
+            self._upload_file(src_path, key)
+            _logger.debug(f'Media Storage: stored {src_path} as {url}')
+        except ClientError as e:
+            self.handle_s3_error(e, self.bucket_name, f'upload file {key}')
+            raise
+
+    def delete_blob(self, url: str) -> None:
+        key = self._uri_to_key(url)
+        try:
+            self.client().delete_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            self.handle_s3_error(e, self.bucket_name, f'delete object {key}', ignore_404=True)
+
     def _get_filtered_objects(self, tbl_id: uuid.UUID, tbl_version: Optional[int] = None) -> tuple[Iterator, Any]:
         """Private method to get filtered objects for a table, optionally filtered by version.
 
@@ -0,0 +1,233 @@
+"""
+Mergeable sketches for approximate aggregation (see pixeltable.functions.sketch).
+
+Sketches are serialized as JSON-compatible dicts, so that they can be stored in Json columns and merged later (eg,
+daily sketches can be combined into a monthly one without looking at the underlying rows again).
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime
+import hashlib
+import json
+import math
+import random
+from typing import Any, ClassVar, Iterable, Optional
+
+import numpy as np
+
+from pixeltable import exceptions as excs
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch for estimating the number of distinct values (Flajolet et al., 2007), with linear counting for
+    small cardinalities. The relative standard error is about 1.04 / sqrt(2**precision).
+
+    Values are hashed with a 64-bit BLAKE2b hash of a canonical byte representation, so that sketches created in
+    different processes can be merged.
+    """
+
+    DEFAULT_PRECISION: ClassVar[int] = 14
+    MIN_PRECISION: ClassVar[int] = 4
+    MAX_PRECISION: ClassVar[int] = 18
+
+    precision: int
+    registers: np.ndarray  # of uint8
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[np.ndarray] = None):
+        if not self.MIN_PRECISION <= precision <= self.MAX_PRECISION:
+            raise excs.Error(
+                f'HyperLogLog precision must be between {self.MIN_PRECISION} and {self.MAX_PRECISION}: {precision}'
+            )
+        self.precision = precision
+        self.registers = np.zeros(2**precision, dtype=np.uint8) if registers is None else registers
+
+    @classmethod
+    def _to_bytes(cls, val: Any) -> bytes:
+        # the type tag keeps values of different types apart (eg, '1' and 1)
+        if isinstance(val, str):
+            return b's' + val.encode()
+        if isinstance(val, (dict, list)):
+            return b'j' + json.dumps(val, sort_keys=True, default=str).encode()
+        if isinstance(val, datetime.datetime):
+            return b't' + val.isoformat().encode()
+        if isinstance(val, datetime.date):
+            return b'd' + val.isoformat().encode()
+        return type(val).__name__.encode() + b':' + repr(val).encode()
+
+    @classmethod
+    def _hash(cls, vals: list[Any]) -> np.ndarray:
+        hashes = [int.from_bytes(hashlib.blake2b(cls._to_bytes(val), digest_size=8).digest(), 'little') for val in vals]
+        return np.array(hashes, dtype=np.uint64)
+
+    def update(self, vals: list[Any]) -> None:
+        """Adds non-null values to the sketch"""
+        if len(vals) == 0:
+            return
+        hashes = self._hash(vals)
+        # the first precision bits select the register, the rank is the position of the leftmost 1-bit in the rest
+        width = 64 - self.precision
+        idxs = (hashes >> np.uint64(width)).astype(np.int64)
+        rest = hashes & np.uint64((1 << width) - 1)
+        bit_length = np.zeros(len(rest), dtype=np.int64)
+        for shift in (32, 16, 8, 4, 2, 1):
+            mask = rest >= np.uint64(1 << shift)
+            bit_length[mask] += shift
+            rest[mask] >>= np.uint64(shift)
+        bit_length += (rest > 0).astype(np.int64)
+        ranks = (width - bit_length + 1).astype(np.uint8)
+        self.update_registers(idxs, ranks)
+
+    def update_registers(self, idxs: np.ndarray, ranks: np.ndarray) -> None:
+        """Raises registers[idxs] to ranks, where they are lower"""
+        np.maximum.at(self.registers, idxs, ranks.astype(np.uint8))
+
+    def merge(self, other: HyperLogLog) -> None:
+        if other.precision != self.precision:
+            raise excs.Error(
+                f'Cannot merge HyperLogLog sketches with different precisions: {self.precision} and {other.precision}'
+            )
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        raw_estimate = alpha * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        num_zeros = int(np.count_nonzero(self.registers == 0))
+        if raw_estimate <= 2.5 * m and num_zeros > 0:
+            # linear counting
+            return round(m * math.log(m / num_zeros))
+        return round(raw_estimate)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'sketch': 'hll',
+            'precision': self.precision,
+            'registers': base64.b64encode(self.registers.tobytes()).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: Any) -> HyperLogLog:
+        if not isinstance(d, dict) or d.get('sketch') != 'hll':
+            raise excs.Error(f'Not a HyperLogLog sketch: {str(d)[:100]}')
+        registers = np.frombuffer(base64.b64decode(d['registers']), dtype=np.uint8).copy()
+        if len(registers) != 2 ** d['precision']:
+            raise excs.Error(f'Invalid HyperLogLog sketch: {len(registers)} registers for precision {d["precision"]}')
+        return cls(d['precision'], registers)
+
+
+class KllSketch:
+    """
+    KLL quantile sketch (Karnin, Lang, Liberty, 2016) over numeric values.
+
+    Values are stored in a hierarchy of compactors; an item at level h stands for 2**h input values. A compactor that
+    exceeds its capacity is sorted and every other item (starting at a random offset) is promoted to the next level.
+    The rank error is about 1.65 / k, independently of the number of values.
+    """
+
+    DEFAULT_K: ClassVar[int] = 200
+    MIN_K: ClassVar[int] = 8
+    # capacities decrease geometrically with the distance from the top level
+    CAPACITY_DECAY: ClassVar[float] = 2 / 3
+    MIN_CAPACITY: ClassVar[int] = 2
+
+    k: int
+    n: int  # number of values
+    levels: list[list[float]]
+    min_val: Optional[float]
+    max_val: Optional[float]
+    rng: random.Random
+
+    def __init__(self, k: int = DEFAULT_K):
+        if k < self.MIN_K:
+            raise excs.Error(f'KLL sketch size k must be at least {self.MIN_K}: {k}')
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self.min_val = None
+        self.max_val = None
+        # seeded, so that results are reproducible
+        self.rng = random.Random(0)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(self.MIN_CAPACITY, math.ceil(self.k * self.CAPACITY_DECAY**depth))
+
+    def update(self, vals: Iterable[float]) -> None:
+        """Adds non-null values to the sketch"""
+        vals = [float(v) for v in vals]
+        if len(vals) == 0:
+            return
+        self.levels[0].extend(vals)
+        self.n += len(vals)
+        self._update_min_max(min(vals), max(vals))
+        self._compress()
+
+    def _update_min_max(self, min_val: Optional[float], max_val: Optional[float]) -> None:
+        if min_val is not None:
+            self.min_val = min_val if self.min_val is None else min(self.min_val, min_val)
+        if max_val is not None:
+            self.max_val = max_val if self.max_val is None else max(self.max_val, max_val)
+
+    def _compress(self) -> None:
+        while sum(len(level) for level in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            # compact the lowest level that is over capacity
+            h = next(h for h in range(len(self.levels)) if len(self.levels[h]) >= self._capacity(h))
+            if h == len(self.levels) - 1:
+                self.levels.append([])
+            level = sorted(self.levels[h])
+            # an odd item out stays at this level
+            leftover = [level.pop()] if len(level) % 2 == 1 else []
+            offset = self.rng.randint(0, 1)
+            self.levels[h + 1].extend(level[offset::2])
+            self.levels[h] = leftover
+
+    def merge(self, other: KllSketch) -> None:
+        if other.k != self.k:
+            raise excs.Error(f'Cannot merge KLL sketches with different sizes: {self.k} and {other.k}')
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.n += other.n
+        self._update_min_max(other.min_val, other.max_val)
+        self._compress()
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not 0.0 <= q <= 1.0:
+            raise excs.Error(f'Quantile must be between 0 and 1: {q}')
+        if self.n == 0:
+            return None
+        if q == 0.0:
+            return self.min_val
+        if q == 1.0:
+            return self.max_val
+        vals = np.concatenate([np.asarray(level, dtype=np.float64) for level in self.levels])
+        weights = np.concatenate([np.full(len(level), 2**h, dtype=np.int64) for h, level in enumerate(self.levels)])
+        order = np.argsort(vals, kind='stable')
+        cum_weights = np.cumsum(weights[order])
+        idx = int(np.searchsorted(cum_weights, q * cum_weights[-1]))
+        return float(vals[order[min(idx, len(order) - 1)]])
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'sketch': 'kll',
+            'k': self.k,
+            'n': self.n,
+            'min': self.min_val,
+            'max': self.max_val,
+            'levels': self.levels,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Any) -> KllSketch:
+        if not isinstance(d, dict) or d.get('sketch') != 'kll':
+            raise excs.Error(f'Not a KLL sketch: {str(d)[:100]}')
+        sketch = cls(d['k'])
+        sketch.n = d['n']
+        sketch.min_val = d['min']
+        sketch.max_val = d['max']
+        sketch.levels = [list(level) for level in d['levels']]
+        return sketch
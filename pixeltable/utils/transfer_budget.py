@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import ClassVar, Iterator, Optional
+
+from pixeltable.config import Config
+
+_logger = logging.getLogger('pixeltable')
+
+
+class TransferBudget:
+    """
+    A process-wide limit on the number of bytes of media transfers (uploads by ObjectStoreSaveNode, downloads by
+    CachePrefetchNode) that are in flight at the same time.
+
+    Transfers reserve their size before starting and block until enough of the budget is available. A transfer that
+    is larger than the entire budget is admitted once no other transfer is in flight.
+    """
+
+    DEFAULT_CAPACITY_MB: ClassVar[int] = 1024
+    # reserved for transfers of unknown size, such as downloads
+    DEFAULT_RESERVATION: ClassVar[int] = 8 * 2**20
+
+    __instance: ClassVar[Optional[TransferBudget]] = None
+
+    capacity: int
+    available: int
+    cond: threading.Condition
+
+    @classmethod
+    def get(cls) -> TransferBudget:
+        if cls.__instance is None:
+            cls.init()
+        assert cls.__instance is not None
+        return cls.__instance
+
+    @classmethod
+    def init(cls) -> None:
+        capacity_mb = Config.get().get_int_value('transfer_budget_mb') or cls.DEFAULT_CAPACITY_MB
+        cls.__instance = cls(capacity_mb * 2**20)
+
+    def __init__(self, capacity: int):
+        assert capacity > 0
+        self.capacity = capacity
+        self.available = capacity
+        self.cond = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        return self.capacity - self.available
+
+    @contextmanager
+    def reserve(self, num_bytes: Optional[int] = None) -> Iterator[None]:
+        """Blocks until num_bytes (or DEFAULT_RESERVATION, if None) of the budget are available"""
+        n = min(self.DEFAULT_RESERVATION if num_bytes is None else max(num_bytes, 1), self.capacity)
+        with self.cond:
+            if n > self.available:
+                _logger.debug(f'waiting for transfer budget: {n} bytes requested, {self.available} available')
+            self.cond.wait_for(lambda: self.available >= n)
+            self.available -= n
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.available += n
+                self.cond.notify_all()
@@ -18,7 +18,17 @@ from pixeltable.config import Config
 from pixeltable.env import Env
 from pixeltable.functions.huggingface import clip, sentence_transformer
 from pixeltable.metadata import SystemInfo, create_system_info
-from pixeltable.metadata.schema import Dir, Function, PendingTableOp, Table, TableSchemaVersion, TableVersion
+from pixeltable.metadata.schema import (
+    BatchApiRequest,
+    Dir,
+    Function,
+    MediaBlob,
+    PendingTableOp,
+    RateLimitBucket,
+    Table,
+    TableSchemaVersion,
+    TableVersion,
+)
 from pixeltable.utils.filecache import FileCache
 from pixeltable.utils.local_store import LocalStore, TempStore
 
@@ -204,6 +214,9 @@ def clean_db(restore_md_tables: bool = True) -> None:
         TableVersion.__table__.create(engine)
         TableSchemaVersion.__table__.create(engine)
         PendingTableOp.__table__.create(engine)
+        MediaBlob.__table__.create(engine)
+        RateLimitBucket.__table__.create(engine)
+        BatchApiRequest.__table__.create(engine)
         SystemInfo.__table__.create(engine)
         create_system_info(engine)
 
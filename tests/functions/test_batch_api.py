@@ -0,0 +1,232 @@
+import http.server
+import json
+import threading
+import time
+from typing import Any, Iterator
+
+import pytest
+
+import pixeltable as pxt
+from pixeltable import env
+from pixeltable.exec.expr_eval.schedulers import BatchApiScheduler
+
+from ..utils import skip_test_if_not_installed, validate_update_status
+
+
+class MockOpenAIBatchServer:
+    """
+    A local HTTP server that implements the parts of the OpenAI Files and Batch APIs that are used by
+    OpenAIBatchApi. Batches are reported as in progress the first time they are retrieved. Chat completion requests
+    with 'FAIL' in their last message fail.
+    """
+
+    files: dict[str, bytes]
+    batches: dict[str, dict[str, Any]]
+    batch_requests: list[list[str]]  # custom ids of the requests of each submitted batch
+    events: list[str]  # 'submit' or 'poll', in the order in which the requests were received
+
+    def __init__(self) -> None:
+        self.files = {}
+        self.batches = {}
+        self.batch_requests = []
+        self.events = []
+        lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                with lock:
+                    if self.path == '/v1/files':
+                        file_id = f'file-{len(server.files)}'
+                        # the multipart body contains the jsonl file verbatim
+                        lines = [line for line in body.split(b'\r\n') if line.startswith(b'{"custom_id"')]
+                        server.files[file_id] = b'\n'.join(lines)
+                        self._send_json(
+                            {
+                                'id': file_id,
+                                'object': 'file',
+                                'bytes': len(body),
+                                'created_at': int(time.time()),
+                                'filename': 'batch.jsonl',
+                                'purpose': 'batch',
+                                'status': 'processed',
+                            }
+                        )
+                    elif self.path == '/v1/batches':
+                        args = json.loads(body)
+                        batch_id = f'batch-{len(server.batches)}'
+                        server.batches[batch_id] = {
+                            'id': batch_id,
+                            'object': 'batch',
+                            'endpoint': args['endpoint'],
+                            'completion_window': args['completion_window'],
+                            'created_at': int(time.time()),
+                            'input_file_id': args['input_file_id'],
+                            'status': 'validating',
+                            'metadata': args.get('metadata'),
+                        }
+                        requests = server.files[args['input_file_id']].split(b'\n')
+                        server.batch_requests.append([json.loads(line)['custom_id'] for line in requests])
+                        server.events.append('submit')
+                        self._send_json(server.batches[batch_id])
+                    else:
+                        self.send_error(404)
+
+            def do_GET(self) -> None:
+                with lock:
+                    parts = self.path.strip('/').split('/')
+                    if parts[:2] == ['v1', 'batches'] and len(parts) == 3:
+                        batch = server.batches[parts[2]]
+                        server.events.append('poll')
+                        if batch['status'] == 'validating':
+                            batch['status'] = 'in_progress'
+                        elif batch['status'] == 'in_progress':
+                            server._complete(batch)
+                        self._send_json(batch)
+                    elif parts[:2] == ['v1', 'files'] and len(parts) == 4 and parts[3] == 'content':
+                        content = server.files[parts[2]]
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'application/octet-stream')
+                        self.send_header('Content-Length', str(len(content)))
+                        self.end_headers()
+                        self.wfile.write(content)
+                    else:
+                        self.send_error(404)
+
+            def _send_json(self, obj: dict[str, Any]) -> None:
+                body = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def _complete(self, batch: dict[str, Any]) -> None:
+        output: list[str] = []
+        errors: list[str] = []
+        for line in self.files[batch['input_file_id']].split(b'\n'):
+            request = json.loads(line)
+            body = request['body']
+            response_body: dict[str, Any]
+            if request['url'] == '/v1/embeddings':
+                response_body = {'data': [{'embedding': [float(len(body['input'])), 1.0]}]}
+            else:
+                content = body['messages'][-1]['content']
+                if 'FAIL' in content:
+                    response = {'status_code': 400, 'body': {'error': {'message': 'invalid prompt'}}}
+                    errors.append(json.dumps({'custom_id': request['custom_id'], 'response': response}))
+                    continue
+                response_body = {'choices': [{'message': {'role': 'assistant', 'content': content.upper()}}]}
+            response = {'status_code': 200, 'body': response_body}
+            output.append(json.dumps({'custom_id': request['custom_id'], 'response': response}))
+
+        batch['status'] = 'completed'
+        for lines, key in ((output, 'output_file_id'), (errors, 'error_file_id')):
+            if len(lines) > 0:
+                file_id = f'file-{len(self.files)}'
+                self.files[file_id] = '\n'.join(lines).encode()
+                batch[key] = file_id
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_port}/v1'
+
+
+class TestBatchApi:
+    @pytest.fixture
+    def openai_batch_server(self, monkeypatch: pytest.MonkeyPatch) -> Iterator[MockOpenAIBatchServer]:
+        skip_test_if_not_installed('openai')
+        import pixeltable.functions.openai  # noqa: F401  # registers the client
+
+        server = MockOpenAIBatchServer()
+        server.thread.start()
+        monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+        monkeypatch.setenv('OPENAI_BASE_URL', server.base_url)
+        monkeypatch.setattr(env._registered_clients['openai'], 'client_obj', None)
+        monkeypatch.setattr(BatchApiScheduler, 'BATCH_LINGER', 0.1)
+        monkeypatch.setattr(BatchApiScheduler, 'POLL_INTERVAL', 0.1)
+        yield server
+        server.httpd.shutdown()
+        server.httpd.server_close()
+
+    def test_chat_completions(self, reset_db: None, openai_batch_server: MockOpenAIBatchServer) -> None:
+        from pixeltable.functions.openai import chat_completions
+
+        prompts = ['hello', 'FAIL this one', 'hello', 'world']
+        t = pxt.create_table('test_batch', {'id': pxt.Int, 'prompt': pxt.String})
+        validate_update_status(t.insert({'id': i, 'prompt': p} for i, p in enumerate(prompts)), len(prompts))
+        messages = [{'role': 'user', 'content': t.prompt}]
+        status = t.add_computed_column(
+            response=chat_completions(messages, model='gpt-4o-mini'), on_error='ignore', batch_mode=True
+        )
+        assert status.num_excs == 1
+
+        res = t.select(t.response, err=t.response.errormsg).order_by(t.id).collect()
+        contents = [r['choices'][0]['message']['content'] if r is not None else None for r in res['response']]
+        assert contents == ['HELLO', None, 'HELLO', 'WORLD']
+        assert 'invalid prompt' in res['err'][1]
+        # identical requests are submitted only once
+        assert len(openai_batch_server.batch_requests) == 1
+        assert len(openai_batch_server.batch_requests[0]) == 3
+
+        # the results of submitted requests are picked up from their batch; only the failed request is resubmitted
+        t2 = pxt.create_table('test_batch2', {'id': pxt.Int, 'prompt': pxt.String})
+        validate_update_status(t2.insert({'id': i, 'prompt': p} for i, p in enumerate(prompts)), len(prompts))
+        messages = [{'role': 'user', 'content': t2.prompt}]
+        status = t2.add_computed_column(
+            response=chat_completions(messages, model='gpt-4o-mini'), on_error='ignore', batch_mode=True
+        )
+        assert status.num_excs == 1
+        res2 = t2.select(t2.response).order_by(t2.id).collect()
+        assert res2['response'] == res['response']
+        assert len(openai_batch_server.batch_requests) == 2
+        assert len(openai_batch_server.batch_requests[1]) == 1
+
+        # batch mode only applies to the backfill: inserted rows go to the regular endpoint (which the server lacks)
+        status = t2.insert([{'id': 4, 'prompt': 'later'}], on_error='ignore')
+        assert status.num_excs == 1
+        assert len(openai_batch_server.batch_requests) == 2
+
+        # recompute_columns() with batch_mode=True: only the failed requests are submitted again
+        status = t2.recompute_columns('response', errors_only=True, batch_mode=True)
+        assert status.num_excs == 1
+        assert len(openai_batch_server.batch_requests) == 3
+        assert len(openai_batch_server.batch_requests[2]) == 2
+        res2 = t2.select(t2.response).where(t2.id == 4).collect()
+        assert res2['response'][0]['choices'][0]['message']['content'] == 'LATER'
+
+    def test_chunked_submission(
+        self, reset_db: None, openai_batch_server: MockOpenAIBatchServer, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        # the requests of all rows are submitted, in chunks, before the results of the first batch are retrieved
+        from pixeltable.functions.openai import chat_completions
+
+        monkeypatch.setattr(BatchApiScheduler, 'MAX_BATCH_REQUESTS', 5)
+        t = pxt.create_table('test_batch', {'id': pxt.Int, 'prompt': pxt.String})
+        validate_update_status(t.insert({'id': i, 'prompt': f'prompt {i}'} for i in range(20)), 20)
+        messages = [{'role': 'user', 'content': t.prompt}]
+        t.add_computed_column(response=chat_completions(messages, model='gpt-4o-mini'), batch_mode=True)
+        res = t.select(t.response).order_by(t.id).collect()
+        assert [r['choices'][0]['message']['content'] for r in res['response']] == [f'PROMPT {i}' for i in range(20)]
+        assert sorted(len(requests) for requests in openai_batch_server.batch_requests) == [5, 5, 5, 5]
+        events = openai_batch_server.events
+        assert events.index('poll') > len(events) - 1 - events[::-1].index('submit')
+
+    def test_embeddings(self, reset_db: None, openai_batch_server: MockOpenAIBatchServer) -> None:
+        from pixeltable.functions.openai import embeddings
+
+        t = pxt.create_table('test_batch', {'id': pxt.Int, 'text': pxt.String})
+        validate_update_status(t.insert({'id': i, 'text': 'x' * (i + 1)} for i in range(50)), 50)
+        t.add_computed_column(embed=embeddings(t.text, model='text-embedding-3-small'), batch_mode=True)
+        res = t.select(t.embed).order_by(t.id).collect()
+        assert [list(e) for e in res['embed']] == [[float(i + 1), 1.0] for i in range(50)]
+        # the rows of all calls of the batched udf are combined into a single batch
+        assert len(openai_batch_server.batch_requests) == 1
+        assert len(openai_batch_server.batch_requests[0]) == 50
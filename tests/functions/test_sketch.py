@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+import pixeltable as pxt
+from pixeltable.functions import sketch
+from pixeltable.utils.sketches import HyperLogLog, KllSketch
+
+from ..utils import create_scalars_tbl
+
+
+class TestSketch:
+    def test_hll(self) -> None:
+        hll1, hll2 = HyperLogLog(), HyperLogLog()
+        hll1.update(list(range(60_000)))
+        hll2.update([str(i) for i in range(50_000)] + list(range(40_000, 80_000)))
+        assert hll1.estimate() == pytest.approx(60_000, rel=0.03)
+        assert hll2.estimate() == pytest.approx(90_000, rel=0.03)
+        # small cardinalities are estimated almost exactly
+        small = HyperLogLog()
+        small.update(['a', 'b', 'c', 'a'])
+        assert small.estimate() == 3
+
+        hll1.merge(HyperLogLog.from_dict(hll2.as_dict()))
+        assert hll1.estimate() == pytest.approx(130_000, rel=0.03)
+        with pytest.raises(pxt.Error, match='different precisions'):
+            hll1.merge(HyperLogLog(10))
+        with pytest.raises(pxt.Error, match='Not a HyperLogLog sketch'):
+            HyperLogLog.from_dict({'sketch': 'kll'})
+
+    def test_kll(self) -> None:
+        rng = np.random.default_rng(0)
+        vals = rng.permutation(100_000)
+        kll1, kll2 = KllSketch(), KllSketch()
+        kll1.update(vals[:70_000].tolist())
+        kll2.update(vals[70_000:].tolist())
+        kll1.merge(KllSketch.from_dict(kll2.as_dict()))
+        assert kll1.n == 100_000
+        for q in (0.01, 0.5, 0.9, 0.99):
+            # rank error
+            assert abs(kll1.quantile(q) - q * 100_000) < 0.02 * 100_000
+        assert kll1.quantile(0.0) == 0 and kll1.quantile(1.0) == 99_999
+        assert sum(len(level) for level in kll1.levels) < 2_000
+        assert KllSketch().quantile(0.5) is None
+
+    def test_aggregates(self, reset_db: None) -> None:
+        t = create_scalars_tbl(1000)
+        rows = t.select(t.c_int, t.c_float, t.c_string).collect()
+        distinct_strings = {s for s in rows['c_string'] if s is not None}
+        floats = [f for f in rows['c_float'] if f is not None]
+
+        res = t.select(
+            n=sketch.approx_count_distinct(t.c_string), p=sketch.approx_percentile(t.c_float, q=0.9)
+        ).collect()
+        assert abs(res[0]['n'] - len(distinct_strings)) <= 1
+        assert res[0]['p'] == pytest.approx(np.percentile(floats, 90), abs=0.02)
+
+        # computed arguments
+        upper = t.c_string.apply(lambda s: None if s is None else s.upper(), col_type=t.c_string.col_type)
+        res = t.select(
+            n=sketch.approx_count_distinct(upper),
+            p=sketch.approx_percentile(t.c_float.apply(lambda f: f, col_type=t.c_float.col_type), q=0.9),
+        ).collect()
+        assert abs(res[0]['n'] - len(distinct_strings)) <= 1
+        assert res[0]['p'] == pytest.approx(np.percentile(floats, 90), abs=0.02)
+
+        # sketches are stored per group and rolled up later
+        sketches = t.group_by(t.c_int).select(
+            t.c_int, hll=sketch.hll_accumulate(t.c_string), kll=sketch.kll_accumulate(t.c_float)
+        )
+        daily = pxt.create_table('daily', source=sketches)
+        assert daily.count() == len(set(rows['c_int']))
+        res = daily.select(
+            n=sketch.hll_estimate(sketch.hll_combine(daily.hll)),
+            p=sketch.kll_quantile(sketch.kll_combine(daily.kll), 0.5),
+        ).collect()
+        assert abs(res[0]['n'] - len(distinct_strings)) <= 1
+        assert res[0]['p'] == pytest.approx(np.percentile(floats, 50), abs=0.02)
+
+        with pytest.raises(pxt.Error) as exc_info:
+            floats_py = t.c_float.apply(lambda f: f, col_type=t.c_float.col_type)
+            _ = t.select(sketch.approx_percentile(floats_py, q=2.0)).collect()
+        assert 'q must be between 0 and 1' in str(exc_info.value)
+
+    def test_sql_aggregates(self, reset_db: None) -> None:
+        t = pxt.create_table('test_tbl', {'g': pxt.Int, 'x': pxt.Int, 's': pxt.String})
+        rng = np.random.default_rng(0)
+        xs = rng.integers(0, 20_000, 60_000)
+        t.insert({'g': i % 3, 'x': int(x), 's': None if i % 5 == 0 else str(x)} for i, x in enumerate(xs))
+
+        # the registers are computed in SQL, the estimate in Python
+        res = (
+            t.group_by(t.g)
+            .select(
+                t.g,
+                n=sketch.approx_count_distinct(t.x),
+                n_str=sketch.approx_count_distinct(t.s, precision=12),
+                p=sketch.approx_percentile(t.x, q=0.9),
+            )
+            .order_by(t.g)
+            .collect()
+        )
+        assert res['g'] == [0, 1, 2]
+        for g, row in enumerate(res):
+            group = np.arange(len(xs)) % 3 == g
+            assert row['n'] == pytest.approx(len(set(xs[group].tolist())), rel=0.03)
+            with_str = group & (np.arange(len(xs)) % 5 != 0)
+            assert row['n_str'] == pytest.approx(len(set(xs[with_str].tolist())), rel=0.06)
+            # percentile_disc() returns one of the values
+            assert row['p'] in xs[group]
+            assert row['p'] == pytest.approx(np.percentile(xs[group], 90), rel=0.001)
+
+        # no rows
+        res = t.where(t.g > 2).select(n=sketch.approx_count_distinct(t.x), p=sketch.approx_percentile(t.x)).collect()
+        assert res[0]['n'] == 0 and res[0]['p'] is None
+
+        # aggregates that can be translated to SQL, in a select list that can't: aggregation happens in Python
+        p = sketch.approx_percentile(t.x, q=0.9)
+        res = t.group_by(t.g).select(t.g, p=p.apply(lambda p: p, col_type=p.col_type)).collect()
+        assert len(res) == 3
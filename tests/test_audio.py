@@ -2,6 +2,7 @@ import math
 from typing import Counter, Optional
 
 import av
+import numpy as np
 import pytest
 
 import pixeltable as pxt
@@ -327,3 +328,96 @@ class TestAudio:
                 ),
             )
         assert 'overlap_sec must be less than chunk_duration_sec' in str(excinfo.value)
+
+    def test_audio_iterator_set_pos(self) -> None:
+        audio_filepath = get_audio_file('jfk_1961_0109_cityuponahill-excerpt.flac')  # 60s audio file
+        it = AudioSplitter(audio_filepath, 14.0, overlap_sec=2.5)
+        chunks = [(r['start_time_sec'], r['end_time_sec']) for r in it]
+        it.close()
+        assert len(chunks) > 2
+
+        it = AudioSplitter(audio_filepath, 14.0, overlap_sec=2.5)
+        for pos in [len(chunks) - 1, 0, 2, 1]:
+            it.set_pos(pos)
+            r = next(it)
+            assert (r['start_time_sec'], r['end_time_sec']) == chunks[pos]
+        it.close()
+
+    def test_audio_iterator_stream_copy(self, reset_db: None) -> None:
+        audio_filepath = get_audio_file('jfk_1961_0109_cityuponahill-excerpt.flac')  # 60s audio file
+        base_t = pxt.create_table('audio_tbl', {'audio': pxt.Audio})
+        validate_update_status(base_t.insert([{'audio': audio_filepath}]))
+        audio_chunk_view = pxt.create_view(
+            'audio_chunks',
+            base_t,
+            iterator=AudioSplitter.create(audio=base_t.audio, chunk_duration_sec=5.0, stream_copy=True),
+        )
+        results = audio_chunk_view.order_by(audio_chunk_view.pos).collect()
+        assert len(results) == self.__get_chunk_count(audio_filepath, 5.0, 0.0, 0.0)
+        assert results[0]['start_time_sec'] == 0
+        assert results[-1]['end_time_sec'] == 60
+        for i in range(len(results) - 1):
+            # chunks are aligned to packets and don't overlap
+            assert results[i]['end_time_sec'] == results[i + 1]['start_time_sec']
+            assert abs(results[i]['start_time_sec'] - i * 5.0) < 0.5
+        for result in results:
+            self.check_audio_params(result['audio_chunk'], format='flac', codec='flac')
+
+        with pytest.raises(pxt.Error, match='cannot be specified together'):
+            pxt.create_view(
+                'audio_chunks_2',
+                base_t,
+                iterator=AudioSplitter.create(
+                    audio=base_t.audio, chunk_duration_sec=5.0, stream_copy=True, pcm_sample_rate=16000
+                ),
+            )
+
+    def test_audio_iterator_stream_copy_set_pos(self) -> None:
+        audio_filepath = get_audio_file('jfk_1961_0109_cityuponahill-excerpt.flac')  # 60s audio file
+        # chunks that are shorter than the packets: some of them don't contain the start of a packet
+        it = AudioSplitter(audio_filepath, 0.05, stream_copy=True)
+        chunks = [(r['start_time_sec'], r['end_time_sec'], r['audio_chunk'] is None) for r in it]
+        it.close()
+        assert any(is_empty for _, _, is_empty in chunks)
+        assert not all(is_empty for _, _, is_empty in chunks)
+        for i, (start, _, _) in enumerate(chunks):
+            assert abs(start - i * 0.05) < 0.1
+
+        it = AudioSplitter(audio_filepath, 0.05, stream_copy=True)
+        for pos in [len(chunks) - 1, 0, 7, 3, 100, 99]:
+            it.set_pos(pos)
+            r = next(it)
+            assert (r['start_time_sec'], r['end_time_sec'], r['audio_chunk'] is None) == chunks[pos]
+        it.close()
+
+    def test_audio_iterator_pcm(self, reset_db: None) -> None:
+        audio_filepath = get_audio_file('jfk_1961_0109_cityuponahill-excerpt.flac')  # 60s audio file
+        base_t = pxt.create_table('audio_tbl', {'audio': pxt.Audio})
+        validate_update_status(base_t.insert([{'audio': audio_filepath}]))
+        audio_chunk_view = pxt.create_view(
+            'audio_chunks',
+            base_t,
+            iterator=AudioSplitter.create(
+                audio=base_t.audio, chunk_duration_sec=14.0, overlap_sec=2.5, pcm_sample_rate=16000
+            ),
+        )
+        assert audio_chunk_view.audio_chunk.col_type.is_array_type()
+        results = audio_chunk_view.order_by(audio_chunk_view.pos).collect()
+        assert len(results) == self.__get_chunk_count(audio_filepath, 14.0, 2.5, 0.0)
+        for result in results:
+            chunk = result['audio_chunk']
+            assert chunk.dtype == np.float32 and chunk.ndim == 1
+            assert len(chunk) == round((result['end_time_sec'] - result['start_time_sec']) * 16000)
+        assert results[-1]['end_time_sec'] == 60
+
+        # overlapping samples are identical, and random access produces the same chunks as sequential decoding
+        it = AudioSplitter(audio_filepath, 14.0, overlap_sec=2.5, pcm_sample_rate=16000)
+        chunks = [r['audio_chunk'] for r in it]
+        overlap = round(2.5 * 16000)
+        assert np.array_equal(chunks[0][-overlap:], chunks[1][:overlap])
+        for pos in [2, 0, len(chunks) - 1]:
+            it.set_pos(pos)
+            chunk = next(it)['audio_chunk']
+            assert len(chunk) == len(chunks[pos])
+            assert np.allclose(chunk, chunks[pos], atol=1e-5)
+        it.close()
@@ -7,6 +7,7 @@ import pytest
 
 import pixeltable as pxt
 import pixeltable.type_system as ts
+from pixeltable.exprs import ColumnRef
 from pixeltable.iterators import ComponentIterator
 from pixeltable.iterators.video import FrameIterator
 
@@ -58,6 +59,22 @@ class ConstantImgIterator(ComponentIterator):
         self.next_frame_idx = pos
 
 
+class CountingImgIterator(ConstantImgIterator):
+    """ConstantImgIterator that records the number of instances and set_pos() calls."""
+
+    num_instances = 0
+    num_backward_seeks = 0
+
+    def __init__(self, video: str, *, num_frames: int = 10):
+        super().__init__(video, num_frames=num_frames)
+        CountingImgIterator.num_instances += 1
+
+    def set_pos(self, pos: int) -> None:
+        if pos < self.next_frame_idx:
+            CountingImgIterator.num_backward_seeks += 1
+        super().set_pos(pos)
+
+
 class TestComponentView:
     def test_basic(self, reset_db: None) -> None:
         # create video table
@@ -377,3 +394,48 @@ class TestComponentView:
         assert status.num_rows == 1 + v2.where(v2.video == video_url).count()
         assert sorted(str.split('.')[1] for str in status.updated_cols) == ['img4', 'int2', 'int6', 'int7']
         check_view()
+
+    def test_parallel_iteration(self, reset_db: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        video_t = pxt.create_table('video_tbl', {'video': pxt.Video})
+        video_t.insert({'video': p} for p in get_test_video_files())
+        v1 = pxt.create_view('seq_view', video_t, iterator=FrameIterator.create(video=video_t.video, fps=1))
+
+        # populate a second view with 4 iterator workers
+        monkeypatch.setenv('PIXELTABLE_ITERATOR_WORKERS', '4')
+        v2 = pxt.create_view('par_view', video_t, iterator=FrameIterator.create(video=video_t.video, fps=1))
+        v2.add_computed_column(frame_width=v2.frame.width)
+        assert_resultset_eq(
+            v1.select(v1.video, v1.pos, v1.frame_idx, v1.pos_msec, v1.frame.width).order_by(v1.video, v1.pos).collect(),
+            v2.select(v2.video, v2.pos, v2.frame_idx, v2.pos_msec, v2.frame_width).order_by(v2.video, v2.pos).collect(),
+        )
+        # components are assigned positions in iteration order
+        res = v2.select(v2.pos, v2.frame_idx).collect().to_pandas()
+        assert np.all(res['pos'] == res['frame_idx'])
+
+    def test_unstored_iter_col_reconstruction(self, reset_db: None) -> None:
+        video_t = pxt.create_table('video_tbl', {'video': pxt.Video})
+        video_filepaths = get_test_video_files()
+        video_t.insert({'video': p} for p in video_filepaths)
+        v = pxt.create_view('test_view', video_t, iterator=CountingImgIterator.create(video=video_t.video))
+        num_rows = v.count()
+        assert len(video_filepaths) <= ColumnRef.MAX_OPEN_ITERATORS
+
+        # rows arrive interleaved across base rows and in descending pos order: every base row still only needs a
+        # single iterator, and the positions within a row batch are reconstructed in ascending order (a later batch
+        # needs to seek back, but only once per iterator, rather than once per row)
+        CountingImgIterator.num_instances = 0
+        CountingImgIterator.num_backward_seeks = 0
+        res = v.select(v.frame_idx, frame_width=v.frame.width).order_by(v.frame_idx, asc=False).collect()
+        assert len(res) == num_rows
+        assert res['frame_idx'] == sorted(res['frame_idx'], reverse=True)
+        assert all(w == 1280 for w in res['frame_width'])
+        assert CountingImgIterator.num_instances == len(video_filepaths)
+        assert CountingImgIterator.num_backward_seeks < num_rows - len(video_filepaths)
+
+        # a filtered query without ordering gets clustered by base rowid
+        CountingImgIterator.num_instances = 0
+        CountingImgIterator.num_backward_seeks = 0
+        res = v.where(v.pos % 3 == 0).select(v.frame).collect()
+        assert len(res) == v.where(v.pos % 3 == 0).count()
+        assert CountingImgIterator.num_instances == len(video_filepaths)
+        assert CountingImgIterator.num_backward_seeks == 0
@@ -8,7 +8,10 @@ from uuid import UUID
 import pytest
 
 import pixeltable as pxt
+from pixeltable.catalog import Column
 from pixeltable.config import Config
+from pixeltable.utils.filecache import FileCache
+from pixeltable.utils.local_store import LocalStore
 from pixeltable.utils.object_stores import ObjectOps, ObjectPath
 
 
@@ -284,6 +287,81 @@ class TestDestination:
         # Ensure that local file is copied to a specified destination
         assert len(r) == self.count(dest1_uri, t._id)
 
+    @pytest.mark.parametrize('dest_id', [None, 'fs'])
+    def test_dest_dedup(self, reset_db: None, dest_id: Optional[str], monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test content-addressed storage of identical media files in multiple tables"""
+        monkeypatch.setenv('PIXELTABLE_MEDIA_DEDUP', 'true')
+        dest, dest_uri = (None, None) if dest_id is None else self.create_destination_by_number(1, dest_id)
+        img = 'tests/data/imagenette2-160/ILSVRC2012_val_00000557.JPEG'
+
+        tables: list[pxt.Table] = []
+        for i in range(2):
+            t = pxt.create_table(f'test_dest_{i}', schema={'img': pxt.Image})
+            t.add_computed_column(img_rot=t.img.rotate(90), destination=dest)
+            t.insert([{'img': img}, {'img': img}])
+            tables.append(t)
+
+        urls = {url for t in tables for url in t.select(t.img_rot.fileurl).collect()['img_rot_fileurl']}
+        # all rows of both tables reference the same file, which isn't owned by either table
+        assert len(urls) == 1
+        url = urls.pop()
+        assert ObjectPath.blob_name(url) is not None
+        path = LocalStore.file_url_to_path(url)
+        assert path is not None and path.exists()
+        assert all(self.count(dest_uri, t._id) == 0 for t in tables)
+
+        # the files stored by a failed insert are deleted again, unless they're referenced by other tables
+        stored: list[str] = []
+        put_blob = ObjectOps.put_blob
+
+        def failing_put_blob(col: Column, src_path: Path, blob_url: str, relocate_or_delete: bool) -> None:
+            put_blob(col, src_path, blob_url, relocate_or_delete)
+            stored.append(blob_url)
+            if blob_url != url:
+                raise RuntimeError('upload failed')
+
+        t = pxt.create_table('test_dest_2', schema={'img': pxt.Image})
+        t.add_computed_column(img_rot=t.img.rotate(90), destination=dest)
+        with monkeypatch.context() as m, pytest.raises(RuntimeError, match='upload failed'):
+            m.setattr(ObjectOps, 'put_blob', failing_put_blob)
+            t.insert([{'img': img}, {'img': 'tests/data/imagenette2-160/ILSVRC2012_val_00001432.JPEG'}])
+        assert len(stored) == 2
+        assert path.exists()
+        failed_path = LocalStore.file_url_to_path(next(u for u in stored if u != url))
+        assert failed_path is not None and not failed_path.exists()
+
+        # delete() retains the file for the earlier versions of the table; reverting the insert that stored a file
+        # releases it
+        t = tables[1]
+        t.insert([{'img': 'tests/data/imagenette2-160/ILSVRC2012_val_00001432.JPEG'}])
+        new_url = t.where(t.img_rot.fileurl != url).select(t.img_rot.fileurl).collect()['img_rot_fileurl'][0]
+        new_path = LocalStore.file_url_to_path(new_url)
+        assert new_path is not None and new_path.exists()
+        t.delete(t.img_rot.fileurl == new_url)
+        assert new_path.exists()
+        t.revert()
+        assert t.where(t.img_rot.fileurl == new_url).count() == 1
+        t.revert()
+        assert t.count() == 2
+        assert not new_path.exists()
+
+        # the files of a dropped table are only deleted once the drop has committed
+        def failing_clear(*args: object, **kwargs: object) -> None:
+            raise RuntimeError('drop failed')
+
+        with monkeypatch.context() as m, pytest.raises(RuntimeError, match='drop failed'):
+            m.setattr(FileCache, 'clear', failing_clear)
+            pxt.drop_table(tables[0])
+        assert path.exists()
+
+        # the file is deleted with the last table that references it
+        pxt.drop_table(tables[0])
+        assert path.exists()
+        res = tables[1].select(tables[1].img_rot).collect()
+        assert res['img_rot'][0].size == res['img_rot'][1].size
+        pxt.drop_table(tables[1])
+        assert not path.exists()
+
     def test_dest_all(self, reset_db: None) -> None:
         """Test destination with all available storage targets"""
         n = 1
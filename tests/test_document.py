@@ -3,16 +3,26 @@ import itertools
 import json
 import os
 import re
+import shutil
+from pathlib import Path
 from typing import Any, Optional
 
 import pytest
 
 import pixeltable as pxt
 import pixeltable.type_system as ts
-from pixeltable.iterators.document import DocumentSplitter
-from pixeltable.utils.documents import get_document_handle
+from pixeltable.iterators.document import DocumentSplitter, _ParsedDocumentCache
+from pixeltable.utils.documents import DocumentHandle, get_document_handle
 
-from .utils import get_audio_files, get_documents, get_image_files, get_video_files, skip_test_if_not_installed
+from .utils import (
+    assert_resultset_eq,
+    get_audio_files,
+    get_documents,
+    get_image_files,
+    get_video_files,
+    reload_catalog,
+    skip_test_if_not_installed,
+)
 
 
 def _check_pdf_metadata(rec: dict, sep1: str, metadata: list[str]) -> None:
@@ -223,6 +233,152 @@ class TestDocument:
 
             pxt.drop_table('chunks')
 
+    def test_doc_splitter_set_pos(self) -> None:
+        skip_test_if_not_installed('tiktoken')
+        skip_test_if_not_installed('spacy')
+        file_paths = [path for path in self.valid_doc_paths() if not path.endswith('.xml')]
+        args_list: list[dict[str, Any]] = [
+            {'separators': 'paragraph', 'metadata': 'heading,page'},
+            {'separators': 'sentence,token_limit', 'limit': 20, 'overlap': 5, 'metadata': 'page,bounding_box'},
+            {'separators': 'page,char_limit', 'limit': 100, 'overlap': 10, 'metadata': 'page'},
+        ]
+        for path, args in itertools.product(file_paths, args_list):
+            expected = list(DocumentSplitter(path, **args))
+            if len(expected) == 0:
+                continue
+            positions = [len(expected) - 1, 0, len(expected) // 2, len(expected) // 2 + 1, 1]
+            positions = [pos for pos in positions if pos < len(expected)]
+
+            # the chunk locations returned by pos_state() let restore_pos() reconstruct chunks from their section
+            it = DocumentSplitter(path, **args)
+            pos_states = []
+            for _ in expected:
+                next(it)
+                pos_states.append(it.pos_state())
+            assert all(pos_state is not None for pos_state in pos_states)
+            it = DocumentSplitter(path, **args)
+            for pos in positions:
+                it.restore_pos(pos, pos_states[pos])
+                assert next(it) == expected[pos], f'{path}, {args}, {pos}'
+            # sequential iteration resumes after a jump
+            it.set_pos(0)
+            assert list(it) == expected
+
+            # without chunk locations, set_pos() falls back to running the splitting pipeline
+            it = DocumentSplitter(path, **args)
+            for pos in positions:
+                it.set_pos(pos)
+                assert next(it) == expected[pos], f'{path}, {args}, {pos}'
+
+    def test_doc_splitter_unstored_text(self, reset_db: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        file_paths = [path for path in self.valid_doc_paths() if path.endswith(('.html', '.pdf', '.txt'))]
+        doc_t = pxt.create_table('docs', {'id': pxt.Int, 'doc': pxt.Document})
+        doc_t.insert({'id': i, 'doc': p} for i, p in enumerate(file_paths))
+        args: dict[str, Any] = {'separators': 'paragraph,char_limit', 'limit': 200, 'overlap': 20, 'metadata': 'page'}
+        stored = pxt.create_view('stored_chunks', doc_t, iterator=DocumentSplitter.create(document=doc_t.doc, **args))
+        unstored = pxt.create_view(
+            'unstored_chunks', doc_t, iterator=DocumentSplitter.create(document=doc_t.doc, store_text=False, **args)
+        )
+        assert not unstored._tbl_version.get().cols_by_name['text'].is_stored
+
+        # the text is reconstructed from the chunk locations that were stored when the view was populated
+        reload_catalog()
+        stored, unstored = pxt.get_table('stored_chunks'), pxt.get_table('unstored_chunks')
+        _ParsedDocumentCache.get().clear()
+        pos_states: list[Any] = []
+        restore_pos = DocumentSplitter.restore_pos
+
+        def recording_restore_pos(self: DocumentSplitter, pos: int, pos_state: Any) -> None:
+            pos_states.append(pos_state)
+            restore_pos(self, pos, pos_state)
+
+        monkeypatch.setattr(DocumentSplitter, 'restore_pos', recording_restore_pos)
+        for asc in (True, False):
+            res = unstored.select(unstored.text, unstored.page).order_by(unstored.id, unstored.pos, asc=asc).collect()
+            expected = stored.select(stored.text, stored.page).order_by(stored.id, stored.pos, asc=asc).collect()
+            assert_resultset_eq(res, expected)
+        assert len(pos_states) == 2 * stored.count()
+        assert all(pos_state is not None for pos_state in pos_states)
+
+        res = unstored.where(unstored.pos % 3 == 0).select(unstored.text).order_by(unstored.id, unstored.pos).collect()
+        expected = stored.where(stored.pos % 3 == 0).select(stored.text).order_by(stored.id, stored.pos).collect()
+        assert_resultset_eq(res, expected)
+
+    def test_doc_splitter_spacy_n_process(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        # chunks are located in their section also if the sentence splitting runs in other processes
+        skip_test_if_not_installed('spacy')
+        monkeypatch.setattr(DocumentSplitter, 'SPACY_N_PROCESS', 2)
+        file_paths = [path for path in self.valid_doc_paths() if path.endswith(('.html', '.pdf'))]
+        for path in file_paths[:2]:
+            _ParsedDocumentCache.get().clear()
+            it = DocumentSplitter(path, separators='sentence', metadata='page')
+            expected = list(it)
+            assert it._index.num_chunks == len(expected)
+            assert all(location is not None for location in it._index.chunks.values())
+            for pos in (len(expected) - 1, 0, len(expected) // 2):
+                it.set_pos(pos)
+                assert next(it) == expected[pos], f'{path}, {pos}'
+
+    def test_doc_splitter_parsed_doc_cache(self, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+        skip_test_if_not_installed('spacy')
+        file_paths = [path for path in self.valid_doc_paths() if not path.endswith('.xml')]
+        _ParsedDocumentCache.get().clear()
+        num_parses = 0
+
+        def counting_get_document_handle(path: str) -> DocumentHandle:
+            nonlocal num_parses
+            num_parses += 1
+            return get_document_handle(path)
+
+        monkeypatch.setattr('pixeltable.iterators.document.get_document_handle', counting_get_document_handle)
+        for path in file_paths:
+            num_parses = 0
+            expected = list(DocumentSplitter(path, separators='paragraph', metadata='title,heading,page'))
+            assert num_parses == 1
+            # the cached sections are also used with separators that only affect the subsequent splitting
+            assert list(DocumentSplitter(path, separators='paragraph', metadata='title,heading,page')) == expected
+            assert normalize(''.join(r['text'] for r in expected)) == normalize(
+                ''.join(r['text'] for r in DocumentSplitter(path, separators='paragraph,char_limit', limit=50))
+            )
+            assert num_parses == 1
+            # the separators used by the format-specific splitting are part of the cache key
+            _ = list(DocumentSplitter(path, separators='sentence'))
+            assert num_parses == 2
+
+        # a copy of a document is served from the cache; a modified document is parsed again
+        path = str(tmp_path / 'pxtbrief.txt')
+        shutil.copy('tests/data/documents/pxtbrief.txt', path)
+        _ParsedDocumentCache.get().clear()
+        num_parses = 0
+        _ = list(DocumentSplitter('tests/data/documents/pxtbrief.txt', separators='paragraph'))
+        _ = list(DocumentSplitter(path, separators='paragraph'))
+        assert num_parses == 1
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('\nAn additional paragraph.\n')
+        chunks = list(DocumentSplitter(path, separators='paragraph'))
+        assert num_parses == 2
+        assert 'An additional paragraph.' in chunks[-1]['text']
+
+    def test_doc_splitter_parallel_pdf(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        skip_test_if_not_installed('spacy')
+        file_paths = [path for path in self.valid_doc_paths() if path.endswith('.pdf')]
+        args_list: list[dict[str, Any]] = [
+            {'separators': 'page', 'metadata': 'page'},
+            {'separators': 'sentence', 'metadata': 'page,bounding_box'},
+        ]
+        for args in args_list:
+            _ParsedDocumentCache.get().clear()
+            expected = [list(DocumentSplitter(path, **args)) for path in file_paths]
+            _ParsedDocumentCache.get().clear()
+            with monkeypatch.context() as m:
+                m.setattr(DocumentSplitter, 'PDF_PARALLEL_MIN_PAGES', 1)
+                m.setattr(DocumentSplitter, 'PDF_PAGES_PER_TASK', 2)
+                m.setattr(DocumentSplitter, 'PDF_MAX_WORKERS', 2)
+                executor = DocumentSplitter._get_pdf_executor()
+                assert [list(DocumentSplitter(path, **args)) for path in file_paths] == expected
+                # the worker processes are shared by all iterators
+                assert DocumentSplitter._get_pdf_executor() is executor
+
     def test_doc_splitter_headings(self, reset_db: None) -> None:
         skip_test_if_not_installed('spacy')
         file_paths = [
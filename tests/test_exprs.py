@@ -1,11 +1,15 @@
 import base64
 import json
 import math
+import operator
+import pickle
+import random
+import types
 import urllib.parse
 import urllib.request
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, ClassVar, Optional
 
 import numpy as np
 import pandas as pd
@@ -95,6 +99,27 @@ class TestExprs:
         def value(self) -> float:
             return 1 / self.sum
 
+    # vectorized aggregate; records the sizes of the batches it receives
+    @pxt.uda
+    class batch_sum(pxt.Aggregator):
+        batch_sizes: ClassVar[list[int]] = []
+
+        def __init__(self) -> None:
+            self.sum = 0
+
+        def update(self, val: int) -> None:
+            raise AssertionError('update_batch() should be called instead')
+
+        def update_batch(self, val: list[int]) -> None:
+            type(self).batch_sizes.append(len(val))
+            self.sum += int(np.sum(np.asarray(val)))
+
+        def merge(self, other: Any) -> None:
+            self.sum += other.sum
+
+        def value(self) -> int:
+            return self.sum
+
     @classmethod
     def is_str(cls, object: Any) -> bool:
         return isinstance(object, str) or (isinstance(object, Expr) and object.col_type.is_string_type())
@@ -645,6 +670,251 @@ class TestExprs:
         assert all(res['slice_range_step'][i] == orig[i][3:7:2] for i in range(len(orig)))
         assert all(res['slice_range_step_item'][i] == orig[i][3:7:2] for i in range(len(orig)))
 
+    def test_json_sql_pushdown(self, reset_db: None) -> None:
+        # comparisons, casts and null checks of JSON paths are evaluated in SQL where that has Python semantics
+        rng = random.Random(0)
+        scalars: list[Any] = [None, True, False, 0, 1, -2, 3, 3.0, 2.5, -0.5, 2**63, '', 'a', 'ab', 'B', '3', 'é']
+
+        def random_val(depth: int) -> Any:
+            r = rng.random()
+            if depth < 3 and r < 0.15:
+                return {k: random_val(depth + 1) for k in rng.sample(['a', 'b'], rng.randint(0, 2))}
+            if depth < 3 and r < 0.3:
+                return [random_val(depth + 1) for _ in range(rng.randint(0, 3))]
+            return rng.choice(scalars)
+
+        t = pxt.create_table('json_tbl', {'id': pxt.Int, 'doc': pxt.Json})
+        docs = [{'a': random_val(1), 'b': random_val(1), 'l': random_val(2)} for _ in range(200)]
+        validate_update_status(t.insert({'id': i, 'doc': doc} for i, doc in enumerate(docs)), len(docs))
+        paths: list[list[str | int]] = [['a'], ['b'], ['a', 'b'], ['l', 0], ['l', -1], ['a', 1], ['l', 'a']]
+        literals: list[Any] = [0, 1, 3, 2.5, -0.5, True, False, 'a', 'B', '3', 'é']
+        self._check_json_pushdown(t, docs, paths, literals)
+
+        # wildcards and slices are evaluated in Python
+        with Catalog.get().begin_xact(for_write=False):
+            sql_elements = exprs.SqlElementCache()
+            assert sql_elements.get(t.doc.l['*'] == 'a') is None
+            assert sql_elements.get(t.doc.l[1:] == 'a') is None
+            assert sql_elements.get(t.doc.a) is None
+
+    def test_json_sql_pushdown_schema(self, reset_db: None) -> None:
+        # with a json_schema that guarantees the type of a value, ordering comparisons and casts are done in SQL
+        schema = {
+            'type': 'object',
+            'properties': {
+                'n': {'type': 'number'},
+                'i': {'type': 'integer'},
+                'b': {'type': 'boolean'},
+                's': {'type': 'string'},
+                'o': {'type': ['number', 'null']},
+                'l': {'type': 'array', 'items': {'type': 'string'}},
+            },
+            'required': ['n', 'i', 'b', 's', 'l'],
+        }
+        rng = random.Random(0)
+        t = pxt.create_table('json_tbl', {'id': pxt.Int, 'doc': pxt.Required[pxt.Json[schema]]})
+        docs: list[dict[str, Any]] = []
+        for _ in range(200):
+            doc = {
+                'n': rng.choice([0, 1, -2, 3.0, 2.5, -0.5, 2**63]),
+                'i': rng.choice([0, 1, -2, 3, 2**63]),
+                'b': rng.choice([True, False]),
+                's': rng.choice(['', 'a', 'ab', 'B', '3', 'é']),
+                'l': rng.sample(['a', 'B', 'é'], rng.randint(0, 3)),
+            }
+            if rng.random() < 0.5:
+                doc['o'] = rng.choice([None, 1, 2.5])
+            docs.append(doc)
+        validate_update_status(t.insert({'id': i, 'doc': doc} for i, doc in enumerate(docs)), len(docs))
+        paths: list[list[str | int]] = [['n'], ['i'], ['b'], ['s'], ['o'], ['l', 0]]
+        literals: list[Any] = [0, 1, 3, 2.5, True, 'a', 'B', 'é']
+        self._check_json_pushdown(t, docs, paths, literals)
+
+        with Catalog.get().begin_xact(for_write=False):
+            sql_elements = exprs.SqlElementCache()
+            assert sql_elements.get(t.doc.n < 1) is not None
+            assert sql_elements.get(t.doc.s >= 'a') is not None
+            assert sql_elements.get(t.doc.n.astype(pxt.Float)) is not None
+            assert sql_elements.get(t.doc.o.astype(pxt.Float)) is not None
+            assert sql_elements.get(t.doc.l[0].astype(pxt.String)) is not None
+            # a value that is optional, of the wrong type or an int that can be stored as a float (eg, 3.0)
+            assert sql_elements.get(t.doc.o < 1) is None
+            assert sql_elements.get(t.doc.l[0] < 'a') is None
+            assert sql_elements.get(t.doc.s < 1) is None
+            assert sql_elements.get(t.doc.i.astype(pxt.Int)) is None
+
+    def _check_json_pushdown(
+        self, t: pxt.Table, docs: list[Any], paths: list[list[str | int]], literals: list[Any]
+    ) -> None:
+        """
+        Checks that comparisons, casts and null checks of the paths in t.doc have Python semantics: an expr that raises
+        an error in Python for some rows isn't evaluated in SQL, and the results of all others match Python.
+        """
+
+        class PyError:
+            pass
+
+        def get(val: Any, path: list[str | int]) -> Any:
+            for el in path:
+                if isinstance(el, str) and isinstance(val, dict):
+                    val = val.get(el)
+                elif isinstance(el, int) and isinstance(val, list) and -len(val) <= el < len(val):
+                    val = val[el]
+                else:
+                    return None
+            return val
+
+        def path_expr(anchor: Expr, path: list[str | int]) -> Expr:
+            e = anchor
+            for el in path:
+                e = e[el]
+            return e
+
+        def py_results(fn: Callable[[Any], Any], vals: list[Any]) -> list[Any]:
+            results: list[Any] = []
+            for val in vals:
+                try:
+                    results.append(fn(val))
+                except TypeError:
+                    results.append(PyError)
+            return results
+
+        # the apply() makes the path anchor (and everything that depends on it) Python-only
+        py_doc = t.doc.apply(lambda doc: doc, col_type=t.doc.col_type)
+        ops = [operator.eq, operator.ne, operator.lt, operator.le, operator.gt, operator.ge]
+        cast_types = [pxt.Int, pxt.Float, pxt.Bool, pxt.String]
+
+        for path in paths:
+            vals = [get(doc, path) for doc in docs]
+            sql_path, py_path = path_expr(t.doc, path), path_expr(py_doc, path)
+            # (expr, the same expr evaluated in Python, expected results)
+            exprs_list: list[tuple[Expr, Optional[Expr], list[Any]]] = []
+            for lit in literals:
+                for op in ops:
+                    expected = py_results(lambda val: op(val, lit), vals)
+                    exprs_list.append((op(sql_path, lit), op(py_path, lit), expected))
+            for cast_type in cast_types:
+                col_type = ts.ColumnType.normalize_type(cast_type, nullable_default=True)
+                expected = py_results(col_type.create_literal, vals)
+                exprs_list.append((sql_path.astype(cast_type), None, expected))
+            exprs_list.append((sql_path == None, py_path == None, [val is None for val in vals]))
+
+            with Catalog.get().begin_xact(for_write=False):
+                sql_elements = exprs.SqlElementCache()
+                for sql_expr, py_expr, expected in exprs_list:
+                    if PyError in expected:
+                        assert sql_elements.get(sql_expr) is None, sql_expr
+                    assert py_expr is None or sql_elements.get(py_expr) is None, py_expr
+
+            error_exprs = [e for e, _, expected in exprs_list if PyError in expected]
+            for sql_expr in error_exprs[:3]:
+                with pytest.raises(pxt.Error):
+                    _ = t.select(sql_expr).collect()
+            exprs_list = [item for item in exprs_list if PyError not in item[2]]
+            select_list = {f'sql_{i}': e for i, (e, _, _) in enumerate(exprs_list)}
+            select_list.update({f'py_{i}': e for i, (_, e, _) in enumerate(exprs_list) if e is not None})
+            res = t.select(**select_list).order_by(t.id).collect()
+            for i, (sql_expr, py_expr, expected) in enumerate(exprs_list):
+                assert res[f'sql_{i}'] == expected, sql_expr
+                if py_expr is not None:
+                    assert res[f'py_{i}'] == expected, py_expr
+
+            # as filters
+            for sql_expr, _, expected in exprs_list[::7]:
+                if sql_expr.col_type.is_bool_type():
+                    assert t.where(sql_expr).count() == expected.count(True), sql_expr
+
+    def test_compiled_eval(self, test_tbl: pxt.Table, monkeypatch: pytest.MonkeyPatch) -> None:
+        # predicates evaluated in Python return the same results with and without compiled evaluation contexts
+        t = test_tbl
+        num_compiled = 0
+        compile_eval_ctx = exprs.row_builder.compile_eval_ctx
+
+        def compile_spy(row_builder: exprs.RowBuilder, ctx: exprs.RowBuilder.EvalCtx) -> Any:
+            nonlocal num_compiled
+            fn = compile_eval_ctx(row_builder, ctx)
+            num_compiled += fn is not None
+            return fn
+
+        monkeypatch.setattr(exprs.row_builder, 'compile_eval_ctx', compile_spy)
+        plus_one = t.c2.apply(lambda x: x + 1, col_type=pxt.Int)
+        predicates = [
+            (t.c6.f2 * 2 + t.c6.f3) > 50,
+            (t.c6.f2 + 0).isin([1.0, 5.0, 17.0, 90.0]),
+            ((t.c6.f2 % 3 == 0) & ~(t.c6.f3 * 2 < 40.0)) | (t.c6.f4 == True),
+            (t.c6.f9 + 1 == None) & (t.c6.f2 * 1 > 90),
+            # a FunctionCall in the middle of the compiled exprs
+            ((plus_one + t.c6.f2) % 7 == 0) & (t.c6.f2 - 1 > 10),
+        ]
+        for predicate in predicates:
+            monkeypatch.setattr(exprs.RowBuilder, 'COMPILE_EVAL_CTXS', False)
+            expected = t.where(predicate).select(t.c2, x=t.c6.f2 * 2).order_by(t.c2).collect()
+            monkeypatch.setattr(exprs.RowBuilder, 'COMPILE_EVAL_CTXS', True)
+            num_compiled = 0
+            res = t.where(predicate).select(t.c2, x=t.c6.f2 * 2).order_by(t.c2).collect()
+            assert num_compiled > 0, predicate
+            assert len(res) > 0, predicate
+            assert res['c2'] == expected['c2'], predicate
+            assert res['x'] == expected['x'], predicate
+
+        # exceptions are recorded as without compilation
+        for compile_eval_ctxs in (False, True):
+            monkeypatch.setattr(exprs.RowBuilder, 'COMPILE_EVAL_CTXS', compile_eval_ctxs)
+            with pytest.raises(pxt.Error) as exc_info:
+                _ = t.where((t.c6.f2 + 1) / (t.c2 - 10) > 0).collect()
+            assert 'division by zero' in str(exc_info.value)
+
+    def test_eval_buffer_budget(self, reset_db: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        from pixeltable.exec.exec_context import ExecContext
+        from pixeltable.exec.expr_eval.expr_eval_node import ExprEvalNode
+
+        buffered: list[tuple[int, int]] = []  # (total_buffered, max_buffered_rows) after each dispatch
+        nodes: list[ExprEvalNode] = []
+        dispatch_input_rows = ExprEvalNode._dispatch_input_rows
+
+        def dispatch_spy(self: ExprEvalNode) -> None:
+            dispatch_input_rows(self)
+            buffered.append((self.total_buffered, self.max_buffered_rows))
+            nodes.append(self)
+
+        monkeypatch.setattr(ExprEvalNode, '_dispatch_input_rows', dispatch_spy)
+        t = pxt.create_table('buffer_tbl', {'id': pxt.Int, 'data': pxt.Array[(2048,), pxt.Float]})  # type: ignore[misc]
+        rows = [{'id': i, 'data': np.full(2048, i, dtype=np.float32)} for i in range(1000)]
+        validate_update_status(t.insert(rows), len(rows))
+        total = t.data.apply(lambda a: float(a.sum()), col_type=pxt.Float)
+
+        # with a 1 MiB budget, only about 1 MiB / 8 KiB rows are buffered at once
+        monkeypatch.setenv('PIXELTABLE_EVAL_BUFFER_MEMORY_MB', '1')
+        buffered.clear()
+        res = t.select(t.id, total=total).order_by(t.id).collect()
+        assert res['total'] == [2048.0 * i for i in range(1000)]
+        peak_rows = max(n for n, _ in buffered)
+        assert ExprEvalNode.BATCH_SIZE <= peak_rows <= 2**20 // 8192
+        assert all(n <= max_rows for n, max_rows in buffered)
+        assert nodes[-1].stats.peak_buffered_rows == peak_rows
+        assert 0 < nodes[-1].stats.peak_buffered_bytes <= 2 * 2**20
+        # the stats are also recorded in the ExecContext of the plan, which reports them with print_stats=True
+        assert nodes[-1].ctx.eval_buffer_stats == [nodes[-1].stats]
+        profiled: list[ExecContext] = []
+        print_profile = ExecContext.print_profile
+
+        def print_profile_spy(self: ExecContext, num_rows: int) -> None:
+            profiled.append(self)
+            print_profile(self, num_rows)
+
+        monkeypatch.setattr(ExecContext, 'print_profile', print_profile_spy)
+        t.add_computed_column(total=total, print_stats=True)
+        # the column and its index are populated by separate plans
+        assert len(profiled) == 2
+        assert profiled[0].eval_buffer_stats == [nodes[-1].stats]
+
+        # small rows are buffered up to MAX_BUFFERED_ROWS
+        monkeypatch.delenv('PIXELTABLE_EVAL_BUFFER_MEMORY_MB')
+        buffered.clear()
+        res = t.select(x=t.id.apply(lambda x: x + 1, col_type=pxt.Int)).collect()
+        assert sorted(res['x']) == list(range(1, 1001))
+        assert buffered[-1][1] == ExprEvalNode.MAX_BUFFERED_ROWS
+
     def test_json_mapper(self, test_tbl: pxt.Table, reload_tester: ReloadTester) -> None:
         t = test_tbl
 
@@ -1280,6 +1550,134 @@ class TestExprs:
         pd_result = df.groupby('c_int', dropna=True).agg(out=('c_int', 'sum')).reset_index().sort_values('c_int')
         assert pxt_sql_result['out'] == series_to_list(pd_result['out'])
 
+    def test_hash_agg(self, reset_db: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        from pixeltable.exec.hash_aggregation_node import HashAggregationNode, _GroupTable
+
+        t = create_scalars_tbl(1000)
+        rows = t.select(t.row_id, t.c_int, t.c_string).collect()
+
+        # grouping by a Python expression, with SQL and Python aggregates
+        bucket = t.c_int.apply(lambda x: None if x is None else x % 3, col_type=t.c_int.col_type)
+        res = t.group_by(bucket).select(b=bucket, n=pxtf.count(t.c_int), s=pxtf.sum(t.c_int)).collect()
+        expected: dict[Optional[int], list[int]] = {}
+        for x in rows['c_int']:
+            expected.setdefault(None if x is None else x % 3, []).append(x)
+        assert len(res) == len(expected)
+        for b, n, s in zip(res['b'], res['n'], res['s']):
+            vals = [x for x in expected[b] if x is not None]
+            assert n == len(vals)
+            assert s == (sum(vals) if len(vals) > 0 else None)
+
+        # json scalars that are equal in Python are still different grouping values
+        json_key = t.row_id.apply(lambda x: [1, 1.0, True, '1'][x % 4], col_type=pxt.Json)
+        res = t.group_by(json_key).select(key=json_key, n=pxtf.count(t.row_id)).collect()
+        assert sorted((type(k).__name__, n) for k, n in zip(res['key'], res['n'])) == [
+            ('bool', 250),
+            ('float', 250),
+            ('int', 250),
+            ('str', 250),
+        ]
+
+        # json grouping values; the aggregation state is spilled to disk and re-partitioned
+        monkeypatch.setenv('PIXELTABLE_AGGREGATION_MEMORY_MB', '1')
+        monkeypatch.setattr(HashAggregationNode, 'MEMORY_CHECK_INTERVAL', 16)
+        spill_levels: list[int] = []
+        spill = _GroupTable._spill
+
+        def spill_spy(self: _GroupTable, partition: int) -> None:
+            spill_levels.append(self.level)
+            spill(self, partition)
+
+        monkeypatch.setattr(_GroupTable, '_spill', spill_spy)
+        key = t.row_id.apply(lambda x: {'k': x % 500, 'pad': 'x' * 4000}, col_type=pxt.Json)
+        res = t.group_by(key).select(key=key, n=pxtf.count(t.row_id), s=pxtf.json.make_list({'id': t.row_id})).collect()
+        assert len(spill_levels) > 0
+        assert sorted(d['k'] for d in res['key']) == list(range(500))
+        for d, n, s in zip(res['key'], res['n'], res['s']):
+            assert n == 2 and sorted(e['id'] for e in s) == [d['k'], d['k'] + 500]
+
+        # aggregates without merge() spill their input rows; rows that can't be pickled bring the partition back into
+        # memory
+        from pixeltable.exec import hash_aggregation_node
+
+        num_pickled_rows: list[int] = []
+
+        def dumps(record: tuple) -> bytes:
+            if len(record) == 4 and record[3] is not None:
+                num_pickled_rows.append(len(record[3]))
+                if len(num_pickled_rows) > 10:
+                    raise pickle.PicklingError('cannot pickle update args')
+            return pickle.dumps(record)
+
+        spill_levels.clear()
+        res = t.group_by(key).select(key=key, n=pxtf.count(t.row_id), v=self.value_exc(t.row_id)).collect()
+        assert len(spill_levels) > 0
+        assert sorted(d['k'] for d in res['key']) == list(range(500))
+        assert res['v'] == [1 / (2 * d['k'] + 500) for d in res['key']]
+        spill_levels.clear()
+        monkeypatch.setattr(hash_aggregation_node, 'pickle', types.SimpleNamespace(dumps=dumps, load=pickle.load))
+        res2 = t.group_by(key).select(key=key, v=self.value_exc(t.row_id)).collect()
+        assert len(spill_levels) > 0 and len(num_pickled_rows) > 10
+        assert sorted(zip(res2['v'], (d['k'] for d in res2['key']))) == sorted(
+            zip(res['v'], (d['k'] for d in res['key']))
+        )
+        monkeypatch.undo()
+
+        # limit
+        res = t.group_by(key).select(n=pxtf.count(t.row_id)).limit(7).collect()
+        assert len(res) == 7
+
+        # grouping without aggregates
+        strings = t.c_string.apply(lambda s: None if s is None else s.upper(), col_type=t.c_string.col_type)
+        res = t.group_by(strings).select(strings).collect()
+        assert len(res) == len({None if s is None else s.upper() for s in rows['c_string']})
+
+    def test_agg_batch_update(self, reset_db: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        from pixeltable.exec.hash_aggregation_node import HashAggregationNode, _GroupTable
+
+        t = create_scalars_tbl(1000)
+        rows = t.select(t.row_id, t.c_bool, t.c_int).collect()
+        batch_sizes = self.batch_sum.agg_class.batch_sizes  # type: ignore[attr-defined]
+        batch_sizes.clear()
+
+        # sort-based aggregation; the built-in aggregates also get their input in batches
+        res = (
+            t.group_by(t.c_bool)
+            .select(t.c_bool, s=self.batch_sum(t.c_int), s2=pxtf.sum(t.c_int), m=pxtf.max(t.c_int))
+            .collect()
+        )
+        expected: dict[Optional[bool], list[int]] = {}
+        for b, i in zip(rows['c_bool'], rows['c_int']):
+            if i is not None:
+                expected.setdefault(b, []).append(i)
+        assert len(res) == len(expected)
+        for b, s, s2, m in zip(res['c_bool'], res['s'], res['s2'], res['m']):
+            assert s == s2 == sum(expected[b])
+            assert m == max(expected[b])
+        assert sum(batch_sizes) == sum(len(vals) for vals in expected.values())
+        assert max(batch_sizes) > 1
+
+        # hash aggregation merges spilled partial states instead of spilling input rows
+        monkeypatch.setenv('PIXELTABLE_AGGREGATION_MEMORY_MB', '1')
+        monkeypatch.setattr(HashAggregationNode, 'MEMORY_CHECK_INTERVAL', 8)
+        spilled_rows: list[int] = []
+        add = _GroupTable.add
+
+        def add_spy(self: _GroupTable, key: tuple, vals: list, aggregators: Any, rows_args: Any) -> None:
+            if rows_args is not None and self.spill_files.get(self._partition(key)) is not None:
+                spilled_rows.append(len(rows_args))
+            add(self, key, vals, aggregators, rows_args)
+
+        monkeypatch.setattr(_GroupTable, 'add', add_spy)
+        key = t.row_id.apply(lambda x: {'k': x % 400, 'pad': 'x' * 4000}, col_type=pxt.Json)
+        res = t.group_by(key).select(key=key, s=self.batch_sum(t.row_id), m=pxtf.mean(t.row_id)).collect()
+        assert len(res) == 400
+        for d, s, m in zip(res['key'], res['s'], res['m']):
+            ids = [i for i in rows['row_id'] if i % 400 == d['k']]
+            assert s == sum(ids)
+            assert m == pytest.approx(sum(ids) / len(ids))
+        assert len(spilled_rows) > 0  # some rows arrived for spilled partitions and were aggregated in memory
+
     def test_agg_errors(self, test_tbl: pxt.Table) -> None:
         t = test_tbl
         from pixeltable.functions import count, sum
@@ -1297,6 +1695,10 @@ class TestExprs:
         with pytest.raises(pxt.Error):
             # nested aggregates
             _ = t.group_by(t.c2 % 2).select(sum(count(t.c2))).collect()
+        with pytest.raises(pxt.Error, match='order_by'):
+            # hash aggregation doesn't support ordering
+            key = t.c2.apply(lambda x: x % 2, col_type=pxt.Int)
+            _ = t.group_by(key).select(key, sum(t.c2)).order_by(key).collect()
 
     def test_function_call_errors(self, test_tbl: pxt.Table) -> None:
         t = test_tbl
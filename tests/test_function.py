@@ -1,3 +1,4 @@
+import asyncio
 import re
 import typing
 import warnings
@@ -24,6 +25,32 @@ def dummy_fn(i: int) -> int:
 T = typing.TypeVar('T')
 
 
+# the arguments of the calls of the describe udfs (see test_deterministic_udf())
+describe_calls: list[str] = []
+
+
+@pxt.udf(is_deterministic=True)
+async def describe(label: str) -> str:
+    describe_calls.append(label)
+    await asyncio.sleep(0.01)
+    if label == 'error':
+        raise ValueError(label)
+    return f'a {label}'
+
+
+@pxt.udf
+async def describe_nondeterministic(label: str) -> str:
+    describe_calls.append(label)
+    await asyncio.sleep(0)
+    return f'a {label}'
+
+
+@pxt.udf(batch_size=8, is_deterministic=True)
+def describe_batch(label: Batch[str]) -> Batch[str]:
+    describe_calls.extend(label)
+    return [f'a {s}' for s in label]
+
+
 class TestFunction:
     @staticmethod
     @pxt.udf
@@ -81,6 +108,33 @@ class TestFunction:
         assert status.num_rows == len(rows)
         assert status.num_excs == 0
 
+    def test_deterministic_udf(self, reset_db: None) -> None:
+        t = pxt.create_table('test', {'id': pxt.Int, 'label': pxt.String})
+        labels = ['cat', 'dog', 'bird', 'fish', 'error']
+        validate_update_status(t.insert({'id': i, 'label': labels[i % len(labels)]} for i in range(100)), 100)
+        calls = describe_calls
+        calls.clear()
+
+        # the calls for each label are in flight at the same time
+        res = t.where(t.label != 'error').select(t.id, d=describe(t.label)).order_by(t.id).collect()
+        assert res['d'] == [f'a {labels[i % len(labels)]}' for i in range(100) if i % len(labels) != 4]
+        assert set(calls) == set(labels[:4]) and len(calls) < 20
+
+        # the exception is passed to all rows with the same arguments
+        status = t.add_computed_column(d=describe(t.label), on_error='ignore')
+        assert status.num_excs == 20
+        res = t.where(t.label == 'error').select(e=t.d.errortype).collect()
+        assert res['e'] == ['ValueError'] * 20
+
+        calls.clear()
+        _ = t.select(describe_batch(t.label)).collect()
+        assert len(calls) < 100 and set(calls) == set(labels)
+
+        # functions aren't deterministic by default
+        calls.clear()
+        _ = t.select(describe_nondeterministic(t.label)).collect()
+        assert len(calls) == 100
+
     @staticmethod
     @pxt.udf
     def f1(a: int, b: float, c: float = 0.0, d: float = 1.0) -> float:
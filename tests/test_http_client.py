@@ -0,0 +1,140 @@
+import hashlib
+import http.server
+import threading
+from pathlib import Path
+from typing import Iterator
+
+import PIL.Image
+import pytest
+
+import pixeltable as pxt
+from pixeltable import env
+from pixeltable.utils.filecache import FileCache
+from pixeltable.utils.http_client import HttpClient, http_client
+
+from .utils import get_image_files
+
+
+class MediaServer:
+    """A local HTTP/1.1 server for media files that supports conditional GETs and records its requests"""
+
+    files: dict[str, bytes]  # path -> contents
+    requests: list[tuple[str, int]]  # (path, response status)
+    connections: set[tuple[str, int]]  # client addresses
+
+    def __init__(self) -> None:
+        self.files = {}
+        self.requests = []
+        self.connections = set()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def do_GET(self) -> None:
+                server.connections.add(self.client_address)
+                data = server.files.get(self.path)
+                if data is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    server.requests.append((self.path, 404))
+                    return
+                etag = f'"{hashlib.sha256(data).hexdigest()}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    server.requests.append((self.path, 304))
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                server.requests.append((self.path, 200))
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_port}'
+
+    def statuses(self, path: str) -> list[int]:
+        return [status for p, status in self.requests if p == path]
+
+
+class TestHttpClient:
+    @pytest.fixture
+    def media_server(self) -> Iterator[MediaServer]:
+        server = MediaServer()
+        server.thread.start()
+        yield server
+        server.httpd.shutdown()
+        server.httpd.server_close()
+
+    def test_download(self, media_server: MediaServer, tmp_path: Path) -> None:
+        image_files = get_image_files()[:10]
+        for i, file in enumerate(image_files):
+            media_server.files[f'/img{i}.jpg'] = Path(file).read_bytes()
+        client = HttpClient(max_connections_per_host=2)
+
+        validators = []
+        for i, file in enumerate(image_files):
+            dest_path = tmp_path / f'img{i}.jpg'
+            v = client.download(f'{media_server.base_url}/img{i}.jpg', dest_path)
+            assert v is not None and v.etag is not None
+            assert dest_path.read_bytes() == Path(file).read_bytes()
+            validators.append(v)
+        # sequential requests reuse a single connection
+        assert len(media_server.connections) == 1
+
+        # conditional GETs
+        url = f'{media_server.base_url}/img0.jpg'
+        assert client.download(url, tmp_path / 'cond.jpg', validators[0]) is None
+        assert not (tmp_path / 'cond.jpg').exists()
+        media_server.files['/img0.jpg'] = media_server.files['/img1.jpg']
+        v = client.download(url, tmp_path / 'cond.jpg', validators[0])
+        assert v is not None and v.etag == validators[1].etag
+        assert media_server.statuses('/img0.jpg') == [200, 304, 200]
+
+        with pytest.raises(Exception, match='404'):
+            client.download(f'{media_server.base_url}/missing.jpg', tmp_path / 'missing.jpg')
+
+    def test_shared_client(self, reset_db: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        # the shared client is configured in the [http] config section
+        monkeypatch.setenv('HTTP_MAX_CONNECTIONS_PER_HOST', '3')
+        monkeypatch.setenv('HTTP_REVALIDATE_AFTER_S', '60')
+        monkeypatch.setattr(env._registered_clients['http'], 'client_obj', None)
+        client = http_client()
+        assert client.max_connections_per_host == 3
+        assert client.revalidate_after_s == 60
+        assert http_client() is client
+
+    def test_revalidation(self, reset_db: None, media_server: MediaServer, monkeypatch: pytest.MonkeyPatch) -> None:
+        image_files = get_image_files()[:2]
+        media_server.files['/img.jpg'] = Path(image_files[0]).read_bytes()
+        client = HttpClient(revalidate_after_s=0)
+        monkeypatch.setattr('pixeltable.exec.cache_prefetch_node.http_client', lambda: client)
+        FileCache.get().clear()
+
+        t = pxt.create_table('test_http', {'img': pxt.Image})
+        t.insert(img=f'{media_server.base_url}/img.jpg')
+        expected = PIL.Image.open(image_files[0]).tobytes()
+        assert t.select(t.img).collect()['img'][0].tobytes() == expected
+        num_requests = len(media_server.requests)
+
+        # the cached file is revalidated, not downloaded again
+        assert t.select(t.img).collect()['img'][0].tobytes() == expected
+        assert media_server.requests[num_requests:] == [('/img.jpg', 304)]
+        assert FileCache.get().validators(f'{media_server.base_url}/img.jpg') is not None
+
+        # a modified file is downloaded again
+        media_server.files['/img.jpg'] = Path(image_files[1]).read_bytes()
+        assert t.select(t.img).collect()['img'][0].tobytes() == PIL.Image.open(image_files[1]).tobytes()
+        assert media_server.statuses('/img.jpg')[-1] == 200
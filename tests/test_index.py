@@ -36,6 +36,11 @@ class TestIndex:
     def bad_embed2(x: str) -> pxt.Array[(None,), pxt.Float]:
         return np.zeros(10)
 
+    @staticmethod
+    @pxt.udf
+    def parse_int(s: str) -> int:
+        return int(s)
+
     def test_similarity_multiple_index(
         self, multi_idx_img_tbl: pxt.Table, clip_embed: pxt.Function, reload_tester: ReloadTester
     ) -> None:
@@ -808,3 +813,82 @@ class TestIndex:
             start + datetime.timedelta(days=random.randint(0, int(delta_days))) for _ in range(self.BTREE_TEST_NUM_ROWS)
         ]
         self.run_btree_test(data, pxt.Date)
+
+    def test_expr_index(self, reset_db: None, reload_tester: ReloadTester) -> None:
+        t = pxt.create_table('expr_idx_test', {'id': pxt.Int, 'meta': pxt.Json})
+        num_rows = self.BTREE_TEST_NUM_ROWS
+        rows = [
+            {'id': i, 'meta': {'source': f'camera{i % 10}', 'count': i % 7, 'labels': [i % 3, i % 5]}}
+            for i in range(num_rows)
+        ]
+        validate_update_status(t.insert(rows), expected_rows=num_rows)
+        expected_source = t.where(t.id % 10 == 7).count()
+        expected_count = t.where(t.id % 7 > 3).count()
+        expected_label = t.where(t.id % 3 == 2).count()
+
+        t.add_index(t.meta.source.astype(pxt.String), idx_name='source_idx')
+        t.add_index(t.meta['count'].astype(pxt.Int))
+        t.add_index('meta', idx_name='meta_gin', index_type='gin')
+        idx_names = {info['_name'] for info in t._list_index_info_for_test()}
+        assert {'source_idx', 'meta_gin'} <= idx_names
+
+        # the comparisons are evaluated in SQL, against the index value columns
+        assert t.where(t.meta.source == 'camera7').count() == expected_source
+        assert t.where(t.meta.source.astype(pxt.String) == 'camera7').count() == expected_source
+        assert t.where(t.meta['count'].astype(pxt.Int) > 3).count() == expected_count
+        assert t.where(t.meta.labels[0] == 2).count() == expected_label
+        # a label that appears in the list, but not at the indexed position
+        assert t.where(t.meta.labels[0] == 4).count() == 0
+
+        # new rows are indexed
+        validate_update_status(t.insert([{'id': num_rows, 'meta': {'source': 'camera7', 'labels': [4]}}]), 1)
+        assert t.where(t.meta.source == 'camera7').count() == expected_source + 1
+        assert t.where(t.meta.labels[0] == 4).count() == 1
+
+        _ = reload_tester.run_query(t.where(t.meta.source == 'camera7').select(t.id).order_by(t.id))
+        reload_tester.run_reload_test()
+
+        t.drop_index(idx_name='source_idx')
+        assert t.where(t.meta.source == 'camera7').count() == expected_source + 1
+        t.drop_index(idx_name='meta_gin')
+        assert t.where(t.meta.labels[0] == 4).count() == 1
+
+    def test_expr_index_errors(self, reset_db: None) -> None:
+        t = pxt.create_table('expr_idx_test', {'id': pxt.Int, 'meta': pxt.Json})
+        with pytest.raises(pxt.Error, match='requires a scalar expression'):
+            t.add_index(t.meta.source)
+        with pytest.raises(pxt.Error, match='created automatically'):
+            t.add_index(t.id)
+        with pytest.raises(pxt.Error, match='GIN index requires a JSON column'):
+            t.add_index(t.id, index_type='gin')
+        with pytest.raises(pxt.Error, match='GIN index requires a column reference'):
+            t.add_index(t.id + 1, index_type='gin')
+        with pytest.raises(pxt.Error, match='Invalid index type'):
+            t.add_index(t.id + 1, index_type='hash')  # type: ignore[arg-type]
+        t.add_index(t.id + 1, idx_name='id_idx')
+        with pytest.raises(pxt.Error, match='Duplicate index name'):
+            t.add_index(t.id + 2, idx_name='id_idx')
+        t.add_index(t.id + 2, idx_name='id_idx', if_exists='replace')
+        assert t.where(t.id + 2 == 3).count() == 0
+
+        # rows for which the indexed expression fails: the comparison reports the errors, as it would without the index
+        t2 = pxt.create_table('expr_idx_test2', {'s': pxt.String})
+        validate_update_status(t2.insert({'s': str(i)} for i in range(10)), expected_rows=10)
+        t2.add_index(self.parse_int(t2.s))
+        assert t2.where(self.parse_int(t2.s) > 3).count() == 6
+        status = t2.insert([{'s': 'ten'}], on_error='ignore')
+        assert status.num_rows == 1 and status.num_excs == 1
+        with pytest.raises(pxt.Error, match='invalid literal'):
+            _ = t2.where(self.parse_int(t2.s) > 3).collect()
+        # the errors are recorded in the index metadata
+        reload_catalog()
+        t2 = pxt.get_table('expr_idx_test2')
+        with pytest.raises(pxt.Error, match='invalid literal'):
+            _ = t2.where(self.parse_int(t2.s) > 3).collect()
+
+        # errors while populating the index
+        t3 = pxt.create_table('expr_idx_test3', {'s': pxt.String})
+        validate_update_status(t3.insert([{'s': '1'}, {'s': 'one'}]), expected_rows=2)
+        t3.add_index(self.parse_int(t3.s))
+        with pytest.raises(pxt.Error, match='invalid literal'):
+            _ = t3.where(self.parse_int(t3.s) > 0).collect()
@@ -0,0 +1,177 @@
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import numpy as np
+import pytest
+
+import pixeltable as pxt
+from pixeltable.config import Config
+from pixeltable.utils.object_stores import ObjectPath
+from pixeltable.utils.transfer_budget import TransferBudget
+
+from .utils import skip_test_if_not_installed
+
+
+class FlakyS3Client:
+    """Wraps an S3 client and fails upload_part() requests according to a schedule"""
+
+    def __init__(self, client: Any, failures: dict[int, list[Exception]]):
+        self.client = client
+        self.failures = failures  # part number -> exceptions to raise, in order
+        self.part_calls: Counter[int] = Counter()
+        self.lock = threading.Lock()
+
+    def upload_part(self, **kwargs: Any) -> Any:
+        part_number = kwargs['PartNumber']
+        with self.lock:
+            self.part_calls[part_number] += 1
+            failures = self.failures.get(part_number)
+            exc = failures.pop(0) if failures else None
+        if exc is not None:
+            raise exc
+        return self.client.upload_part(**kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+
+class TestObjectTransfer:
+    @pytest.fixture
+    def s3_client(self, monkeypatch: pytest.MonkeyPatch) -> Iterator[Any]:
+        """An S3 client for a local S3-compatible server with an empty bucket 'pxt-test'"""
+        skip_test_if_not_installed('boto3')
+        import boto3
+
+        # moto is a test-only dependency, so it isn't registered with Env
+        moto_server = pytest.importorskip('moto.server')
+
+        monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+        monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+        server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+        server.start()
+        try:
+            host, port = server.get_host_and_port()
+            client = boto3.client('s3', endpoint_url=f'http://{host}:{port}', region_name='us-east-1')
+            client.create_bucket(Bucket='pxt-test')
+            yield client
+        finally:
+            server.stop()
+
+    @staticmethod
+    def make_file(path: Path, size: int) -> bytes:
+        data = np.random.default_rng(0).bytes(size)
+        path.write_bytes(data)
+        return data
+
+    def test_multipart_upload(self, s3_client: Any, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        from botocore.exceptions import ClientError, EndpointConnectionError
+
+        from pixeltable.utils.s3_store import MultipartUpload, S3Store
+
+        monkeypatch.setenv('S3_UPLOAD_PART_SIZE_MB', '5')
+        monkeypatch.setenv('S3_UPLOAD_CONCURRENCY', '2')
+        monkeypatch.setattr(MultipartUpload, 'PART_ATTEMPTS', 2)
+        slow_down = ClientError({'Error': {'Code': 'SlowDown', 'Message': 'slow down'}}, 'UploadPart')
+        conn_error = EndpointConnectionError(endpoint_url='http://localhost')
+        # part 2 succeeds on its second attempt; part 3 exhausts its attempts and succeeds after the upload is resumed
+        client = FlakyS3Client(s3_client, {2: [slow_down], 3: [conn_error, conn_error]})
+        monkeypatch.setattr(S3Store, 'client', lambda self: client)
+
+        src_path = tmp_path / 'video.mp4'
+        data = self.make_file(src_path, 12 * 2**20)
+        store = S3Store(ObjectPath.parse_object_storage_addr('s3://pxt-test/uploads/', False))
+        store._upload_file(src_path, 'uploads/video.mp4')
+
+        # each part was retried individually, and the resumed upload only uploaded the missing part
+        assert client.part_calls == {1: 1, 2: 2, 3: 3}
+        assert s3_client.get_object(Bucket='pxt-test', Key='uploads/video.mp4')['Body'].read() == data
+        assert len(s3_client.list_multipart_uploads(Bucket='pxt-test').get('Uploads', [])) == 0
+
+        # an upload that keeps failing is left unfinished, and a later upload of the same key (eg, by another
+        # process) resumes it
+        monkeypatch.setattr(S3Store, 'UPLOAD_ATTEMPTS', 1)
+        client.failures = {3: [conn_error, conn_error]}
+        client.part_calls.clear()
+        with pytest.raises(EndpointConnectionError):
+            store._upload_file(src_path, 'uploads/blob.mp4')
+        assert len(s3_client.list_multipart_uploads(Bucket='pxt-test').get('Uploads', [])) == 1
+        client.part_calls.clear()
+        S3Store(ObjectPath.parse_object_storage_addr('s3://pxt-test/uploads/', False))._upload_file(
+            src_path, 'uploads/blob.mp4'
+        )
+        assert client.part_calls == {3: 1}
+        assert s3_client.get_object(Bucket='pxt-test', Key='uploads/blob.mp4')['Body'].read() == data
+        assert len(s3_client.list_multipart_uploads(Bucket='pxt-test').get('Uploads', [])) == 0
+
+        # a permanent error aborts the upload
+        access_denied = ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'denied'}}, 'UploadPart')
+        client.failures = {1: [access_denied]}
+        client.part_calls.clear()
+        with pytest.raises(ClientError, match='AccessDenied'):
+            store._upload_file(src_path, 'uploads/video2.mp4')
+        assert client.part_calls[1] == 1
+        assert len(s3_client.list_multipart_uploads(Bucket='pxt-test').get('Uploads', [])) == 0
+
+        # files up to the part size are uploaded with a single request
+        small_path = tmp_path / 'image.jpg'
+        small_data = self.make_file(small_path, 2**20)
+        client.part_calls.clear()
+        store._upload_file(small_path, 'uploads/image.jpg')
+        assert len(client.part_calls) == 0
+        assert s3_client.get_object(Bucket='pxt-test', Key='uploads/image.jpg')['Body'].read() == small_data
+
+    def test_upload_settings(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        skip_test_if_not_installed('boto3')
+        from pixeltable.utils.object_stores import StorageTarget
+        from pixeltable.utils.s3_store import DEFAULT_UPLOAD_CONCURRENCY, DEFAULT_UPLOAD_PART_SIZE_MB, UploadSettings
+
+        monkeypatch.setenv('R2_UPLOAD_PART_SIZE_MB', '32')
+        assert UploadSettings.for_target(StorageTarget.R2_STORE) == (32 * 2**20, DEFAULT_UPLOAD_CONCURRENCY)
+        default_part_size = DEFAULT_UPLOAD_PART_SIZE_MB * 2**20
+        assert UploadSettings.for_target(StorageTarget.S3_STORE).part_size == default_part_size
+        monkeypatch.setenv('B2_UPLOAD_PART_SIZE_MB', '1')
+        with pytest.raises(pxt.Error, match='must be at least 5'):
+            UploadSettings.for_target(StorageTarget.B2_STORE)
+
+    def test_transfer_budget(self) -> None:
+        budget = TransferBudget(10 * 2**20)
+        max_in_flight = 0
+        lock = threading.Lock()
+
+        def transfer(size: int) -> None:
+            nonlocal max_in_flight
+            with budget.reserve(size):
+                with lock:
+                    max_in_flight = max(max_in_flight, budget.in_flight)
+                threading.Event().wait(0.01)
+
+        # includes a transfer that is larger than the entire budget
+        sizes = [3 * 2**20] * 20 + [50 * 2**20]
+        threads = [threading.Thread(target=transfer, args=(size,)) for size in sizes]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert max_in_flight <= budget.capacity
+        assert budget.in_flight == 0
+
+    def test_local_transfers_bypass_budget(self, reset_db: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        reservations: list[Optional[int]] = []
+        reserve = TransferBudget.reserve
+
+        def reserve_spy(self: TransferBudget, num_bytes: Optional[int] = None) -> Any:
+            reservations.append(num_bytes)
+            return reserve(self, num_bytes)
+
+        monkeypatch.setattr(TransferBudget, 'reserve', reserve_spy)
+        dest = Config.get().home / 'test_dest'
+        dest.mkdir(exist_ok=True)
+        t = pxt.create_table('test_tbl', {'img': pxt.Image})
+        t.add_computed_column(img_rot1=t.img.rotate(90))
+        t.add_computed_column(img_rot2=t.img.rotate(180), destination=dest)
+        t.insert([{'img': 'tests/data/imagenette2-160/ILSVRC2012_val_00000557.JPEG'}])
+        assert t.where(t.img_rot2 != None).count() == 1
+        # moves into the LocalStore and copies to a local destination aren't network transfers
+        assert reservations == []
@@ -0,0 +1,206 @@
+import asyncio
+import http.server
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+import httpx
+import pytest
+import sqlalchemy as sql
+
+import pixeltable as pxt
+from pixeltable import env
+from pixeltable.exec.expr_eval.schedulers import AdaptiveConcurrencyInfo, AdaptiveConcurrencyScheduler
+from pixeltable.metadata import schema
+from pixeltable.utils.rate_limit_buckets import SharedRateLimits
+
+from .utils import validate_update_status
+
+
+class ThrottlingServer:
+    """A local HTTP server that responds with 429 when more than `capacity` requests are in flight"""
+
+    capacity: int
+    latency: float  # in seconds
+    retry_after: Optional[str]  # value of the Retry-After header of 429 responses
+    num_in_flight: int
+    max_in_flight: int
+    num_throttled: int
+
+    def __init__(self, capacity: int, latency: float, retry_after: Optional[str] = None) -> None:
+        self.capacity = capacity
+        self.latency = latency
+        self.retry_after = retry_after
+        self.num_in_flight = 0
+        self.max_in_flight = 0
+        self.num_throttled = 0
+        lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                with lock:
+                    server.num_in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.num_in_flight)
+                    is_throttled = server.num_in_flight > server.capacity
+                    if is_throttled:
+                        server.num_throttled += 1
+                try:
+                    if is_throttled:
+                        self.send_response(429)
+                        if server.retry_after is not None:
+                            self.send_header('Retry-After', server.retry_after)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    time.sleep(server.latency)
+                    body = self.path.strip('/').encode()
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with lock:
+                        server.num_in_flight -= 1
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_port}'
+
+
+async def _fetch(base_url: str, i: int) -> int:
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f'{base_url}/{i}')
+        response.raise_for_status()
+        return int(response.text)
+
+
+@pxt.udf(resource_pool='adaptive:mock')
+async def fetch(base_url: str, i: int) -> int:
+    return await _fetch(base_url, i)
+
+
+@pxt.udf(resource_pool='adaptive:mock-capped')
+async def fetch_capped(base_url: str, i: int) -> int:
+    return await _fetch(base_url, i)
+
+
+@pxt.udf(resource_pool='adaptive:mock-unavailable')
+async def fetch_unavailable(base_url: str, i: int) -> int:
+    return await _fetch(base_url, i)
+
+
+@pxt.udf(resource_pool='request-rate:shared-test')
+async def incr(i: int) -> int:
+    await asyncio.sleep(0)
+    return i + 1
+
+
+class TestSchedulers:
+    @pytest.fixture
+    def throttling_server(self) -> Iterator[ThrottlingServer]:
+        server = ThrottlingServer(capacity=4, latency=0.05, retry_after='0.1')
+        server.thread.start()
+        yield server
+        server.httpd.shutdown()
+        server.httpd.server_close()
+
+    def test_adaptive_concurrency(
+        self, reset_db: None, throttling_server: ThrottlingServer, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        base_url = throttling_server.base_url
+        t = pxt.create_table('test_adaptive', {'id': pxt.Int})
+        validate_update_status(t.insert({'id': i} for i in range(200)), 200)
+
+        # the scheduler runs into the server's capacity, backs off and retries the throttled requests
+        res = t.select(t.id, r=fetch(base_url, t.id)).order_by(t.id).collect()
+        assert res['r'] == list(range(200))
+        assert throttling_server.num_throttled > 0
+        info: object = env.Env.get().get_resource_pool_info('adaptive:mock')
+        assert isinstance(info, AdaptiveConcurrencyInfo)
+        assert info.num_decreases > 0
+        assert 1 <= info.limit <= 2 * throttling_server.capacity
+
+        # the learned limit carries over to the next query, which skips the slow start
+        num_decreases = info.num_decreases
+        res = t.select(t.id, r=fetch(base_url, t.id)).order_by(t.id).collect()
+        assert res['r'] == list(range(200))
+        assert env.Env.get().get_resource_pool_info('adaptive:mock') is info
+        assert info.num_decreases >= num_decreases
+        assert 1 <= info.limit <= 2 * throttling_server.capacity
+
+        # the limit is capped by the config
+        monkeypatch.setenv('PIXELTABLE_ADAPTIVE_MAX_CONCURRENCY', '2')
+        throttling_server.num_throttled = throttling_server.max_in_flight = 0
+        res = t.select(t.id, r=fetch_capped(base_url, t.id)).order_by(t.id).collect()
+        assert res['r'] == list(range(200))
+        assert throttling_server.max_in_flight <= 2 and throttling_server.num_throttled == 0
+
+        # without Retry-After, requests are retried with backoff until they exceed MAX_RETRIES
+        throttling_server.capacity = 0
+        throttling_server.retry_after = None
+        monkeypatch.setattr(AdaptiveConcurrencyScheduler, 'BASE_RETRY_DELAY', 0.01)
+        with pytest.raises(pxt.Error, match='429'):
+            _ = t.where(t.id < 2).select(fetch_unavailable(base_url, t.id)).collect()
+
+    def test_shared_rate_limits(self, reset_db: None) -> None:
+        # separate instances stand in for separate processes
+        limits1, limits2 = SharedRateLimits('request-rate:test'), SharedRateLimits('request-rate:test')
+        bucket_limits = {'requests': (10.0, 5.0), 'tokens': (1000.0, 100.0)}
+        for _ in range(5):
+            assert limits1.try_acquire({'requests': 1, 'tokens': 100}, bucket_limits) == 0.0
+            assert limits2.try_acquire({'requests': 1, 'tokens': 100}, bucket_limits) == 0.0
+        # both buckets are depleted; the wait is determined by the resource that takes longer to refill
+        wait = limits2.try_acquire({'requests': 1, 'tokens': 100}, bucket_limits)
+        assert 0.8 <= wait <= 1.0 + SharedRateLimits.WAIT_JITTER
+        time.sleep(wait)
+        assert limits1.try_acquire({'requests': 1, 'tokens': 100}, bucket_limits) == 0.0
+
+        # an amount that exceeds the capacity is taken once the bucket is full, which overdraws it
+        fresh = SharedRateLimits('request-rate:test2')
+        assert fresh.try_acquire({'tokens': 1500}, {'tokens': (1000.0, 1000.0)}) == 0.0
+        assert fresh.try_acquire({'tokens': 1}, {'tokens': (1000.0, 1000.0)}) >= 0.45
+
+        # concurrent processes don't exceed the budget
+        pool_limits = {'requests': (5.0, 20.0)}
+        duration = 1.0
+
+        def worker() -> int:
+            limits = SharedRateLimits('request-rate:test3')
+            num_acquired = 0
+            start = time.monotonic()
+            while time.monotonic() - start < duration:
+                wait = limits.try_acquire({'requests': 1}, pool_limits)
+                if wait == 0.0:
+                    num_acquired += 1
+                else:
+                    time.sleep(wait)
+            return num_acquired
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            counts = list(executor.map(lambda _: worker(), range(4)))
+        # capacity + refills, with some slack for the time it takes to start the workers
+        assert sum(counts) <= 5 + 20 * (duration + 0.2)
+        assert all(count > 0 for count in counts)
+
+    def test_shared_request_rate(self, reset_db: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv('PIXELTABLE_SHARED_RATE_LIMITS', 'true')
+
+        t = pxt.create_table('test_shared', {'id': pxt.Int})
+        validate_update_status(t.insert({'id': i} for i in range(20)), 20)
+        res = t.select(r=incr(t.id)).order_by(t.id).collect()
+        assert res['r'] == list(range(1, 21))
+        with env.Env.get().engine.connect() as conn:
+            t_bucket = schema.RateLimitBucket
+            q = sql.select(t_bucket.resource, t_bucket.capacity, t_bucket.refill_rate).where(
+                t_bucket.pool_id == 'request-rate:shared-test'
+            )
+            # the default of 600 RPM
+            assert conn.execute(q).all() == [('requests', 10.0, 10.0)]
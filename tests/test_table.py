@@ -21,7 +21,8 @@ import pixeltable as pxt
 import pixeltable.functions as pxtf
 import pixeltable.type_system as ts
 from pixeltable.env import Env
-from pixeltable.exprs import ColumnRef
+from pixeltable.exec.cell_materialization_node import CellMaterializationNode
+from pixeltable.exprs import ColumnPropertyRef, ColumnRef, DataRow, PackedBoolArray
 from pixeltable.func import Batch
 from pixeltable.io.external_store import MockProject
 from pixeltable.iterators import FrameIterator
@@ -1637,6 +1638,116 @@ class TestTable:
         pxt.drop_table('test')
         assert LocalStore(Env.get().media_dir).count(tbl_id) == 0
 
+    def test_array_reconstruction(self, reset_db: None) -> None:
+        t = pxt.create_table('test', {'id': pxt.Int, 'a': pxt.Array})
+        rng = np.random.default_rng(0)
+        vals: list[np.ndarray] = [
+            rng.random((100, 100), dtype=np.float32),
+            np.asfortranarray(rng.random((50, 30), dtype=np.float32)),
+            rng.integers(0, 100, (1000,), dtype=np.int64),
+            rng.random((64, 64)) > 0.5,
+            rng.random((3, 7, 11)) > 0.5,
+            np.zeros((2, 2), dtype=np.int64),  # stored in the db column
+        ]
+        validate_update_status(t.insert({'id': i, 'a': val} for i, val in enumerate(vals)), expected_rows=len(vals))
+        res = t.order_by(t.id, asc=False).select(t.a).collect()
+        for ar, val in zip(res['a'], reversed(vals)):
+            assert ar.dtype == val.dtype
+            assert np.array_equal(ar, val)
+            if val.nbytes > CellMaterializationNode.MAX_DB_ARRAY_SIZE and val.dtype != np.bool_:
+                # a read-only view into the memory-mapped file
+                assert not ar.flags.writeable
+                assert ar.base is not None
+                with pytest.raises(ValueError, match='read-only'):
+                    ar[(0,) * ar.ndim] = 0
+                writable = ar.copy()
+                writable[(0,) * ar.ndim] = 0
+
+        # bool arrays are only unpacked when their slot is accessed
+        packed = np.packbits(vals[3])
+        row = DataRow(1, [], [], [0], [])
+        row[0] = PackedBoolArray(packed, vals[3].shape)
+        assert isinstance(row.vals[0], PackedBoolArray)
+        assert np.array_equal(row[0], vals[3])
+        assert isinstance(row.vals[0], np.ndarray)
+
+    @pytest.mark.parametrize('codec,float16', [('zstd', False), ('lz4', False), ('zstd', True)])
+    def test_compressed_array_storage(
+        self, codec: str, float16: bool, reset_db: None, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        skip_test_if_not_installed({'zstd': 'zstandard', 'lz4': 'lz4'}[codec])
+        monkeypatch.setenv('PIXELTABLE_ARRAY_COMPRESSION', codec)
+        monkeypatch.setenv('PIXELTABLE_ARRAY_FLOAT16', str(float16).lower())
+        t = pxt.create_table('test', {'id': pxt.Int, 'a': pxt.Array, 'b': pxt.Array})
+        rng = np.random.default_rng(0)
+        vals: list[np.ndarray] = [
+            rng.random((100, 100), dtype=np.float32),
+            np.asfortranarray(rng.random((50, 30), dtype=np.float32)),
+            rng.integers(0, 100, (1000,), dtype=np.int64),
+            rng.random((64, 64)) > 0.5,
+            np.zeros((2, 2), dtype=np.int64),  # stored in the db column
+        ]
+        rows = [{'id': i, 'a': val, 'b': vals[-i - 1]} for i, val in enumerate(vals)]
+        validate_update_status(t.insert(rows), expected_rows=len(vals))
+
+        # arrays of the same column and batch share a segment file; cellmd only records its id and the index
+        cellmd = ColumnPropertyRef(t.a, ColumnPropertyRef.Property.CELLMD)
+        md = t.where(t.id < 4).order_by(t.id).select(md=cellmd).collect()['md']
+        assert all(cell_md.keys() == {'array_md'} for cell_md in md)
+        assert len({cell_md['array_md']['segment_id'] for cell_md in md}) == 1
+        assert [cell_md['array_md']['segment_idx'] for cell_md in md] == list(range(4))
+
+        res = t.order_by(t.id).select(t.a, t.b).collect()
+        for col, expected_vals in (('a', vals), ('b', list(reversed(vals)))):
+            for ar, val in zip(res[col], expected_vals):
+                assert ar.dtype == val.dtype
+                assert ar.shape == val.shape
+                if float16 and val.dtype.kind == 'f':
+                    assert np.allclose(ar, val, rtol=1e-3)
+                else:
+                    assert np.array_equal(ar, val)
+
+    def test_compact_storage(self, reset_db: None) -> None:
+        t = pxt.create_table('test', {'id': pxt.Int, 'a': pxt.Array})
+        t.add_computed_column(j=[t.a, t.id])
+        rng = np.random.default_rng(0)
+        vals = [rng.random((32, 32), dtype=np.float32) for _ in range(10)]
+        # each insert writes its own small file
+        for i, val in enumerate(vals):
+            t.insert(id=i, a=val)
+        t.update({'id': t.id + 100}, where=t.id < 3)
+        # an unreferenced file, eg, left behind by a failed insert
+        store = LocalStore(Env.get().media_dir)
+        orphan = store._prepare_path_raw(t._id, 0, 1)
+        orphan.write_bytes(b'x' * 1000)
+        num_files = store.count(t._id)
+
+        status = t.compact_storage()
+        assert not orphan.exists()
+        assert status.num_files_before == num_files
+        assert status.num_files_after == store.count(t._id) == 1
+        assert status.num_rewritten_cells > 0
+        assert status.bytes_reclaimed >= 1000
+        assert status.read_amplification_after <= status.read_amplification_before
+
+        res = t.select(t.id, t.a, t.j).collect()
+        assert len(res) == len(vals)
+        for row in res:
+            i = row['id'] - 100 if row['id'] >= 100 else row['id']
+            assert np.array_equal(row['a'], vals[i])
+            assert np.array_equal(row['j'][0], vals[i])
+            assert row['j'][1] == row['id']
+        # the rows of older versions were rewritten as well
+        snapshot = pxt.get_table(f'test:{t._get_version() - 1}')
+        res = snapshot.select(snapshot.id, snapshot.a, snapshot.j).collect()
+        for row in res:
+            assert np.array_equal(row['a'], vals[row['id']])
+            assert np.array_equal(row['j'][0], vals[row['id']])
+
+        # nothing left to compact
+        status = t.compact_storage()
+        assert status.num_deleted_files == 0 and status.num_rewritten_cells == 0
+
     def test_nonstandard_json_construction(self, reset_db: None) -> None:
         # test list/dict construction
         # use 5 arrays to ensure every row sees a different combination of shapes and dtypes
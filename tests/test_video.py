@@ -1,8 +1,9 @@
 import math
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
+import av
 import PIL
 import pytest
 
@@ -13,6 +14,7 @@ from pixeltable.utils.object_stores import ObjectOps
 
 from .utils import (
     generate_test_video,
+    get_audio_files,
     get_video_files,
     reload_catalog,
     skip_test_if_not_installed,
@@ -125,6 +127,22 @@ class TestVideo:
             )
         assert 'At most one of `fps` or `num_frames` may be specified' in str(exc_info.value)
 
+    @pytest.mark.parametrize('num_frames', [3, 10, 50])
+    def test_sparse_frame_seek(self, num_frames: int) -> None:
+        # frames extracted via keyframe seeks are identical to the ones extracted via sequential decoding
+        for path in get_video_files():
+            seq_it = FrameIterator(path, num_frames=num_frames, seek=False)
+            seq_frames = list(seq_it)
+            seq_it.close()
+            seek_it = FrameIterator(path, num_frames=num_frames)
+            seek_frames = list(seek_it)
+            seek_it.close()
+            assert len(seq_frames) == len(seek_frames) == min(num_frames, seq_it.video_frame_count)
+            for seq_frame, seek_frame in zip(seq_frames, seek_frames):
+                assert seq_frame['pos_frame'] == seek_frame['pos_frame']
+                assert seq_frame['frame'].tobytes() == seek_frame['frame'].tobytes()
+            assert seek_it.keyframes is None or len(seek_it.keyframes) > 0
+
     def test_computed_cols(self, reset_db: None) -> None:
         video_filepaths = get_video_files()
         base_t, view_t = self.create_tbls()
@@ -384,6 +402,68 @@ class TestVideo:
         with pytest.raises(pxt.Error):
             t.add_computed_column(invalid3=t.video.extract_frame(timestamp=-1.0))
 
+    def test_decoder_session(self) -> None:
+        from pixeltable.utils.av import DecoderCache, DecoderSession
+
+        path = get_video_files()[0]
+        cache = DecoderCache.get()
+        cache.clear()
+        timestamps = [0.0, 0.1, 0.5, 0.52, 1.0, 3.5, 0.2, 10.0, 10.0, 2.0, 1000.0]
+        with cache.session(path) as session:
+            for ts in timestamps:
+                # a fresh session always seeks
+                expected = DecoderSession(path)
+                expected_frame = expected.extract_frame(ts)
+                expected.close()
+                frame = session.extract_frame(ts)
+                if expected_frame is None:
+                    assert frame is None
+                else:
+                    assert frame is not None and frame.tobytes() == expected_frame.tobytes()
+            assert session.num_users == 1
+        with cache.session(path) as session2:
+            assert session2 is session
+            assert session.video_duration is not None
+        assert cache.num_hits >= 1
+
+        # a decoding error leaves the session usable
+        with cache.session(path) as session:
+            assert session.extract_frame(0.5) is not None
+
+            def failing_decode() -> Iterator[av.VideoFrame]:
+                raise av.error.InvalidDataError(0, 'corrupt frame')
+                yield
+
+            session.frames = failing_decode()
+            with pytest.raises(av.error.InvalidDataError):
+                session.extract_frame(0.52)
+            assert session.frames is None and session.last_frame is None
+            expected = DecoderSession(path)
+            expected_frame = expected.extract_frame(0.52)
+            expected.close()
+            frame = session.extract_frame(0.52)
+            assert frame is not None and expected_frame is not None and frame.tobytes() == expected_frame.tobytes()
+
+        # a session that is in use when it gets evicted is closed by its user
+        with cache.session(path) as session:
+            cache.clear()
+            assert session.is_evicted
+            assert session.extract_frame(0.0) is not None
+        assert session.num_users == 0
+        with cache.session(path) as session2:
+            assert session2 is not session
+        # idle sessions are closed at the end of a query
+        cache.close_idle()
+        assert len(cache.sessions) == 0
+
+        # a file without a video stream
+        with cache.session(get_audio_files()[0]) as session:
+            assert not session.has_video
+            assert session.extract_frame(0.0) is None
+            assert session.video_duration is None
+            assert all(stream['type'] != 'video' for stream in session.metadata['streams'])
+        cache.clear()
+
     def _validate_segments(self, segments: list[str], max_duration: float | None = None) -> None:
         t = pxt.create_table('validate_segments', {'segment': pxt.Video}, media_validation='on_write')
         t.insert({'segment': s} for s in segments)
@@ -565,6 +645,29 @@ class TestVideo:
                 self._validate_splitter_segments(t, s, overlap, min_segment_duration)
                 pxt.drop_table('videos', force=True)
 
+    @pytest.mark.parametrize('segment_duration', [2.0, 5.0, 100.0])
+    def test_video_splitter_single_pass(self, segment_duration: float, reset_db: None) -> None:
+        from pixeltable.iterators import VideoSplitter
+
+        video_filepaths = get_video_files()
+        for min_segment_duration in [0.0, segment_duration]:
+            for overlap in [0.0, 1.0]:
+                t = pxt.create_table('videos', {'video': pxt.Video})
+                t.insert([{'video': p} for p in video_filepaths])
+                s = pxt.create_view(
+                    'segments',
+                    t,
+                    iterator=VideoSplitter.create(
+                        video=t.video,
+                        segment_duration=segment_duration,
+                        overlap=overlap,
+                        min_segment_duration=min_segment_duration,
+                        single_pass=True,
+                    ),
+                )
+                self._validate_splitter_segments(t, s, overlap, min_segment_duration)
+                pxt.drop_table('videos', force=True)
+
     def test_video_splitter_errors(self, reset_db: None) -> None:
         from pixeltable.iterators.video import VideoSplitter
 
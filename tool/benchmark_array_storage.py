@@ -0,0 +1,120 @@
+"""
+Benchmark for the storage layouts of externally stored array cells: compares the uncompressed .npy layout against
+compressed segment files (see pixeltable/utils/array_segment.py), in terms of storage size, write time and scan time.
+
+Example:
+    python -m tool.benchmark_array_storage --num-arrays 10000 --shape 1024 --kind embedding
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from tabulate import tabulate  # type: ignore
+
+from pixeltable.exec.cell_reconstruction_node import MappedFiles
+from pixeltable.utils.array_segment import ArraySegmentWriter
+
+
+def make_arrays(kind: str, num_arrays: int, shape: tuple[int, ...]) -> list[np.ndarray]:
+    rng = np.random.default_rng(0)
+    if kind == 'embedding':
+        return [rng.standard_normal(shape, dtype=np.float32) for _ in range(num_arrays)]
+    if kind == 'mask':
+        return [rng.random(shape) > 0.9 for _ in range(num_arrays)]
+    assert kind == 'counts'
+    # sparse, low-entropy integer data
+    return [rng.poisson(0.5, shape).astype(np.int64) for _ in range(num_arrays)]
+
+
+def write_npy(path: Path, arrays: list[np.ndarray]) -> list[tuple[int, int]]:
+    """The uncompressed layout of CellMaterializationNode; returns (start, end) of each array"""
+    offsets = []
+    with open(path, 'wb') as fh:
+        for ar in arrays:
+            start = fh.tell()
+            np.save(fh, np.packbits(ar) if ar.dtype == np.bool_ else ar, allow_pickle=False)
+            offsets.append((start, fh.tell()))
+    return offsets
+
+
+def run_layout(
+    tmp_dir: Path, arrays: list[np.ndarray], codec: Optional[str], float16: bool, batch_size: int
+) -> tuple[int, float, float]:
+    """Returns storage size in bytes, write time and scan time in seconds"""
+    start = time.monotonic()
+    files: list[Path] = []
+    if codec is None:
+        path = tmp_dir / 'arrays.npy'
+        offsets = write_npy(path, arrays)
+        files.append(path)
+    else:
+        # one segment file per batch of rows
+        for i in range(0, len(arrays), batch_size):
+            writer = ArraySegmentWriter(tmp_dir / f'arrays_{i}.seg', codec, float16=float16)
+            for ar in arrays[i : i + batch_size]:
+                writer.append(ar)
+            writer.close()
+            files.append(writer.path)
+    write_time = time.monotonic() - start
+
+    start = time.monotonic()
+    mapped_files = MappedFiles()
+    total = 0.0
+    if codec is None:
+        for ar, (ar_start, ar_end) in zip(arrays, offsets):
+            shape = ar.shape if ar.dtype == np.bool_ else None
+            total += float(mapped_files.load_array(files[0], ar_start, ar_end, shape is not None, shape).sum())
+    else:
+        for i in range(len(arrays)):
+            total += float(mapped_files.load_segment_array(files[i // batch_size], i % batch_size).sum())
+    scan_time = time.monotonic() - start
+    mapped_files.clear()
+
+    size = sum(f.stat().st_size for f in files)
+    for f in files:
+        f.unlink()
+    return size, write_time, scan_time
+
+
+def run_benchmark(args: argparse.Namespace) -> None:
+    shape = tuple(args.shape)
+    print(f'Creating {args.num_arrays} {args.kind} arrays of shape {shape} ...')
+    arrays = make_arrays(args.kind, args.num_arrays, shape)
+    layouts: list[tuple[Optional[str], bool]] = [(None, False), ('zstd', False), ('lz4', False)]
+    if args.kind == 'embedding':
+        layouts.append(('zstd', True))
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        base_size: Optional[int] = None
+        for codec, float16 in layouts:
+            size, write_time, scan_time = run_layout(Path(tmp_dir), arrays, codec, float16, args.batch_size)
+            if base_size is None:
+                base_size = size
+            rows.append(
+                [
+                    codec or 'npy',
+                    float16,
+                    f'{size / 2**20:.1f}',
+                    f'{base_size / size:.2f}x',
+                    f'{write_time:.2f}',
+                    f'{scan_time:.2f}',
+                ]
+            )
+    print(
+        tabulate(
+            rows, headers=['layout', 'float16', 'size (MB)', 'compression', 'write (s)', 'scan (s)'], tablefmt='grid'
+        )
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark storage layouts for externally stored arrays')
+    parser.add_argument('--num-arrays', type=int, default=10000, help='number of arrays')
+    parser.add_argument('--shape', type=int, nargs='+', default=[1024], help='shape of each array')
+    parser.add_argument('--kind', choices=['embedding', 'mask', 'counts'], default='embedding', help='array contents')
+    parser.add_argument('--batch-size', type=int, default=1024, help='number of arrays per segment file')
+    run_benchmark(parser.parse_args())
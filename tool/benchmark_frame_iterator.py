@@ -0,0 +1,59 @@
+"""
+Benchmark for sparse frame sampling in FrameIterator: compares seek-to-keyframe against sequential decoding on
+synthetic long videos created with tool/create_test_video.py.
+
+Example:
+    python -m tool.benchmark_frame_iterator --frame-count 36000 --frame-rate 10 --num-frames 10
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional
+
+from tabulate import tabulate  # type: ignore
+
+from pixeltable.iterators import FrameIterator
+from tool.create_test_video import create_test_video
+
+
+def extract_frames(video_path: Path, seek: bool, fps: Optional[float], num_frames: Optional[int]) -> tuple[int, float]:
+    """Returns the number of extracted frames and the elapsed time in seconds"""
+    start = time.monotonic()
+    it = FrameIterator(str(video_path), fps=fps, num_frames=num_frames, seek=seek)
+    n = sum(1 for _ in it)
+    it.close()
+    return n, time.monotonic() - start
+
+
+def run_benchmark(args: argparse.Namespace) -> None:
+    print(f'Creating test video with {args.frame_count} frames at {args.frame_rate} fps ...')
+    video_path = create_test_video(
+        frame_count=args.frame_count, frame_rate=args.frame_rate, frame_width=args.frame_width, font_file=args.font_file
+    )
+    configs: list[tuple[Optional[float], Optional[int]]] = [(None, args.num_frames), (args.fps, None), (None, None)]
+    rows = []
+    for fps, num_frames in configs:
+        n_seq, t_seq = extract_frames(video_path, seek=False, fps=fps, num_frames=num_frames)
+        n_seek, t_seek = extract_frames(video_path, seek=True, fps=fps, num_frames=num_frames)
+        assert n_seq == n_seek
+        rows.append([fps, num_frames, n_seek, f'{t_seq:.2f}', f'{t_seek:.2f}', f'{t_seq / t_seek:.1f}x'])
+    print(
+        tabulate(
+            rows,
+            headers=['fps', 'num_frames', 'frames', 'sequential (s)', 'cost model (s)', 'speedup'],
+            tablefmt='grid',
+        )
+    )
+    video_path.unlink()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark sparse frame sampling in FrameIterator')
+    parser.add_argument('--frame-count', type=int, default=36000, help='number of frames in the test video')
+    parser.add_argument('--frame-rate', type=int, default=10, help='frame rate of the test video')
+    parser.add_argument('--frame-width', type=int, default=224, help='frame width of the test video')
+    parser.add_argument('--num-frames', type=int, default=10, help='num_frames for the sparse sampling run')
+    parser.add_argument('--fps', type=float, default=0.05, help='fps for the low-rate sampling run')
+    parser.add_argument('--font-file', type=str, default='/Library/Fonts/Arial Unicode.ttf')
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,98 @@
+"""
+Benchmark for fetching media files over HTTP: compares a new urllib connection per file (the previous behavior of
+HTTPStore) against the shared, pooled HttpClient (see pixeltable/utils/http_client.py), and measures conditional GETs.
+
+The files are served by a local HTTP/1.1 server, so the numbers understate the cost of connection setup against
+remote (TLS) servers. Use --latency-ms to add a per-connection delay that simulates a handshake.
+
+Example:
+    python -m tool.benchmark_http_fetch --num-files 2000 --file-size 20000 --workers 15
+"""
+
+import argparse
+import http.server
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent import futures
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from tabulate import tabulate  # type: ignore
+
+from pixeltable.utils.http_client import HttpClient, HttpValidators
+
+
+def start_server(data: bytes, latency_ms: int) -> http.server.ThreadingHTTPServer:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+
+        def setup(self) -> None:
+            # called once per connection
+            time.sleep(latency_ms / 1000)
+            super().setup()
+
+        def do_GET(self) -> None:
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def fetch_urllib(url: str, dest_path: Path) -> None:
+    with urllib.request.urlopen(url) as resp, open(dest_path, 'wb') as f:
+        f.write(resp.read())
+
+
+def run(urls: list[str], tmp_dir: Path, workers: int, fetch: Callable[[str, Path], object]) -> float:
+    start = time.monotonic()
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda i: fetch(urls[i], tmp_dir / f'{i}.bin'), range(len(urls))))
+    return time.monotonic() - start
+
+
+def run_benchmark(args: argparse.Namespace) -> None:
+    data = np.random.default_rng(0).bytes(args.file_size)
+    httpd = start_server(data, args.latency_ms)
+    urls = [f'http://127.0.0.1:{httpd.server_port}/img{i}.jpg' for i in range(args.num_files)]
+    client = HttpClient(max_connections_per_host=args.workers)
+    validators = HttpValidators('"v1"', None, time.time())
+
+    fetchers: list[tuple[str, Callable[[str, Path], object]]] = [
+        ('urllib (new connection per file)', fetch_urllib),
+        ('HttpClient (pooled)', client.download),
+        ('HttpClient (conditional GET, 304)', lambda url, path: client.download(url, path, validators)),
+    ]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, fetch in fetchers:
+            elapsed = run(urls, Path(tmp_dir), args.workers, fetch)
+            rows.append([name, f'{elapsed:.2f}', f'{args.num_files / elapsed:.0f}'])
+    httpd.shutdown()
+    client.close()
+    print(tabulate(rows, headers=['method', 'time (s)', 'files/s'], tablefmt='grid'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark HTTP media fetching')
+    parser.add_argument('--num-files', type=int, default=2000, help='number of files to fetch')
+    parser.add_argument('--file-size', type=int, default=20000, help='size of each file in bytes')
+    parser.add_argument('--workers', type=int, default=15, help='number of concurrent fetches')
+    parser.add_argument('--latency-ms', type=int, default=20, help='simulated connection setup latency')
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,89 @@
+"""
+Benchmark for scans with predicates that are evaluated in Python (ie, that can't be pushed down to SQL): compares
+RowBuilder.eval() with compiled evaluation contexts (see pixeltable/exprs/eval_compiler.py) against the per-expr
+evaluation loop.
+
+Example:
+    python -m tool.benchmark_py_filter --num-rows 200000 --repeat 3
+"""
+
+import argparse
+import time
+from typing import Any, Callable
+
+from tabulate import tabulate  # type: ignore
+
+import pixeltable as pxt
+from pixeltable import exprs
+
+
+def create_tbl(num_rows: int) -> pxt.Table:
+    pxt.drop_table('benchmark_py_filter', if_not_exists='ignore')
+    t = pxt.create_table('benchmark_py_filter', {'c_int': pxt.Int, 'c_float': pxt.Float, 'meta': pxt.Json})
+    rows = [
+        {
+            'c_int': i,
+            'c_float': i / 7,
+            'meta': {'count': i % 17, 'score': (i % 101) / 10, 'tags': ['a', 'b'] if i % 3 == 0 else ['c']},
+        }
+        for i in range(num_rows)
+    ]
+    t.insert(rows)
+    return t
+
+
+def predicates(t: pxt.Table) -> list[tuple[str, Callable[[], Any]]]:
+    return [
+        ('json arithmetic', lambda: (t.meta['count'] * 2 + t.meta.score) > 10),
+        ('isin on json path', lambda: t.meta['count'].isin([1, 3, 5, 7, 11, 13])),
+        # json arithmetic is evaluated in Python, plain comparisons of json paths would be pushed down to SQL
+        ('compound', lambda: ((t.meta['count'] + 1 > 6) & ~(t.meta.score * 2 < 6.0)) | (t.meta['count'] % 4 == 0)),
+        ('mixed with columns', lambda: (t.c_float * t.meta.score > 100.0) & (t.c_int % 2 == 0)),
+    ]
+
+
+def run(t: pxt.Table, predicate: Callable[[], Any], repeat: int) -> tuple[float, int]:
+    best = float('inf')
+    num_rows = 0
+    for _ in range(repeat):
+        start = time.monotonic()
+        num_rows = len(t.where(predicate()).select(t.c_int).collect())
+        best = min(best, time.monotonic() - start)
+    return best, num_rows
+
+
+def run_benchmark(args: argparse.Namespace) -> None:
+    pxt.init()
+    t = create_tbl(args.num_rows)
+    rows = []
+    for name, predicate in predicates(t):
+        exprs.RowBuilder.COMPILE_EVAL_CTXS = False
+        interpreted, num_interpreted = run(t, predicate, args.repeat)
+        exprs.RowBuilder.COMPILE_EVAL_CTXS = True
+        compiled, num_compiled = run(t, predicate, args.repeat)
+        assert num_interpreted == num_compiled
+        rows.append(
+            [
+                name,
+                num_compiled,
+                f'{interpreted:.2f}',
+                f'{compiled:.2f}',
+                f'{args.num_rows / compiled:.0f}',
+                f'{interpreted / compiled:.2f}x',
+            ]
+        )
+    pxt.drop_table('benchmark_py_filter')
+    print(
+        tabulate(
+            rows,
+            headers=['predicate', 'result rows', 'interpreted (s)', 'compiled (s)', 'rows/s', 'speedup'],
+            tablefmt='grid',
+        )
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark scans with Python-evaluated predicates')
+    parser.add_argument('--num-rows', type=int, default=200000, help='number of rows in the table')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per predicate (the best is reported)')
+    run_benchmark(parser.parse_args())